@@ -0,0 +1,104 @@
+"""
+    An on-disk cache of parsed Harmony files.
+
+    Parsing with the ANTLR Python runtime is slow, and most of it is spent
+    on the same modules (synch, list, ...) in every run.  The cache maps a
+    key to the pickled AST of a file.  The key is a hash of the contents
+    and the name of the file (the name ends up in the tokens), the compiler
+    version, the Python version, and the sources of the parser, so that a
+    change to any of those gives a different key.  The -c and -m options
+    do not change the AST of a file: -m selects another file, which has
+    its own key, and constants are looked up during compilation.
+
+    The cache is in $XDG_CACHE_HOME/harmony-model-checker/ast (by default
+    ~/.cache/...) and can be turned off by setting HARMONY_DISABLE_CACHE to
+    true.  A file that cannot be read or unpickled is treated as a miss.
+"""
+
+import hashlib
+import os
+import pathlib
+import pickle
+import sys
+import tempfile
+
+import harmony_model_checker
+
+_parser_sources = [
+    "harmony/ast.py",
+    "parser/antlr_rule_visitor.py",
+    "parser/HarmonyParser.py",
+    "parser/HarmonyLexer.py",
+]
+
+_salt = None
+
+def _get_salt():
+    """A hash of everything other than the file that determines its AST."""
+    global _salt
+    if _salt is None:
+        h = hashlib.sha256()
+        h.update(str(getattr(harmony_model_checker, "__version__", "")).encode())
+        h.update(sys.version.encode())
+        install_path = os.path.dirname(os.path.realpath(__file__))
+        for src in _parser_sources:
+            with open(os.path.join(install_path, src), "rb") as f:
+                h.update(f.read())
+        _salt = h.digest()
+    return _salt
+
+def cache_dir(kind='ast'):
+    """The cache directory, or None if caching is turned off."""
+    if os.environ.get('HARMONY_DISABLE_CACHE', '').lower() == 'true':
+        return None
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME', str(pathlib.Path.home() / ".cache"))
+    return pathlib.Path(xdg_cache_home, 'harmony-model-checker', kind).expanduser()
+
+def cache_key(filename: str, contents: str) -> str:
+    h = hashlib.sha256(_get_salt())
+    for part in [os.path.abspath(filename), filename, contents]:
+        data = part.encode('utf-8', 'surrogatepass')
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+def load(key: str):
+    """Return the cached AST for key, or None."""
+    d = cache_dir()
+    if d is None:
+        return None
+    try:
+        with open(d / key, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Corrupt or written by an incompatible version: recompute it
+        return None
+
+def store(key: str, ast):
+    """Save ast under key.  Failures are ignored: the cache is only an
+    optimization."""
+    d = cache_dir()
+    if d is None:
+        return
+    tmp = None
+    try:
+        d.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Write to a temporary file and rename it so that concurrent runs
+        # never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, d / key)
+        tmp = None
+    except Exception:
+        pass
+    finally:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,691 @@
+#include "head.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <assert.h>
+
+#include "global.h"
+#include "value.h"
+#include "json.h"
+#include "behavior.h"
+
+// A transition of the NFA or DFA.  In the NFA, symbol 0 is the empty
+// transition.  The other symbols are numbered as in collect_symbols().
+struct btrans {
+    unsigned int src, symbol, dst;
+};
+
+struct btrans_vec {
+    struct btrans *v;
+    unsigned int n, alloc;
+};
+
+static void btrans_add(struct btrans_vec *tv, unsigned int src, unsigned int symbol, unsigned int dst){
+    if (tv->n == tv->alloc) {
+        tv->alloc = tv->alloc == 0 ? 1024 : 2 * tv->alloc;
+        tv->v = realloc(tv->v, tv->alloc * sizeof(*tv->v));
+    }
+    struct btrans *t = &tv->v[tv->n++];
+    t->src = src;
+    t->symbol = symbol;
+    t->dst = dst;
+}
+
+// The NFA has a state for each node that is kept by destutter1, and an
+// intermediate state after each symbol but the last of a print history.
+// State 0 is the initial state.  The outgoing transitions of state q are
+// trans[first[q]..first[q+1]).
+struct nfa {
+    unsigned int nstates, nnodes;
+    bool *final;                // for the first nnodes states
+    struct btrans_vec tv;
+    unsigned int *first;
+    struct btrans *trans;
+};
+
+// The DFA, or the result of minimizing it.  State 0 is the initial state.
+// Missing transitions go to an implicit error state.
+struct bdfa {
+    unsigned int nstates;
+    bool *final;
+    struct btrans_vec tv;
+};
+
+static unsigned int symbol_id(struct dict *symbols, hvalue_t v){
+    void *p = dict_lookup(symbols, &v, sizeof(v));
+    assert(p != NULL);
+    return (unsigned int) (uintptr_t) p;
+}
+
+static void nfa_build(struct nfa *nfa, struct graph_t *graph, struct dict *symbols){
+    unsigned int *state = malloc(graph->size * sizeof(*state));
+    nfa->nnodes = 0;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        if (graph->nodes[i]->reachable) {
+            state[i] = nfa->nnodes++;
+        }
+    }
+    nfa->nstates = nfa->nnodes;
+    nfa->final = calloc(nfa->nnodes, sizeof(*nfa->final));
+
+    for (unsigned int i = 0; i < graph->size; i++) {
+        struct node *node = graph->nodes[i];
+        if (!node->reachable) {
+            continue;
+        }
+        unsigned int src = state[i];
+        nfa->final[src] = i != 0 && node->final;
+
+        // Print histories of more than one symbol from this node that have
+        // all but their last symbol in common share intermediate states
+        struct dict *prefixes = NULL;
+
+        // The transitions include those of the nodes merged into this one
+        for (struct node *n = node; n != NULL; n = n->next) {
+            for (struct edge *e = n->fwd; e < &n->fwd[n->nfwd]; e++) {
+                if (!e->dst->reachable) {
+                    continue;
+                }
+                unsigned int dst = state[e->dst->id];
+                if (e->nlog == 0) {
+                    btrans_add(&nfa->tv, src, 0, dst);
+                    continue;
+                }
+                unsigned int q = src;
+                if (e->nlog > 1) {
+                    if (prefixes == NULL) {
+                        prefixes = dict_new(0, 0, NULL, NULL);
+                    }
+                    void **p = dict_insert(prefixes, NULL, e->log, (e->nlog - 1) * sizeof(*e->log));
+                    if (*p == NULL) {
+                        for (unsigned int j = 0; j < e->nlog - 1; j++) {
+                            unsigned int next = nfa->nstates++;
+                            btrans_add(&nfa->tv, q, symbol_id(symbols, e->log[j]), next);
+                            q = next;
+                        }
+                        *p = (void *) (uintptr_t) (q + 1);
+                    }
+                    else {
+                        q = (unsigned int) (uintptr_t) *p - 1;
+                    }
+                }
+                btrans_add(&nfa->tv, q, symbol_id(symbols, e->log[e->nlog - 1]), dst);
+            }
+        }
+        if (prefixes != NULL) {
+            dict_delete(prefixes);
+        }
+    }
+    free(state);
+
+    // Order the transitions by source state
+    nfa->first = calloc(nfa->nstates + 1, sizeof(*nfa->first));
+    for (unsigned int t = 0; t < nfa->tv.n; t++) {
+        nfa->first[nfa->tv.v[t].src + 1]++;
+    }
+    for (unsigned int q = 0; q < nfa->nstates; q++) {
+        nfa->first[q + 1] += nfa->first[q];
+    }
+    unsigned int *next = malloc((nfa->nstates + 1) * sizeof(*next));
+    memcpy(next, nfa->first, (nfa->nstates + 1) * sizeof(*next));
+    nfa->trans = malloc((nfa->tv.n + 1) * sizeof(*nfa->trans));
+    for (unsigned int t = 0; t < nfa->tv.n; t++) {
+        nfa->trans[next[nfa->tv.v[t].src]++] = nfa->tv.v[t];
+    }
+    free(next);
+    free(nfa->tv.v);
+}
+
+static int uint_cmp(const void *a, const void *b){
+    unsigned int x = * (const unsigned int *) a, y = * (const unsigned int *) b;
+    return x < y ? -1 : x > y;
+}
+
+static int btrans_symbol_cmp(const void *a, const void *b){
+    const struct btrans *x = a, *y = b;
+    return x->symbol < y->symbol ? -1 : x->symbol > y->symbol;
+}
+
+// Subset construction.  The DFA states are the sets of NFA states closed
+// under empty transitions, kept sorted so they can be used as keys.
+struct subsets {
+    struct nfa *nfa;
+    struct dict *index;         // set of NFA states -> DFA state + 1
+    unsigned int **sets;        // NFA states of each DFA state
+    unsigned int *sizes;
+    unsigned int n, alloc;
+    unsigned int *mark, stamp;  // to find the closure
+};
+
+// Put the closure of the n states in states into out, which must have room
+// for all NFA states, and return its size.
+static unsigned int closure(struct subsets *ss, const unsigned int *states, unsigned int n, unsigned int *out){
+    struct nfa *nfa = ss->nfa;
+    unsigned int k = 0;
+
+    ss->stamp++;
+    for (unsigned int i = 0; i < n; i++) {
+        if (ss->mark[states[i]] != ss->stamp) {
+            ss->mark[states[i]] = ss->stamp;
+            out[k++] = states[i];
+        }
+    }
+    for (unsigned int i = 0; i < k; i++) {
+        for (unsigned int t = nfa->first[out[i]]; t < nfa->first[out[i] + 1]; t++) {
+            unsigned int dst = nfa->trans[t].dst;
+            if (nfa->trans[t].symbol == 0 && ss->mark[dst] != ss->stamp) {
+                ss->mark[dst] = ss->stamp;
+                out[k++] = dst;
+            }
+        }
+    }
+    qsort(out, k, sizeof(*out), uint_cmp);
+    return k;
+}
+
+static unsigned int subset_state(struct subsets *ss, struct bdfa *dfa, const unsigned int *set, unsigned int n){
+    void **p = dict_insert(ss->index, NULL, set, n * sizeof(*set));
+    if (*p == NULL) {
+        if (ss->n == ss->alloc) {
+            ss->alloc = ss->alloc == 0 ? 1024 : 2 * ss->alloc;
+            ss->sets = realloc(ss->sets, ss->alloc * sizeof(*ss->sets));
+            ss->sizes = realloc(ss->sizes, ss->alloc * sizeof(*ss->sizes));
+            dfa->final = realloc(dfa->final, ss->alloc * sizeof(*dfa->final));
+        }
+        ss->sets[ss->n] = malloc(n * sizeof(*set));
+        memcpy(ss->sets[ss->n], set, n * sizeof(*set));
+        ss->sizes[ss->n] = n;
+        dfa->final[ss->n] = false;
+        for (unsigned int i = 0; i < n; i++) {
+            if (set[i] < ss->nfa->nnodes && ss->nfa->final[set[i]]) {
+                dfa->final[ss->n] = true;
+                break;
+            }
+        }
+        *p = (void *) (uintptr_t) ++ss->n;
+    }
+    return (unsigned int) (uintptr_t) *p - 1;
+}
+
+static void nfa_to_dfa(struct nfa *nfa, struct bdfa *dfa){
+    struct subsets ss = {
+        .nfa = nfa,
+        .index = dict_new(0, 0, NULL, NULL),
+        .mark = calloc(nfa->nstates, sizeof(unsigned int))
+    };
+    unsigned int *set = malloc(nfa->nstates * sizeof(*set));
+    unsigned int *targets = malloc(nfa->nstates * sizeof(*targets));
+    struct btrans_vec moves = { .n = 0 };
+
+    unsigned int initial = 0;
+    subset_state(&ss, dfa, set, closure(&ss, &initial, 1, set));
+
+    // The DFA states are numbered in the order they are found, so this
+    // loop handles each exactly once
+    for (unsigned int d = 0; d < ss.n; d++) {
+        unsigned int *cur = ss.sets[d], size = ss.sizes[d];
+
+        // Collect the non-empty transitions out of the set, grouped by symbol
+        moves.n = 0;
+        for (unsigned int i = 0; i < size; i++) {
+            for (unsigned int t = nfa->first[cur[i]]; t < nfa->first[cur[i] + 1]; t++) {
+                if (nfa->trans[t].symbol != 0) {
+                    btrans_add(&moves, d, nfa->trans[t].symbol, nfa->trans[t].dst);
+                }
+            }
+        }
+        if (moves.n > 1) {
+            qsort(moves.v, moves.n, sizeof(*moves.v), btrans_symbol_cmp);
+        }
+
+        for (unsigned int i = 0; i < moves.n;) {
+            unsigned int symbol = moves.v[i].symbol, n = 0;
+            for (; i < moves.n && moves.v[i].symbol == symbol; i++) {
+                targets[n++] = moves.v[i].dst;
+            }
+            unsigned int k = closure(&ss, targets, n, set);
+            btrans_add(&dfa->tv, d, symbol, subset_state(&ss, dfa, set, k));
+        }
+    }
+    dfa->nstates = ss.n;
+
+    for (unsigned int d = 0; d < ss.n; d++) {
+        free(ss.sets[d]);
+    }
+    free(ss.sets);
+    free(ss.sizes);
+    free(ss.mark);
+    free(set);
+    free(targets);
+    free(moves.v);
+    dict_delete(ss.index);
+}
+
+// Refinable partition of the elements 0..n-1.  Set s consists of the
+// elements E[F[s]..P[s]).  L[e] is the location of element e in E and S[e]
+// its set.
+struct partition {
+    unsigned int z;
+    unsigned int *E, *L, *S, *F, *P;
+};
+
+static void partition_init(struct partition *p, unsigned int n){
+    p->z = n > 0;
+    p->E = malloc((n + 1) * sizeof(unsigned int));
+    p->L = malloc((n + 1) * sizeof(unsigned int));
+    p->S = malloc((n + 1) * sizeof(unsigned int));
+    p->F = malloc((n + 1) * sizeof(unsigned int));
+    p->P = malloc((n + 1) * sizeof(unsigned int));
+    for (unsigned int i = 0; i < n; i++) {
+        p->E[i] = p->L[i] = i;
+        p->S[i] = 0;
+    }
+    if (p->z) {
+        p->F[0] = 0;
+        p->P[0] = n;
+    }
+}
+
+static void partition_free(struct partition *p){
+    free(p->E);
+    free(p->L);
+    free(p->S);
+    free(p->F);
+    free(p->P);
+}
+
+// Hopcroft-style minimization of a DFA with missing transitions, after
+// Valmari and Lehtinen, "Efficient minimization of DFAs with partial
+// transition functions".  Blocks of states are refined by cords, which are
+// sets of transitions with the same symbol, and vice versa.  The marks (M)
+// and touched sets (W) are shared by both partitions, as only one is split
+// at a time.
+struct minimizer {
+    struct partition B, C;      // blocks of states, cords of transitions
+    unsigned int *M, *W, w;
+    unsigned int rr;            // #states reached so far
+    unsigned int mm;            // #transitions
+    unsigned int *T, *X, *H;    // tail, symbol, and head of transitions
+    unsigned int *A, *Adj;      // transitions of state q: A[Adj[q]..Adj[q+1])
+    unsigned int nn;
+};
+
+static void mark(struct minimizer *mz, struct partition *p, unsigned int e){
+    unsigned int s = p->S[e], i = p->L[e], j = p->F[s] + mz->M[s];
+    p->E[i] = p->E[j];
+    p->L[p->E[i]] = i;
+    p->E[j] = e;
+    p->L[e] = j;
+    if (mz->M[s]++ == 0) {
+        mz->W[mz->w++] = s;
+    }
+}
+
+static void split(struct minimizer *mz, struct partition *p){
+    while (mz->w > 0) {
+        unsigned int s = mz->W[--mz->w], j = p->F[s] + mz->M[s];
+        if (j == p->P[s]) {
+            mz->M[s] = 0;
+            continue;
+        }
+        // The smaller part becomes the new set
+        unsigned int z = p->z;
+        if (mz->M[s] <= p->P[s] - j) {
+            p->F[z] = p->F[s];
+            p->P[z] = p->F[s] = j;
+        }
+        else {
+            p->P[z] = p->P[s];
+            p->F[z] = p->P[s] = j;
+        }
+        for (unsigned int i = p->F[z]; i < p->P[z]; i++) {
+            p->S[p->E[i]] = z;
+        }
+        mz->M[s] = mz->M[z] = 0;
+        p->z++;
+    }
+}
+
+// Index the transitions by K, which is either T or H
+static void make_adjacent(struct minimizer *mz, const unsigned int *K){
+    for (unsigned int q = 0; q <= mz->nn; q++) {
+        mz->Adj[q] = 0;
+    }
+    for (unsigned int t = 0; t < mz->mm; t++) {
+        mz->Adj[K[t]]++;
+    }
+    for (unsigned int q = 0; q < mz->nn; q++) {
+        mz->Adj[q + 1] += mz->Adj[q];
+    }
+    for (unsigned int t = mz->mm; t-- > 0;) {
+        mz->A[--mz->Adj[K[t]]] = t;
+    }
+}
+
+static void reach(struct minimizer *mz, unsigned int q){
+    struct partition *B = &mz->B;
+    unsigned int i = B->L[q];
+    if (i >= mz->rr) {
+        B->E[i] = B->E[mz->rr];
+        B->L[B->E[i]] = i;
+        B->E[mz->rr] = q;
+        B->L[q] = mz->rr++;
+    }
+}
+
+// Extend the reached states along the transitions from K to J, and remove
+// the states (and their transitions) that were not reached
+static void rem_unreachable(struct minimizer *mz, unsigned int *K, unsigned int *J){
+    struct partition *B = &mz->B;
+    make_adjacent(mz, K);
+    for (unsigned int i = 0; i < mz->rr; i++) {
+        unsigned int q = B->E[i];
+        for (unsigned int j = mz->Adj[q]; j < mz->Adj[q + 1]; j++) {
+            reach(mz, J[mz->A[j]]);
+        }
+    }
+    unsigned int j = 0;
+    for (unsigned int t = 0; t < mz->mm; t++) {
+        if (B->L[K[t]] < mz->rr) {
+            J[j] = J[t];
+            mz->X[j] = mz->X[t];
+            K[j] = K[t];
+            j++;
+        }
+    }
+    mz->mm = j;
+    B->P[0] = mz->rr;
+    mz->rr = 0;
+}
+
+static void minimize(struct bdfa *dfa, unsigned int nsymbols, struct bdfa *min){
+    struct minimizer mz = { .nn = dfa->nstates, .mm = dfa->tv.n };
+    struct partition *B = &mz.B, *C = &mz.C;
+    unsigned int n = mz.nn > mz.mm ? mz.nn : mz.mm;
+
+    mz.T = malloc((mz.mm + 1) * sizeof(unsigned int));
+    mz.X = malloc((mz.mm + 1) * sizeof(unsigned int));
+    mz.H = malloc((mz.mm + 1) * sizeof(unsigned int));
+    for (unsigned int t = 0; t < mz.mm; t++) {
+        mz.T[t] = dfa->tv.v[t].src;
+        mz.X[t] = dfa->tv.v[t].symbol;
+        mz.H[t] = dfa->tv.v[t].dst;
+    }
+    mz.A = malloc((mz.mm + 1) * sizeof(unsigned int));
+    mz.Adj = malloc((mz.nn + 1) * sizeof(unsigned int));
+    mz.M = calloc(n + 1, sizeof(unsigned int));
+    mz.W = malloc((n + 1) * sizeof(unsigned int));
+
+    // Remove the states that cannot be reached from the initial state or
+    // from which no final state can be reached.  The final states end up
+    // in front.
+    partition_init(B, mz.nn);
+    reach(&mz, 0);
+    rem_unreachable(&mz, mz.T, mz.H);
+    for (unsigned int q = 0; q < mz.nn; q++) {
+        if (dfa->final[q] && B->L[q] < B->P[0]) {
+            reach(&mz, q);
+        }
+    }
+    unsigned int ff = mz.rr;
+    rem_unreachable(&mz, mz.H, mz.T);
+
+    // Initial partition: final and non-final states
+    mz.M[0] = ff;
+    if (ff > 0) {
+        mz.W[mz.w++] = 0;
+        split(&mz, B);
+    }
+
+    // Initial cords: the transitions grouped by symbol
+    partition_init(C, mz.mm);
+    if (mz.mm > 0) {
+        unsigned int *count = calloc(nsymbols + 2, sizeof(unsigned int));
+        for (unsigned int t = 0; t < mz.mm; t++) {
+            count[mz.X[t] + 1]++;
+        }
+        for (unsigned int a = 0; a <= nsymbols; a++) {
+            count[a + 1] += count[a];
+        }
+        for (unsigned int t = 0; t < mz.mm; t++) {
+            C->E[count[mz.X[t]]++] = t;
+        }
+        free(count);
+
+        C->z = 0;
+        unsigned int a = mz.X[C->E[0]];
+        for (unsigned int i = 0; i < mz.mm; i++) {
+            unsigned int t = C->E[i];
+            if (mz.X[t] != a) {
+                a = mz.X[t];
+                C->P[C->z++] = i;
+                C->F[C->z] = i;
+                mz.M[C->z] = 0;
+            }
+            C->S[t] = C->z;
+            C->L[t] = i;
+        }
+        C->P[C->z++] = mz.mm;
+    }
+
+    // Split blocks by cords and cords by blocks until nothing changes
+    make_adjacent(&mz, mz.H);
+    unsigned int b = 1, c = 0;
+    while (c < C->z) {
+        for (unsigned int i = C->F[c]; i < C->P[c]; i++) {
+            mark(&mz, B, mz.T[C->E[i]]);
+        }
+        split(&mz, B);
+        c++;
+        while (b < B->z) {
+            for (unsigned int i = B->F[b]; i < B->P[b]; i++) {
+                unsigned int q = B->E[i];
+                for (unsigned int j = mz.Adj[q]; j < mz.Adj[q + 1]; j++) {
+                    mark(&mz, C, mz.A[j]);
+                }
+            }
+            split(&mz, C);
+            b++;
+        }
+    }
+
+    // The blocks are the states of the result, numbered so that the
+    // block of the initial state comes first.  Each block takes the
+    // transitions of its first state.
+    unsigned int init = B->S[0];
+#define BLOCK(s)    ((s) == init ? 0 : (s) == 0 ? init : (s))
+    min->nstates = B->z;
+    min->final = calloc(B->z + 1, sizeof(*min->final));
+    for (unsigned int s = 0; s < B->z; s++) {
+        min->final[BLOCK(s)] = B->F[s] < ff;
+    }
+    for (unsigned int t = 0; t < mz.mm; t++) {
+        unsigned int q = mz.T[t];
+        if (B->L[q] == B->F[B->S[q]]) {
+            btrans_add(&min->tv, BLOCK(B->S[q]), mz.X[t], BLOCK(B->S[mz.H[t]]));
+        }
+    }
+#undef BLOCK
+
+    partition_free(B);
+    partition_free(C);
+    free(mz.T);
+    free(mz.X);
+    free(mz.H);
+    free(mz.A);
+    free(mz.Adj);
+    free(mz.M);
+    free(mz.W);
+}
+
+// Without final states the DFA is not minimized.  Leave out the error
+// states: non-final states all of whose transitions lead to themselves.
+static void remove_error_states(struct bdfa *dfa, unsigned int nsymbols){
+    unsigned int *loops = calloc(dfa->nstates, sizeof(unsigned int));
+    for (unsigned int t = 0; t < dfa->tv.n; t++) {
+        if (dfa->tv.v[t].src == dfa->tv.v[t].dst) {
+            loops[dfa->tv.v[t].src]++;
+        }
+    }
+    unsigned int *name = malloc(dfa->nstates * sizeof(unsigned int));
+    unsigned int n = 0;
+    for (unsigned int q = 0; q < dfa->nstates; q++) {
+        if (q != 0 && !dfa->final[q] && loops[q] == nsymbols) {
+            name[q] = UINT32_MAX;
+        }
+        else {
+            dfa->final[n] = dfa->final[q];
+            name[q] = n++;
+        }
+    }
+    unsigned int j = 0;
+    for (unsigned int t = 0; t < dfa->tv.n; t++) {
+        struct btrans bt = dfa->tv.v[t];
+        if (name[bt.src] != UINT32_MAX && name[bt.dst] != UINT32_MAX) {
+            dfa->tv.v[j].src = name[bt.src];
+            dfa->tv.v[j].symbol = bt.symbol;
+            dfa->tv.v[j].dst = name[bt.dst];
+            j++;
+        }
+    }
+    dfa->tv.n = j;
+    dfa->nstates = n;
+    free(loops);
+    free(name);
+}
+
+struct symbol_values {
+    hvalue_t *values;
+    unsigned int n;
+};
+
+static void symbol_value(void *env, const void *key, unsigned int key_size, void *value){
+    struct symbol_values *sv = env;
+    unsigned int id = (unsigned int) (uintptr_t) value;
+
+    assert(key_size == sizeof(hvalue_t));
+    assert(id <= sv->n);
+    sv->values[id] = * (const hvalue_t *) key;
+}
+
+static void symbol_count(void *env, const void *key, unsigned int key_size, void *value){
+    unsigned int *n = env;
+    (*n)++;
+}
+
+static void write_hfa(FILE *out, struct bdfa *dfa, hvalue_t *values){
+    fprintf(out, "{\n");
+    fprintf(out, "  \"initial\": \"0\",\n");
+    fprintf(out, "  \"nodes\": [\n");
+    for (unsigned int q = 0; q < dfa->nstates; q++) {
+        fprintf(out, "    {\n");
+        fprintf(out, "      \"idx\": \"%u\",\n", q);
+        fprintf(out, "      \"type\": \"%s\"\n", dfa->final[q] ? "final" : "normal");
+        fprintf(out, "    }%s\n", q + 1 < dfa->nstates ? "," : "");
+    }
+    fprintf(out, "  ],\n");
+    fprintf(out, "  \"edges\": [\n");
+    for (unsigned int t = 0; t < dfa->tv.n; t++) {
+        struct btrans *bt = &dfa->tv.v[t];
+        char *p = value_json(values[bt->symbol]);
+        fprintf(out, "    {\n");
+        fprintf(out, "      \"src\": \"%u\",\n", bt->src);
+        fprintf(out, "      \"dst\": \"%u\",\n", bt->dst);
+        fprintf(out, "      \"symbol\": %s\n", p);
+        fprintf(out, "    }%s\n", t + 1 < dfa->tv.n ? "," : "");
+        free(p);
+    }
+    fprintf(out, "  ]\n");
+    fprintf(out, "}\n");
+}
+
+static void write_gv(FILE *out, struct bdfa *dfa, hvalue_t *values){
+    fprintf(out, "digraph {\n");
+    fprintf(out, "  rankdir = \"LR\"\n");
+    for (unsigned int q = 0; q < dfa->nstates; q++) {
+        if (q == 0) {
+            fprintf(out, "  s0 [label=\"initial\",style=filled,%sfillcolor=\"#66cc33\"]\n",
+                                dfa->final[q] ? "peripheries=2," : "");
+        }
+        else if (dfa->final[q]) {
+            fprintf(out, "  s%u [peripheries=2,label=\"final\"]\n", q);
+        }
+        else {
+            fprintf(out, "  s%u [label=\"\"]\n", q);
+        }
+    }
+    for (unsigned int t = 0; t < dfa->tv.n; t++) {
+        struct btrans *bt = &dfa->tv.v[t];
+        char *s = value_string(values[bt->symbol]);
+        char *label = json_escape(s, strlen(s));
+        fprintf(out, "  s%u -> s%u [label=\"%s\"]\n", bt->src, bt->dst, label);
+        free(label);
+        free(s);
+    }
+    fprintf(out, "}\n");
+}
+
+static FILE *behavior_create(const char *file){
+    FILE *out = fopen(file, "w");
+    if (out == NULL) {
+        fprintf(stderr, "charm: can't create %s\n", file);
+        exit(1);
+    }
+    return out;
+}
+
+void behavior_write(struct graph_t *graph, struct dict *symbols,
+                                const char *hfafile, const char *gvfile){
+    struct nfa nfa;
+    memset(&nfa, 0, sizeof(nfa));
+    nfa_build(&nfa, graph, symbols);
+    printf("convert NFA (%u states) to DFA\n", nfa.nstates);
+    fflush(stdout);
+
+    struct bdfa dfa;
+    memset(&dfa, 0, sizeof(dfa));
+    nfa_to_dfa(&nfa, &dfa);
+
+    struct symbol_values sv = { .n = 0 };
+    dict_iter(symbols, symbol_count, &sv.n);
+    sv.values = calloc(sv.n + 1, sizeof(*sv.values));
+    dict_iter(symbols, symbol_value, &sv);
+
+    bool any_final = false;
+    for (unsigned int q = 0; q < dfa.nstates; q++) {
+        any_final = any_final || dfa.final[q];
+    }
+    struct bdfa *result = &dfa, min;
+    memset(&min, 0, sizeof(min));
+    if (any_final) {
+        printf("minify #states=%u\n", dfa.nstates);
+        minimize(&dfa, sv.n, &min);
+        printf("minify done #states=%u\n", min.nstates);
+        result = &min;
+    }
+    else {
+        remove_error_states(&dfa, sv.n);
+    }
+
+    if (hfafile != NULL) {
+        FILE *out = behavior_create(hfafile);
+        write_hfa(out, result, sv.values);
+        fclose(out);
+    }
+    if (gvfile != NULL) {
+        FILE *out = behavior_create(gvfile);
+        write_gv(out, result, sv.values);
+        fclose(out);
+    }
+
+    free(nfa.final);
+    free(nfa.first);
+    free(nfa.trans);
+    free(dfa.final);
+    free(dfa.tv.v);
+    free(min.final);
+    free(min.tv.v);
+    free(sv.values);
+}
@@ -0,0 +1,16 @@
+#ifndef SRC_BEHAVIOR_H
+#define SRC_BEHAVIOR_H
+
+#include "graph.h"
+#include "hashdict.h"
+
+// Compute the behavior of the model: the minimal DFA that accepts the
+// sequences of printed values along the paths from the initial state to a
+// terminal state.  The graph must have been destuttered (destutter1) and
+// symbols maps each printed value to its id (collect_symbols).  The DFA is
+// written in the .hfa format to hfafile and in the dot format to gvfile,
+// either of which may be NULL.
+void behavior_write(struct graph_t *graph, struct dict *symbols,
+                                const char *hfafile, const char *gvfile);
+
+#endif //SRC_BEHAVIOR_H
@@ -11,6 +11,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include <inttypes.h>
+#include <limits.h>
 #include <errno.h>
 #include <assert.h>
 #include <time.h>
@@ -27,16 +28,47 @@
 #include "dfa.h"
 #include "thread.h"
 #include "spawn.h"
+#include "checkpoint.h"
+#include "hvm.h"
+#include "hco.h"
+#include "behavior.h"
 
 #define WALLOC_CHUNK    (1024 * 1024)
+#define DISK_BATCH      64          // #records a worker reads at a time
+#define SWARM_TABLE     (1 << 24)   // default bitstate table size per search
+#define SWARM_DEPTH     10000       // default depth bound per search
+#define CHECKPOINT_INTERVAL 600     // default #seconds between checkpoints
+
+// What the memory that the workers allocate with walloc is used for
+enum walloc_use {
+    WA_TABLES,          // values and hash table entries
+    WA_NODES,
+    WA_EDGES,
+    WA_ACCESSES,        // loads and stores, for data race detection
+    WA_LOGS,            // print history
+    WA_TRAILS,
+    WA_FAILURES,
+    WA_NUSES
+};
+
+static const char *walloc_names[WA_NUSES] = {
+    "tables", "nodes", "edges", "accesses", "logs", "trails", "failures"
+};
 
 // For -d option
 unsigned int run_count;  // counter of #threads
 mutex_t run_mutex;       // to protect count
 mutex_t run_waiting;     // for main thread to wait on
 
-mutex_t todo_lock;
-struct node *todo_list;
+// Per-worker queue of nodes to explore in the current epoch.  The owner
+// takes nodes from the head.  An idle worker steals half of the remaining
+// nodes from the tail of some other worker's deque.
+struct deque {
+    mutex_t lock;
+    struct node **nodes;
+    unsigned int head, tail;     // nodes[head..tail) are waiting
+    unsigned int alloc_size;     // size allocated
+};
 
 // One of these per worker thread
 struct worker {
@@ -48,19 +80,46 @@ struct worker {
 
     unsigned int index;          // index of worker
     unsigned int nworkers;       // total number of workers
+    struct worker *workers;      // all workers, for stealing
+    struct deque deque;          // nodes to explore
+    unsigned int nsteals;        // #successful steals
+    unsigned int nidle;          // #times no work could be found
+    unsigned int nresults;       // #nodes in results
     int timecnt;                 // to reduce gettime() overhead
     struct step inv_step;        // for evaluating invariants
+    struct access_info *ai;      // accesses made by the current step
+    unsigned int nai, alloc_ai;  // #accesses, #allocated
+    struct edge *edges;          // edges out of the node being explored
+    unsigned int nedges, alloc_edges; // #edges, #allocated
 
     // for dict_make_stable and dict_set_sequential
     unsigned int nstable;
     struct value_stable vs;     // TODO: dict stable counters
 
+    struct disk_record *disk_buf; // disk mode: batch of records to explore
+    unsigned int disk_n, disk_i;  // #records in disk_buf, next one
+
+    struct fpset *fpset;        // fingerprints (swarm mode: of this search)
+    uint64_t seed;              // swarm mode: random number generator state
+    struct node *root;          // swarm mode: the initial state
+    struct swarm_frame *frames; // swarm mode: depth-first search stack
+    int depth;                  // swarm mode: top of stack, -1 if no search
+    bool *pcs;                  // swarm mode: instructions executed
+    unsigned int nruns;         // swarm mode: #searches completed
+    uint64_t nvisits;           // swarm mode: #states visited by them
+
+    struct minheap *found;      // phase 3: failures found by this worker
+    uint64_t *onpath;           // phase 3: bitmap of nodes on busy-wait path
+
     struct node *results;       // list of resulting states
     struct node **last;         // to keep track of end
     struct failure *failures;   // list of failures
 
     char *alloc_buf;            // allocated buffer
     char *alloc_ptr;            // pointer into allocated buffer
+    char *ai_chunks;            // list of buffers for access info
+    char *ai_ptr, *ai_end;      // free space in the current one
+    uint64_t nbytes[WA_NUSES];  // #bytes allocated, by use
 
     struct allocator allocator; // mostly for hashdict
 
@@ -69,16 +128,36 @@ struct worker {
     hvalue_t stack[MAX_CONTEXT_STACK];
 };
 
-// Per thread one-time memory allocator (no free)
-static void *walloc(void *ctx, unsigned int size, bool zero){
-    struct worker *w = ctx;
+// Swarm mode: a level of the depth-first search stack
+struct swarm_frame {
+    struct node *node;          // the state
+    struct node **succ;         // its successors, in random order
+    unsigned int nsucc, next;   // #successors, next one to explore
+};
+
+// Count memory that a worker allocated against the budget (-Xmem).  Once
+// over the limit, the workers go to the barriers so that the main thread can
+// decide what to do about it (see mem_check()).
+static void mem_account(struct worker *w, int64_t n){
+    struct global_t *global = w->global;
+    int64_t used = atomic_add64(&global->mem_used, n);
+    if (global->mem_budget != 0 &&
+                (uint64_t) used + global->mem_tables >= global->mem_limit) {
+        global->pause = true;
+    }
+}
 
+// Per thread one-time memory allocator (no free)
+static void *walloc_use(struct worker *w, enum walloc_use use, unsigned int size, bool zero){
+    w->nbytes[use] += size;
     if (size > WALLOC_CHUNK) {
         printf("BIG\n");
+        mem_account(w, size);
         return zero ? calloc(1, size) : malloc(size);
     }
     size = (size + 0xF) & ~0xF;     // align to 16 bytes
     if (w->alloc_ptr + size > w->alloc_buf + WALLOC_CHUNK) {
+        mem_account(w, WALLOC_CHUNK);
         w->alloc_buf = malloc(WALLOC_CHUNK);
         w->alloc_ptr = w->alloc_buf;
     }
@@ -90,6 +169,118 @@ static void *walloc(void *ctx, unsigned int size, bool zero){
     return result;
 }
 
+// Access info is only needed until the check for data races, so it is
+// allocated separately and released once that is done.  The first word of
+// each buffer points to the previous one, and the second holds its size.
+static void *walloc_access(struct worker *w, unsigned int size){
+    w->nbytes[WA_ACCESSES] += size;
+    size = (size + 0xF) & ~0xF;     // align to 16 bytes
+    if ((size_t) (w->ai_end - w->ai_ptr) < size) {
+        size_t n = size + 16 > WALLOC_CHUNK ? size + 16 : WALLOC_CHUNK;
+        mem_account(w, n);
+        char *buf = malloc(n);
+        * (char **) buf = w->ai_chunks;
+        * (size_t *) (buf + sizeof(char *)) = n;
+        w->ai_chunks = buf;
+        w->ai_ptr = buf + 16;
+        w->ai_end = buf + n;
+    }
+    void *result = w->ai_ptr;
+    w->ai_ptr += size;
+    return result;
+}
+
+// Release the access info.  The ai fields of the edges are no longer valid.
+static void walloc_access_free(struct worker *w){
+    while (w->ai_chunks != NULL) {
+        char *buf = w->ai_chunks;
+        w->ai_chunks = * (char **) buf;
+        w->global->mem_used -= * (size_t *) (buf + sizeof(char *));
+        free(buf);
+    }
+    w->ai_ptr = w->ai_end = NULL;
+}
+
+// Allocator for the value and hash tables
+static void *walloc(void *ctx, unsigned int size, bool zero){
+    return walloc_use(ctx, WA_TABLES, size, zero);
+}
+
+static struct failure *failure_alloc(struct worker *w){
+    return walloc_use(w, WA_FAILURES, sizeof(struct failure), true);
+}
+
+// Add a node to the tail of the deque.  In the concurrent phase (async mode
+// only) the caller must hold the lock.
+static void deque_push(struct deque *dq, struct node *node){
+    if (dq->head == dq->tail) {
+        dq->head = dq->tail = 0;
+    }
+    if (dq->tail == dq->alloc_size) {
+        dq->alloc_size = (dq->alloc_size + 1) * 2;
+        dq->nodes = realloc(dq->nodes, dq->alloc_size * sizeof(*dq->nodes));
+    }
+    dq->nodes[dq->tail++] = node;
+}
+
+// Take a node from the head of the worker's own deque
+static struct node *deque_pop(struct worker *w){
+    struct deque *dq = &w->deque;
+    struct node *node = NULL;
+
+    mutex_acquire(&dq->lock);
+    if (dq->head < dq->tail) {
+        node = dq->nodes[dq->head++];
+    }
+    mutex_release(&dq->lock);
+    return node;
+}
+
+// Move half of the nodes in the deque of some other worker to the (empty)
+// deque of this worker.  Returns false if there is nothing left to steal.
+// Unless in async mode, no new nodes are added to deques during an epoch,
+// so if all deques are empty the epoch is done for this worker.
+static bool deque_steal(struct worker *w){
+    struct deque *mine = &w->deque;
+
+    for (unsigned int i = 1; i < w->nworkers; i++) {
+        struct worker *victim = &w->workers[(w->index + i) % w->nworkers];
+        struct deque *theirs = &victim->deque;
+
+        // The victim's head and tail are only looked at with its lock held.
+        // Acquire the locks in order of worker index to avoid deadlock.
+        if (victim->index < w->index) {
+            mutex_acquire(&theirs->lock);
+            mutex_acquire(&mine->lock);
+        }
+        else {
+            mutex_acquire(&mine->lock);
+            mutex_acquire(&theirs->lock);
+        }
+        unsigned int n = (theirs->tail - theirs->head + 1) / 2;
+        if (n > 0) {
+            assert(mine->head == mine->tail);
+            if (n > mine->alloc_size) {
+                mine->alloc_size = n * 2;
+                free(mine->nodes);
+                mine->nodes = malloc(mine->alloc_size * sizeof(*mine->nodes));
+            }
+            theirs->tail -= n;
+            memcpy(mine->nodes, &theirs->nodes[theirs->tail],
+                                n * sizeof(*mine->nodes));
+            mine->head = 0;
+            mine->tail = n;
+        }
+        mutex_release(&theirs->lock);
+        mutex_release(&mine->lock);
+        if (n > 0) {
+            w->nsteals++;
+            return true;
+        }
+    }
+    return false;
+}
+
 static void run_thread(struct global_t *global, struct state *state, struct context *ctx){
     struct step step;
     memset(&step, 0, sizeof(step));
@@ -172,7 +363,7 @@ bool invariant_check(struct global_t *global, struct state *state, struct step *
 
 bool check_invariants(struct worker *w, struct node *node, struct step *step){
     struct global_t *global = w->global;
-    struct state *state = &node->state;
+    struct state *state = node->state;
     extern int invariant_cnt(const void *env);
 
     assert(VALUE_TYPE(state->invariants) == VALUE_SET);
@@ -197,13 +388,130 @@ bool check_invariants(struct worker *w, struct node *node, struct step *step){
     return true;
 }
 
-static void *node_alloc(void *ctx){
-    struct node *node = ctx == NULL ? malloc(sizeof(struct node)) :
-                    walloc(ctx, sizeof(struct node), false);
-    memset(node, 0, sizeof(*node));
+// A node in the graph refers to its state in the table of visited states.
+// Without a worker, the node is not in the graph, and a copy of the state
+// is allocated along with it, so that it can be released with free().
+static struct node *node_alloc(struct worker *w, struct state *state){
+    struct node *node;
+    if (w == NULL) {
+        node = malloc(sizeof(struct node) + sizeof(struct state));
+        memset(node, 0, sizeof(*node));
+        node->state = (struct state *) (node + 1);
+        *node->state = *state;
+    }
+    else {
+        node = walloc_use(w, WA_NODES, sizeof(struct node), false);
+        memset(node, 0, sizeof(*node));
+        node->state = state;
+    }
     return node;
 }
 
+// Whether the node is in the graph.  Nodes that are not are freed once they
+// have been explored.
+static bool node_in_graph(struct global_t *global, struct node *node){
+    return node->id < global->graph.size && global->graph.nodes[node->id] == node;
+}
+
+// In hash-compaction, bitstate, and disk mode there is no graph.  Only new
+// states (and failures) are recorded, without edges, and the node is
+// freed once it has been explored.
+static void onestep_compact(
+    struct worker *w,
+    struct node *node,
+    struct state *sc,
+    hvalue_t ctx,
+    hvalue_t choice,
+    bool interrupt,
+    hvalue_t after,
+    int weight,
+    int instrcnt,
+    bool failure,
+    bool infinite_loop
+) {
+    struct global_t *global = w->global;
+
+    // After switching to hash compaction (see mem_compact()), the states
+    // found before are still in the table of visited states
+    if (global->mem_level == MEM_COMPACT && !failure &&
+                dict_lookup(w->visited, sc, sizeof(*sc)) != NULL) {
+        return;
+    }
+
+    if (w->fpset != NULL &&
+            !fpset_insert(w->fpset, sc, sizeof(*sc)) && !failure) {
+        return;
+    }
+
+    // In swarm mode the global set keeps track of all the states seen
+    if (global->swarm != 0) {
+        (void) fpset_insert(global->fpset, sc, sizeof(*sc));
+    }
+
+    struct node *next = node_alloc(NULL, sc);
+    next->trail = NULL;
+    next->before = ctx;
+    next->choice = choice;
+    next->interrupt = interrupt;
+    next->after = after;
+    next->len = node->len + weight;
+    next->steps = node->steps + instrcnt;
+
+    enum fail_type type = FAIL_NONE;
+    if (failure) {
+        type = infinite_loop ? FAIL_TERMINATION : FAIL_SAFETY;
+    }
+    else if (sc->choosing == 0 && sc->invariants != VALUE_SET &&
+                                !check_invariants(w, next, &w->inv_step)) {
+        type = FAIL_INVARIANT;
+    }
+
+    // In disk mode whether the state is new is only known at the end of
+    // the layer, so all successors are written out
+    if (type == FAIL_NONE && global->disk != NULL) {
+        struct disk_record rec;
+        rec.state = *sc;
+        rec.trail.parent = node->trail;
+        rec.trail.ctx = ctx;
+        rec.trail.choice = choice;
+        rec.trail.interrupt = interrupt;
+        disk_add(global->disk, w->index, &rec);
+        free(next);
+        return;
+    }
+
+    // In swarm mode the trail is freed when the search backtracks
+    struct trail *trail = global->swarm != 0 ? malloc(sizeof(struct trail)) :
+                                walloc_use(w, WA_TRAILS, sizeof(struct trail), false);
+    trail->parent = node->trail;
+    trail->ctx = ctx;
+    trail->choice = choice;
+    trail->interrupt = interrupt;
+    next->trail = trail;
+
+    if (type != FAIL_NONE) {
+        struct failure *f = failure_alloc(w);
+        f->type = type;
+        f->choice = choice;
+        f->interrupt = interrupt;
+        f->node = next;
+        f->next = w->failures;
+        w->failures = f;
+    }
+    else if (global->async) {
+        w->nresults++;
+        atomic_add64(&global->pending, 1);
+        mutex_acquire(&w->deque.lock);
+        deque_push(&w->deque, next);
+        mutex_release(&w->deque.lock);
+    }
+    else {
+        *w->last = next;
+        w->last = &next->next;
+        w->nresults++;
+    }
+}
+
 static bool onestep(
     struct worker *w,       // thread info
     struct node *node,      // starting node
@@ -246,14 +554,32 @@ static bool onestep(
             if (now - global->lasttime > 1) {
                 if (global->lasttime != 0) {
                     char *p = value_string(step->ctx->name);
-                    fprintf(stderr, "%s pc=%d states=%d diameter=%u queue=%d\n",
-                            p, step->ctx->pc, global->enqueued, global->diameter, global->enqueued - global->dequeued);
+                    // In swarm mode there is no queue
+                    if (global->swarm != 0) {
+                        int64_t started = global->nextrun;
+                        if (started > global->swarm) {
+                            started = global->swarm;
+                        }
+                        fprintf(stderr, "%s pc=%d states=%d searches=%d/%u\n",
+                                p, step->ctx->pc, global->enqueued,
+                                (int) started, global->swarm);
+                    }
+                    else {
+                        fprintf(stderr, "%s pc=%d states=%d diameter=%u queue=%d\n",
+                                p, step->ctx->pc, global->enqueued, global->diameter, global->enqueued - global->dequeued);
+                    }
                     free(p);
                 }
                 global->lasttime = now;
-                if (now > w->timeout) {
-                    fprintf(stderr, "charm: timeout exceeded\n");
-                    exit(1);
+                if (now > w->timeout && global->swarm == 0) {
+                    // With checkpoints, stop at the end of the epoch so
+                    // that a last one can be written
+                    if (global->checkpoint == NULL) {
+                        fprintf(stderr, "charm: timeout exceeded\n");
+                        exit(1);
+                    }
+                    global->timedout = true;
+                    global->pause = true;
                 }
             }
             w->timecnt = 100;
@@ -261,6 +587,9 @@ static bool onestep(
 
         struct instr_t *instrs = global->code.instrs;
         struct op_info *oi = instrs[pc].oi;
+        if (w->pcs != NULL) {
+            w->pcs[pc] = true;
+        }
         if (instrs[pc].choose) {
             assert(step->ctx->sp > 0);
             step->ctx->stack[step->ctx->sp - 1] = choice;
@@ -287,12 +616,26 @@ static bool onestep(
         }
         else {
             // Keep track of access for data race detection
-            if (instrs[pc].load || instrs[pc].store || instrs[pc].del) {
-                struct access_info *ai = graph_ai_alloc(multiplicity, step->ctx->atomic, pc);
-                ai->next = step->ai;
-                step->ai = ai;
+            if (global->fpset == NULL && global->disk == NULL &&
+                    (instrs[pc].load || instrs[pc].store || instrs[pc].del)) {
+                if (w->nai == w->alloc_ai) {
+                    w->alloc_ai = w->alloc_ai == 0 ? 16 : 2 * w->alloc_ai;
+                    w->ai = realloc(w->ai, w->alloc_ai * sizeof(*w->ai));
+                }
+                step->ai = &w->ai[w->nai];
+                memset(step->ai, 0, sizeof(*step->ai));
+                step->ai->multiplicity = multiplicity;
+                step->ai->atomic = step->ctx->atomic;
+                step->ai->pc = pc;
             }
             (*oi->op)(instrs[pc].env, sc, step, global);
+            if (step->ai != NULL) {
+                // keep it only if the operation filled it in
+                if (step->ai->indices != NULL) {
+                    w->nai++;
+                }
+                step->ai = NULL;
+            }
         }
 		assert(step->ctx->pc >= 0);
 		assert(step->ctx->pc < global->code.len);
@@ -463,24 +806,63 @@ static bool onestep(
         sc->ctxbag = value_bag_add(&step->engine, sc->ctxbag, after, 1);
     }
 
+    // Replace the state by the representative of its symmetry class.  The
+    // context that made the step is renamed along with it.
+    unsigned int perm = 0;
+    if (global->symmetry != NULL) {
+        struct symmetry *sym = global->symmetry;
+        perm = symmetry_canon(sym, &step->engine, sc);
+        if (perm != 0) {
+            after = symmetry_map(sym, &step->engine, after, &sym->perms[perm * sym->natoms]);
+        }
+    }
+
     // Weight of this step
     int weight = ctx == node->after ? 0 : 1;
 
-    // Allocate edge now
-    struct edge *edge = walloc(w, sizeof(struct edge), false);
+    if (global->fpset != NULL || global->disk != NULL) {
+        onestep_compact(w, node, sc, ctx, choice_copy, interrupt, after,
+                            weight, instrcnt, failure, infinite_loop);
+        step->nlog = 0;
+        return true;
+    }
+
+    // Add an edge.  The edges out of a node are collected here until the
+    // node has been explored (see explore()).
+    if (w->nedges == w->alloc_edges) {
+        w->alloc_edges = (w->alloc_edges + 1) * 2;
+        w->edges = realloc(w->edges, w->alloc_edges * sizeof(struct edge));
+    }
+    struct edge *edge = &w->edges[w->nedges++];
     edge->ctx = ctx;
     edge->choice = choice_copy;
     edge->interrupt = interrupt;
+    edge->perm = perm;
+    edge->steps = instrcnt;
     edge->after = after;
-    edge->ai = step->ai;
-    edge->log = step->log;
+    edge->nai = w->nai;
+    if (w->nai == 0 || global->mem_level >= MEM_NO_ACCESSES) {
+        edge->ai = NULL;
+    }
+    else {
+        edge->ai = walloc_access(w, w->nai * sizeof(struct access_info));
+        memcpy(edge->ai, w->ai, w->nai * sizeof(struct access_info));
+    }
     edge->nlog = step->nlog;
+    if (step->nlog == 0 || global->mem_level >= MEM_NO_EDGES) {
+        edge->log = NULL;
+    }
+    else {
+        edge->log = walloc_use(w, WA_LOGS, step->nlog * sizeof(hvalue_t), false);
+        memcpy(edge->log, step->log, step->nlog * sizeof(hvalue_t));
+    }
 
     // See if this state has been computed before
     struct keynode *k = dict_find_lock(w->visited, &w->allocator,
                 sc, sizeof(struct state));
     struct node *next = k->value;
-    if (next != NULL) {
+    bool new_node = next == NULL;
+    if (!new_node) {
         int len = node->len + weight;
         int steps = node->steps + instrcnt;
         if (len < next->len || (len == next->len && steps < next->steps)) {
@@ -491,56 +873,63 @@ static bool onestep(
             next->after = after;
             next->choice = choice_copy;
             next->interrupt = interrupt;
+            next->perm = perm;
         }
     }
     else {
-        next = node_alloc(w);
+        next = node_alloc(w, dict_retrieve(k, NULL));
         next->parent = node;
-        next->state = *sc;
         next->before = ctx;
         next->choice = choice_copy;
         next->interrupt = interrupt;
+        next->perm = perm;
         next->after = after;
         next->len = node->len + weight;
         next->steps = node->steps + instrcnt;
         *w->last = next;
         w->last = &next->next;
+        w->nresults++;
         k->value = next;
     }
 
     if (failure) {
-        struct failure *f = new_alloc(struct failure);
+        struct failure *f = failure_alloc(w);
         f->type = infinite_loop ? FAIL_TERMINATION : FAIL_SAFETY;
         f->choice = choice_copy;
         f->interrupt = interrupt;
+        f->perm = perm;
         f->parent = node;
         f->node = next;
         f->next = w->failures;
         w->failures = f;
     }
-    else if (sc->choosing == 0 && sc->invariants != VALUE_SET) {
-        if (!check_invariants(w, next, &w->inv_step)) {
-            struct failure *f = new_alloc(struct failure);
-            f->type = FAIL_INVARIANT;
-            f->choice = choice_copy;
-            f->interrupt = interrupt;
-            f->parent = node;
-            f->node = next;
-            f->next = w->failures;
-            w->failures = f;
-        }
+    else if (sc->choosing == 0 && sc->invariants != VALUE_SET &&
+                                !check_invariants(w, next, &w->inv_step)) {
+        struct failure *f = failure_alloc(w);
+        f->type = FAIL_INVARIANT;
+        f->choice = choice_copy;
+        f->interrupt = interrupt;
+        f->perm = perm;
+        f->parent = node;
+        f->node = next;
+        f->next = w->failures;
+        w->failures = f;
+    }
+    else if (global->async && new_node) {
+        // In async mode the new node can be explored right away
+        atomic_add64(&global->pending, 1);
+        mutex_acquire(&w->deque.lock);
+        deque_push(&w->deque, next);
+        mutex_release(&w->deque.lock);
     }
 
-    // Backward edge from node to parent.
     edge->src = node;
-    edge->bwdnext = next->bwd;
-    next->bwd = edge;
+    edge->dst = next;
 
     dict_find_release(w->visited, k);
 
-    // We stole the access info and log
-    step->ai = NULL;
-    step->log = NULL;
+    // The access info and log have been copied
+    w->nai = 0;
     step->nlog = 0;
 
     return true;
@@ -557,9 +946,10 @@ static void make_step(
     memset(&step, 0, sizeof(step));
     step.engine.allocator = &w->allocator;
     step.engine.values = &w->global->values;
+    w->nai = 0;
 
     // Make a copy of the state
-    struct state sc = node->state;
+    struct state sc = *node->state;
 
     // Make a copy of the context
     unsigned int size;
@@ -574,7 +964,7 @@ static void make_step(
             (void) onestep(w, node, &sc, ctx, &step, choice, true, true, multiplicity);
         }
 
-        sc = node->state;
+        sc = *node->state;
         memcpy(&w->ctx, cc, size);
     }
 
@@ -583,6 +973,7 @@ static void make_step(
     if (!succ) {        // ran into an infinite loop
         (void) onestep(w, node, &sc, ctx, &step, choice, false, true, multiplicity);
     }
+    free(step.log);
 }
 
 void print_vars(FILE *file, hvalue_t v){
@@ -717,21 +1108,17 @@ bool print_trace(
 }
 
 char *ctx_status(struct node *node, hvalue_t ctx) {
-    if (node->state.choosing == ctx) {
+    if (node->state->choosing == ctx) {
         return "choosing";
     }
-    while (node->state.choosing != 0) {
+    while (node->state->choosing != 0) {
         node = node->parent;
     }
-    struct edge *edge;
-    for (edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
-        if (edge->ctx == ctx) {
-            break;
+    for (unsigned int i = 0; i < node->nfwd; i++) {
+        if (node->fwd[i].ctx == ctx) {
+            return node->fwd[i].dst == node ? "blocked" : "runnable";
         }
     }
-    if (edge != NULL && edge->dst == node) {
-        return "blocked";
-    }
     return "runnable";
 }
 
@@ -821,7 +1208,19 @@ void print_context(
         fprintf(file, "          \"mode\": \"stopped\",\n");
     }
     else {
-        fprintf(file, "          \"mode\": \"%s\",\n", ctx_status(node, ctx));
+        // The node may hold a renamed representative of the state
+        hvalue_t nctx = ctx;
+        struct symmetry *sym = global->symmetry;
+        if (sym != NULL) {
+            struct engine engine;
+            engine.allocator = NULL;
+            engine.values = &global->values;
+            unsigned int *inv = malloc(sym->natoms * sizeof(unsigned int));
+            symmetry_invert(sym, inv, global->symmap);
+            nctx = symmetry_map(sym, &engine, ctx, inv);
+            free(inv);
+        }
+        fprintf(file, "          \"mode\": \"%s\",\n", ctx_status(node, nctx));
     }
 
 #ifdef notdef
@@ -849,16 +1248,16 @@ void print_context(
 void print_state(
     struct global_t *global,
     FILE *file,
-    struct node *node
+    struct node *node,
+    struct state *state     // actual state (node may hold a representative)
 ) {
 
 #ifdef notdef
     fprintf(file, "      \"shared\": ");
-    print_vars(file, node->state.vars);
+    print_vars(file, node->state->vars);
     fprintf(file, ",\n");
 #endif
 
-    struct state *state = &node->state;
     extern int invariant_cnt(const void *env);
     struct step inv_step;
     memset(&inv_step, 0, sizeof(inv_step));
@@ -1053,6 +1452,7 @@ hvalue_t twostep(
     struct global_t *global,
     FILE *file,
     struct node *node,
+    struct state *state,
     hvalue_t ctx,
     hvalue_t choice,
     bool interrupt,
@@ -1063,7 +1463,7 @@ hvalue_t twostep(
 ){
     // Make a copy of the state
     struct state *sc = new_alloc(struct state);
-    *sc = node->state;
+    *sc = *state;
     sc->choosing = 0;
 
     struct step step;
@@ -1217,7 +1617,8 @@ void path_dump(
     struct state *oldstate,
     struct context **oldctx,
     bool interrupt,
-    int nsteps
+    int nsteps,
+    unsigned int perm
 ) {
     struct node *node = last;
 
@@ -1226,17 +1627,29 @@ void path_dump(
         fprintf(file, "\n");
     }
     else {
-        path_dump(global, file, last, last->parent, last->choice, oldstate, oldctx, last->interrupt, last->steps);
+        path_dump(global, file, last, last->parent, last->choice, oldstate, oldctx, last->interrupt, last->steps, last->perm);
         fprintf(file, ",\n");
     }
 
+    // With symmetry reduction the nodes hold representatives.  Rename the
+    // state of the parent, and the context, into the actual ones.
+    struct state state = *last->state;
+    hvalue_t ctx = node->before;
+    struct symmetry *sym = global->symmetry;
+    struct engine engine;
+    engine.allocator = NULL;
+    engine.values = &global->values;
+    if (sym != NULL) {
+        symmetry_map_state(sym, &engine, &state, global->symmap);
+        ctx = symmetry_map(sym, &engine, ctx, global->symmap);
+    }
+
     fprintf(file, "    {\n");
     fprintf(file, "      \"id\": \"%d\",\n", node->id);
     fprintf(file, "      \"len\": \"%d\",\n", node->len);
 
     /* Find the starting context in the list of processes.
      */
-    hvalue_t ctx = node->before;
     int pid;
     for (pid = 0; pid < global->nprocesses; pid++) {
         if (global->processes[pid] == ctx) {
@@ -1273,21 +1686,29 @@ void path_dump(
         global,
         file,
         last,
+        &state,
         ctx,
         choice,
         interrupt,
         oldstate,
         oldctx,
-        node->state.vars,
+        node->state->vars,
         nsteps
     );
     fprintf(file, "\n      ],\n");
 
+    // The renaming for the resulting node
+    state = *node->state;
+    if (sym != NULL) {
+        symmetry_undo(sym, global->symmap, perm);
+        symmetry_map_state(sym, &engine, &state, global->symmap);
+    }
+
     /* Match each context to a process.
      */
     bool *matched = calloc(global->nprocesses, sizeof(bool));
     unsigned int nctxs;
-    hvalue_t *ctxs = value_get(node->state.ctxbag, &nctxs);
+    hvalue_t *ctxs = value_get(state.ctxbag, &nctxs);
     nctxs /= sizeof(hvalue_t);
     for (unsigned int i = 0; i < nctxs; i += 2) {
         assert(VALUE_TYPE(ctxs[i]) == VALUE_CONTEXT);
@@ -1312,7 +1733,7 @@ void path_dump(
     }
     free(matched);
   
-    print_state(global, file, node);
+    print_state(global, file, node, &state);
     fprintf(file, "    }");
 }
 
@@ -1406,7 +1827,14 @@ static void enum_loc(
 }
 
 enum busywait { BW_ESCAPE, BW_RETURN, BW_VISITED };
+
+// The nodes on the current path are marked in a bitmap (one per worker)
+#define ONPATH(p, id)       ((p)[(id) / 64] & ((uint64_t) 1 << ((id) % 64)))
+#define ONPATH_SET(p, id)   ((p)[(id) / 64] |= ((uint64_t) 1 << ((id) % 64)))
+#define ONPATH_CLR(p, id)   ((p)[(id) / 64] &= ~((uint64_t) 1 << ((id) % 64)))
+
 static enum busywait is_stuck(
+    uint64_t *onpath,
     struct node *start,
     struct node *node,
     hvalue_t ctx,
@@ -1415,30 +1843,30 @@ static enum busywait is_stuck(
 	if (node->component != start->component) {
 		return BW_ESCAPE;
 	}
-	if (node->visited) {
+	if (ONPATH(onpath, node->id)) {
 		return BW_VISITED;
 	}
-    change = change || (node->state.vars != start->state.vars);
-	node->visited = true;
+    change = change || (node->state->vars != start->state->vars);
+	ONPATH_SET(onpath, node->id);
 	enum busywait result = BW_ESCAPE;
-    for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
+    for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
         if (edge->ctx == ctx) {
 			if (edge->dst == node) {
-				node->visited = false;
+				ONPATH_CLR(onpath, node->id);
 				return BW_ESCAPE;
 			}
 			if (edge->dst == start) {
 				if (!change) {
-					node->visited = false;
+					ONPATH_CLR(onpath, node->id);
 					return BW_ESCAPE;
 				}
 				result = BW_RETURN;
 			}
 			else {
-				enum busywait bw = is_stuck(start, edge->dst, edge->after, change);
+				enum busywait bw = is_stuck(onpath, start, edge->dst, edge->after, change);
 				switch (bw) {
 				case BW_ESCAPE:
-					node->visited = false;
+					ONPATH_CLR(onpath, node->id);
 					return BW_ESCAPE;
 				case BW_RETURN:
 					result = BW_RETURN;
@@ -1451,23 +1879,23 @@ static enum busywait is_stuck(
 			}
         }
     }
-	node->visited = false;
+	ONPATH_CLR(onpath, node->id);
     return result;
 }
 
-static void detect_busywait(struct minheap *failures, struct node *node){
+static void detect_busywait(struct worker *w, struct node *node){
 	// Get the contexts
 	unsigned int size;
-	hvalue_t *ctxs = value_get(node->state.ctxbag, &size);
+	hvalue_t *ctxs = value_get(node->state->ctxbag, &size);
 	size /= sizeof(hvalue_t);
 
 	for (unsigned int i = 0; i < size; i += 2) {
-		if (is_stuck(node, node, ctxs[i], false) == BW_RETURN) {
-			struct failure *f = new_alloc(struct failure);
+		if (is_stuck(w->onpath, node, node, ctxs[i], false) == BW_RETURN) {
+			struct failure *f = failure_alloc(w);
 			f->type = FAIL_BUSYWAIT;
 			f->choice = node->choice;
 			f->node = node;
-			minheap_insert(failures, f);
+			minheap_insert(w->found, f);
 			// break;
 		}
 	}
@@ -1491,72 +1919,263 @@ static int fail_cmp(void *f1, void *f2){
     return node_cmp(fail1->node, fail2->node);
 }
 
+// Disk mode: get the next node of the current layer, or NULL if done
+static struct node *disk_node(struct worker *w){
+    if (w->disk_i == w->disk_n) {
+        w->disk_n = disk_read(w->global->disk, w->disk_buf, DISK_BATCH);
+        w->disk_i = 0;
+        if (w->disk_n == 0) {
+            return NULL;
+        }
+    }
+    struct disk_record *rec = &w->disk_buf[w->disk_i++];
+    struct node *node = node_alloc(NULL, &rec->state);
+    if (rec->trail.ctx != 0) {      // the initial state has no trail
+        node->trail = walloc_use(w, WA_TRAILS, sizeof(struct trail), false);
+        *node->trail = rec->trail;
+    }
+    else {
+        node->after = w->global->processes[0];
+    }
+    return node;
+}
+
+// Take all the steps possible from the given node
+static void explore(struct worker *w, struct node *node){
+    struct global_t *global = w->global;
+
+	struct state *state = node->state;
+	atomic_add32(&global->dequeued, 1);
+
+	if (state->choosing != 0) {
+		assert(VALUE_TYPE(state->choosing) == VALUE_CONTEXT);
+
+		struct context *cc = value_get(state->choosing, NULL);
+		assert(cc != NULL);
+		assert(cc->sp > 0);
+		hvalue_t s = cc->stack[cc->sp - 1];
+		assert(VALUE_TYPE(s) == VALUE_SET);
+		unsigned int size;
+		hvalue_t *vals = value_get(s, &size);
+		size /= sizeof(hvalue_t);
+		assert(size > 0);
+		for (unsigned int i = 0; i < size; i++) {
+			make_step(
+				w,
+				node,
+				state->choosing,
+				vals[i],
+				1
+			);
+		}
+	}
+	else {
+		unsigned int size;
+		hvalue_t *ctxs = value_get(state->ctxbag, &size);
+		size /= sizeof(hvalue_t);
+		assert(size >= 0);
+		for (unsigned int i = 0; i < size; i += 2) {
+			assert(VALUE_TYPE(ctxs[i]) == VALUE_CONTEXT);
+			assert(VALUE_TYPE(ctxs[i+1]) == VALUE_INT);
+			make_step(
+				w,
+				node,
+				ctxs[i],
+				0,
+				VALUE_FROM_INT(ctxs[i+1])
+			);
+		}
+	}
+
+    // Keep the edges out of the node in an array of their own (unless
+    // memory is running low)
+    if (w->nedges > 0 && global->mem_level < MEM_NO_EDGES) {
+        node->fwd = walloc_use(w, WA_EDGES, w->nedges * sizeof(struct edge), false);
+        memcpy(node->fwd, w->edges, w->nedges * sizeof(struct edge));
+        node->nfwd = w->nedges;
+    }
+    w->nedges = 0;
+}
+
+// In async mode, workers keep going until there are no more pending nodes,
+// a failure is found, or it is time to stabilize the hash tables.
 static void do_work(struct worker *w){
+    struct global_t *global = w->global;
 	struct node *node;
+    bool idle = false;
 
     for (;;) {
-        mutex_acquire(&todo_lock);
-        node = todo_list;
-        if (node == NULL) {
-            mutex_release(&todo_lock);
+        // In async mode, or if memory is running low
+        if (global->pause) {
             break;
         }
-        todo_list = node->next;
-        mutex_release(&todo_lock);
-
-		struct state *state = &node->state;
-		w->global->dequeued++; // TODO race condition
-
-		if (state->choosing != 0) {
-			assert(VALUE_TYPE(state->choosing) == VALUE_CONTEXT);
-
-			struct context *cc = value_get(state->choosing, NULL);
-			assert(cc != NULL);
-			assert(cc->sp > 0);
-			hvalue_t s = cc->stack[cc->sp - 1];
-			assert(VALUE_TYPE(s) == VALUE_SET);
-			unsigned int size;
-			hvalue_t *vals = value_get(s, &size);
-			size /= sizeof(hvalue_t);
-			assert(size > 0);
-			for (unsigned int i = 0; i < size; i++) {
-				make_step(
-					w,
-					node,
-					state->choosing,
-					vals[i],
-					1
-				);
-			}
-		}
-		else {
-			unsigned int size;
-			hvalue_t *ctxs = value_get(state->ctxbag, &size);
-			size /= sizeof(hvalue_t);
-			assert(size >= 0);
-			for (unsigned int i = 0; i < size; i += 2) {
-				assert(VALUE_TYPE(ctxs[i]) == VALUE_CONTEXT);
-				assert(VALUE_TYPE(ctxs[i+1]) == VALUE_INT);
-				make_step(
-					w,
-					node,
-					ctxs[i],
-					0,
-					VALUE_FROM_INT(ctxs[i+1])
-				);
-			}
-		}
+        if (global->disk != NULL) {
+            if ((node = disk_node(w)) == NULL) {
+                disk_flush(global->disk, w->index);
+                break;
+            }
+        }
+        else if ((node = deque_pop(w)) == NULL) {
+            if (deque_steal(w)) {
+                idle = false;
+                continue;
+            }
+            if (!idle) {
+                w->nidle++;
+                idle = true;
+            }
+            if (!global->async) {
+                break;
+            }
+            if (global->pending == 0) {
+                global->pause = true;
+                break;
+            }
+            thread_yield();     // other workers may still produce nodes
+            continue;
+        }
+        idle = false;
+
+        explore(w, node);
+
+        // Without a graph, the node is no longer needed
+        if ((global->fpset != NULL || global->disk != NULL) &&
+                                        !node_in_graph(global, node)) {
+            free(node);
+        }
+
+        if (global->async) {
+            atomic_add64(&global->pending, -1);
+
+            // Stop if there is a failure or if the tables have grown
+            // enough that they should be stabilized and resized.
+            if (w->failures != NULL ||
+                    w->nresults * w->nworkers > global->enqueued + 1024) {
+                global->pause = true;
+            }
+        }
 	}
 }
 
+// Swarm mode: random number generator (xorshift64*)
+static uint64_t swarm_random(struct worker *w){
+    w->seed ^= w->seed >> 12;
+    w->seed ^= w->seed << 25;
+    w->seed ^= w->seed >> 27;
+    return w->seed * 0x2545F4914F6CDD1DULL;
+}
+
+// Swarm mode: a node is freed once the search backtracks over it
+static void swarm_free(struct node *node){
+    free(node->trail);
+    free(node);
+}
+
+// Swarm mode: explore the node and keep the new successors in the frame,
+// shuffled so that each search tries the contexts in a different order
+static void swarm_expand(struct worker *w, struct swarm_frame *f, struct node *node){
+    unsigned int before = w->nresults;
+
+    explore(w, node);
+    if (w->failures != NULL) {
+        w->global->stop = true;
+    }
+
+    f->node = node;
+    f->succ = malloc((w->nresults - before + 1) * sizeof(struct node *));
+    f->nsucc = f->next = 0;
+    for (struct node *next = w->results; next != NULL; next = next->next) {
+        unsigned int j = swarm_random(w) % (f->nsucc + 1);
+        f->succ[f->nsucc++] = f->succ[j];
+        f->succ[j] = next;
+    }
+    w->results = NULL;
+    w->last = &w->results;
+}
+
+// Swarm mode: start a new search from the initial state.  Each search has
+// its own random seed and its own (small) table of visited states.
+static void swarm_start(struct worker *w, unsigned int run){
+    w->seed = (run + 1) * 0x9E3779B97F4A7C15ULL;
+    fpset_clear(w->fpset);
+    (void) fpset_insert(w->fpset, w->root->state, sizeof(*w->root->state));
+    w->depth = 0;
+    swarm_expand(w, &w->frames[0], w->root);
+}
+
+// Swarm mode: take one step of the depth-first search.  Returns false when
+// the search is done.
+static bool swarm_step(struct worker *w){
+    struct swarm_frame *f = &w->frames[w->depth];
+
+    if (f->next < f->nsucc) {
+        struct node *next = f->succ[f->next++];
+        if (w->depth + 1 < (int) w->global->maxdepth) {
+            w->depth++;
+            swarm_expand(w, &w->frames[w->depth], next);
+        }
+        else {
+            swarm_free(next);
+        }
+        return true;
+    }
+    free(f->succ);
+    if (w->depth > 0) {
+        swarm_free(f->node);
+    }
+    return --w->depth >= 0;
+}
+
+// Swarm mode: workers take searches until there are none left, a failure
+// is found, time runs out, or it is time to stabilize the hash tables.
+// A search that is in progress continues in the next epoch.
+static void swarm_work(struct worker *w){
+    struct global_t *global = w->global;
+    unsigned int timecnt = 0;
+
+    while (!global->pause && !global->stop) {
+        if (w->depth < 0) {
+            int64_t run = atomic_add64(&global->nextrun, 1) - 1;
+            if (run >= global->swarm) {
+                break;
+            }
+            swarm_start(w, run);
+        }
+        else if (!swarm_step(w)) {
+            w->nruns++;
+            w->nvisits += w->fpset->count;
+        }
+
+        if (w->nresults * w->nworkers > global->enqueued + 1024) {
+            global->pause = true;
+        }
+        if (++timecnt % 1024 == 0 && gettime() > w->timeout) {
+            global->stop = true;
+        }
+    }
+}
+
 static void worker(void *arg){
     struct worker *w = arg;
 
     barrier_wait(w->start_barrier);
     for (int epoch = 0;; epoch++) {
+        // After the search, the workers are used for parts of the analysis
+        if (w->global->task != NULL) {
+            (*w->global->task)(w->global->task_arg, w->index);
+            barrier_wait(w->end_barrier);
+            barrier_wait(w->start_barrier);
+            continue;
+        }
+
         // parallel phase starts now
 		// printf("WORKER %d starting epoch %d\n", w->index, epoch);
-		do_work(w);
+        if (w->global->swarm != 0) {
+            swarm_work(w);
+        }
+        else {
+            do_work(w);
+        }
         // wait for others to finish
 		// printf("WORKER %d finished epoch %d %f %f\n", w->index, epoch, work_time, wait_time);
         barrier_wait(w->middle_barrier);
@@ -1569,19 +2188,34 @@ static void worker(void *arg){
     }
 }
 
-void process_results(struct global_t *global, struct worker *w){
+// Returns the number of new nodes, which are added to the deque of the
+// worker that found them (unless in async mode, where this was done already).
+unsigned int process_results(struct global_t *global, struct worker *w){
 	struct node *node;
     struct node *results = w->results;
+    unsigned int n = 0;
 
     while ((node = results) != NULL) {
 		results = node->next;
-        graph_add(&global->graph, node);   // sets node->id
-        assert(node->id != 0);
+        if (global->fpset == NULL) {
+            graph_add(&global->graph, node);   // sets node->id
+            assert(node->id != 0);
+        }
         global->enqueued++;
+        if (!global->async) {
+            deque_push(&w->deque, node);
+        }
+        n++;
+    }
+
+    // In compact async mode the nodes are not put on the results list, as
+    // they may already have been explored and freed
+    if (global->fpset != NULL && global->async) {
+        n = w->nresults;
+        global->enqueued += n;
     }
-    *w->last = todo_list;
-    todo_list = w->results;
     w->results = NULL;
+    w->nresults = 0;
     w->last = &w->results;
 
     struct failure *f;
@@ -1589,6 +2223,7 @@ void process_results(struct global_t *global, struct worker *w){
         w->failures = f->next;
         minheap_insert(global->failures, f);
     }
+    return n;
 }
 
 char *state_string(struct state *state){
@@ -1614,52 +2249,124 @@ char *state_string(struct state *state){
     return strbuf_convert(&sb);
 }
 
-// This routine removes all node that have a single incoming edge and it's
-// an "epsilon" edge (empty print log).  These are essentially useless nodes.
-// Typically about half of the nodes can be removed this way.
-static void destutter1(struct graph_t *graph){
-    for (unsigned int i = 0; i < graph->size; i++) {
-        struct node *n = graph->nodes[i];
+// A node on the heap of shorten_paths(), with its length and #steps at the
+// time it was put there
+struct path_entry {
+    struct node *node;
+    int len, steps;
+};
 
-        if (n->bwd != NULL && n->bwd->bwdnext == NULL && n->bwd->nlog == 0) {
-            struct node *parent = n->bwd->src;
+static int path_cmp(void *v1, void *v2){
+    struct path_entry *pe1 = v1, *pe2 = v2;
 
-            if (n->final) {
-                parent->final = true;
-            }
+    if (pe1->len != pe2->len) {
+        return pe1->len < pe2->len ? -1 : 1;
+    }
+    if (pe1->steps != pe2->steps) {
+        return pe1->steps < pe2->steps ? -1 : 1;
+    }
+    return 0;
+}
 
-            // Remove the edge from the parent
-            struct edge **pe, *e;
-            for (pe = &parent->fwd; (e = *pe) != NULL; pe = &e->fwdnext) {
-                if (e->dst == n && e->nlog == 0) {
-                    *pe = e->fwdnext;
-                    // free(e);
-                    break;
-                }
+// In async mode a node may be explored before the shortest path to it is
+// known, so its successors may end up with paths that are too long.  This
+// is Dijkstra's algorithm over the forward edges, by length and then by
+// #steps.  The paths found during the search are upper bounds, so every
+// node starts out on the heap with its own, and only a shorter path
+// replaces the one it has.  A node that gets a shorter path is put on the
+// heap again, and the old entry is skipped when it comes out.
+static void shorten_paths(struct graph_t *graph){
+    unsigned int nentries = graph->size;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        nentries += graph->nodes[i]->nfwd;
+    }
+    struct path_entry *entries = malloc(nentries * sizeof(*entries));
+    struct minheap *heap = minheap_create(path_cmp);
+    unsigned int n = 0;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        struct node *node = graph->nodes[i];
+        struct path_entry *pe = &entries[n++];
+        pe->node = node;
+        pe->len = node->len;
+        pe->steps = node->steps;
+        minheap_insert(heap, pe);
+    }
+
+    while (!minheap_empty(heap)) {
+        struct path_entry *pe = minheap_getmin(heap);
+        struct node *src = pe->node;
+        if (pe->len != src->len || pe->steps != src->steps) {
+            continue;       // src got a shorter path since
+        }
+        for (struct edge *edge = src->fwd; edge < &src->fwd[src->nfwd]; edge++) {
+            struct node *node = edge->dst;
+            int len = src->len + (edge->ctx == src->after ? 0 : 1);
+            int steps = src->steps + edge->steps;
+            if (node != graph->nodes[0] && (len < node->len ||
+                            (len == node->len && steps < node->steps))) {
+                node->len = len;
+                node->steps = steps;
+                node->parent = src;
+                node->before = edge->ctx;
+                node->after = edge->after;
+                node->choice = edge->choice;
+                node->interrupt = edge->interrupt;
+                node->perm = edge->perm;
+                assert(n < nentries);
+                pe = &entries[n++];
+                pe->node = node;
+                pe->len = len;
+                pe->steps = steps;
+                minheap_insert(heap, pe);
             }
+        }
+    }
+    minheap_destroy(heap);
+    free(entries);
+}
+
+// This routine removes all node that have a single incoming edge and it's
+// an "epsilon" edge (empty print log).  These are essentially useless nodes.
+// Typically about half of the nodes can be removed this way.  A removed
+// node is merged into the node its incoming edge comes from (or the node
+// that one is merged into), which takes over its outgoing edges.  The
+// nodes merged into a node are kept on a list linked through node->next.
+static void destutter1(struct graph_t *graph){
+    unsigned int *bwd_index = graph->bwd_index;
+    struct node **owner = malloc(graph->size * sizeof(*owner));
 
-            struct edge *next;
-            for (struct edge *e = n->fwd; e != NULL; e = next) {
-                // Move the outgoing edge to the parent.
-                next = e->fwdnext;
-                e->fwdnext = parent->fwd;
-                parent->fwd = e;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        struct node *n = graph->nodes[i];
+        n->reachable = i == 0 || bwd_index[i + 1] != bwd_index[i] + 1 ||
+                                graph->bwd[bwd_index[i]]->nlog != 0;
+        n->next = NULL;
+        owner[i] = n->reachable ? n : NULL;
+    }
+    for (unsigned int i = 1; i < graph->size; i++) {
+        struct node *n = graph->nodes[i];
+        if (n->reachable) {
+            continue;
+        }
 
-                // Fix the corresponding backwards edge
-                for (struct edge *f = e->dst->bwd; f != NULL; f = f->bwdnext) {
-                    if (f->src == n && f->nlog == e->nlog &&
-                            memcmp(f->log, e->log, f->nlog * sizeof(*f->log)) == 0) {
-                        f->src = parent;
-                        break;
-                    }
-                }
-            }
-            n->reachable = false;
+        // Follow the incoming edges back to a node that is kept, and
+        // remember the result for the nodes along the way
+        struct node *m = n;
+        while (owner[m->id] == NULL) {
+            m = graph->bwd[bwd_index[m->id]]->src;
         }
-        else {
-            n->reachable = true;
+        struct node *o = owner[m->id];
+        for (m = n; owner[m->id] == NULL;) {
+            owner[m->id] = o;
+            m = graph->bwd[bwd_index[m->id]]->src;
+        }
+
+        if (n->final) {
+            o->final = true;
         }
+        n->next = o->next;
+        o->next = n;
     }
+    free(owner);
 }
 
 static struct dict *collect_symbols(struct graph_t *graph){
@@ -1667,15 +2374,16 @@ static struct dict *collect_symbols(struct graph_t *graph){
     hvalue_t symbol_id = 0;
 
     for (unsigned int i = 0; i < graph->size; i++) {
-        struct node *n = graph->nodes[i];
-        if (!n->reachable) {
+        if (!graph->nodes[i]->reachable) {
             continue;
         }
-        for (struct edge *e = n->fwd; e != NULL; e = e->fwdnext) {
-            for (unsigned int j = 0; j < e->nlog; j++) {
-                void **p = dict_insert(symbols, NULL, &e->log[j], sizeof(e->log[j]));
-                if (*p == NULL) {
-                    *p = (void *) ++symbol_id;
+        for (struct node *n = graph->nodes[i]; n != NULL; n = n->next) {
+            for (struct edge *e = n->fwd; e < &n->fwd[n->nfwd]; e++) {
+                for (unsigned int j = 0; j < e->nlog; j++) {
+                    void **p = dict_insert(symbols, NULL, &e->log[j], sizeof(e->log[j]));
+                    if (*p == NULL) {
+                        *p = (void *) ++symbol_id;
+                    }
                 }
             }
         }
@@ -1736,20 +2444,27 @@ static void print_trans_upcall(void *env, const void *key, unsigned int key_size
     free(sb);
 }
 
-static void print_transitions(FILE *out, struct dict *symbols, struct edge *edges){
+// The transitions of a node include those of the nodes merged into it,
+// except for the ones to merged nodes (see destutter1)
+static void print_transitions(FILE *out, struct dict *symbols, struct node *node){
     struct dict *d = dict_new(0, 0, NULL, NULL);
 
     fprintf(out, "      \"transitions\": [\n");
-    for (struct edge *e = edges; e != NULL; e = e->fwdnext) {
-        void **p = dict_insert(d, NULL, e->log, e->nlog * sizeof(*e->log));
-        struct strbuf *sb = *p;
-        if (sb == NULL) {
-            *p = sb = malloc(sizeof(struct strbuf));
-            strbuf_init(sb);
-            strbuf_printf(sb, "%d", e->dst->id);
-        }
-        else {
-            strbuf_printf(sb, ",%d", e->dst->id);
+    for (struct node *n = node; n != NULL; n = n->next) {
+        for (struct edge *e = n->fwd; e < &n->fwd[n->nfwd]; e++) {
+            if (!e->dst->reachable) {
+                continue;
+            }
+            void **p = dict_insert(d, NULL, e->log, e->nlog * sizeof(*e->log));
+            struct strbuf *sb = *p;
+            if (sb == NULL) {
+                *p = sb = malloc(sizeof(struct strbuf));
+                strbuf_init(sb);
+                strbuf_printf(sb, "%d", e->dst->id);
+            }
+            else {
+                strbuf_printf(sb, ",%d", e->dst->id);
+            }
         }
     }
     struct print_trans_env pte = {
@@ -1761,6 +2476,114 @@ static void print_transitions(FILE *out, struct dict *symbols, struct edge *edge
     dict_delete(d);
 }
 
+// For the binary .hco format: the destinations of the transitions of a
+// node with the same symbols
+struct hco_trans {
+    int *dsts;
+    unsigned int n;
+};
+
+struct hco_trans_env {
+    FILE *out;
+    struct dict *symbols;
+};
+
+static void hco_trans_upcall(void *env, const void *key, unsigned int key_size, void *value){
+    struct hco_trans_env *hte = env;
+    const hvalue_t *log = key;
+    unsigned int nkeys = key_size / sizeof(hvalue_t);
+    struct hco_trans *ht = value;
+
+    hco_put(hte->out, nkeys);
+    for (unsigned int i = 0; i < nkeys; i++) {
+        void *p = dict_lookup(hte->symbols, &log[i], sizeof(log[i]));
+        assert(p != NULL);
+        hco_put(hte->out, (uint32_t) (uint64_t) p);
+    }
+    hco_put(hte->out, ht->n);
+    for (unsigned int i = 0; i < ht->n; i++) {
+        hco_put(hte->out, ht->dsts[i]);
+    }
+    free(ht->dsts);
+    free(ht);
+}
+
+// Binary version of print_transitions
+static void hco_transitions(FILE *out, struct dict *symbols, struct node *node){
+    struct dict *d = dict_new(0, 0, NULL, NULL);
+    unsigned int ntrans = 0;
+
+    for (struct node *n = node; n != NULL; n = n->next) {
+        for (struct edge *e = n->fwd; e < &n->fwd[n->nfwd]; e++) {
+            if (!e->dst->reachable) {
+                continue;
+            }
+            void **p = dict_insert(d, NULL, e->log, e->nlog * sizeof(*e->log));
+            struct hco_trans *ht = *p;
+            if (ht == NULL) {
+                *p = ht = calloc(1, sizeof(*ht));
+                ntrans++;
+            }
+            ht->dsts = realloc(ht->dsts, (ht->n + 1) * sizeof(*ht->dsts));
+            ht->dsts[ht->n++] = e->dst->id;
+        }
+    }
+    hco_put(out, ntrans);
+    struct hco_trans_env hte = { .out = out, .symbols = symbols };
+    dict_iter(d, hco_trans_upcall, &hte);
+    dict_delete(d);
+}
+
+static void hco_count_symbol(void *env, const void *key, unsigned int key_size, void *value){
+    (*(unsigned int *) env)++;
+}
+
+static void hco_symbol(void *env, const void *key, unsigned int key_size, void *value){
+    FILE *out = env;
+    const hvalue_t *symbol = key;
+
+    assert(key_size == sizeof(*symbol));
+    char *p = value_json(*symbol);
+    unsigned int len = strlen(p);
+    hco_put(out, (uint32_t) (uint64_t) value);
+    hco_put(out, len);
+    fwrite(p, 1, len, out);
+    free(p);
+}
+
+// Output the reachable nodes of the graph in binary (see hco.h)
+static void hco_graph(FILE *out, struct graph_t *graph, struct dict *symbols){
+    unsigned int nnodes = 0;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        if (graph->nodes[i]->reachable) {
+            nnodes++;
+        }
+    }
+    hco_put(out, nnodes);
+    for (unsigned int i = 0; i < graph->size; i++) {
+        struct node *node = graph->nodes[i];
+        assert(node->id == i);
+        if (node->reachable) {
+            hco_put(out, node->id);
+            hco_put(out, node->component);
+            hco_put(out, i == 0 ? HCO_NODE_INITIAL :
+                    node->final ? HCO_NODE_TERMINAL : HCO_NODE_NORMAL);
+            hco_transitions(out, symbols, node);
+        }
+    }
+}
+
+static void hco_issue(FILE *out, bool json, const char *issue){
+    if (json) {
+        char *v = json_string_encode((char *) issue, strlen(issue));
+        fprintf(out, "  \"issue\": \"%s\",\n", v);
+        free(v);
+    }
+    else {
+        hco_section(out, "ISSU", issue, strlen(issue));
+    }
+}
+
 #ifdef OBSOLETE
 static void pr_state(struct global_t *global, FILE *fp, struct state *state, int index){
     char *v = state_string(state);
@@ -1769,15 +2592,468 @@ static void pr_state(struct global_t *global, FILE *fp, struct state *state, int
 }
 #endif
 
+// In hash-compaction and bitstate mode, the path to a failure is only known
+// as a trail of steps.  Re-execute those steps from the initial state, this
+// time creating ordinary nodes, so the path can be dumped as usual.  Returns
+// the corresponding failure on the new path.
+static struct failure *replay_trail(
+    struct global_t *global,
+    struct worker *w,
+    struct state *state,        // initial state
+    hvalue_t ictx,              // initial context
+    struct failure *bad
+) {
+    unsigned int n = 0;
+    for (struct trail *t = bad->node->trail; t != NULL; t = t->parent) {
+        n++;
+    }
+    struct trail **trails = malloc(n * sizeof(*trails));
+    unsigned int i = n;
+    for (struct trail *t = bad->node->trail; t != NULL; t = t->parent) {
+        trails[--i] = t;
+    }
+
+    global->fpset = NULL;
+    w->visited = dict_new(0, w->nworkers, NULL, NULL);
+    struct node *node = node_alloc(NULL, state);
+    node->after = ictx;
+    graph_add(&global->graph, node);
+    void **p = dict_insert(w->visited, NULL, state, sizeof(*state));
+    *p = node;
+
+    struct failure *result = NULL;
+    for (i = 0; i < n; i++) {
+        struct trail *t = trails[i];
+        int multiplicity = 1;
+        if (node->state->choosing == 0) {
+            hvalue_t count = value_dict_load(node->state->ctxbag, t->ctx);
+            multiplicity = VALUE_FROM_INT(count);
+        }
+        w->results = NULL;
+        w->last = &w->results;
+        w->failures = NULL;
+        w->nedges = 0;
+        make_step(w, node, t->ctx, t->choice, multiplicity);
+
+        // Find the node that was reached by this particular step
+        struct node *next = NULL;
+        for (unsigned int j = 0; j < w->nedges; j++) {
+            struct edge *e = &w->edges[j];
+            if (e->ctx == t->ctx && e->choice == t->choice &&
+                                    e->interrupt == t->interrupt) {
+                next = e->dst;
+                break;
+            }
+        }
+        if (next == NULL) {
+            panic("replay_trail: can't reproduce counterexample");
+        }
+        graph_add(&global->graph, next);
+        node = next;
+    }
+    free(trails);
+
+    for (struct failure *f = w->failures; f != NULL; f = f->next) {
+        if (f->node == node && f->interrupt == bad->interrupt) {
+            result = f;
+            break;
+        }
+    }
+    if (result == NULL) {
+        result = new_alloc(struct failure);
+        result->type = bad->type;
+        result->choice = node->choice;
+        result->interrupt = node->interrupt;
+        result->node = node;
+    }
+    return result;
+}
+
+// Have all the workers run the given task, and wait until they are done
+static void run_task(struct global_t *global, barrier_t *start_barrier, barrier_t *end_barrier,
+                        void (*task)(void *arg, unsigned int worker), void *arg){
+    global->task = task;
+    global->task_arg = arg;
+    barrier_wait(start_barrier);
+    barrier_wait(end_barrier);
+    global->task = NULL;
+}
+
+// Phase 3 (analysis of the graph) is done in passes over the nodes or the
+// components, run on the worker pool.  Each pass hands out chunks of nodes
+// (or components) from a shared cursor, and the workers synchronize in
+// between passes.  Failures go into per-worker heaps and are merged by the
+// main thread.  As failures are ordered by node, the outcome does not
+// depend on the number of workers.
+#define ANALYSIS_CHUNK  1024
+
+enum analysis_pass {
+    AP_INIT,            // components: initialize
+    AP_MEMBERS,         // nodes: size, representative, way out
+    AP_SAME,            // nodes: is the shared state the same throughout?
+    AP_FINAL,           // components: find the final ones
+    AP_BEHAVIOR,        // nodes: mark final nodes, check behavior
+    AP_TERMINATION,     // nodes: find nodes in bad components
+    AP_BUSYWAIT,        // nodes: look for busy waiting
+    AP_RACES,           // nodes: look for data races
+    AP_NPASSES
+};
+
+struct analysis {
+    struct global_t *global;
+    struct worker *workers;
+    struct component *components;
+    unsigned int ncomponents;
+    bool busywait;                  // check for busy waiting
+    barrier_t barrier;
+    volatile int64_t cursor[AP_NPASSES];    // next chunk of each pass
+    volatile int64_t nfound[AP_NPASSES];    // #failures found by each pass
+    volatile uint32_t race;         // lowest node with a data race
+};
+
+// Get the next chunk [*lo, *hi) of the given pass over n items
+static bool analysis_next(struct analysis *an, enum analysis_pass pass,
+                                unsigned int n, unsigned int *lo, unsigned int *hi){
+    int64_t end = atomic_add64(&an->cursor[pass], ANALYSIS_CHUNK);
+    int64_t start = end - ANALYSIS_CHUNK;
+    if (start >= n) {
+        return false;
+    }
+    *lo = start;
+    *hi = end < n ? end : n;
+    return true;
+}
+
+static void analysis_failure(struct analysis *an, struct worker *w, enum analysis_pass pass,
+                                struct node *node, enum fail_type type){
+    struct failure *f = failure_alloc(w);
+    f->type = type;
+    f->choice = node->choice;
+    f->node = node;
+    minheap_insert(w->found, f);
+    atomic_add64(&an->nfound[pass], 1);
+}
+
+// Find the components, and within them the failures to terminate, bad
+// final states, and busy waiting
+static void analysis_work(void *arg, unsigned int index){
+    struct analysis *an = arg;
+    struct worker *w = &an->workers[index];
+    struct node **nodes = an->global->graph.nodes;
+    unsigned int size = an->global->graph.size;
+    unsigned int lo, hi;
+
+    while (analysis_next(an, AP_INIT, an->ncomponents, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            an->components[i].all_same = true;
+        }
+    }
+    barrier_wait(&an->barrier);
+
+    // mark the components that are "good" because they have a way out
+    while (analysis_next(an, AP_MEMBERS, size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            struct node *node = nodes[i];
+            assert(node->component < an->ncomponents);
+            struct component *comp = &an->components[node->component];
+            atomic_add32((volatile int32_t *) &comp->size, 1);
+            for (;;) {
+                struct node *rep = comp->rep;
+                if ((rep != NULL && rep->id < node->id) ||
+                        atomic_cas_ptr((void *volatile *) &comp->rep, rep, node)) {
+                    break;
+                }
+            }
+            if (!value_ctx_all_eternal(node->state->ctxbag) ||
+                        !value_ctx_all_eternal(node->state->stopbag)) {
+                comp->all_same = false;
+            }
+            if (comp->good) {
+                continue;
+            }
+            // if this component has a way out, it is good
+            for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+                if (edge->dst->component != node->component) {
+                    comp->good = true;
+                    break;
+                }
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+
+    while (analysis_next(an, AP_SAME, size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            struct node *node = nodes[i];
+            struct component *comp = &an->components[node->component];
+            if (node->state->vars != comp->rep->state->vars) {
+                comp->all_same = false;
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+
+    // components that have only one shared state and only eternal
+    // threads are good because it means all its threads are blocked
+    while (analysis_next(an, AP_FINAL, an->ncomponents, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            struct component *comp = &an->components[i];
+            assert(comp->size > 0);
+            if (!comp->good && comp->all_same) {
+                comp->good = true;
+                comp->final = true;
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+
+    // Look for states in final components
+    while (analysis_next(an, AP_BEHAVIOR, size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            struct node *node = nodes[i];
+            if (an->components[node->component].final) {
+                node->final = true;
+                if (an->global->dfa != NULL &&
+                        !dfa_is_final(an->global->dfa, node->state->dfa_state)) {
+                    analysis_failure(an, w, AP_BEHAVIOR, node, FAIL_BEHAVIOR);
+                }
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+    if (an->nfound[AP_BEHAVIOR] != 0) {
+        return;
+    }
+
+    // now look for the nodes that are in bad components
+    while (analysis_next(an, AP_TERMINATION, size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            if (!an->components[nodes[i]->component].good) {
+                analysis_failure(an, w, AP_TERMINATION, nodes[i], FAIL_TERMINATION);
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+    if (an->nfound[AP_TERMINATION] != 0 || !an->busywait) {
+        return;
+    }
+
+    w->onpath = calloc((size + 63) / 64, sizeof(uint64_t));
+    while (analysis_next(an, AP_BUSYWAIT, size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi; i++) {
+            if (an->components[nodes[i]->component].size > 1) {
+                detect_busywait(w, nodes[i]);
+            }
+        }
+    }
+    free(w->onpath);
+    w->onpath = NULL;
+}
+
+// Look for the data race in the lowest numbered node.  Each worker stops
+// at the first node with a data race that it finds, and only the worker
+// that found the lowest one keeps its warnings.  The values must be in
+// concurrent mode, as addresses are created.
+static void analysis_races(void *arg, unsigned int index){
+    struct analysis *an = arg;
+    struct worker *w = &an->workers[index];
+    struct node **nodes = an->global->graph.nodes;
+    unsigned int lo, hi, found = UINT_MAX;
+
+    while (found == UINT_MAX &&
+            analysis_next(an, AP_RACES, an->global->graph.size, &lo, &hi)) {
+        for (unsigned int i = lo; i < hi && i < an->race; i++) {
+            graph_check_for_data_race(nodes[i], w->found, &w->inv_step.engine);
+            if (!minheap_empty(w->found)) {
+                uint32_t race;
+                while ((race = an->race) > i && !atomic_cas32(&an->race, race, i))
+                    ;
+                found = i;
+                break;
+            }
+        }
+    }
+    barrier_wait(&an->barrier);
+    if (found != an->race) {
+        while (!minheap_empty(w->found)) {
+            free(minheap_getmin(w->found));
+        }
+    }
+    value_make_stable(&an->global->values, index, &w->vs);
+}
+
+// What is given up at each level of the memory budget
+static const char *mem_warnings[] = {
+    NULL,
+    "access info is no longer recorded, so data races are not detected",
+    "edges are no longer recorded, so only safety and invariants are checked"
+        " (no termination, busy waiting, or data race detection)",
+    "new states are only stored as fingerprints (hash compaction), so some"
+        " states may be missed"
+};
+
+// Memory use at which to go to the next level.  The levels are based on
+// the memory actually in use: each level is left a reserve of what the
+// workers may allocate before they get to the barriers (a chunk each) plus
+// what the tables may grow by (doubling the largest one), so the first
+// level starts three reserves below the budget.  Without a graph, or once
+// states are only kept as fingerprints, there is nothing left to give up,
+// and the search stops when it runs out of the budget.
+static uint64_t mem_threshold(struct global_t *global, struct dict *visited,
+                                    unsigned int nworkers, bool nograph){
+    if (nograph || global->mem_level == MEM_COMPACT) {
+        return global->mem_budget;
+    }
+    uint64_t largest = dict_table_size(visited);
+    uint64_t values = value_table_size(&global->values);
+    uint64_t nodes = (uint64_t) global->graph.alloc_size * sizeof(struct node *);
+    if (values > largest) {
+        largest = values;
+    }
+    if (nodes > largest) {
+        largest = nodes;
+    }
+    uint64_t reserve = 2 * (uint64_t) nworkers * WALLOC_CHUNK + largest;
+    reserve *= MEM_COMPACT - global->mem_level;
+    return global->mem_budget > reserve ? global->mem_budget - reserve : 0;
+}
+
+// Give a node that is yet to be explored a trail, so that a path to a
+// failure found from it can be reconstructed (see replay_trail()).
+static struct trail *node_trail(struct worker *w, struct node *node){
+    if (node->trail == NULL && node->parent != NULL) {
+        struct trail *trail = walloc_use(w, WA_TRAILS, sizeof(struct trail), false);
+        trail->parent = node_trail(w, node->parent);
+        trail->ctx = node->before;
+        trail->choice = node->choice;
+        trail->interrupt = node->interrupt;
+        node->trail = trail;
+    }
+    return node->trail;
+}
+
+// Switch to hash compaction.  The states found so far stay in the table of
+// visited states, but new ones are only kept as fingerprints in what is
+// left of the budget.
+static void mem_compact(struct global_t *global, struct worker *workers, unsigned int nworkers){
+    uint64_t used = global->mem_used + global->mem_tables;
+    uint64_t nbytes = used < global->mem_budget ? (global->mem_budget - used) / 2 : 0;
+    if (nbytes < WALLOC_CHUNK) {
+        nbytes = WALLOC_CHUNK;
+    }
+    global->fpset = fpset_new(false, nbytes);
+    for (unsigned int i = 0; i < nworkers; i++) {
+        workers[i].fpset = global->fpset;
+    }
+    for (unsigned int i = 0; i < nworkers; i++) {
+        struct deque *dq = &workers[i].deque;
+        for (unsigned int j = dq->head; j < dq->tail; j++) {
+            (void) node_trail(&workers[0], dq->nodes[j]);
+        }
+    }
+}
+
+// Called between epochs if there is a memory budget.  Goes to the next
+// level(s) if memory use is over the limit, and stops the search (leaving
+// global->mem_out set) if it is over the budget.
+static void mem_check(struct global_t *global, struct worker *workers, unsigned int nworkers, bool nograph){
+    global->mem_tables = value_table_size(&global->values) +
+                        dict_table_size(workers[0].visited) +
+                        (uint64_t) global->graph.alloc_size * sizeof(struct node *);
+    if (global->fpset != NULL) {
+        global->mem_tables += global->fpset->bitstate ?
+                global->fpset->size / 8 : global->fpset->size * sizeof(uint64_t);
+    }
+    global->mem_limit = mem_threshold(global, workers[0].visited, nworkers, nograph);
+    for (;;) {
+        uint64_t used = global->mem_used + global->mem_tables;
+        if (used < global->mem_limit) {
+            break;
+        }
+        if (used >= global->mem_budget) {
+            printf("Warning: using %.1fMB of %.1fMB: memory budget exceeded, stopping the search\n",
+                    used / 1e6, global->mem_budget / 1e6);
+            global->mem_out = true;
+            return;
+        }
+        global->mem_level++;
+        printf("Warning: using %.1fMB of %.1fMB: %s\n", used / 1e6,
+                global->mem_budget / 1e6, mem_warnings[global->mem_level]);
+        switch (global->mem_level) {
+        case MEM_NO_ACCESSES:
+            for (unsigned int i = 0; i < nworkers; i++) {
+                walloc_access_free(&workers[i]);
+            }
+            break;
+        case MEM_COMPACT:
+            mem_compact(global, workers, nworkers);
+            break;
+        default:
+            break;
+        }
+        global->mem_limit = mem_threshold(global, workers[0].visited, nworkers, nograph);
+    }
+}
+
+// Write a checkpoint with the nodes that are still in the deques
+static void save_checkpoint(struct global_t *global, struct worker *workers,
+                            unsigned int nworkers, uint64_t hvm_hash){
+    double before = gettime();
+    unsigned int n = 0;
+    for (unsigned int i = 0; i < nworkers; i++) {
+        n += workers[i].deque.tail - workers[i].deque.head;
+    }
+    struct node **frontier = malloc((n + 1) * sizeof(struct node *));
+    n = 0;
+    for (unsigned int i = 0; i < nworkers; i++) {
+        struct deque *dq = &workers[i].deque;
+        for (unsigned int j = dq->head; j < dq->tail; j++) {
+            frontier[n++] = dq->nodes[j];
+        }
+    }
+    checkpoint_write(global->checkpoint, global, hvm_hash, frontier, n);
+    free(frontier);
+    printf("Checkpoint: %u states, %u to explore, saved in %s (%.3lf seconds)\n",
+                global->graph.size, n, global->checkpoint, gettime() - before);
+}
+
+// Parse a size such as 512M or 8G.  Returns 0 if malformed.
+static uint64_t parse_size(const char *p){
+    char *end;
+    uint64_t n = strtoull(p, &end, 10);
+    switch (*end) {
+    case 'k': case 'K':
+        n <<= 10; end++;
+        break;
+    case 'm': case 'M':
+        n <<= 20; end++;
+        break;
+    case 'g': case 'G':
+        n <<= 30; end++;
+        break;
+    }
+    return *end == '\0' ? n : 0;
+}
+
 static void usage(char *prog){
-    fprintf(stderr, "Usage: %s [-c] [-t<maxtime>] [-B<dfafile>] -o<outfile> file.json\n", prog);
+    fprintf(stderr, "Usage: %s [-c] [-t<maxtime>] [-B<dfafile>] [-Xproduct] [-Xasync] [-Xsymmetry=<atom>,<atom>,...] [-Xopen[=visited|values]] [-Xhashcompact[=<size>]] [-Xbitstate[=<size>]] [-Xdisk[=<dir>]] [-Xswarm[=<searches>]] [-Xdepth=<steps>] [-Xscc=serial|parallel] [-Xmem=<size>] [-Xcheckpoint=<file>[,<seconds>]] [-Xresume=<file>] [-Xjson] [-Xhfa=<file>] [-Xgv=<file>] -o<outfile> file.json\n", prog);
     exit(1);
 }
 
 int main(int argc, char **argv){
-    bool cflag = false;
+    bool cflag = false, async = false, open_visited = false, open_values = false;
+    bool bitstate = false, hco_json = false, product = false;
+    uint64_t fpset_size = 0;        // for hash compaction or bitstate
+    bool disk = false, parallel_scc = false;
+    uint64_t mem_budget = 0;
+    char *checkpoint = NULL, *resume = NULL;
+    int checkpoint_interval = CHECKPOINT_INTERVAL;
+    unsigned int swarm = 0, maxdepth = 0;  // for swarm mode
+    char *diskdir = NULL;           // for disk mode files
+    char **symgroups = malloc(argc * sizeof(char *));
+    unsigned int nsymgroups = 0;    // #groups of symmetric atoms
     int i, maxtime = 300000000 /* about 10 years */;
-    char *outfile = NULL, *dfafile = NULL;
+    char *outfile = NULL, *dfafile = NULL, *hfafile = NULL, *gvfile = NULL;
     for (i = 1; i < argc; i++) {
         if (*argv[i] != '-') {
             break;
@@ -1802,6 +3078,102 @@ int main(int argc, char **argv){
         case 'x':
             printf("Charm model checker working\n");
             return 0;
+        case 'X':
+            if (strcmp(&argv[i][2], "async") == 0) {
+                async = true;
+            }
+            else if (strcmp(&argv[i][2], "json") == 0) {
+                hco_json = true;
+            }
+            else if (strcmp(&argv[i][2], "product") == 0) {
+                product = true;
+            }
+            else if (strncmp(&argv[i][2], "hfa=", 4) == 0) {
+                hfafile = &argv[i][6];
+            }
+            else if (strncmp(&argv[i][2], "gv=", 3) == 0) {
+                gvfile = &argv[i][5];
+            }
+            else if (strncmp(&argv[i][2], "symmetry=", 9) == 0) {
+                symgroups[nsymgroups++] = &argv[i][11];
+            }
+            else if (strcmp(&argv[i][2], "open") == 0) {
+                open_visited = open_values = true;
+            }
+            else if (strcmp(&argv[i][2], "open=visited") == 0) {
+                open_visited = true;
+            }
+            else if (strcmp(&argv[i][2], "open=values") == 0) {
+                open_values = true;
+            }
+            else if (strcmp(&argv[i][2], "disk") == 0) {
+                disk = true;
+            }
+            else if (strncmp(&argv[i][2], "disk=", 5) == 0) {
+                disk = true;
+                diskdir = &argv[i][7];
+            }
+            else if (strcmp(&argv[i][2], "scc=parallel") == 0) {
+                parallel_scc = true;
+            }
+            else if (strcmp(&argv[i][2], "scc=serial") == 0) {
+                parallel_scc = false;
+            }
+            else if (strcmp(&argv[i][2], "swarm") == 0) {
+                swarm = getNumCores();
+            }
+            else if (strncmp(&argv[i][2], "swarm=", 6) == 0) {
+                swarm = atoi(&argv[i][8]);
+                if ((int) swarm <= 0) {
+                    fprintf(stderr, "%s: bad option %s\n", argv[0], argv[i]);
+                    usage(argv[0]);
+                }
+            }
+            else if (strncmp(&argv[i][2], "depth=", 6) == 0) {
+                maxdepth = atoi(&argv[i][8]);
+                if ((int) maxdepth <= 0) {
+                    fprintf(stderr, "%s: bad option %s\n", argv[0], argv[i]);
+                    usage(argv[0]);
+                }
+            }
+            else if (strncmp(&argv[i][2], "hashcompact", 11) == 0 ||
+                            strncmp(&argv[i][2], "bitstate", 8) == 0) {
+                bitstate = argv[i][2] == 'b';
+                char *sz = &argv[i][bitstate ? 10 : 13];
+                if (*sz == '\0') {
+                    fpset_size = (uint64_t) 1 << 30;
+                }
+                else if (*sz != '=' || (fpset_size = parse_size(sz + 1)) == 0) {
+                    fprintf(stderr, "%s: bad option %s\n", argv[0], argv[i]);
+                    usage(argv[0]);
+                }
+            }
+            else if (strncmp(&argv[i][2], "checkpoint=", 11) == 0) {
+                checkpoint = &argv[i][13];
+                char *comma = strchr(checkpoint, ',');
+                if (comma != NULL) {
+                    *comma = '\0';
+                    checkpoint_interval = atoi(comma + 1);
+                }
+                if (*checkpoint == '\0' || checkpoint_interval <= 0) {
+                    fprintf(stderr, "%s: bad option %s\n", argv[0], argv[i]);
+                    usage(argv[0]);
+                }
+            }
+            else if (strncmp(&argv[i][2], "resume=", 7) == 0) {
+                resume = &argv[i][9];
+            }
+            else if (strncmp(&argv[i][2], "mem=", 4) == 0) {
+                if ((mem_budget = parse_size(&argv[i][6])) == 0) {
+                    fprintf(stderr, "%s: bad option %s\n", argv[0], argv[i]);
+                    usage(argv[0]);
+                }
+            }
+            else {
+                fprintf(stderr, "%s: unknown option %s\n", argv[0], argv[i]);
+                usage(argv[0]);
+            }
+            break;
         default:
             usage(argv[0]);
         }
@@ -1809,22 +3181,55 @@ int main(int argc, char **argv){
     if (argc - i != 1) {
         usage(argv[0]);
     }
+    if (swarm != 0 && (async || disk || nsymgroups != 0)) {
+        fprintf(stderr, "%s: -Xswarm cannot be combined with -Xasync, -Xdisk, or -Xsymmetry\n", argv[0]);
+        exit(1);
+    }
+    if (maxdepth != 0 && swarm == 0) {
+        fprintf(stderr, "%s: -Xdepth only applies to -Xswarm\n", argv[0]);
+        exit(1);
+    }
+
+    // By default each search of the swarm uses a small bitstate table
+    if (swarm != 0 && fpset_size == 0) {
+        bitstate = true;
+        fpset_size = SWARM_TABLE;
+    }
+    if (diskdir != NULL && !disk_dir_ok(diskdir)) {
+        fprintf(stderr, "%s: -Xdisk=%s: not a writable directory\n", argv[0], diskdir);
+        exit(1);
+    }
+    if (disk && (async || fpset_size != 0)) {
+        fprintf(stderr, "%s: -Xdisk cannot be combined with -Xasync, -Xhashcompact, or -Xbitstate\n", argv[0]);
+        exit(1);
+    }
+    if (nsymgroups != 0 && (disk || fpset_size != 0)) {
+        fprintf(stderr, "%s: -Xsymmetry needs the state graph (no -Xdisk, -Xhashcompact, or -Xbitstate)\n", argv[0]);
+        exit(1);
+    }
+    if ((checkpoint != NULL || resume != NULL) && (disk || fpset_size != 0)) {
+        fprintf(stderr, "%s: -Xcheckpoint and -Xresume need the state graph (no -Xdisk, -Xhashcompact, -Xbitstate, or -Xswarm)\n", argv[0]);
+        exit(1);
+    }
     char *fname = argv[i];
     double timeout = gettime() + maxtime;
 
-    mutex_init(&todo_lock);
-
     // Determine how many worker threads to use
     unsigned int nworkers = getNumCores();
 	printf("nworkers = %d\n", nworkers);
-    barrier_t start_barrier, middle_barrier, end_barrier;
-    barrier_init(&start_barrier, nworkers + 1);
-    barrier_init(&middle_barrier, nworkers + 1);
-    barrier_init(&end_barrier, nworkers + 1);
+
+    // The workers still wait on the start barrier after this returns (when
+    // called from Python), so the barriers cannot be on the stack
+    barrier_t *start_barrier = new_alloc(barrier_t);
+    barrier_t *middle_barrier = new_alloc(barrier_t);
+    barrier_t *end_barrier = new_alloc(barrier_t);
+    barrier_init(start_barrier, nworkers + 1);
+    barrier_init(middle_barrier, nworkers + 1);
+    barrier_init(end_barrier, nworkers + 1);
 
     // initialize modules
     struct global_t *global = new_alloc(struct global_t);
-    value_init(&global->values, nworkers);
+    value_init(&global->values, nworkers, open_values);
 
     struct engine engine;
     engine.allocator = NULL;
@@ -1839,42 +3244,46 @@ int main(int argc, char **argv){
     global->enqueued = 0;
     global->dequeued = 0;
     global->dumpfirst = false;
+    global->async = async;
+    global->swarm = swarm;
+    global->maxdepth = maxdepth == 0 ? SWARM_DEPTH : maxdepth;
     global->init_name = value_put_atom(&engine, "__init__", 8);
 
+    // Groups of symmetric atoms
+    if (nsymgroups != 0) {
+        global->symmetry = symmetry_new();
+        for (unsigned int g = 0; g < nsymgroups; g++) {
+            if (!symmetry_add_group(global->symmetry, &engine, symgroups[g])) {
+                fprintf(stderr, "%s: bad symmetry group %s (need at least two distinct atoms)\n", argv[0], symgroups[g]);
+                exit(1);
+            }
+        }
+        symmetry_init(global->symmetry);
+        global->symmap = malloc(global->symmetry->natoms * sizeof(unsigned int));
+    }
+    free(symgroups);
+
     // First read and parse the DFA if any
     if (dfafile != NULL) {
         global->dfa = dfa_read(&engine, dfafile);
         if (global->dfa == NULL) {
             exit(1);
         }
-    }
 
-    // open the HVM file
-    FILE *fp = fopen(fname, "r");
-    if (fp == NULL) {
-        fprintf(stderr, "%s: can't open %s\n", argv[0], fname);
-        exit(1);
-    }
-
-    // read the file
-    json_buf_t buf;
-    buf.base = malloc(CHUNKSIZE);
-    buf.len = 0;
-    int n;
-    while ((n = fread(&buf.base[buf.len], 1, CHUNKSIZE, fp)) > 0) {
-        buf.len += n;
-        buf.base = realloc(buf.base, buf.len + CHUNKSIZE);
+        // With -Xproduct a step fails as soon as the output so far is not
+        // the prefix of a behavior
+        if (product) {
+            dfa_prune(global->dfa);
+        }
     }
-    fclose(fp);
 
-    // parse the contents
-    struct json_value *jv = json_parse_value(&buf);
-    assert(jv->type == JV_MAP);
+    // read the HVM file (binary or JSON) and create the code array
+    struct hvm hvm;
+    hvm_read(fname, &engine, &hvm);
+    global->code = hvm.code;
 
-    // travel through the json code contents to create the code array
-    struct json_value *jc = dict_lookup(jv->u.map, "code", 4);
-    assert(jc->type == JV_LIST);
-    global->code = code_init_parse(&engine, jc);
+    // A checkpoint is only good for the same model
+    uint64_t hvm_hash = dict_hash64(hvm.contents.base, hvm.contents.len, 0);
 
     // Create an initial state
     struct context *init_ctx = calloc(1, sizeof(struct context) + MAX_CONTEXT_STACK * sizeof(hvalue_t));
@@ -1921,14 +3330,31 @@ int main(int argc, char **argv){
     }
 
     // Put the initial state in the visited map
-    struct dict *visited = dict_new(1024*1024, nworkers, NULL, NULL);
-    struct node *node = node_alloc(NULL);
-    node->state = *state;
+    struct dict *visited = open_visited ?
+                dict_new_open(1024*1024, nworkers, NULL, NULL) :
+                dict_new(1024*1024, nworkers, NULL, NULL);
+    struct node *node = node_alloc(NULL, state);
     node->after = ictx;
-    graph_add(&global->graph, node);
-    void **p = dict_insert(visited, NULL, state, sizeof(*state));
-    assert(*p == NULL);
-    *p = node;
+    if (fpset_size != 0) {
+        global->fpset = fpset_new(bitstate, fpset_size);
+        (void) fpset_insert(global->fpset, state, sizeof(*state));
+    }
+    else if (disk) {
+        struct disk_record rec;
+        memset(&rec, 0, sizeof(rec));
+        rec.state = *state;
+        global->disk = disk_new(diskdir, nworkers, &rec);
+    }
+    else if (resume == NULL) {
+        graph_add(&global->graph, node);
+        void **p = dict_insert(visited, NULL, state, sizeof(*state));
+        assert(*p == NULL);
+        *p = node;
+    }
+    struct fpset *fpset = global->fpset;
+    bool nograph = fpset != NULL || disk;
+    global->mem_budget = mem_budget;
+    global->mem_limit = mem_threshold(global, visited, nworkers, nograph);
 
     // Allocate space for worker info
     struct worker *workers = calloc(nworkers, sizeof(*workers));
@@ -1936,14 +3362,27 @@ int main(int argc, char **argv){
         struct worker *w = &workers[i];
         w->global = global;
         w->timeout = timeout;
-        w->start_barrier = &start_barrier;
-        w->middle_barrier = &middle_barrier;
-        w->end_barrier = &end_barrier;
+        w->start_barrier = start_barrier;
+        w->middle_barrier = middle_barrier;
+        w->end_barrier = end_barrier;
         w->index = i;
         w->nworkers = nworkers;
+        w->workers = workers;
+        mutex_init(&w->deque.lock);
         w->visited = visited;
         w->last = &w->results;
 
+        // In swarm mode each worker has its own table of visited states,
+        // and global->fpset collects the states of all searches
+        w->fpset = global->fpset;
+        w->depth = -1;
+        if (swarm != 0) {
+            w->fpset = fpset_new(bitstate, fpset_size);
+            w->root = node;
+            w->frames = malloc(global->maxdepth * sizeof(struct swarm_frame));
+            w->pcs = calloc(global->code.len, sizeof(bool));
+        }
+
         // Create a context for evaluating invariants
         w->inv_step.ctx = calloc(1, sizeof(struct context) +
                                 MAX_CONTEXT_STACK * sizeof(hvalue_t));
@@ -1956,12 +3395,19 @@ int main(int argc, char **argv){
         w->inv_step.engine.allocator = &w->allocator;
         w->inv_step.engine.values = &global->values;
 
+        w->found = minheap_create(fail_cmp);
+
+        mem_account(w, WALLOC_CHUNK);
         w->alloc_buf = malloc(WALLOC_CHUNK);
         w->alloc_ptr = w->alloc_buf;
 
         w->allocator.alloc = walloc;
         w->allocator.ctx = w;
         w->allocator.worker = i;
+
+        if (disk) {
+            w->disk_buf = malloc(DISK_BATCH * sizeof(struct disk_record));
+        }
     }
 
     // Start the workers, who'll wait on the start barrier
@@ -1969,19 +3415,41 @@ int main(int argc, char **argv){
         thread_create(worker, &workers[i]);
     }
 
-    todo_list = node;
-    global->enqueued++;
+    // Continue from a checkpoint, or start with the initial state
+    if (resume != NULL) {
+        unsigned int nfrontier;
+        struct node **frontier = checkpoint_read(resume, global, &engine,
+                                    visited, hvm_hash, &nfrontier);
+        for (unsigned int i = 0; i < nfrontier; i++) {
+            deque_push(&workers[0].deque, frontier[i]);
+        }
+        free(frontier);
+        global->enqueued = global->graph.size;
+        global->pending = nfrontier;
+        global->mem_limit = mem_threshold(global, visited, nworkers, nograph);
+        printf("Resumed from %s: %u states, %u to explore\n",
+                    resume, global->graph.size, nfrontier);
+    }
+    else {
+        if (!disk && swarm == 0) {
+            deque_push(&workers[0].deque, node);
+        }
+        global->enqueued++;
+        global->pending = 1;
+    }
 
     double before = gettime(), postproc = 0;
+    double next_checkpoint = before + checkpoint_interval;
+    global->checkpoint = checkpoint;
     while (minheap_empty(global->failures)) {
         // Put the value dictionaries in concurrent mode
         value_set_concurrent(&global->values);
         dict_set_concurrent(visited);
 
         // make the threads work
-        barrier_wait(&start_barrier);
-        barrier_wait(&middle_barrier);
-        barrier_wait(&end_barrier);
+        barrier_wait(start_barrier);
+        barrier_wait(middle_barrier);
+        barrier_wait(end_barrier);
         // printf("Diameter %d\n", global->diameter);
         global->diameter++;
 
@@ -2000,124 +3468,185 @@ int main(int argc, char **argv){
         value_set_sequential(&global->values, &vs);
 
         // Collect the results of all the workers
+        unsigned int nnew = 0;
         for (unsigned int i = 0; i < nworkers; i++) {
-			process_results(global, &workers[i]);
+			nnew += process_results(global, &workers[i]);
+        }
+
+        // In disk mode, the new states are found by merging
+        if (disk && minheap_empty(global->failures)) {
+            nnew = disk_merge(global->disk);
+            global->enqueued += nnew;
         }
 
         postproc += gettime() - before_postproc;
 
-        if (todo_list == NULL) {
+        // In swarm mode, stop when all searches are done
+        if (swarm != 0) {
+            global->enqueued = fpset->count;
+            bool busy = false;
+            for (unsigned int i = 0; i < nworkers; i++) {
+                busy = busy || workers[i].depth >= 0;
+            }
+            if (global->stop || (!busy && global->nextrun >= swarm)) {
+                break;
+            }
+        }
+        else if (async ? global->pending == 0 : nnew == 0 && !global->pause) {
             break;
         }
-    }
 
-    printf("#states %d (time %.3lf+%.3lf=%.3lf)\n", global->graph.size, gettime() - before - postproc, postproc, gettime() - before);
- 
-    printf("Phase 3: analysis\n");
-    if (minheap_empty(global->failures)) {
-        // Link the forward edges
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-            for (struct edge *edge = node->bwd; edge != NULL; edge = edge->bwdnext) {
-                struct node *other = edge->src;
-                edge->dst = node;
-                edge->fwdnext = other->fwd;
-                other->fwd = edge;
+        // See if it is time to record less
+        if (mem_budget != 0) {
+            mem_check(global, workers, nworkers, nograph);
+            fpset = global->fpset;
+            if (global->mem_out) {
+                break;
             }
         }
 
-        // find the strongly connected components
-        unsigned int ncomponents = graph_find_scc(&global->graph);
-        printf("%u components\n", ncomponents);
+        // Every so often, and when out of time, save a checkpoint.  The
+        // trails of hash compaction are not saved, so after switching to it
+        // (see mem_check()) there are no more checkpoints.
+        if (checkpoint != NULL && minheap_empty(global->failures) &&
+                    global->mem_level < MEM_COMPACT &&
+                    (global->timedout || gettime() >= next_checkpoint)) {
+            save_checkpoint(global, workers, nworkers, hvm_hash);
+            next_checkpoint = gettime() + checkpoint_interval;
+        }
+        if (global->timedout && minheap_empty(global->failures)) {
+            fprintf(stderr, "charm: timeout exceeded\n");
+            exit(1);
+        }
+        global->pause = false;
+    }
 
-        // mark the components that are "good" because they have a way out
-        struct component *components = calloc(ncomponents, sizeof(*components));
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-			assert(node->component < ncomponents);
-            struct component *comp = &components[node->component];
-            if (comp->size == 0) {
-                comp->rep = node;
-                comp->all_same = value_ctx_all_eternal(node->state.ctxbag)
-                    && value_ctx_all_eternal(node->state.stopbag);
-            }
-            else if (node->state.vars != comp->rep->state.vars ||
-                        !value_ctx_all_eternal(node->state.ctxbag) ||
-                        !value_ctx_all_eternal(node->state.stopbag)) {
-                comp->all_same = false;
-            }
-            comp->size++;
-            if (comp->good) {
-                continue;
-            }
-            // if this component has a way out, it is good
-            for (struct edge *edge = node->fwd;
-                            edge != NULL && !comp->good; edge = edge->fwdnext) {
-                if (edge->dst->component != node->component) {
-                    comp->good = true;
-                    break;
-                }
-            }
+    // With a memory budget the search may have stopped recording edges or
+    // switched to hash compaction (in which case a path to a failure is
+    // only known as a trail)
+    enum mem_level mem_level = global->mem_level;
+    bool trails = nograph || mem_level == MEM_COMPACT;
+    nograph = nograph || mem_level >= MEM_NO_EDGES;
+
+    // If the budget ran out, or the hash compaction table filled up, only
+    // part of the state space has been explored
+    bool table_full = fpset != NULL && swarm == 0 && !fpset->bitstate &&
+                                                        fpset_full(fpset);
+    bool incomplete = global->mem_out || table_full;
+
+    if (!nograph) {
+        graph_build_bwd(&global->graph);
+    }
+    if (async && !nograph) {
+        shorten_paths(&global->graph);
+    }
+
+    printf("#states %d (time %.3lf+%.3lf=%.3lf) steal/idle:", nograph ? global->enqueued : global->graph.size, gettime() - before - postproc, postproc, gettime() - before);
+    for (unsigned int i = 0; i < nworkers; i++) {
+        printf(" %u/%u", workers[i].nsteals, workers[i].nidle);
+    }
+    printf("\n");
+
+    // Memory allocated by the workers, by use
+    printf("Memory:");
+    uint64_t total = 0;
+    for (unsigned int u = 0; u < WA_NUSES; u++) {
+        uint64_t nbytes = 0;
+        for (unsigned int i = 0; i < nworkers; i++) {
+            nbytes += workers[i].nbytes[u];
         }
+        printf(" %s %.1fMB", walloc_names[u], nbytes / 1e6);
+        total += nbytes;
+    }
+    unsigned int nstates = nograph ? global->enqueued : global->graph.size;
+    printf(" (%.0f bytes/state)\n", nstates == 0 ? 0.0 : (double) total / nstates);
 
-        // components that have only one shared state and only eternal
-        // threads are good because it means all its threads are blocked
-        for (unsigned int i = 0; i < ncomponents; i++) {
-            struct component *comp = &components[i];
-            assert(comp->size > 0);
-            if (!comp->good && comp->all_same) {
-                comp->good = true;
-                comp->final = true;
+    if (global->symmetry != NULL) {
+        printf("Symmetry: %u atoms in %u groups, %u permutations per state\n",
+                global->symmetry->natoms, global->symmetry->ngroups, global->symmetry->nperms);
+    }
+
+    // Coverage of all the searches together
+    unsigned int nruns = 0, ncovered = 0;
+    uint64_t nvisits = 0;
+    if (swarm != 0) {
+        for (unsigned int i = 0; i < nworkers; i++) {
+            nruns += workers[i].nruns;
+            nvisits += workers[i].nvisits;
+            if (workers[i].depth >= 0) {        // unfinished search
+                nvisits += workers[i].fpset->count;
             }
         }
-
-        // Look for states in final components
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-			assert(node->component < ncomponents);
-            struct component *comp = &components[node->component];
-            if (comp->final) {
-                node->final = true;
-                if (global->dfa != NULL &&
-						!dfa_is_final(global->dfa, node->state.dfa_state)) {
-                    struct failure *f = new_alloc(struct failure);
-                    f->type = FAIL_BEHAVIOR;
-                    f->choice = node->choice;
-                    f->node = node;
-                    minheap_insert(global->failures, f);
-                    // break;
+        for (int pc = 0; pc < global->code.len; pc++) {
+            for (unsigned int i = 0; i < nworkers; i++) {
+                if (workers[i].pcs[pc]) {
+                    ncovered++;
+                    break;
                 }
             }
         }
+        printf("Swarm: %u of %u searches completed%s, %"PRIu64" states visited (about %d distinct), %u of %d instructions executed; liveness and data races not checked\n",
+                nruns, swarm, global->stop && minheap_empty(global->failures) ? " (out of time)" : "",
+                nvisits, global->enqueued, ncovered, global->code.len);
+    }
 
-        if (minheap_empty(global->failures)) {
-            // now count the nodes that are in bad components
-            int nbad = 0;
-            for (unsigned int i = 0; i < global->graph.size; i++) {
-                struct node *node = global->graph.nodes[i];
-                if (!components[node->component].good) {
-                    nbad++;
-                    struct failure *f = new_alloc(struct failure);
-                    f->type = FAIL_TERMINATION;
-                    f->choice = node->choice;
-                    f->node = node;
-                    minheap_insert(global->failures, f);
-                    // break;
-                }
-            }
+    double omission_expected = 0, omission_probability = 0;
+    if (fpset != NULL && swarm == 0) {
+        fpset_omission(fpset, &omission_expected, &omission_probability);
+        printf("%s: estimated omission probability %.3g (%.3g states)\n",
+                    bitstate ? "Bitstate" : "Hash compaction",
+                    omission_probability, omission_expected);
+    }
+    if (table_full) {
+        printf("Hash compaction: table full, %"PRId64" new states not explored (use a larger -Xhashcompact size)\n",
+                    fpset->ndropped);
+    }
+    if (disk) {
+        disk_delete(global->disk);
+        global->disk = NULL;
+    }
 
-            if (nbad == 0 && !cflag) {
-                for (unsigned int i = 0; i < global->graph.size; i++) {
-                    global->graph.nodes[i]->visited = false;
-                }
-                for (unsigned int i = 0; i < global->graph.size; i++) {
-                    struct node *node = global->graph.nodes[i];
-                    if (components[node->component].size > 1) {
-                        detect_busywait(global->failures, node);
-                    }
-                }
-            }
+    // Reconstruct the path to the failure by re-executing it
+    if (trails && !minheap_empty(global->failures)) {
+        struct failure *bad = minheap_getmin(global->failures);
+        global->graph.size = 0;
+        global->mem_level = MEM_FULL;
+        global->failures = minheap_create(fail_cmp);
+        minheap_insert(global->failures,
+                replay_trail(global, &workers[0], state, ictx, bad));
+    }
+ 
+    // Without a graph (hash compaction, bitstate, or disk) only safety and
+    // invariants can be checked
+    printf("Phase 3: analysis\n");
+    if (!nograph && !incomplete && minheap_empty(global->failures)) {
+        // find the strongly connected components
+        unsigned int ncomponents;
+        if (parallel_scc) {
+            struct scc *scc = graph_scc_new(&global->graph, nworkers);
+            run_task(global, start_barrier, end_barrier, graph_scc_work, scc);
+            ncomponents = graph_scc_finish(scc);
         }
+        else {
+            ncomponents = graph_find_scc(&global->graph);
+        }
+        printf("%u components\n", ncomponents);
+
+        // look for failures to terminate, bad final states, and busy waiting
+        struct analysis *an = new_alloc(struct analysis);
+        an->global = global;
+        an->workers = workers;
+        an->components = calloc(ncomponents, sizeof(struct component));
+        an->ncomponents = ncomponents;
+        an->busywait = !cflag;
+        barrier_init(&an->barrier, nworkers);
+        run_task(global, start_barrier, end_barrier, analysis_work, an);
+        for (unsigned int i = 0; i < nworkers; i++) {
+            minheap_move(workers[i].found, global->failures);
+        }
+        barrier_destroy(&an->barrier);
+        free(an->components);
+        free(an);
     }
 
 #ifdef OBSOLETE
@@ -2132,10 +3661,10 @@ int main(int argc, char **argv){
             if (node->parent != NULL) {
                 fprintf(df, "    parent: %d\n", node->parent->id);
             }
-            fprintf(df, "    vars: %s\n", value_string(node->state.vars));
+            fprintf(df, "    vars: %s\n", value_string(node->state->vars));
             fprintf(df, "    fwd:\n");
             int eno = 0;
-            for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext, eno++) {
+            for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++, eno++) {
                 fprintf(df, "        %d:\n", eno);
                 struct context *ctx = value_get(edge->ctx, NULL);
                 fprintf(df, "            context: %s %s %d\n", value_string(ctx->name), value_string(ctx->arg), ctx->pc);
@@ -2151,7 +3680,8 @@ int main(int argc, char **argv){
             }
             fprintf(df, "    bwd:\n");
             eno = 0;
-            for (struct edge *edge = node->bwd; edge != NULL; edge = edge->bwdnext, eno++) {
+            for (unsigned int b = global->graph.bwd_index[i]; b < global->graph.bwd_index[i + 1]; b++, eno++) {
+                struct edge *edge = global->graph.bwd[b];
                 fprintf(df, "        %d:\n", eno);
                 struct context *ctx = value_get(edge->ctx, NULL);
                 fprintf(df, "            context: %s %s %d\n", value_string(ctx->name), value_string(ctx->arg), ctx->pc);
@@ -2183,26 +3713,57 @@ int main(int argc, char **argv){
 #endif // OBSOLETE
 
     // Look for data races
-    // TODO.  Can easily be parallelized
 	// TODO.  Don't need failures/warnings distinction any more
     struct minheap *warnings = minheap_create(fail_cmp);
-    if (minheap_empty(global->failures)) {
+    if (!nograph && !incomplete && mem_level < MEM_NO_ACCESSES && minheap_empty(global->failures)) {
         printf("Check for data races\n");
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-            graph_check_for_data_race(node, warnings, &engine);
-            if (!minheap_empty(warnings)) {
-                break;
-            }
+        struct analysis *an = new_alloc(struct analysis);
+        an->global = global;
+        an->workers = workers;
+        an->race = UINT_MAX;
+        barrier_init(&an->barrier, nworkers);
+        value_set_concurrent(&global->values);
+        run_task(global, start_barrier, end_barrier, analysis_races, an);
+        struct value_stable vs;
+        memset(&vs, 0, sizeof(vs));
+        for (unsigned int i = 0; i < nworkers; i++) {
+            value_stable_add(&vs, &workers[i].vs);
+            minheap_move(workers[i].found, warnings);
         }
+        value_set_sequential(&global->values, &vs);
+        barrier_destroy(&an->barrier);
+        free(an);
     }
 
+    // The access info is no longer needed
+    for (unsigned int i = 0; i < nworkers; i++) {
+        walloc_access_free(&workers[i]);
+    }
+
+    // Without the graph only safety and invariants have been checked, and
+    // the results must not claim more
     bool no_issues = minheap_empty(global->failures) && minheap_empty(warnings);
+    const char *no_issues_str = global->mem_out ?
+        "Incomplete: memory budget exceeded (no safety violations found so far)" :
+        table_full ?
+        "Incomplete: hash compaction table full (no safety violations found so far)" :
+        nograph ? "No safety violations (liveness and data races not checked)" :
+        mem_level >= MEM_NO_ACCESSES ?
+            "No safety or liveness violations (data races not checked)" :
+        "No issues";
     if (no_issues) {
-        printf("No issues\n");
+        printf("%s\n", no_issues_str);
+        if (fpset_size != 0 || disk) {
+            printf("Warning: %s keeps no state graph, so termination, busy waiting, and data races are not checked\n",
+                        swarm != 0 ? "-Xswarm" : disk ? "-Xdisk" :
+                        bitstate ? "-Xbitstate" : "-Xhashcompact");
+        }
+        for (unsigned int l = MEM_NO_ACCESSES; l <= mem_level; l++) {
+            printf("Warning: %s\n", mem_warnings[l]);
+        }
     }
 
-    FILE *out = fopen(outfile, "w");
+    FILE *out = fopen(outfile, hco_json ? "w" : "wb");
     if (out == NULL) {
         fprintf(stderr, "charm: can't create %s\n", outfile);
         exit(1);
@@ -2211,68 +3772,76 @@ int main(int argc, char **argv){
     printf("Phase 4: write results to %s\n", outfile);
     fflush(stdout);
 
-    fprintf(out, "{\n");
+    // The output is either JSON or binary (see hco.h).  The binary format
+    // consists of sections, and section is the start of the current one.
+    int64_t section = 0;
+    if (hco_json) {
+        fprintf(out, "{\n");
+    }
+    else {
+        hco_header(out);
+    }
+
+    struct strbuf stats;
+    strbuf_init(&stats);
+    if (fpset != NULL && swarm == 0) {
+        strbuf_printf(&stats, "\"omission_probability\": %.3g", omission_probability);
+    }
+    if (swarm != 0) {
+        strbuf_printf(&stats, "\"swarm\": { \"searches\": %u, \"completed\": %u, \"visited\": %"PRIu64", \"distinct\": %d, \"instructions\": %d, \"executed\": %u }",
+                swarm, nruns, nvisits, global->enqueued, global->code.len, ncovered);
+    }
+    if (strbuf_getlen(&stats) > 0) {
+        if (hco_json) {
+            fprintf(out, "  %s,\n", strbuf_getstr(&stats));
+        }
+        else {
+            section = hco_begin(out, "STAT");
+            fprintf(out, "{ %s }", strbuf_getstr(&stats));
+            hco_end(out, section);
+        }
+    }
+    strbuf_deinit(&stats);
 
-    if (no_issues) {
-        fprintf(out, "  \"issue\": \"No issues\",\n");
+    if (no_issues && (nograph || incomplete)) {
+        // There is no (complete) graph to output
+        hco_issue(out, hco_json, no_issues_str);
+    }
+    else if (no_issues) {
+        hco_issue(out, hco_json, no_issues_str);
 
         destutter1(&global->graph);
 
         // Output the symbols;
         struct dict *symbols = collect_symbols(&global->graph);
-        fprintf(out, "  \"symbols\": {\n");
-        struct symbol_env se = { .out = out, .first = true };
-        dict_iter(symbols, print_symbol, &se);
-        fprintf(out, "\n");
-        fprintf(out, "  },\n");
+        if (hco_json) {
+            fprintf(out, "  \"symbols\": {\n");
+            struct symbol_env se = { .out = out, .first = true };
+            dict_iter(symbols, print_symbol, &se);
+            fprintf(out, "\n");
+            fprintf(out, "  },\n");
+        }
+        else {
+            unsigned int nsymbols = 0;
+            dict_iter(symbols, hco_count_symbol, &nsymbols);
+            section = hco_begin(out, "SYMB");
+            hco_put(out, nsymbols);
+            dict_iter(symbols, hco_symbol, out);
+            hco_end(out, section);
+        }
 
-        fprintf(out, "  \"nodes\": [\n");
-        bool first = true;
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-            assert(node->id == i);
-            if (node->reachable) {
-                if (first) {
-                    first = false;
-                }
-                else {
-                    fprintf(out, ",\n");
-                }
-                fprintf(out, "    {\n");
-                fprintf(out, "      \"idx\": %d,\n", node->id);
-                fprintf(out, "      \"component\": %d,\n", node->component);
-#ifdef notdef
-                if (node->parent != NULL) {
-                    fprintf(out, "      \"parent\": %d,\n", node->parent->id);
-                }
-                char *val = json_escape_value(node->state.vars);
-                fprintf(out, "      \"value\": \"%s:%d\",\n", val, node->state.choosing != 0);
-                free(val);
-#endif
-                print_transitions(out, symbols, node->fwd);
-                if (i == 0) {
-                    fprintf(out, "      \"type\": \"initial\"\n");
-                }
-                else if (node->final) {
-                    fprintf(out, "      \"type\": \"terminal\"\n");
-                }
-                else {
-                    fprintf(out, "      \"type\": \"normal\"\n");
-                }
-                fprintf(out, "    }");
-            }
+        if (!hco_json) {
+            section = hco_begin(out, "GRPH");
+            hco_graph(out, &global->graph, symbols);
+            hco_end(out, section);
         }
-        fprintf(out, "\n");
-        fprintf(out, "  ],\n");
-#ifdef notdef
-        fprintf(out, "  \"edges\": [\n");
-        first = true;
-        bool first_log;
-        for (unsigned int i = 0; i < global->graph.size; i++) {
-            struct node *node = global->graph.nodes[i];
-            if (node->reachable) {
-                for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
-                    assert(edge->dst->reachable);
+        else {
+            fprintf(out, "  \"nodes\": [\n");
+            bool first = true;
+            for (unsigned int i = 0; i < global->graph.size; i++) {
+                struct node *node = global->graph.nodes[i];
+                assert(node->id == i);
+                if (node->reachable) {
                     if (first) {
                         first = false;
                     }
@@ -2280,31 +3849,78 @@ int main(int argc, char **argv){
                         fprintf(out, ",\n");
                     }
                     fprintf(out, "    {\n");
-                    fprintf(out, "      \"src\": %d,\n", node->id);
-                    fprintf(out, "      \"dst\": %d,\n", edge->dst->id);
-                    fprintf(out, "      \"print\": [");
-                    first_log = true;
-                    for (int j = 0; j < edge->nlog; j++) {
-                        if (first_log) {
-                            first_log = false;
-                            fprintf(out, "\n");
+                    fprintf(out, "      \"idx\": %d,\n", node->id);
+                    fprintf(out, "      \"component\": %d,\n", node->component);
+#ifdef notdef
+                    if (node->parent != NULL) {
+                        fprintf(out, "      \"parent\": %d,\n", node->parent->id);
+                    }
+                    char *val = json_escape_value(node->state->vars);
+                    fprintf(out, "      \"value\": \"%s:%d\",\n", val, node->state->choosing != 0);
+                    free(val);
+#endif
+                    print_transitions(out, symbols, node);
+                    if (i == 0) {
+                        fprintf(out, "      \"type\": \"initial\"\n");
+                    }
+                    else if (node->final) {
+                        fprintf(out, "      \"type\": \"terminal\"\n");
+                    }
+                    else {
+                        fprintf(out, "      \"type\": \"normal\"\n");
+                    }
+                    fprintf(out, "    }");
+                }
+            }
+            fprintf(out, "\n");
+            fprintf(out, "  ],\n");
+#ifdef notdef
+            fprintf(out, "  \"edges\": [\n");
+            first = true;
+            bool first_log;
+            for (unsigned int i = 0; i < global->graph.size; i++) {
+                struct node *node = global->graph.nodes[i];
+                if (node->reachable) {
+                    for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+                        assert(edge->dst->reachable);
+                        if (first) {
+                            first = false;
                         }
                         else {
                             fprintf(out, ",\n");
                         }
-                        char *p = value_json(edge->log[j]);
-                        fprintf(out, "        %s", p);
-                        free(p);
+                        fprintf(out, "    {\n");
+                        fprintf(out, "      \"src\": %d,\n", node->id);
+                        fprintf(out, "      \"dst\": %d,\n", edge->dst->id);
+                        fprintf(out, "      \"print\": [");
+                        first_log = true;
+                        for (int j = 0; j < edge->nlog; j++) {
+                            if (first_log) {
+                                first_log = false;
+                                fprintf(out, "\n");
+                            }
+                            else {
+                                fprintf(out, ",\n");
+                            }
+                            char *p = value_json(edge->log[j]);
+                            fprintf(out, "        %s", p);
+                            free(p);
+                        }
+                        fprintf(out, "\n");
+                        fprintf(out, "      ]\n");
+                        fprintf(out, "    }");
                     }
-                    fprintf(out, "\n");
-                    fprintf(out, "      ]\n");
-                    fprintf(out, "    }");
                 }
             }
-        }
-        fprintf(out, "\n");
-        fprintf(out, "  ],\n");
+            fprintf(out, "\n");
+            fprintf(out, "  ],\n");
 #endif // notdef
+        }
+
+        // The behavior (the DFA of what is printed) for harmony -o x.hfa
+        if (hfafile != NULL || gvfile != NULL) {
+            behavior_write(&global->graph, symbols, hfafile, gvfile);
+        }
     }
     else {
         // Find shortest "bad" path
@@ -2319,30 +3935,34 @@ int main(int argc, char **argv){
         switch (bad->type) {
         case FAIL_SAFETY:
             printf("Safety Violation\n");
-            fprintf(out, "  \"issue\": \"Safety violation\",\n");
+            hco_issue(out, hco_json, "Safety violation");
             break;
         case FAIL_INVARIANT:
             printf("Invariant Violation\n");
-            fprintf(out, "  \"issue\": \"Invariant violation\",\n");
+            hco_issue(out, hco_json, "Invariant violation");
             break;
         case FAIL_BEHAVIOR:
             printf("Behavior Violation: terminal state not final\n");
-            fprintf(out, "  \"issue\": \"Behavior violation: terminal state not final\",\n");
+            hco_issue(out, hco_json, "Behavior violation: terminal state not final");
             break;
         case FAIL_TERMINATION:
             printf("Non-terminating state\n");
-            fprintf(out, "  \"issue\": \"Non-terminating state\",\n");
+            hco_issue(out, hco_json, "Non-terminating state");
             break;
         case FAIL_BUSYWAIT:
             printf("Active busy waiting\n");
-            fprintf(out, "  \"issue\": \"Active busy waiting\",\n");
+            hco_issue(out, hco_json, "Active busy waiting");
             break;
         case FAIL_RACE:
             assert(bad->address != VALUE_ADDRESS);
             char *addr = value_string(bad->address);
             char *json = json_string_encode(addr, strlen(addr));
             printf("Data race (%s)\n", json);
-            fprintf(out, "  \"issue\": \"Data race (%s)\",\n", json);
+            struct strbuf sb;
+            strbuf_init(&sb);
+            strbuf_printf(&sb, "Data race (%s)", addr);
+            hco_issue(out, hco_json, strbuf_getstr(&sb));
+            strbuf_deinit(&sb);
             free(json);
             free(addr);
             break;
@@ -2350,19 +3970,42 @@ int main(int argc, char **argv){
             panic("main: bad fail type");
         }
 
-        fprintf(out, "  \"macrosteps\": [");
+        if (hco_json) {
+            fprintf(out, "  \"macrosteps\": [");
+        }
+        else {
+            section = hco_begin(out, "CEXM");
+            fprintf(out, "[");
+        }
         struct state oldstate;
         memset(&oldstate, 0, sizeof(oldstate));
         struct context *oldctx = calloc(1, sizeof(*oldctx));
         global->dumpfirst = true;
-        path_dump(global, out, bad->node, bad->parent, bad->choice, &oldstate, &oldctx, bad->interrupt, bad->node->steps);
+        if (global->symmetry != NULL) {
+            for (unsigned int i = 0; i < global->symmetry->natoms; i++) {
+                global->symmap[i] = i;
+            }
+        }
+        path_dump(global, out, bad->node, bad->parent, bad->choice, &oldstate, &oldctx, bad->interrupt, bad->node->steps,
+                    bad->parent == NULL ? bad->node->perm : bad->perm);
         fprintf(out, "\n");
         free(oldctx);
-        fprintf(out, "  ],\n");
+        if (hco_json) {
+            fprintf(out, "  ],\n");
+        }
+        else {
+            fprintf(out, "  ]\n");
+            hco_end(out, section);
+        }
     }
 
+    // In the binary format the code is a JSON object in its own section
+    if (!hco_json) {
+        section = hco_begin(out, "CODE");
+        fprintf(out, "{\n");
+    }
     fprintf(out, "  \"code\": [\n");
-    jc = dict_lookup(jv->u.map, "pretty", 6);
+    struct json_value *jc = hvm.pretty;
     assert(jc->type == JV_LIST);
     for (unsigned int i = 0; i < jc->u.list.nvals; i++) {
         struct json_value *next = jc->u.list.vals[i];
@@ -2398,7 +4041,7 @@ int main(int argc, char **argv){
     fprintf(out, "  ],\n");
 
     fprintf(out, "  \"locations\": {");
-    jc = dict_lookup(jv->u.map, "locations", 9);
+    jc = hvm.locations;
     assert(jc->type == JV_MAP);
     struct enum_loc_env_t enum_loc_env;
     enum_loc_env.out = out;
@@ -2407,6 +4050,10 @@ int main(int argc, char **argv){
     fprintf(out, "\n  }\n");
 
     fprintf(out, "}\n");
+    if (!hco_json) {
+        hco_end(out, section);
+        hco_section(out, HCO_END, NULL, 0);
+    }
 	fclose(out);
 
     iface_write_spec_graph_to_file(global, "iface.gv");
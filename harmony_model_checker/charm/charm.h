@@ -5,6 +5,18 @@
 #include "code.h"
 #include "value.h"
 #include "graph.h"
+#include "fpset.h"
+#include "disk.h"
+#include "symmetry.h"
+
+// With a memory budget (-Xmem), the search records less and less as memory
+// use grows, giving up on some of the checks
+enum mem_level {
+    MEM_FULL,           // everything is recorded
+    MEM_NO_ACCESSES,    // no access info, so no data race detection
+    MEM_NO_EDGES,       // no edges, so only safety and invariants are checked
+    MEM_COMPACT         // new states are only kept as fingerprints
+};
 
 struct global_t {
     struct code_t code;
@@ -15,12 +27,33 @@ struct global_t {
     int nprocesses;              // the number of processes in the list
     double lasttime;             // since last report printed
     int enqueued;                // #states enqueued
-    int dequeued;                // #states dequeued
+    volatile int32_t dequeued;   // #states dequeued (updated atomically)
     bool dumpfirst;              // for json dumping
     struct dfa *dfa;             // for tracking correct behaviors
     hvalue_t init_name;          // "__init__" atom
     unsigned int diameter;       // graph diameter
     bool run_direct;             // non-model-checked mode
+    bool async;                  // explore without per-layer epochs
+    volatile bool pause;         // async: workers should go to the barriers
+    volatile int64_t pending;    // async: #nodes found but not yet explored
+    struct fpset *fpset;         // fingerprints of states if not NULL
+    struct disk *disk;           // external-memory BFS if not NULL
+    struct symmetry *symmetry;   // symmetry reduction if not NULL
+    unsigned int *symmap;        // renames nodes into states when printing a path
+    unsigned int swarm;          // swarm mode: #independent searches (0 if not)
+    unsigned int maxdepth;       // swarm mode: depth bound of each search
+    volatile int64_t nextrun;    // swarm mode: #searches started so far
+    volatile bool stop;          // swarm mode: failure found or out of time
+    uint64_t mem_budget;         // #bytes allowed, 0 if no budget
+    volatile int64_t mem_used;   // #bytes allocated by the workers
+    uint64_t mem_tables;         // #bytes in the hash tables (as of last epoch)
+    uint64_t mem_limit;          // when to go to the next level
+    enum mem_level mem_level;    // only changes between epochs
+    bool mem_out;                // stopped because of the budget
+    const char *checkpoint;      // file for checkpoints (-Xcheckpoint), or NULL
+    volatile bool timedout;      // with checkpoints: out of time
+    void (*task)(void *arg, unsigned int worker);  // analysis task, if any
+    void *task_arg;              // argument to the task
 };
 
 #endif //SRC_CHARM_H
@@ -0,0 +1,646 @@
+#include "head.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stddef.h>
+#include <string.h>
+#include <assert.h>
+
+#include "global.h"
+#include "hashdict.h"
+#include "checkpoint.h"
+
+#define CK_MAGIC        "HCHK"
+#define CK_VERSION      1
+#define CK_BUFSIZE      (1 << 16)
+
+// Flags of an edge in a checkpoint
+#define CK_INTERRUPT    0x1
+#define CK_LOG          0x2     // print history included
+#define CK_AI           0x4     // access info included
+
+// The fields of a state that are values (dfa_state is just a number)
+static const size_t ck_state_fields[] = {
+    offsetof(struct state, vars),
+    offsetof(struct state, seqs),
+    offsetof(struct state, choosing),
+    offsetof(struct state, ctxbag),
+    offsetof(struct state, stopbag),
+    offsetof(struct state, termbag),
+    offsetof(struct state, invariants)
+};
+#define CK_NSTATE_FIELDS    (sizeof(ck_state_fields) / sizeof(ck_state_fields[0]))
+
+// The fields of a context that are values (in addition to the stack)
+static const size_t ck_context_fields[] = {
+    offsetof(struct context, name),
+    offsetof(struct context, entry),
+    offsetof(struct context, arg),
+    offsetof(struct context, this),
+    offsetof(struct context, vars),
+    offsetof(struct context, trap_pc),
+    offsetof(struct context, trap_arg),
+    offsetof(struct context, failure)
+};
+#define CK_NCONTEXT_FIELDS  (sizeof(ck_context_fields) / sizeof(ck_context_fields[0]))
+
+#define CK_FIELD(p, off)    (* (hvalue_t *) ((char *) (p) + (off)))
+
+static hvalue_t ck_noindices[1];    // for access info with an empty address
+
+struct ck_writer {
+    FILE *fp;
+    unsigned char buf[CK_BUFSIZE];
+    unsigned int n;             // #bytes in buf
+    struct dict *ids;           // value -> record number
+    uint64_t nvalues;           // #value records written
+};
+
+struct ck_reader {
+    FILE *fp;
+    const char *file;
+    unsigned char buf[CK_BUFSIZE];
+    unsigned int n, i;          // #bytes in buf, next one
+    hvalue_t *vals;             // value of each record (starting at 1)
+    uint64_t nvalues, alloc_vals;
+    void *scratch;              // for reading a value record
+    unsigned int alloc_scratch;
+};
+
+// Values that are pointers into the value tables.  In a checkpoint they are
+// replaced by the number of their record, keeping the type.
+static bool ck_pointer(hvalue_t v){
+    switch (VALUE_TYPE(v)) {
+    case VALUE_ATOM:
+    case VALUE_LIST:
+    case VALUE_DICT:
+    case VALUE_SET:
+    case VALUE_ADDRESS:
+    case VALUE_CONTEXT:
+        return (v & ~VALUE_MASK) != 0;
+    default:
+        return false;
+    }
+}
+
+static void ck_flush(struct ck_writer *w){
+    if (w->n != 0 && fwrite(w->buf, 1, w->n, w->fp) != w->n) {
+        panic("checkpoint_write: write failed (disk full?)");
+    }
+    w->n = 0;
+}
+
+static void ck_bytes(struct ck_writer *w, const void *p, size_t size){
+    const unsigned char *q = p;
+    while (size > 0) {
+        if (w->n == CK_BUFSIZE) {
+            ck_flush(w);
+        }
+        size_t k = CK_BUFSIZE - w->n;
+        if (k > size) {
+            k = size;
+        }
+        memcpy(&w->buf[w->n], q, k);
+        w->n += k;
+        q += k;
+        size -= k;
+    }
+}
+
+// Numbers are written 7 bits at a time, low bits first
+static void ck_put(struct ck_writer *w, uint64_t x){
+    unsigned char b[10];
+    unsigned int n = 0;
+    while (x >= 0x80) {
+        b[n++] = (unsigned char) (x | 0x80);
+        x >>= 7;
+    }
+    b[n++] = (unsigned char) x;
+    ck_bytes(w, b, n);
+}
+
+static uint64_t ck_ref(struct ck_writer *w, hvalue_t v){
+    if (!ck_pointer(v)) {
+        return v;
+    }
+    void *id = dict_lookup(w->ids, &v, sizeof(v));
+    assert(id != NULL);
+    return ((uint64_t) (uintptr_t) id << VALUE_BITS) | VALUE_TYPE(v);
+}
+
+// Write the record of a value, after those of the values it contains
+static void ck_value(struct ck_writer *w, hvalue_t v){
+    if (!ck_pointer(v) || dict_lookup(w->ids, &v, sizeof(v)) != NULL) {
+        return;
+    }
+
+    unsigned int size;
+    switch (VALUE_TYPE(v)) {
+    case VALUE_ATOM:
+        {
+            char *s = value_get(v, &size);
+            ck_put(w, VALUE_ATOM);
+            ck_put(w, size);
+            ck_bytes(w, s, size);
+        }
+        break;
+    case VALUE_CONTEXT:
+        {
+            struct context *ctx = value_get(v, &size);
+            for (unsigned int i = 0; i < CK_NCONTEXT_FIELDS; i++) {
+                ck_value(w, CK_FIELD(ctx, ck_context_fields[i]));
+            }
+            for (int i = 0; i < ctx->sp; i++) {
+                ck_value(w, ctx->stack[i]);
+            }
+            struct context *copy = malloc(size);
+            memcpy(copy, ctx, size);
+            for (unsigned int i = 0; i < CK_NCONTEXT_FIELDS; i++) {
+                hvalue_t *f = &CK_FIELD(copy, ck_context_fields[i]);
+                *f = ck_ref(w, *f);
+            }
+            for (int i = 0; i < copy->sp; i++) {
+                copy->stack[i] = ck_ref(w, copy->stack[i]);
+            }
+            ck_put(w, VALUE_CONTEXT);
+            ck_put(w, size);
+            ck_bytes(w, copy, size);
+            free(copy);
+        }
+        break;
+    default:
+        {
+            hvalue_t *vals = value_get(v, &size);
+            unsigned int n = size / sizeof(hvalue_t);
+            for (unsigned int i = 0; i < n; i++) {
+                ck_value(w, vals[i]);
+            }
+            ck_put(w, VALUE_TYPE(v));
+            ck_put(w, n);
+            for (unsigned int i = 0; i < n; i++) {
+                ck_put(w, ck_ref(w, vals[i]));
+            }
+        }
+    }
+
+    void **p = dict_insert(w->ids, NULL, &v, sizeof(v));
+    *p = (void *) (uintptr_t) ++w->nvalues;
+}
+
+// Write the records of the values that a node refers to
+static void ck_node_values(struct ck_writer *w, struct node *node){
+    for (unsigned int i = 0; i < CK_NSTATE_FIELDS; i++) {
+        ck_value(w, CK_FIELD(node->state, ck_state_fields[i]));
+    }
+    ck_value(w, node->before);
+    ck_value(w, node->after);
+    ck_value(w, node->choice);
+    for (unsigned int i = 0; i < node->nfwd; i++) {
+        struct edge *edge = &node->fwd[i];
+        ck_value(w, edge->ctx);
+        ck_value(w, edge->choice);
+        ck_value(w, edge->after);
+        if (edge->log != NULL) {
+            for (unsigned int j = 0; j < edge->nlog; j++) {
+                ck_value(w, edge->log[j]);
+            }
+        }
+        if (edge->ai != NULL) {
+            for (unsigned int j = 0; j < edge->nai; j++) {
+                struct access_info *ai = &edge->ai[j];
+                for (unsigned int k = 0; k < ai->n; k++) {
+                    ck_value(w, ai->indices[k]);
+                }
+            }
+        }
+    }
+}
+
+static void ck_node(struct ck_writer *w, struct node *node){
+    for (unsigned int i = 0; i < CK_NSTATE_FIELDS; i++) {
+        ck_put(w, ck_ref(w, CK_FIELD(node->state, ck_state_fields[i])));
+    }
+    ck_put(w, node->state->dfa_state);
+    ck_put(w, node->parent == NULL ? 0 : node->parent->id + 1);
+    ck_put(w, node->len);
+    ck_put(w, node->steps);
+    ck_put(w, ck_ref(w, node->before));
+    ck_put(w, ck_ref(w, node->after));
+    ck_put(w, ck_ref(w, node->choice));
+    ck_put(w, node->interrupt);
+    ck_put(w, node->perm);
+    ck_put(w, node->nfwd);
+    for (unsigned int i = 0; i < node->nfwd; i++) {
+        struct edge *edge = &node->fwd[i];
+        ck_put(w, ck_ref(w, edge->ctx));
+        ck_put(w, ck_ref(w, edge->choice));
+        ck_put(w, ck_ref(w, edge->after));
+        ck_put(w, edge->dst->id);
+        ck_put(w, edge->steps);
+        ck_put(w, edge->perm);
+        ck_put(w, (edge->interrupt ? CK_INTERRUPT : 0) |
+                  (edge->log != NULL ? CK_LOG : 0) |
+                  (edge->ai != NULL ? CK_AI : 0));
+        ck_put(w, edge->nlog);
+        if (edge->log != NULL) {
+            for (unsigned int j = 0; j < edge->nlog; j++) {
+                ck_put(w, ck_ref(w, edge->log[j]));
+            }
+        }
+        ck_put(w, edge->nai);
+        if (edge->ai != NULL) {
+            for (unsigned int j = 0; j < edge->nai; j++) {
+                struct access_info *ai = &edge->ai[j];
+                ck_put(w, ai->load);
+                ck_put(w, ai->pc);
+                ck_put(w, ai->multiplicity);
+                ck_put(w, ai->atomic);
+                ck_put(w, ai->n);
+                for (unsigned int k = 0; k < ai->n; k++) {
+                    ck_put(w, ck_ref(w, ai->indices[k]));
+                }
+            }
+        }
+    }
+}
+
+// The checkpoint is written to a temporary file first, so an earlier
+// checkpoint is not lost if this one cannot be completed.
+void checkpoint_write(const char *file, struct global_t *global,
+            uint64_t hvm_hash, struct node **frontier, unsigned int nfrontier){
+    struct graph_t *graph = &global->graph;
+    char *tmp = malloc(strlen(file) + 5);
+    sprintf(tmp, "%s.tmp", file);
+    struct ck_writer *w = new_alloc(struct ck_writer);
+    if ((w->fp = fopen(tmp, "wb")) == NULL) {
+        fprintf(stderr, "charm: can't create %s\n", tmp);
+        exit(1);
+    }
+    w->ids = dict_new(1024*1024, 1, NULL, NULL);
+
+    ck_bytes(w, CK_MAGIC, 4);
+    ck_put(w, CK_VERSION);
+    ck_put(w, hvm_hash);
+    ck_put(w, global->symmetry != NULL);
+    ck_put(w, global->mem_level);
+    ck_put(w, global->diameter);
+    ck_put(w, global->dequeued);
+
+    // The values, each after the ones it contains, ending with a 0
+    for (unsigned int i = 0; i < graph->size; i++) {
+        ck_node_values(w, graph->nodes[i]);
+    }
+    ck_put(w, 0);
+
+    // The graph
+    uint64_t nedges = 0, nlogs = 0, nai = 0;
+    for (unsigned int i = 0; i < graph->size; i++) {
+        struct node *node = graph->nodes[i];
+        nedges += node->nfwd;
+        for (unsigned int j = 0; j < node->nfwd; j++) {
+            struct edge *edge = &node->fwd[j];
+            if (edge->log != NULL) {
+                nlogs += edge->nlog;
+            }
+            if (edge->ai != NULL) {
+                nai += edge->nai;
+            }
+        }
+    }
+    ck_put(w, graph->size);
+    ck_put(w, nedges);
+    ck_put(w, nlogs);
+    ck_put(w, nai);
+    for (unsigned int i = 0; i < graph->size; i++) {
+        ck_node(w, graph->nodes[i]);
+    }
+
+    // The nodes that are yet to be explored
+    ck_put(w, nfrontier);
+    for (unsigned int i = 0; i < nfrontier; i++) {
+        ck_put(w, frontier[i]->id);
+    }
+    ck_bytes(w, CK_MAGIC, 4);       // to detect a truncated file
+
+    ck_flush(w);
+    if (fclose(w->fp) != 0) {
+        panic("checkpoint_write: write failed (disk full?)");
+    }
+#ifdef _WIN32
+    remove(file);
+#endif
+    if (rename(tmp, file) != 0) {
+        fprintf(stderr, "charm: can't rename %s to %s\n", tmp, file);
+        exit(1);
+    }
+    dict_delete(w->ids);
+    free(w);
+    free(tmp);
+}
+
+static unsigned char ck_byte(struct ck_reader *r){
+    if (r->i == r->n) {
+        r->n = fread(r->buf, 1, CK_BUFSIZE, r->fp);
+        r->i = 0;
+        if (r->n == 0) {
+            fprintf(stderr, "charm: %s: checkpoint is truncated\n", r->file);
+            exit(1);
+        }
+    }
+    return r->buf[r->i++];
+}
+
+static void ck_get_bytes(struct ck_reader *r, void *p, size_t size){
+    unsigned char *q = p;
+    for (size_t i = 0; i < size; i++) {
+        q[i] = ck_byte(r);
+    }
+}
+
+static uint64_t ck_get(struct ck_reader *r){
+    uint64_t x = 0;
+    for (unsigned int shift = 0; shift < 64; shift += 7) {
+        unsigned char b = ck_byte(r);
+        x |= (uint64_t) (b & 0x7F) << shift;
+        if ((b & 0x80) == 0) {
+            return x;
+        }
+    }
+    fprintf(stderr, "charm: %s: checkpoint is corrupted\n", r->file);
+    exit(1);
+}
+
+static hvalue_t ck_deref(struct ck_reader *r, uint64_t x){
+    if (!ck_pointer(x)) {
+        return x;
+    }
+    uint64_t id = x >> VALUE_BITS;
+    if (id > r->nvalues) {
+        fprintf(stderr, "charm: %s: checkpoint is corrupted\n", r->file);
+        exit(1);
+    }
+    return r->vals[id];
+}
+
+static void *ck_scratch(struct ck_reader *r, unsigned int size){
+    if (size > r->alloc_scratch) {
+        r->alloc_scratch = size;
+        r->scratch = realloc(r->scratch, size);
+    }
+    return r->scratch;
+}
+
+static int ck_value_cmp(const void *v1, const void *v2){
+    return value_cmp(* (const hvalue_t *) v1, * (const hvalue_t *) v2);
+}
+
+// Read the value records and intern the values.  The contents of sets and
+// the keys of dicts are sorted again, as the order depends on addresses.
+static void ck_read_values(struct ck_reader *r, struct engine *engine){
+    unsigned int type;
+    while ((type = ck_get(r)) != 0) {
+        unsigned int size, n;
+        hvalue_t v;
+        switch (type) {
+        case VALUE_ATOM:
+            size = ck_get(r);
+            ck_get_bytes(r, ck_scratch(r, size), size);
+            v = value_put_atom(engine, r->scratch, size);
+            break;
+        case VALUE_CONTEXT:
+            {
+                size = ck_get(r);
+                if (size < sizeof(struct context)) {
+                    fprintf(stderr, "charm: %s: checkpoint is corrupted\n", r->file);
+                    exit(1);
+                }
+                struct context *ctx = ck_scratch(r, size);
+                ck_get_bytes(r, ctx, size);
+                if (size != sizeof(*ctx) + ctx->sp * sizeof(hvalue_t)) {
+                    fprintf(stderr, "charm: %s: checkpoint is corrupted\n", r->file);
+                    exit(1);
+                }
+                for (unsigned int i = 0; i < CK_NCONTEXT_FIELDS; i++) {
+                    hvalue_t *f = &CK_FIELD(ctx, ck_context_fields[i]);
+                    *f = ck_deref(r, *f);
+                }
+                for (int i = 0; i < ctx->sp; i++) {
+                    ctx->stack[i] = ck_deref(r, ctx->stack[i]);
+                }
+                v = value_put_context(engine, ctx);
+            }
+            break;
+        case VALUE_LIST:
+        case VALUE_DICT:
+        case VALUE_SET:
+        case VALUE_ADDRESS:
+            {
+                n = ck_get(r);
+                size = n * sizeof(hvalue_t);
+                hvalue_t *vals = ck_scratch(r, size);
+                for (unsigned int i = 0; i < n; i++) {
+                    vals[i] = ck_deref(r, ck_get(r));
+                }
+                switch (type) {
+                case VALUE_LIST:
+                    v = value_put_list(engine, vals, size);
+                    break;
+                case VALUE_DICT:
+                    qsort(vals, n / 2, 2 * sizeof(hvalue_t), ck_value_cmp);
+                    v = value_put_dict(engine, vals, size);
+                    break;
+                case VALUE_SET:
+                    qsort(vals, n, sizeof(hvalue_t), ck_value_cmp);
+                    v = value_put_set(engine, vals, size);
+                    break;
+                default:
+                    v = value_put_address(engine, vals, size);
+                }
+            }
+            break;
+        default:
+            fprintf(stderr, "charm: %s: checkpoint is corrupted\n", r->file);
+            exit(1);
+        }
+
+        if (r->nvalues + 1 == r->alloc_vals) {
+            r->alloc_vals *= 2;
+            r->vals = realloc(r->vals, r->alloc_vals * sizeof(hvalue_t));
+        }
+        r->vals[++r->nvalues] = v;
+    }
+}
+
+// Restore the graph from a checkpoint into the (empty) graph and table of
+// visited states.  Returns the nodes that are yet to be explored.
+struct node **checkpoint_read(const char *file, struct global_t *global,
+            struct engine *engine, struct dict *visited, uint64_t hvm_hash,
+            unsigned int *pnfrontier){
+    struct ck_reader *r = new_alloc(struct ck_reader);
+    r->file = file;
+    if ((r->fp = fopen(file, "rb")) == NULL) {
+        fprintf(stderr, "charm: can't open %s\n", file);
+        exit(1);
+    }
+
+    char magic[4];
+    ck_get_bytes(r, magic, 4);
+    if (memcmp(magic, CK_MAGIC, 4) != 0) {
+        fprintf(stderr, "charm: %s is not a checkpoint\n", file);
+        exit(1);
+    }
+    if (ck_get(r) != CK_VERSION) {
+        fprintf(stderr, "charm: %s: unsupported checkpoint version\n", file);
+        exit(1);
+    }
+    if (ck_get(r) != hvm_hash) {
+        fprintf(stderr, "charm: %s is a checkpoint of a different model\n", file);
+        exit(1);
+    }
+    bool symmetry = ck_get(r);
+    if (symmetry != (global->symmetry != NULL)) {
+        fprintf(stderr, "charm: %s was made with different options (-Xsymmetry)\n", file);
+        exit(1);
+    }
+    global->mem_level = ck_get(r);
+    global->diameter = ck_get(r);
+    global->dequeued = ck_get(r);
+
+    r->alloc_vals = 1024;
+    r->vals = malloc(r->alloc_vals * sizeof(hvalue_t));
+    r->vals[0] = 0;
+    ck_read_values(r, engine);
+
+    // Allocate all the nodes, edges, logs, and access info at once
+    unsigned int nnodes = ck_get(r);
+    uint64_t nedges = ck_get(r), nlogs = ck_get(r), nai = ck_get(r);
+    struct node *nodes = calloc(nnodes, sizeof(struct node));
+    struct edge *edges = malloc(nedges * sizeof(struct edge));
+    hvalue_t *logs = malloc(nlogs * sizeof(hvalue_t));
+    struct access_info *ais = malloc(nai * sizeof(struct access_info));
+    global->mem_used += nnodes * sizeof(struct node) + nedges * sizeof(struct edge) +
+                    nlogs * sizeof(hvalue_t) + nai * sizeof(struct access_info);
+
+    assert(global->graph.size == 0);
+    for (unsigned int i = 0; i < nnodes; i++) {
+        struct node *node = &nodes[i];
+        struct state state;
+        for (unsigned int j = 0; j < CK_NSTATE_FIELDS; j++) {
+            CK_FIELD(&state, ck_state_fields[j]) = ck_deref(r, ck_get(r));
+        }
+        state.dfa_state = ck_get(r);
+        struct keynode *k = dict_find(visited, NULL, &state, sizeof(state));
+        if (k->value != NULL) {
+            fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+            exit(1);
+        }
+        k->value = node;
+        node->state = dict_retrieve(k, NULL);
+        graph_add(&global->graph, node);
+
+        unsigned int parent = ck_get(r);
+        if (parent > nnodes) {
+            fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+            exit(1);
+        }
+        node->parent = parent == 0 ? NULL : &nodes[parent - 1];
+        node->len = ck_get(r);
+        node->steps = ck_get(r);
+        node->before = ck_deref(r, ck_get(r));
+        node->after = ck_deref(r, ck_get(r));
+        node->choice = ck_deref(r, ck_get(r));
+        node->interrupt = ck_get(r);
+        node->perm = ck_get(r);
+        node->nfwd = ck_get(r);
+        if (node->nfwd > nedges) {
+            fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+            exit(1);
+        }
+        node->fwd = node->nfwd == 0 ? NULL : edges;
+        edges += node->nfwd;
+        nedges -= node->nfwd;
+
+        for (unsigned int j = 0; j < node->nfwd; j++) {
+            struct edge *edge = &node->fwd[j];
+            edge->src = node;
+            edge->ctx = ck_deref(r, ck_get(r));
+            edge->choice = ck_deref(r, ck_get(r));
+            edge->after = ck_deref(r, ck_get(r));
+            unsigned int dst = ck_get(r);
+            if (dst >= nnodes) {
+                fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+                exit(1);
+            }
+            edge->dst = &nodes[dst];
+            edge->steps = ck_get(r);
+            edge->perm = ck_get(r);
+            unsigned int flags = ck_get(r);
+            edge->interrupt = (flags & CK_INTERRUPT) != 0;
+            edge->nlog = ck_get(r);
+            edge->log = NULL;
+            if (flags & CK_LOG) {
+                if (edge->nlog > nlogs) {
+                    fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+                    exit(1);
+                }
+                nlogs -= edge->nlog;
+                edge->log = logs;
+                for (unsigned int l = 0; l < edge->nlog; l++) {
+                    edge->log[l] = ck_deref(r, ck_get(r));
+                }
+                logs += edge->nlog;
+            }
+            edge->nai = ck_get(r);
+            edge->ai = NULL;
+            if (flags & CK_AI) {
+                if (edge->nai > nai) {
+                    fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+                    exit(1);
+                }
+                nai -= edge->nai;
+                edge->ai = ais;
+                for (unsigned int a = 0; a < edge->nai; a++) {
+                    struct access_info *ai = &edge->ai[a];
+                    ai->load = ck_get(r);
+                    ai->pc = ck_get(r);
+                    ai->multiplicity = ck_get(r);
+                    ai->atomic = ck_get(r);
+                    ai->n = ck_get(r);
+
+                    // The indices are kept as an address value
+                    unsigned int size = ai->n * sizeof(hvalue_t);
+                    hvalue_t *indices = ck_scratch(r, size);
+                    for (unsigned int x = 0; x < ai->n; x++) {
+                        indices[x] = ck_deref(r, ck_get(r));
+                    }
+                    ai->indices = ai->n == 0 ? ck_noindices :
+                        value_get(value_put_address(engine, indices, size), &size);
+                }
+                ais += edge->nai;
+            }
+        }
+    }
+
+    unsigned int nfrontier = ck_get(r);
+    struct node **frontier = malloc((nfrontier + 1) * sizeof(struct node *));
+    for (unsigned int i = 0; i < nfrontier; i++) {
+        unsigned int id = ck_get(r);
+        if (id >= nnodes) {
+            fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+            exit(1);
+        }
+        frontier[i] = &nodes[id];
+    }
+    ck_get_bytes(r, magic, 4);
+    if (memcmp(magic, CK_MAGIC, 4) != 0) {
+        fprintf(stderr, "charm: %s: checkpoint is corrupted\n", file);
+        exit(1);
+    }
+
+    fclose(r->fp);
+    free(r->vals);
+    free(r->scratch);
+    free(r);
+    *pnfrontier = nfrontier;
+    return frontier;
+}
@@ -0,0 +1,22 @@
+#ifndef SRC_CHECKPOINT_H
+#define SRC_CHECKPOINT_H
+
+#include <stdint.h>
+#include <stdbool.h>
+#include "charm.h"
+
+// Checkpoints of a model checking run (-Xcheckpoint, -Xresume).  Written
+// between epochs, when the workers are waiting at the barriers.  A
+// checkpoint holds the graph found so far (states, edges, and how each node
+// was reached), the nodes that are yet to be explored, and the values that
+// these refer to.  Values are pointers into the value tables, so they are
+// written by content and interned again on resume, where they end up at
+// different addresses.  As the order of values depends on those addresses,
+// sets and dicts are sorted again after they are read back.
+void checkpoint_write(const char *file, struct global_t *global,
+            uint64_t hvm_hash, struct node **frontier, unsigned int nfrontier);
+struct node **checkpoint_read(const char *file, struct global_t *global,
+            struct engine *engine, struct dict *visited, uint64_t hvm_hash,
+            unsigned int *pnfrontier);
+
+#endif //SRC_CHECKPOINT_H
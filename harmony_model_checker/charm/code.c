@@ -10,18 +10,21 @@
 #include "ops.h"
 #endif
 
-static struct instr_t code_instr_parse(struct engine *engine, struct json_value *jv) {
-    assert(jv->type == JV_MAP);
-    struct json_value *op = dict_lookup(jv->u.map, "op", 2);
-    assert(op->type == JV_ATOM);
-    struct op_info *oi = ops_get(op->u.atom.base, op->u.atom.len);
+// Look up an op by its name
+struct op_info *code_op(char *name, unsigned int len) {
+    struct op_info *oi = ops_get(name, len);
     if (oi == NULL) {
-        fprintf(stderr, "Unknown HVM instruction: %.*s\n", op->u.atom.len, op->u.atom.base);
+        fprintf(stderr, "Unknown HVM instruction: %.*s\n", len, name);
         exit(1);
     }
+    return oi;
+}
+
+// Create an instruction from the op and the map of its arguments
+struct instr_t code_instr_init(struct engine *engine, struct op_info *oi, struct dict *args) {
     struct instr_t i;
     i.oi = oi;
-    i.env = (*oi->init)(jv->u.map, engine);
+    i.env = (*oi->init)(args, engine);
     i.choose = strcmp(oi->name, "Choose") == 0;
     i.load = strcmp(oi->name, "Load") == 0;
     i.store = strcmp(oi->name, "Store") == 0;
@@ -41,6 +44,13 @@ static struct instr_t code_instr_parse(struct engine *engine, struct json_value
     return i;
 }
 
+static struct instr_t code_instr_parse(struct engine *engine, struct json_value *jv) {
+    assert(jv->type == JV_MAP);
+    struct json_value *op = dict_lookup(jv->u.map, "op", 2);
+    assert(op->type == JV_ATOM);
+    return code_instr_init(engine, code_op(op->u.atom.base, op->u.atom.len), jv->u.map);
+}
+
 struct code_t code_init_parse(struct engine *engine, struct json_value *json_code) {
     assert(json_code->type == JV_LIST);
 
@@ -18,5 +18,7 @@ struct code_t {
 };
 
 struct code_t code_init_parse(struct engine *engine, struct json_value *json_code);
+struct op_info *code_op(char *name, unsigned int len);
+struct instr_t code_instr_init(struct engine *engine, struct op_info *oi, struct dict *args);
 
 #endif //SRC_CODE_H
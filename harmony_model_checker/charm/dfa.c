@@ -2,31 +2,29 @@
 
 #include <stdlib.h>
 #include <stdio.h>
+#include <stdint.h>
+#include <string.h>
 #include <assert.h>
 
 #include "value.h"
 #include "hashdict.h"
 #include "json.h"
 
-struct dfa_transition {
-    struct dfa_transition *next; // linked list maintenance
-    hvalue_t symbol;             // transition symbol
-    int dst;                     // destination state
-};
-
 struct dfa_state {
-    struct dfa_state *next;      // linked list maintenance
-    int idx;                     // name of state
+    int idx;                     // name of state (-1 if not used)
     bool final;                  // terminal state
-    struct dfa_transition *transitions;     // transition map
-
-    // TODO.  Maybe should make transitions a dict
 };
 
+// The transitions are kept in a table indexed by state and symbol.  The
+// symbols are numbered when the DFA is read, so that a step is a hash
+// lookup of the symbol and an index into the table.
 struct dfa {
     int nstates;
     int initial;
     struct dfa_state *states;
+    struct dict *symbols;        // symbol -> symbol number + 1
+    unsigned int nsymbols;
+    int *delta;                  // delta[state * nsymbols + symbol], or -1
 };
 
 static int int_parse(char *p, int len){
@@ -74,12 +72,12 @@ struct dfa *dfa_read(struct engine *engine, char *fname){
     struct json_value *nodes = dict_lookup(jv->u.map, "nodes", 5);
     assert(nodes->type == JV_LIST);
     int max_idx = 0;
-    struct dfa_state *states = NULL;
+    struct dfa_state *states = malloc((nodes->u.list.nvals + 1) * sizeof(*states));
     for (unsigned int i = 0; i < nodes->u.list.nvals; i++) {
         struct json_value *node = nodes->u.list.vals[i];
         assert(node->type == JV_MAP);
 
-        struct dfa_state *ds = new_alloc(struct dfa_state);
+        struct dfa_state *ds = &states[i];
 
         struct json_value *idx = dict_lookup(node->u.map, "idx", 3);
         assert(idx->type == JV_ATOM);
@@ -94,8 +92,6 @@ struct dfa *dfa_read(struct engine *engine, char *fname){
         ds->final = type->u.atom.base[0] == 'f';
 
         // printf("IDX %d %d\n", ds->idx, ds->final);
-        ds->next = states;
-        states = ds;
     }
 
     dfa->nstates = max_idx + 1;
@@ -103,40 +99,57 @@ struct dfa *dfa_read(struct engine *engine, char *fname){
     for (int i = 0; i < dfa->nstates; i++) {
         dfa->states[i].idx = -1;            // some may not be used
     }
-    struct dfa_state *ds;
-    while ((ds = states) != NULL) {
-        states = ds->next;
-        dfa->states[ds->idx] = *ds;
+    for (unsigned int i = 0; i < nodes->u.list.nvals; i++) {
+        dfa->states[states[i].idx] = states[i];
     }
+    free(states);
 
-    // read the list of edges
+    // read the list of edges, numbering the symbols
     struct json_value *edges = dict_lookup(jv->u.map, "edges", 5);
     assert(edges->type == JV_LIST);
-    for (unsigned int i = 0; i < edges->u.list.nvals; i++) {
+    unsigned int nedges = edges->u.list.nvals;
+    int *src_states = malloc((nedges + 1) * sizeof(int));
+    int *dst_states = malloc((nedges + 1) * sizeof(int));
+    unsigned int *symbols = malloc((nedges + 1) * sizeof(unsigned int));
+    dfa->symbols = dict_new(0, 0, NULL, NULL);
+    for (unsigned int i = 0; i < nedges; i++) {
         struct json_value *edge = edges->u.list.vals[i];
         assert(edge->type == JV_MAP);
 
-        struct dfa_transition *dt = new_alloc(struct dfa_transition);
-
         struct json_value *src = dict_lookup(edge->u.map, "src", 3);
         assert(src->type == JV_ATOM);
-        int src_state = int_parse(src->u.atom.base, src->u.atom.len);
-        assert(src_state < dfa->nstates);
+        src_states[i] = int_parse(src->u.atom.base, src->u.atom.len);
+        assert(src_states[i] < dfa->nstates);
 
         struct json_value *dst = dict_lookup(edge->u.map, "dst", 3);
         assert(dst->type == JV_ATOM);
-        dt->dst = int_parse(dst->u.atom.base, dst->u.atom.len);
-        assert(dt->dst < dfa->nstates);
+        dst_states[i] = int_parse(dst->u.atom.base, dst->u.atom.len);
+        assert(dst_states[i] < dfa->nstates);
 
         struct json_value *symbol = dict_lookup(edge->u.map, "symbol", 6);
         assert(symbol->type == JV_MAP);
-        dt->symbol = value_from_json(engine, symbol->u.map);
+        hvalue_t v = value_from_json(engine, symbol->u.map);
+        void **p = dict_insert(dfa->symbols, NULL, &v, sizeof(v));
+        if (*p == NULL) {
+            *p = (void *) (uintptr_t) ++dfa->nsymbols;
+        }
+        symbols[i] = (unsigned int) (uintptr_t) *p - 1;
 
-        dt->next = dfa->states[src_state].transitions;
-        dfa->states[src_state].transitions = dt;
+        // printf("EDGE %d %d %s\n", src_states[i], dst_states[i], value_string(v));
+    }
 
-        // printf("EDGE %d %d %s\n", src_state, dt->dst, value_string(dt->symbol));
+    // fill in the transition table
+    size_t size = (size_t) dfa->nstates * dfa->nsymbols;
+    dfa->delta = malloc((size + 1) * sizeof(*dfa->delta));
+    for (size_t i = 0; i < size; i++) {
+        dfa->delta[i] = -1;
+    }
+    for (unsigned int i = 0; i < nedges; i++) {
+        dfa->delta[(size_t) src_states[i] * dfa->nsymbols + symbols[i]] = dst_states[i];
     }
+    free(src_states);
+    free(dst_states);
+    free(symbols);
 
     json_value_free(jv);
     return dfa;
@@ -152,16 +165,70 @@ bool dfa_is_final(struct dfa *dfa, int state){
     return dfa->states[state].final;
 }
 
-// make a step.  Return -1 upon error.  Record transition in
-// transitions if requested
+// make a step.  Return -1 upon error.
 int dfa_step(struct dfa *dfa, int current, hvalue_t symbol){
-    struct dfa_state *ds = &dfa->states[current];
+    void *p = dict_lookup(dfa->symbols, &symbol, sizeof(symbol));
+    if (p == NULL) {
+        return -1;
+    }
+    return dfa->delta[(size_t) current * dfa->nsymbols + (uintptr_t) p - 1];
+}
+
+// Remove the transitions to states from which no final state can be
+// reached.  Then dfa_step() fails as soon as the printed output can no
+// longer be extended to a behavior of the DFA, so that the search stops
+// there instead of the terminal state being found not final in Phase 3.
+void dfa_prune(struct dfa *dfa){
+    unsigned int n = dfa->nstates, m = dfa->nsymbols;
+    size_t size = (size_t) n * m;
+
+    // Index the transitions by destination
+    unsigned int *first = calloc(n + 1, sizeof(*first));
+    for (size_t i = 0; i < size; i++) {
+        if (dfa->delta[i] >= 0) {
+            first[dfa->delta[i] + 1]++;
+        }
+    }
+    for (unsigned int q = 0; q < n; q++) {
+        first[q + 1] += first[q];
+    }
+    unsigned int *next = malloc((n + 1) * sizeof(*next));
+    memcpy(next, first, (n + 1) * sizeof(*next));
+    unsigned int *srcs = malloc((first[n] + 1) * sizeof(*srcs));
+    for (size_t i = 0; i < size; i++) {
+        if (dfa->delta[i] >= 0) {
+            srcs[next[dfa->delta[i]]++] = i / m;
+        }
+    }
 
-    // TODO.  Maybe make symbol lookup a hashmap
-    for (struct dfa_transition *dt = ds->transitions; dt != NULL; dt = dt->next) {
-        if (dt->symbol == symbol) {
-            return dt->dst;
+    // Search backwards from the final states
+    bool *live = calloc(n + 1, sizeof(*live));
+    unsigned int *todo = malloc((n + 1) * sizeof(*todo)), ntodo = 0;
+    for (unsigned int q = 0; q < n; q++) {
+        if (dfa->states[q].idx >= 0 && dfa->states[q].final) {
+            live[q] = true;
+            todo[ntodo++] = q;
         }
     }
-    return -1;
+    while (ntodo > 0) {
+        unsigned int q = todo[--ntodo];
+        for (unsigned int i = first[q]; i < first[q + 1]; i++) {
+            if (!live[srcs[i]]) {
+                live[srcs[i]] = true;
+                todo[ntodo++] = srcs[i];
+            }
+        }
+    }
+
+    for (size_t i = 0; i < size; i++) {
+        if (dfa->delta[i] >= 0 && !live[dfa->delta[i]]) {
+            dfa->delta[i] = -1;
+        }
+    }
+
+    free(first);
+    free(next);
+    free(srcs);
+    free(live);
+    free(todo);
 }
@@ -7,6 +7,7 @@ struct dfa *dfa_read(struct engine *engine, char *fname);
 int dfa_initial(struct dfa *dfa);
 bool dfa_is_final(struct dfa *dfa, int state);
 int dfa_step(struct dfa *dfa, int current, hvalue_t symbol);
+void dfa_prune(struct dfa *dfa);
 int dfa_ntransitions(struct dfa *dfa);
 void dfa_check_trie(struct global_t *global);
 
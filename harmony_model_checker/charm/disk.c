@@ -0,0 +1,266 @@
+#include "head.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <assert.h>
+
+#ifndef _WIN32
+#include <unistd.h>
+#include <sys/stat.h>
+#endif
+
+#include "global.h"
+#include "minheap.h"
+#include "disk.h"
+
+#define DISK_RUN_RECORDS    (1 << 17)   // #records per sorted run
+#define DISK_CURSOR_RECORDS 256         // #records buffered per run in merge
+
+#ifdef _WIN32
+#define disk_seek(fp, off)  _fseeki64(fp, off, SEEK_SET)
+#else
+#define disk_seek(fp, off)  fseeko(fp, off, SEEK_SET)
+#endif
+
+// Reads records from a run (or from the visited file) during a merge
+struct disk_cursor {
+    FILE *fp;
+    uint64_t offset;            // where to read the next batch
+    uint64_t left;              // #records not yet read
+    unsigned int size;          // record size
+    bool visited;               // records from the visited file
+    char *buf;                  // batch of records
+    unsigned int n, i;          // #records in buf, current record
+};
+
+// Check that the directory given with -Xdisk=<dir> exists and is
+// writable.  (On Windows the files are always created by tmpfile().)
+bool disk_dir_ok(const char *dir){
+#ifndef _WIN32
+    struct stat st;
+    return stat(dir, &st) == 0 && S_ISDIR(st.st_mode) && access(dir, W_OK | X_OK) == 0;
+#else
+    return true;
+#endif
+}
+
+// Create an anonymous temporary file, in the given directory if any
+static FILE *disk_tmpfile(struct disk *d){
+    FILE *fp;
+
+#ifndef _WIN32
+    if (d->dir != NULL) {
+        char *name = malloc(strlen(d->dir) + 20);
+        sprintf(name, "%s/charmXXXXXX", d->dir);
+        int fd = mkstemp(name);
+        fp = fd < 0 ? NULL : fdopen(fd, "w+b");
+        if (fp != NULL) {
+            unlink(name);       // goes away when closed
+        }
+        free(name);
+    }
+    else
+#endif
+    fp = tmpfile();
+
+    if (fp == NULL) {
+        panic("disk_tmpfile: can't create temporary file");
+    }
+    return fp;
+}
+
+static void disk_write(FILE *fp, void *buf, unsigned int size, uint64_t n){
+    if (n != 0 && fwrite(buf, size, n, fp) != n) {
+        panic("disk_write: write failed (disk full?)");
+    }
+}
+
+static int record_cmp(const void *r1, const void *r2){
+    return memcmp(r1, r2, sizeof(struct state));
+}
+
+struct disk *disk_new(char *dir, unsigned int nworkers, struct disk_record *initial){
+    struct disk *d = new_alloc(struct disk);
+    d->dir = dir;
+    d->nworkers = nworkers;
+    d->workers = calloc(nworkers, sizeof(struct disk_worker));
+    for (unsigned int i = 0; i < nworkers; i++) {
+        struct disk_worker *dw = &d->workers[i];
+        dw->buf = malloc(DISK_RUN_RECORDS * sizeof(struct disk_record));
+        dw->runs = disk_tmpfile(d);
+    }
+    mutex_init(&d->lock);
+
+    d->visited = disk_tmpfile(d);
+    disk_write(d->visited, &initial->state, sizeof(struct state), 1);
+    d->nvisited = 1;
+    d->frontier = disk_tmpfile(d);
+    disk_write(d->frontier, initial, sizeof(*initial), 1);
+    d->nfrontier = 1;
+    rewind(d->frontier);
+    return d;
+}
+
+// Get up to n records of the current layer.  Returns the number of records
+// obtained, 0 if the layer is done.
+unsigned int disk_read(struct disk *d, struct disk_record *buf, unsigned int n){
+    mutex_acquire(&d->lock);
+    unsigned int cnt = fread(buf, sizeof(*buf), n, d->frontier);
+    mutex_release(&d->lock);
+    return cnt;
+}
+
+// Sort the buffered records of the worker and write them out as a run
+void disk_flush(struct disk *d, unsigned int worker){
+    struct disk_worker *dw = &d->workers[worker];
+
+    if (dw->n == 0) {
+        return;
+    }
+    qsort(dw->buf, dw->n, sizeof(struct disk_record), record_cmp);
+    if (dw->nruns == dw->alloc_runs) {
+        dw->alloc_runs = dw->alloc_runs == 0 ? 64 : 2 * dw->alloc_runs;
+        dw->run = realloc(dw->run, dw->alloc_runs * sizeof(struct disk_run));
+    }
+    struct disk_run *run = &dw->run[dw->nruns++];
+    run->offset = dw->end;
+    run->count = dw->n;
+    disk_seek(dw->runs, dw->end);
+    disk_write(dw->runs, dw->buf, sizeof(struct disk_record), dw->n);
+    dw->end += (uint64_t) dw->n * sizeof(struct disk_record);
+    dw->n = 0;
+}
+
+// Add a successor state found by the given worker
+void disk_add(struct disk *d, unsigned int worker, struct disk_record *rec){
+    struct disk_worker *dw = &d->workers[worker];
+
+    dw->buf[dw->n++] = *rec;
+    if (dw->n == DISK_RUN_RECORDS) {
+        disk_flush(d, worker);
+    }
+}
+
+// Load the next batch of records.  Returns false if there are no more.
+static bool cursor_fill(struct disk_cursor *dc){
+    if (dc->left == 0) {
+        return false;
+    }
+    unsigned int n = dc->left < DISK_CURSOR_RECORDS ?
+                        (unsigned int) dc->left : DISK_CURSOR_RECORDS;
+    disk_seek(dc->fp, dc->offset);
+    if (fread(dc->buf, dc->size, n, dc->fp) != n) {
+        panic("cursor_fill: read failed");
+    }
+    dc->offset += (uint64_t) n * dc->size;
+    dc->left -= n;
+    dc->n = n;
+    dc->i = 0;
+    return true;
+}
+
+static struct disk_cursor *cursor_new(FILE *fp, uint64_t offset, uint64_t count,
+                                        unsigned int size, bool visited){
+    struct disk_cursor *dc = new_alloc(struct disk_cursor);
+    dc->fp = fp;
+    dc->offset = offset;
+    dc->left = count;
+    dc->size = size;
+    dc->visited = visited;
+    dc->buf = malloc(DISK_CURSOR_RECORDS * size);
+    return dc;
+}
+
+// Order cursors by their current record.  If the same state is both in the
+// visited file and in a run, the visited one comes first.
+static int cursor_cmp(void *v1, void *v2){
+    struct disk_cursor *dc1 = v1, *dc2 = v2;
+    int r = record_cmp(&dc1->buf[dc1->i * dc1->size], &dc2->buf[dc2->i * dc2->size]);
+    if (r != 0) {
+        return r;
+    }
+    return (int) dc2->visited - (int) dc1->visited;
+}
+
+// End of a layer.  Merge all the runs with the visited states.  States that
+// were not visited before are added to the visited file and become the
+// next layer.  Returns the number of such new states.
+uint64_t disk_merge(struct disk *d){
+    struct minheap *heap = minheap_create(cursor_cmp);
+    struct disk_cursor *dc;
+
+    dc = cursor_new(d->visited, 0, d->nvisited, sizeof(struct state), true);
+    if (cursor_fill(dc)) {
+        minheap_insert(heap, dc);
+    }
+    for (unsigned int i = 0; i < d->nworkers; i++) {
+        struct disk_worker *dw = &d->workers[i];
+        fflush(dw->runs);
+        for (unsigned int j = 0; j < dw->nruns; j++) {
+            dc = cursor_new(dw->runs, dw->run[j].offset, dw->run[j].count,
+                                sizeof(struct disk_record), false);
+            if (cursor_fill(dc)) {
+                minheap_insert(heap, dc);
+            }
+        }
+    }
+
+    FILE *visited = disk_tmpfile(d);
+    FILE *frontier = disk_tmpfile(d);
+    uint64_t nvisited = 0, nfrontier = 0;
+    struct state last;
+    bool first = true;
+    while (!minheap_empty(heap)) {
+        dc = minheap_getmin(heap);
+        char *rec = &dc->buf[dc->i * dc->size];
+        if (first || record_cmp(rec, &last) != 0) {
+            first = false;
+            memcpy(&last, rec, sizeof(last));
+            disk_write(visited, rec, sizeof(struct state), 1);
+            nvisited++;
+            if (!dc->visited) {
+                disk_write(frontier, rec, sizeof(struct disk_record), 1);
+                nfrontier++;
+            }
+        }
+        if (++dc->i < dc->n || cursor_fill(dc)) {
+            minheap_insert(heap, dc);
+        }
+        else {
+            free(dc->buf);
+            free(dc);
+        }
+    }
+    minheap_destroy(heap);
+
+    // The runs have been consumed
+    for (unsigned int i = 0; i < d->nworkers; i++) {
+        struct disk_worker *dw = &d->workers[i];
+        dw->nruns = 0;
+        dw->end = 0;
+    }
+
+    fclose(d->visited);
+    fclose(d->frontier);
+    d->visited = visited;
+    d->nvisited = nvisited;
+    d->frontier = frontier;
+    d->nfrontier = nfrontier;
+    fflush(visited);
+    rewind(frontier);
+    return nfrontier;
+}
+
+void disk_delete(struct disk *d){
+    for (unsigned int i = 0; i < d->nworkers; i++) {
+        free(d->workers[i].buf);
+        free(d->workers[i].run);
+        fclose(d->workers[i].runs);
+    }
+    free(d->workers);
+    fclose(d->visited);
+    fclose(d->frontier);
+    mutex_destroy(&d->lock);
+    free(d);
+}
@@ -0,0 +1,55 @@
+#ifndef SRC_DISK_H
+#define SRC_DISK_H
+
+#include <stdio.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include "thread.h"
+#include "value.h"
+#include "graph.h"
+
+// External-memory breadth-first search (-Xdisk).  Each layer of states is
+// a file of fixed-size records.  The successors that the workers find are
+// sorted in memory-sized runs and written to disk.  At the end of the layer
+// the runs are merged against the sorted file of all visited states (which
+// holds just the struct state), so duplicates are detected late, in bulk.
+// The states that remain form the next layer.
+struct disk_record {
+    struct state state;         // the sort key
+    struct trail trail;         // how the state was reached
+};
+
+struct disk_run {
+    uint64_t offset;            // byte offset in the worker's runs file
+    uint64_t count;             // #records in the run
+};
+
+struct disk_worker {
+    struct disk_record *buf;    // successors not yet written
+    unsigned int n;             // #records in buf
+    FILE *runs;                 // sorted runs of successors
+    uint64_t end;               // size of runs file
+    struct disk_run *run;       // list of runs in the file
+    unsigned int nruns, alloc_runs;
+};
+
+struct disk {
+    char *dir;                  // directory for files, or NULL
+    unsigned int nworkers;
+    struct disk_worker *workers;
+    FILE *visited;              // sorted struct state records
+    uint64_t nvisited;          // #records in visited
+    FILE *frontier;             // struct disk_record records of this layer
+    uint64_t nfrontier;         // #records in frontier
+    mutex_t lock;               // protects reading the frontier
+};
+
+bool disk_dir_ok(const char *dir);
+struct disk *disk_new(char *dir, unsigned int nworkers, struct disk_record *initial);
+unsigned int disk_read(struct disk *d, struct disk_record *buf, unsigned int n);
+void disk_add(struct disk *d, unsigned int worker, struct disk_record *rec);
+void disk_flush(struct disk *d, unsigned int worker);
+uint64_t disk_merge(struct disk *d);
+void disk_delete(struct disk *d);
+
+#endif //SRC_DISK_H
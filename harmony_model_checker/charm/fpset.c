@@ -0,0 +1,134 @@
+#include "head.h"
+
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#include "global.h"
+#include "thread.h"
+#include "hashdict.h"
+#include "fpset.h"
+
+#define FPSET_NHASHES       3       // bitstate: #bits per state
+#define FPSET_MAX_LOAD      0.9     // hash compaction: max fraction used
+
+// Create a set that uses (about) nbytes of memory.  The table is allocated
+// with calloc(), so pages that are never touched take no physical memory.
+struct fpset *fpset_new(bool bitstate, uint64_t nbytes){
+    struct fpset *fs = new_alloc(struct fpset);
+    fs->bitstate = bitstate;
+    fs->nhashes = FPSET_NHASHES;
+
+    // Round down to a power of 2 number of words
+    uint64_t nwords = 1;
+    while (2 * nwords * sizeof(uint64_t) <= nbytes) {
+        nwords *= 2;
+    }
+    fs->table = calloc(nwords, sizeof(uint64_t));
+    if (fs->table == NULL) {
+        panic("fpset_new: can't allocate table");
+    }
+    fs->size = bitstate ? nwords * 64 : nwords;
+    return fs;
+}
+
+// Add a state.  Returns true iff it (or rather its fingerprint) was not
+// already in the set.  With hash compaction, a new state is not added once
+// the table is full (see fpset_full()), and false is returned.
+bool fpset_insert(struct fpset *fs, const void *key, unsigned int len){
+    uint64_t h1 = dict_hash64(key, len, 0);
+    uint64_t mask = fs->size - 1;
+
+    if (fs->bitstate) {
+        // All bits of a state are in the same word, so that one atomic
+        // operation sets them.  Exactly one of the workers that insert the
+        // same state concurrently then finds one of the bits clear.
+        uint64_t h2 = dict_hash64(key, len, 1);
+        uint64_t step = (h2 >> 6) | 1;
+        uint64_t bits = 0;
+        for (unsigned int i = 0; i < fs->nhashes; i++) {
+            bits |= (uint64_t) 1 << ((h2 + i * step) & 63);
+        }
+        volatile uint64_t *word = &fs->table[(h1 & mask) >> 6];
+        if ((*word & bits) == bits || (atomic_or64(word, bits) & bits) == bits) {
+            return false;
+        }
+        atomic_add64(&fs->count, 1);
+        return true;
+    }
+
+    // Hash compaction: linear probing for the 64-bit fingerprint.  An empty
+    // slot is 0, so a fingerprint of 0 is stored as 1.
+    if (h1 == 0) {
+        h1 = 1;
+    }
+    for (uint64_t i = h1 & mask;; i = (i + 1) & mask) {
+        uint64_t x = fs->table[i];
+        if (x == h1) {
+            return false;
+        }
+        if (x == 0) {
+            // Leave the rest of the table empty, so that probing still ends
+            if (fs->count >= FPSET_MAX_LOAD * fs->size) {
+                atomic_add64(&fs->ndropped, 1);
+                return false;
+            }
+            if (!atomic_cas64(&fs->table[i], 0, h1)) {
+                i = (i - 1) & mask;     // lost the race, look at slot again
+                continue;
+            }
+            atomic_add64(&fs->count, 1);
+            return true;
+        }
+    }
+}
+
+// See if new states were left out because the hash compaction table was
+// full.  The search is then incomplete.
+bool fpset_full(struct fpset *fs){
+    return fs->ndropped != 0;
+}
+
+// Estimate the expected number of states that were not explored because
+// their fingerprint matched that of another state, and the probability
+// that at least one state was missed.
+void fpset_omission(struct fpset *fs, double *expected, double *probability){
+    uint64_t n = fs->count;
+    double e = 0;
+
+    if (fs->bitstate) {
+        // A state is lost if all of its k bits are already set in its word.
+        // After j states a word has received Poisson(j/w) of them, and each
+        // of its bits is set with probability 1-(1-1/64)^(k*m) after m.
+        uint64_t nwords = fs->size / 64;
+        uint64_t dx = n / 1000 + 1;
+        for (uint64_t j = 0; j < n; j += dx) {
+            double lambda = (double) j / nwords, p = exp(-lambda), lost = 0;
+            for (uint64_t m = 0; m < 4 * lambda + 50; m++) {
+                double set = 1 - pow(1 - 1.0 / 64, (double) (fs->nhashes * m));
+                lost += p * pow(set, fs->nhashes);
+                p *= lambda / (m + 1);
+            }
+            e += lost * (j + dx > n ? n - j : dx);
+        }
+    }
+    else {
+        // Each pair of states has the same 64-bit fingerprint with
+        // probability 2^-64
+        e = (double) n * (n - 1) / 2 / 18446744073709551616.0;
+    }
+    *expected = e;
+    *probability = -expm1(-e);     // 1 - e^-e, also for small e
+}
+
+// Empty the set so it can be reused (swarm mode: one search after another)
+void fpset_clear(struct fpset *fs){
+    memset((void *) fs->table, 0, fs->bitstate ? fs->size / 8 : fs->size * sizeof(uint64_t));
+    fs->count = 0;
+    fs->ndropped = 0;
+}
+
+void fpset_delete(struct fpset *fs){
+    free((void *) fs->table);
+    free(fs);
+}
@@ -0,0 +1,30 @@
+#ifndef SRC_FPSET_H
+#define SRC_FPSET_H
+
+#include <stdint.h>
+#include <stdbool.h>
+
+// A set of states that only keeps a fingerprint of each state, for state
+// spaces that do not fit in memory.  With hash compaction, each state is
+// represented by a 64-bit hash in an open addressing table.  In bitstate
+// mode (aka supertrace), each state sets a few bits in one word of a large
+// bit array.
+// Either way two different states may be confused, and then part of the
+// state space is not explored.  fpset_omission() estimates how likely that is.
+struct fpset {
+    bool bitstate;              // bitstate rather than hash compaction
+    uint64_t size;              // #slots or #bits, a power of 2
+    unsigned int nhashes;       // bitstate: #bits per state
+    volatile uint64_t *table;   // the slots or bits
+    volatile int64_t count;     // #states inserted
+    volatile int64_t ndropped;  // hash compaction: #new states not inserted
+};
+
+struct fpset *fpset_new(bool bitstate, uint64_t nbytes);
+bool fpset_insert(struct fpset *fs, const void *key, unsigned int len);
+bool fpset_full(struct fpset *fs);
+void fpset_omission(struct fpset *fs, double *expected, double *probability);
+void fpset_clear(struct fpset *fs);
+void fpset_delete(struct fpset *fs);
+
+#endif //SRC_FPSET_H
@@ -15,6 +15,8 @@ void graph_init(struct graph_t *graph, unsigned int initial_size) {
     graph->size = 0;
     graph->alloc_size = initial_size;
     graph->nodes = malloc(graph->alloc_size * sizeof(struct node *));
+    graph->bwd_index = NULL;
+    graph->bwd = NULL;
 }
 
 void graph_add(struct graph_t *graph, struct node *node) {
@@ -26,121 +28,701 @@ void graph_add(struct graph_t *graph, struct node *node) {
     graph->nodes[graph->size++] = node;
 }
 
-static struct stack {
-    struct stack *next;
-    struct node *node;
-} *stack;
+// Called once the graph is complete.  Orders the edges out of each node by
+// destination (latest node first), so the analysis does not depend on the
+// order in which the steps happened to be taken, and builds the index of
+// the edges into each node.
+void graph_build_bwd(struct graph_t *graph) {
+    unsigned int n = graph->size;
 
-static void kosaraju_visit(struct node *node) {
-    if (node->visited) {
-        return;
+    free(graph->bwd_index);
+    free(graph->bwd);
+    graph->bwd_index = calloc(n + 1, sizeof(*graph->bwd_index));
+    for (unsigned int i = 0; i < n; i++) {
+        struct node *node = graph->nodes[i];
+
+        // Insertion sort, as most nodes have few edges
+        for (unsigned int j = 1; j < node->nfwd; j++) {
+            struct edge edge = node->fwd[j];
+            unsigned int k = j;
+            while (k > 0 && node->fwd[k - 1].dst->id < edge.dst->id) {
+                node->fwd[k] = node->fwd[k - 1];
+                k--;
+            }
+            node->fwd[k] = edge;
+        }
+        for (unsigned int j = 0; j < node->nfwd; j++) {
+            graph->bwd_index[node->fwd[j].dst->id + 1]++;
+        }
+    }
+    for (unsigned int i = 0; i < n; i++) {
+        graph->bwd_index[i + 1] += graph->bwd_index[i];
     }
-    node->visited = true;
 
-    for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
-        kosaraju_visit(edge->dst);
+    // Fill in the edges.  This moves bwd_index[i] from the start to the end
+    // of the edges into node i, so then it has to be shifted back.
+    graph->bwd = malloc(graph->bwd_index[n] * sizeof(*graph->bwd));
+    for (unsigned int i = 0; i < n; i++) {
+        struct node *node = graph->nodes[i];
+        for (unsigned int j = 0; j < node->nfwd; j++) {
+            struct edge *edge = &node->fwd[j];
+            graph->bwd[graph->bwd_index[edge->dst->id]++] = edge;
+        }
+    }
+    for (unsigned int i = n; i > 0; i--) {
+        graph->bwd_index[i] = graph->bwd_index[i - 1];
     }
+    graph->bwd_index[0] = 0;
+}
+
+#define SCC_NONE    UINT32_MAX      // no component (or weakly connected subgraph)
+#define SCC_CHUNK   256             // #frontier nodes a worker takes at a time
+
+// Per-worker state for the iterative version of Tarjan's algorithm, and
+// for building frontiers in the parallel algorithm
+struct scc_call {
+    unsigned int id;            // node being visited
+    unsigned int edge;          // next outgoing edge to look at
+};
 
-    // Push node
-    struct stack *s = new_alloc(struct stack);
-    s->node = node;
-    s->next = stack;
-    stack = s;
+struct scc_worker {
+    struct scc_call *calls;     // depth-first search "call stack"
+    unsigned int ncalls, alloc_calls;
+    unsigned int *stack;        // Tarjan's stack of nodes
+    unsigned int nstack, alloc_stack;
+    unsigned int next_index;    // for numbering nodes in DFS order
+    unsigned int *buf;          // nodes for the next frontier
+    unsigned int nbuf;
+};
+
+struct scc {
+    struct graph_t *graph;
+    unsigned int nworkers;
+    volatile uint32_t *comp;    // label (some node id) of component or SCC_NONE
+    unsigned int *index;        // DFS number, 0 if not yet visited
+    unsigned int *low;          // Tarjan's low link
+    struct scc_worker *workers;
+
+    // Parallel only
+    barrier_t barrier;
+    volatile int32_t *outdeg;   // #edges to nodes not yet in a component
+    volatile int32_t *indeg;    // #edges from nodes not yet in a component
+    volatile uint64_t *fwdmap;  // bitmap of nodes reached by forward search
+    volatile uint64_t *bwdmap;  // bitmap of nodes reached by backward search
+    volatile uint32_t *wcc;     // union-find forest of weakly connected parts
+    unsigned int pivot;         // start of forward-backward search
+    unsigned int *frontier;     // current frontier of a search
+    unsigned int *next;         // next frontier
+    volatile int64_t nfrontier, nnext, cursor;
+    unsigned int *roots;        // weakly connected parts left for Tarjan
+    unsigned int *starts;       // where their nodes are in next[]
+    unsigned int nroots;
+};
+
+static struct scc *scc_new(struct graph_t *graph, unsigned int nworkers){
+    struct scc *scc = new_alloc(struct scc);
+    unsigned int n = graph->size;
+
+    scc->graph = graph;
+    scc->nworkers = nworkers;
+    scc->comp = malloc(n * sizeof(*scc->comp));
+    for (unsigned int i = 0; i < n; i++) {
+        scc->comp[i] = SCC_NONE;
+    }
+    scc->index = calloc(n, sizeof(*scc->index));
+    scc->low = malloc(n * sizeof(*scc->low));
+    scc->workers = calloc(nworkers, sizeof(*scc->workers));
+    return scc;
 }
 
-static void kosaraju_assign(struct node *node, int component) {
-    if (node->visited) {
-        return;
+// Iterative version of Tarjan's algorithm, starting from node v.  If the
+// graph is divided into weakly connected parts, only the nodes in the part
+// with the given root are considered.
+static void scc_tarjan(struct scc *scc, struct scc_worker *sw, unsigned int v, unsigned int root){
+    struct node **nodes = scc->graph->nodes;
+
+    sw->ncalls = sw->nstack = 0;
+    for (;;) {
+        // Visit v
+        if (sw->ncalls == sw->alloc_calls) {
+            sw->alloc_calls = (sw->alloc_calls + 1) * 2;
+            sw->calls = realloc(sw->calls, sw->alloc_calls * sizeof(*sw->calls));
+        }
+        if (sw->nstack == sw->alloc_stack) {
+            sw->alloc_stack = (sw->alloc_stack + 1) * 2;
+            sw->stack = realloc(sw->stack, sw->alloc_stack * sizeof(*sw->stack));
+        }
+        scc->index[v] = scc->low[v] = ++sw->next_index;
+        sw->stack[sw->nstack++] = v;
+        sw->calls[sw->ncalls].id = v;
+        sw->calls[sw->ncalls].edge = 0;
+        sw->ncalls++;
+
+        // Look for the next unvisited node, finishing nodes along the way
+        v = SCC_NONE;
+        while (sw->ncalls > 0) {
+            struct scc_call *call = &sw->calls[sw->ncalls - 1];
+            unsigned int u = call->id;
+            if (call->edge < nodes[u]->nfwd) {
+                unsigned int w = nodes[u]->fwd[call->edge++].dst->id;
+                if (scc->wcc != NULL && scc->wcc[w] != root) {
+                    continue;
+                }
+                if (scc->index[w] == 0) {
+                    v = w;
+                    break;
+                }
+                if (scc->comp[w] == SCC_NONE && scc->index[w] < scc->low[u]) {
+                    scc->low[u] = scc->index[w];     // w is on the stack
+                }
+                continue;
+            }
+
+            // All edges of u have been looked at
+            sw->ncalls--;
+            if (scc->low[u] == scc->index[u]) {
+                unsigned int w;
+                do {
+                    w = sw->stack[--sw->nstack];
+                    scc->comp[w] = u;
+                } while (w != u);
+            }
+            if (sw->ncalls > 0) {
+                unsigned int p = sw->calls[sw->ncalls - 1].id;
+                if (scc->low[u] < scc->low[p]) {
+                    scc->low[p] = scc->low[u];
+                }
+            }
+        }
+        if (v == SCC_NONE) {
+            break;
+        }
     }
-    node->visited = true;
-    node->component = component;
-    for (struct edge *edge = node->bwd; edge != NULL; edge = edge->bwdnext) {
-        kosaraju_assign(edge->src, component);
+}
+
+// Number the components in order of their lowest numbered node, so the
+// result does not depend on the algorithm or the number of workers.
+// Returns the number of components.
+static unsigned int scc_finish(struct scc *scc){
+    struct graph_t *graph = scc->graph;
+    unsigned int *map = scc->low, count = 0;
+
+    for (unsigned int i = 0; i < graph->size; i++) {
+        map[i] = SCC_NONE;
+    }
+    for (unsigned int i = 0; i < graph->size; i++) {
+        unsigned int label = scc->comp[i];
+        assert(label < graph->size);
+        if (map[label] == SCC_NONE) {
+            map[label] = count++;
+        }
+        graph->nodes[i]->component = map[label];
+    }
+
+    for (unsigned int i = 0; i < scc->nworkers; i++) {
+        struct scc_worker *sw = &scc->workers[i];
+        free(sw->calls);
+        free(sw->stack);
+        free(sw->buf);
     }
+    free(scc->workers);
+    free((void *) scc->comp);
+    free(scc->index);
+    free(scc->low);
+    free(scc);
+    return count;
 }
 
-int graph_find_scc(struct graph_t *graph) {
+// Find the strongly connected components.  Sets node->component and returns
+// the number of components.
+unsigned int graph_find_scc(struct graph_t *graph){
+    struct scc *scc = scc_new(graph, 1);
+
     for (unsigned int i = 0; i < graph->size; i++) {
-        kosaraju_visit(graph->nodes[i]);
+        if (scc->index[i] == 0) {
+            scc_tarjan(scc, &scc->workers[0], i, 0);
+        }
+    }
+    return scc_finish(scc);
+}
+
+// The parallel version first repeatedly removes nodes that have no
+// incoming or no outgoing edges left (trimming), which takes care of the
+// (many) trivial components.  Then a forward and a backward search from
+// some node find its component, which is typically the one big component.
+// What is left is divided into weakly connected parts, and the workers run
+// Tarjan's algorithm on those in parallel.
+
+struct scc *graph_scc_new(struct graph_t *graph, unsigned int nworkers){
+    struct scc *scc = scc_new(graph, nworkers);
+    unsigned int n = graph->size;
+    unsigned int nwords = (n + 63) / 64;
+
+    barrier_init(&scc->barrier, nworkers);
+    scc->outdeg = malloc(n * sizeof(*scc->outdeg));
+    scc->indeg = malloc(n * sizeof(*scc->indeg));
+    scc->fwdmap = calloc(nwords, sizeof(uint64_t));
+    scc->bwdmap = calloc(nwords, sizeof(uint64_t));
+    scc->wcc = malloc(n * sizeof(*scc->wcc));
+    scc->frontier = malloc(n * sizeof(*scc->frontier));
+    scc->next = malloc(n * sizeof(*scc->next));
+    for (unsigned int i = 0; i < nworkers; i++) {
+        scc->workers[i].buf = malloc(SCC_CHUNK * sizeof(unsigned int));
+    }
+    return scc;
+}
+
+// Add the node to the next frontier
+static void scc_push(struct scc *scc, struct scc_worker *sw, unsigned int id){
+    if (sw->nbuf == SCC_CHUNK) {
+        int64_t pos = atomic_add64(&scc->nnext, SCC_CHUNK) - SCC_CHUNK;
+        memcpy(&scc->next[pos], sw->buf, SCC_CHUNK * sizeof(unsigned int));
+        sw->nbuf = 0;
+    }
+    sw->buf[sw->nbuf++] = id;
+}
+
+// Make the next frontier the current one.  Returns its size.
+static unsigned int scc_advance(struct scc *scc, struct scc_worker *sw, unsigned int worker){
+    if (sw->nbuf > 0) {
+        int64_t pos = atomic_add64(&scc->nnext, sw->nbuf) - sw->nbuf;
+        memcpy(&scc->next[pos], sw->buf, sw->nbuf * sizeof(unsigned int));
+        sw->nbuf = 0;
+    }
+    barrier_wait(&scc->barrier);
+    if (worker == 0) {
+        unsigned int *tmp = scc->frontier;
+        scc->frontier = scc->next;
+        scc->next = tmp;
+        scc->nfrontier = scc->nnext;
+        scc->nnext = 0;
+        scc->cursor = 0;
+    }
+    barrier_wait(&scc->barrier);
+    return scc->nfrontier;
+}
+
+// Take some nodes from the current frontier.  Returns the number taken.
+static unsigned int scc_take(struct scc *scc, unsigned int **nodes){
+    int64_t end = atomic_add64(&scc->cursor, SCC_CHUNK);
+    int64_t start = end - SCC_CHUNK;
+    if (start >= scc->nfrontier) {
+        return 0;
+    }
+    if (end > scc->nfrontier) {
+        end = scc->nfrontier;
+    }
+    *nodes = &scc->frontier[start];
+    return end - start;
+}
+
+// Put the node in a trivial component, unless another worker beat us to it
+static bool scc_trim(struct scc *scc, unsigned int id){
+    return atomic_cas32(&scc->comp[id], SCC_NONE, id);
+}
+
+static bool scc_mark(volatile uint64_t *map, unsigned int id){
+    uint64_t bit = (uint64_t) 1 << (id & 63);
+    return (atomic_or64(&map[id >> 6], bit) & bit) == 0;
+}
+
+static bool scc_marked(volatile uint64_t *map, unsigned int id){
+    return (map[id >> 6] >> (id & 63)) & 1;
+}
+
+static unsigned int scc_find(struct scc *scc, unsigned int id){
+    while (scc->wcc[id] != id) {
+        id = scc->wcc[id];
     }
+    return id;
+}
 
-    // make sure all nodes are marked and on the stack
-    // while at it clear all the visited flags
-    unsigned int count = 0;
-    for (struct stack *s = stack; s != NULL; s = s->next) {
-        assert(s->node->visited);
-        s->node->visited = false;
-        count++;
+// Merge two weakly connected parts.  The root with the higher id is linked
+// to the other one, so there are no cycles even with concurrent updates.
+static void scc_union(struct scc *scc, unsigned int a, unsigned int b){
+    for (;;) {
+        a = scc_find(scc, a);
+        b = scc_find(scc, b);
+        if (a == b) {
+            return;
+        }
+        if (a < b) {
+            unsigned int t = a; a = b; b = t;
+        }
+        if (atomic_cas32(&scc->wcc[a], a, b)) {
+            return;
+        }
     }
-    assert(count == graph->size);
+}
 
-    count = 0;
-    while (stack != NULL) {
-        // Pop
-        struct stack *top = stack;
-        stack = top->next;
-        struct node *next = top->node;
-        free(top);
+// Run by each of the workers
+void graph_scc_work(void *arg, unsigned int worker){
+    struct scc *scc = arg;
+    struct scc_worker *sw = &scc->workers[worker];
+    struct graph_t *graph = scc->graph;
+    struct node **nodes = graph->nodes;
+    unsigned int n = graph->size;
+    unsigned int lo = (uint64_t) n * worker / scc->nworkers;
+    unsigned int hi = (uint64_t) n * (worker + 1) / scc->nworkers;
+    unsigned int *ids, cnt;
 
-        if (!next->visited) {
-            kosaraju_assign(next, count++);
+    // Count the edges of each node, ignoring self-loops.  Nodes without
+    // incoming or outgoing edges form the first frontier for trimming.
+    for (unsigned int i = lo; i < hi; i++) {
+        struct node *node = nodes[i];
+        int32_t out = 0, in = 0;
+        for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+            out += edge->dst->id != i;
+        }
+        for (unsigned int b = graph->bwd_index[i]; b < graph->bwd_index[i + 1]; b++) {
+            in += graph->bwd[b]->src->id != i;
+        }
+        scc->outdeg[i] = out;
+        scc->indeg[i] = in;
+        if ((out == 0 || in == 0) && scc_trim(scc, i)) {
+            scc_push(scc, sw, i);
         }
     }
-    for (unsigned int i = 0; i < graph->size; i++) {
-        assert(graph->nodes[i]->visited);
+
+    // Trim nodes whose last incoming or outgoing edge has gone
+    while (scc_advance(scc, sw, worker) > 0) {
+        while ((cnt = scc_take(scc, &ids)) > 0) {
+            for (unsigned int k = 0; k < cnt; k++) {
+                unsigned int id = ids[k];
+                struct node *node = nodes[id];
+                for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+                    unsigned int w = edge->dst->id;
+                    if (w != id && atomic_add32(&scc->indeg[w], -1) == 0 && scc_trim(scc, w)) {
+                        scc_push(scc, sw, w);
+                    }
+                }
+                for (unsigned int b = graph->bwd_index[id]; b < graph->bwd_index[id + 1]; b++) {
+                    unsigned int w = graph->bwd[b]->src->id;
+                    if (w != id && atomic_add32(&scc->outdeg[w], -1) == 0 && scc_trim(scc, w)) {
+                        scc_push(scc, sw, w);
+                    }
+                }
+            }
+        }
     }
 
-    return count;
+    // Pick a node that is left
+    if (worker == 0) {
+        scc->pivot = SCC_NONE;
+        for (unsigned int i = 0; i < n; i++) {
+            if (scc->comp[i] == SCC_NONE) {
+                scc->pivot = i;
+                scc_mark(scc->fwdmap, i);
+                scc_push(scc, sw, i);
+                break;
+            }
+        }
+    }
+    barrier_wait(&scc->barrier);
+    unsigned int pivot = scc->pivot;
+    if (pivot == SCC_NONE) {
+        return;
+    }
+
+    // Forward search from the pivot
+    while (scc_advance(scc, sw, worker) > 0) {
+        while ((cnt = scc_take(scc, &ids)) > 0) {
+            for (unsigned int k = 0; k < cnt; k++) {
+                struct node *node = nodes[ids[k]];
+                for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+                    unsigned int w = edge->dst->id;
+                    if (scc->comp[w] == SCC_NONE && scc_mark(scc->fwdmap, w)) {
+                        scc_push(scc, sw, w);
+                    }
+                }
+            }
+        }
+    }
+
+    // Backward search, within the nodes reached by the forward search
+    if (worker == 0) {
+        scc_mark(scc->bwdmap, pivot);
+        scc_push(scc, sw, pivot);
+    }
+    while (scc_advance(scc, sw, worker) > 0) {
+        while ((cnt = scc_take(scc, &ids)) > 0) {
+            for (unsigned int k = 0; k < cnt; k++) {
+                unsigned int id = ids[k];
+                for (unsigned int b = graph->bwd_index[id]; b < graph->bwd_index[id + 1]; b++) {
+                    unsigned int w = graph->bwd[b]->src->id;
+                    if (scc->comp[w] == SCC_NONE && scc_marked(scc->fwdmap, w) &&
+                                                scc_mark(scc->bwdmap, w)) {
+                        scc_push(scc, sw, w);
+                    }
+                }
+            }
+        }
+    }
+
+    // The nodes reached both ways form the component of the pivot.  Each
+    // remaining node starts out as a weakly connected part by itself.
+    for (unsigned int i = lo; i < hi; i++) {
+        if (scc_marked(scc->bwdmap, i)) {
+            scc->comp[i] = pivot;
+        }
+        scc->wcc[i] = scc->comp[i] == SCC_NONE ? i : SCC_NONE;
+    }
+    barrier_wait(&scc->barrier);
+
+    // A component is either entirely inside or entirely outside of the
+    // forward reachable set, so only edges within either are followed
+    for (unsigned int i = lo; i < hi; i++) {
+        if (scc->wcc[i] == SCC_NONE) {
+            continue;
+        }
+        struct node *node = nodes[i];
+        bool fwd = scc_marked(scc->fwdmap, i);
+        for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+            unsigned int w = edge->dst->id;
+            if (scc->wcc[w] != SCC_NONE && scc_marked(scc->fwdmap, w) == fwd) {
+                scc_union(scc, i, w);
+            }
+        }
+    }
+    barrier_wait(&scc->barrier);
+    for (unsigned int i = lo; i < hi; i++) {
+        if (scc->wcc[i] != SCC_NONE) {
+            scc->wcc[i] = scc_find(scc, i);
+        }
+    }
+    barrier_wait(&scc->barrier);
+
+    // Sort the remaining nodes by weakly connected part
+    if (worker == 0) {
+        unsigned int *count = scc->frontier;
+        scc->roots = malloc(n * sizeof(*scc->roots));
+        scc->nroots = 0;
+        for (unsigned int i = 0; i < n; i++) {
+            if (scc->wcc[i] == i) {
+                count[i] = 0;
+                scc->roots[scc->nroots++] = i;
+            }
+        }
+        for (unsigned int i = 0; i < n; i++) {
+            if (scc->wcc[i] != SCC_NONE) {
+                count[scc->wcc[i]]++;
+            }
+        }
+        scc->starts = malloc((scc->nroots + 1) * sizeof(*scc->starts));
+        unsigned int total = 0;
+        for (unsigned int k = 0; k < scc->nroots; k++) {
+            unsigned int r = scc->roots[k];
+            scc->starts[k] = total;
+            total += count[r];
+            count[r] = scc->starts[k];      // now where to put the next node
+        }
+        scc->starts[scc->nroots] = total;
+        for (unsigned int i = 0; i < n; i++) {
+            if (scc->wcc[i] != SCC_NONE) {
+                scc->next[count[scc->wcc[i]]++] = i;
+            }
+        }
+        scc->cursor = 0;
+    }
+    barrier_wait(&scc->barrier);
+
+    // Take weakly connected parts one at a time
+    int64_t k;
+    while ((k = atomic_add64(&scc->cursor, 1) - 1) < scc->nroots) {
+        for (unsigned int j = scc->starts[k]; j < scc->starts[k + 1]; j++) {
+            unsigned int id = scc->next[j];
+            if (scc->index[id] == 0) {
+                scc_tarjan(scc, sw, id, scc->roots[k]);
+            }
+        }
+    }
+}
+
+// Called after all workers are done with graph_scc_work().  Sets
+// node->component and returns the number of components.
+unsigned int graph_scc_finish(struct scc *scc){
+    barrier_destroy(&scc->barrier);
+    free((void *) scc->outdeg);
+    free((void *) scc->indeg);
+    free((void *) scc->fwdmap);
+    free((void *) scc->bwdmap);
+    free((void *) scc->wcc);
+    free(scc->frontier);
+    free(scc->next);
+    free(scc->roots);
+    free(scc->starts);
+    return scc_finish(scc);
 }
 
 // For tracking data races
-struct access_info *graph_ai_alloc(int multiplicity, int atomic, int pc) {
-    struct access_info *ai = calloc(1, sizeof(*ai));
-    ai->multiplicity = multiplicity;
-    ai->atomic = atomic;
-    ai->pc = pc;
-    return ai;
+// Data race detection.  The accesses of the steps out of a node are
+// indexed by address, so conflicting accesses can be found without
+// comparing all pairs.  There is an entry for each address that is
+// accessed, and (with prefix set) for each proper prefix of one, which
+// stands for the accesses to the addresses that extend it.  An entry
+// records for each kind of access the last edge that made one.  Two
+// accesses conflict unless both are loads or both are atomic, that is,
+// if their kinds have no bits in common.
+#define RACE_KIND(ai)   (((ai)->load ? 2 : 0) | ((ai)->atomic != 0 ? 1 : 0))
+#define RACE_PAIRWISE   16          // use an index if more accesses
+
+struct race_entry {
+    hvalue_t *indices;              // address, or NULL if unused
+    unsigned int n;                 // length of address
+    bool prefix;                    // entry for longer addresses
+    int last[4];                    // last edge with each kind of access
+};
+
+static inline uint64_t race_hash(uint64_t h, hvalue_t v){
+    return (h ^ v) * 0x9E3779B97F4A7C15ULL;
 }
 
+static struct race_entry *race_lookup(struct race_entry *index, unsigned int mask,
+            uint64_t h, hvalue_t *indices, unsigned int n, bool prefix, bool insert){
+    h = race_hash(h, prefix);
+    for (unsigned int i = (h >> 32) & mask;; i = (i + 1) & mask) {
+        struct race_entry *re = &index[i];
+        if (re->indices == NULL) {
+            if (!insert) {
+                return NULL;
+            }
+            re->indices = indices;
+            re->n = n;
+            re->prefix = prefix;
+            re->last[0] = re->last[1] = re->last[2] = re->last[3] = -1;
+            return re;
+        }
+        if (re->n == n && re->prefix == prefix &&
+                memcmp(re->indices, indices, n * sizeof(hvalue_t)) == 0) {
+            return re;
+        }
+    }
+}
+
+// See if the entry has an access after edge e that conflicts with ai
+static bool race_after(struct race_entry *re, struct access_info *ai, int e){
+    if (re == NULL) {
+        return false;
+    }
+    int kind = RACE_KIND(ai);
+    for (int k = 0; k < 4; k++) {
+        if ((kind & k) == 0 && re->last[k] > e) {
+            return true;
+        }
+    }
+    return false;
+}
+
+// Find the first access of a later edge out of the node that conflicts with
+// ai.  Returns the length of the common address, or 0 if there is no such
+// access.
+static unsigned int race_partner(struct node *node, struct edge *edge, struct access_info *ai){
+    for (struct edge *edge2 = edge + 1; edge2 < &node->fwd[node->nfwd]; edge2++) {
+        for (unsigned int a2 = edge2->nai; a2-- > 0;) {
+            struct access_info *ai2 = &edge2->ai[a2];
+            if ((RACE_KIND(ai) & RACE_KIND(ai2)) == 0) {
+                unsigned int min = ai->n < ai2->n ? ai->n : ai2->n;
+                if (memcmp(ai->indices, ai2->indices, min * sizeof(hvalue_t)) == 0) {
+                    return min;
+                }
+            }
+        }
+    }
+    return 0;
+}
+
+static void race_report(
+    struct node *node,
+    struct minheap *warnings,
+    struct engine *engine,
+    hvalue_t *indices,
+    unsigned int n
+) {
+    struct failure *f = new_alloc(struct failure);
+    f->type = FAIL_RACE;
+    f->choice = node->choice;
+    f->node = node;
+    f->address = value_put_address(engine, indices, n * sizeof(hvalue_t));
+    minheap_insert(warnings, f);
+}
+
+// Look for a data race among the steps out of the given node.  Only the
+// first one is reported: the first access that conflicts with an access
+// of a later edge, or that is a store made by more than one identical
+// thread.  With few accesses it is cheaper to just compare them all.
 void graph_check_for_data_race(
     struct node *node,
     struct minheap *warnings,
     struct engine *engine
 ) {
-    // TODO.  We're checking both if x and y conflict and y and x conflict for any two x and y, which is redundant
-    for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
-        for (struct access_info *ai = edge->ai; ai != NULL; ai = ai->next) {
-            if (ai->indices != NULL) {
+    struct race_entry *index = NULL;
+    unsigned int naccesses = 0, nentries = 0, size = 16;
+
+    for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
+        naccesses += edge->nai;
+        for (unsigned int a = 0; a < edge->nai; a++) {
+            nentries += edge->ai[a].n;
+        }
+    }
+    if (naccesses > RACE_PAIRWISE) {
+        while (size < 2 * nentries) {
+            size *= 2;
+        }
+        index = calloc(size, sizeof(*index));
+
+        for (unsigned int e = 0; e < node->nfwd; e++) {
+            struct edge *edge = &node->fwd[e];
+            for (unsigned int a = 0; a < edge->nai; a++) {
+                struct access_info *ai = &edge->ai[a];
                 assert(ai->n > 0);
-                if (ai->multiplicity > 1 && !ai->load && ai->atomic == 0) {
-                    struct failure *f = new_alloc(struct failure);
-                    f->type = FAIL_RACE;
-                    f->choice = node->choice;
-                    f->node = node;
-                    f->address = value_put_address(engine, ai->indices, ai->n * sizeof(hvalue_t));
-                    minheap_insert(warnings, f);
+                uint64_t h = 0;
+                for (unsigned int k = 1; k <= ai->n; k++) {
+                    h = race_hash(h, ai->indices[k - 1]);
+                    struct race_entry *re = race_lookup(index, size - 1, h,
+                                                ai->indices, k, k < ai->n, true);
+                    re->last[RACE_KIND(ai)] = e;
                 }
-                else {
-                    for (struct edge *edge2 = edge->fwdnext; edge2 != NULL; edge2 = edge2->fwdnext) {
-                        for (struct access_info *ai2 = edge2->ai; ai2 != NULL; ai2 = ai2->next) {
-                            if (ai2->indices != NULL && !(ai->load && ai2->load) &&
-                                (ai->atomic == 0 || ai2->atomic == 0)) {
-                                int min = ai->n < ai2->n ? ai->n : ai2->n;
-                                assert(min > 0);
-                                if (memcmp(ai->indices, ai2->indices,
-                                           min * sizeof(hvalue_t)) == 0) {
-                                    struct failure *f = new_alloc(struct failure);
-                                    f->type = FAIL_RACE;
-                                    f->choice = node->choice;
-                                    f->node = node;
-                                    f->address = value_put_address(engine, ai->indices, min * sizeof(hvalue_t));
-                                    minheap_insert(warnings, f);
-                                }
-                            }
-                        }
-                    }
+            }
+        }
+    }
+
+    // Find the first access that races.  The accesses of an edge are
+    // visited latest first.
+    for (unsigned int e = 0; e < node->nfwd; e++) {
+        struct edge *edge = &node->fwd[e];
+        for (unsigned int a = edge->nai; a-- > 0;) {
+            struct access_info *ai = &edge->ai[a];
+            if (ai->multiplicity > 1 && !ai->load && ai->atomic == 0) {
+                race_report(node, warnings, engine, ai->indices, ai->n);
+                goto done;
+            }
+
+            // Using the index, look for a later access to a prefix of the
+            // address, or to an address that it is a prefix of
+            if (index != NULL) {
+                uint64_t h = 0;
+                bool found = false;
+                for (unsigned int k = 1; k <= ai->n && !found; k++) {
+                    h = race_hash(h, ai->indices[k - 1]);
+                    found = race_after(race_lookup(index, size - 1, h,
+                                                ai->indices, k, false, false), ai, e) ||
+                            (k == ai->n && race_after(race_lookup(index, size - 1, h,
+                                                ai->indices, k, true, false), ai, e));
+                }
+                if (!found) {
+                    continue;
                 }
             }
+
+            unsigned int min = race_partner(node, edge, ai);
+            if (min > 0) {
+                race_report(node, warnings, engine, ai->indices, min);
+                goto done;
+            }
+            assert(index == NULL);
         }
     }
+
+done:
+    free(index);
 }
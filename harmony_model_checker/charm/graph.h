@@ -15,7 +15,6 @@ struct component {
 };
 
 struct access_info {
-    struct access_info *next; // linked list maintenance
     hvalue_t *indices;        // address of load/store
     unsigned int n;           // length of address
     bool load;                // store or del if false
@@ -24,17 +23,30 @@ struct access_info {
     int atomic;               // atomic counter
 };
 
+// The edges out of a node are kept in an array, filled in when the node is
+// explored.  The edges into a node are indexed after the search (see
+// graph_build_bwd).
 struct edge {
-    struct edge *fwdnext;    // forward linked list maintenance
-    struct edge *bwdnext;    // backward linked list maintenance
     hvalue_t ctx, choice;    // ctx that made the microstep, choice if any
-    bool interrupt;          // set if state change is an interrupt
+    hvalue_t after;          // resulting context
     struct node *src;        // source node
     struct node *dst;        // destination node
-    hvalue_t after;          // resulting context
-    struct access_info *ai;  // to detect data races
     hvalue_t *log;           // print history
+    struct access_info *ai;  // to detect data races (freed after)
     unsigned int nlog;       // size of print history
+    unsigned int nai;        // #entries in ai
+    int steps;               // #microsteps
+    uint16_t perm;           // symmetry: renaming applied to the destination
+    bool interrupt;          // set if state change is an interrupt
+};
+
+// In hash-compaction and bitstate mode nodes are discarded once they have
+// been explored.  The trail records how a node was reached so that a
+// counterexample can be reconstructed by re-executing the steps.
+struct trail {
+    struct trail *parent;    // NULL for the initial state
+    hvalue_t ctx, choice;    // ctx that made the step, choice if any
+    bool interrupt;          // set if the step was an interrupt
 };
 
 enum fail_type {
@@ -50,11 +62,12 @@ enum fail_type {
 struct node {
 	struct node *next;		// for linked list
 
-    // Information about state
-    struct state state;     // state corresponding to this node
+    // Information about state.  The state itself is normally kept in the
+    // table of visited states.
+    struct state *state;    // state corresponding to this node
     unsigned int id;        // nodes are numbered starting from 0
+    unsigned int nfwd;      // #forward edges
     struct edge *fwd;       // forward edges
-    struct edge *bwd;       // backward edges
 
     // How to get here from parent node
     struct node *parent;    // shortest path to initial state
@@ -65,13 +78,16 @@ struct node {
     hvalue_t choice;        // choice made if any
     bool interrupt;         // set if gotten here by interrupt
     bool final;             // only eternal threads left
+    uint16_t perm;          // symmetry: renaming applied after step from parent
 
     // SCC
-    bool visited;           // for Kosaraju algorithm
     unsigned int component; // strongly connected component id
 
     // NFA compression
     bool reachable;
+
+    // Hash-compaction and bitstate mode
+    struct trail *trail;    // how we got here
 };
 
 struct failure {
@@ -81,6 +97,7 @@ struct failure {
     struct node *parent;    // if NULL, use node->parent
     hvalue_t choice;        // choice if any
     bool interrupt;         // interrupt transition
+    unsigned int perm;      // symmetry: renaming applied to node (if parent)
     hvalue_t address;       // in case of data race
 };
 
@@ -88,11 +105,14 @@ struct graph_t {
     struct node **nodes;         // vector of all nodes
     unsigned int size;           // to create node identifiers
     unsigned int alloc_size;     // size allocated
+
+    // The edges into node i are bwd[bwd_index[i]..bwd_index[i+1])
+    unsigned int *bwd_index;
+    struct edge **bwd;
 };
 
 void graph_init(struct graph_t *graph, unsigned int initial_size);
 
-struct access_info *graph_ai_alloc(int multiplicity, int atomic, int pc);
 
 void graph_check_for_data_race(
     struct node *node,
@@ -100,6 +120,10 @@ void graph_check_for_data_race(
     struct engine *engine
 );
 void graph_add(struct graph_t *graph, struct node *node);
-int graph_find_scc(struct graph_t *graph);
+void graph_build_bwd(struct graph_t *graph);
+unsigned int graph_find_scc(struct graph_t *graph);
+struct scc *graph_scc_new(struct graph_t *graph, unsigned int nworkers);
+void graph_scc_work(void *scc, unsigned int worker);
+unsigned int graph_scc_finish(struct scc *scc);
 
 #endif //SRC_GRAPH_H
@@ -39,12 +39,246 @@ static inline struct keynode *keynode_new(struct dict *dict,
 	return node;
 }
 
+// Like keynode_new(), but the key is given as an edit (see dict_find_patch())
+static struct keynode *keynode_new_patch(struct dict *dict, struct allocator *al,
+        const struct dict_patch *patch, unsigned int len, uint32_t hash){
+	struct keynode *node = al == NULL ?
+            malloc(sizeof(struct keynode) + len) :
+            (*al->alloc)(al->ctx, sizeof(struct keynode) + len, false);
+	node->len = len;
+    char *q = (char *) (node + 1);
+    unsigned int rest = patch->len - patch->off - patch->del;
+	memcpy(q, patch->base, patch->off);
+	memcpy(q + patch->off, patch->ins, patch->insn);
+	memcpy(q + patch->off + patch->insn,
+                (char *) patch->base + patch->off + patch->del, rest);
+    node->hash = hash;
+	node->next = 0;
+	node->value = NULL;
+	return node;
+}
+
+// See if keynode k has the given key, or, if patch is not NULL, the key
+// described by patch (keyn is its length then)
+static inline bool keynode_match(const struct keynode *k, const void *key,
+                unsigned int keyn, const struct dict_patch *patch){
+    if (k->len != keyn) {
+        return false;
+    }
+    if (patch == NULL) {
+        return memcmp(k + 1, key, keyn) == 0;
+    }
+    const char *q = (const char *) (k + 1);
+    unsigned int rest = patch->len - patch->off - patch->del;
+    return memcmp(q, patch->base, patch->off) == 0 &&
+        memcmp(q + patch->off, patch->ins, patch->insn) == 0 &&
+        memcmp(q + patch->off + patch->insn,
+                (const char *) patch->base + patch->off + patch->del, rest) == 0;
+}
+
 // TODO.  Make iterative rather than recursive
 void keynode_delete(struct dict *dict, struct keynode *node) {
 	if (node->next) keynode_delete(dict, node->next);
 	(*dict->free)(node);
 }
 
+#define DICT_MOVED          ((struct keynode *) 1)
+#define DICT_CHUNK          1024        // #slots migrated at a time
+#define DICT_MAX_PROBES     128         // grow if a probe gets this long
+#define DICT_COUNT_BATCH    64          // per-worker inserts between updates
+
+// 64-bit hash used as the fingerprint in open addressing tables.  Different
+// seeds give (practically) independent hash functions.
+uint64_t dict_hash64(const void *p, unsigned int count, uint64_t seed) {
+    const char *key = p;
+    uint64_t h = seed ^ 0x9e3779b97f4a7c15 ^ count, w;
+	while (count >= 8) {
+        memcpy(&w, key, 8);
+        h ^= w * 0xff51afd7ed558ccd;
+        h = ((h << 31) | (h >> 33)) * 0xc4ceb9fe1a85ec53;
+		count -= 8;
+		key += 8;
+	}
+    while (count > 0) {
+        h = (h ^ (uint8_t) *key++) * 0x100000001b3;
+        count--;
+    }
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccd;
+    h ^= h >> 33;
+    h *= 0xc4ceb9fe1a85ec53;
+    h ^= h >> 33;
+    return h == 0 ? 1 : h;      // 0 means "not yet set"
+}
+
+// The hash of a key for the chained table
+static inline uint32_t dict_hash32(struct dict *dict, const void *key, unsigned int keyn){
+    return dict->hash == NULL ? hash_func(key, keyn) : (*dict->hash)(key, keyn);
+}
+
+// The fingerprint for the open addressing table.  If the dict has its own
+// (32-bit) hash function, the fingerprint is derived from that.
+static inline uint64_t dict_spread(uint32_t h){
+    uint64_t x = ((uint64_t) h + 1) * 0x9e3779b97f4a7c15;
+    x ^= x >> 29;
+    return x == 0 ? 1 : x;
+}
+
+static struct dict_array *dict_array_new(uint64_t size){
+    struct dict_array *a = calloc(1, sizeof(struct dict_array) +
+                                    size * sizeof(struct dict_slot));
+    if (a == NULL) {
+        panic("dict_array_new: out of memory");
+    }
+    a->size = size;
+    return a;
+}
+
+// Put a key that is known not to be in the array yet.  Used for migration.
+static void dict_array_put(struct dict_array *a, uint64_t hash, struct keynode *k){
+    uint64_t mask = a->size - 1;
+    for (uint64_t i = hash & mask;; i = (i + 1) & mask) {
+        struct dict_slot *ds = &a->slots[i];
+        if (ds->key == NULL && atomic_cas_ptr((void *volatile *) &ds->key, NULL, k)) {
+            ds->hash = hash;
+            return;
+        }
+    }
+}
+
+// Help migrating array old to the new array, and wait until it is done.
+static void dict_help_grow(struct dict *dict, struct dict_array *old){
+    struct dict_array *new = old->to;
+    int64_t nchunks = (old->size + DICT_CHUNK - 1) / DICT_CHUNK;
+
+    for (;;) {
+        int64_t c = atomic_add64(&old->next_chunk, 1) - 1;
+        if (c >= nchunks) {
+            break;
+        }
+        uint64_t end = (c + 1) * DICT_CHUNK;
+        if (end > old->size) {
+            end = old->size;
+        }
+        for (uint64_t i = c * DICT_CHUNK; i < end; i++) {
+            struct dict_slot *ds = &old->slots[i];
+            struct keynode *k;
+            do {
+                k = ds->key;
+            } while (!atomic_cas_ptr((void *volatile *) &ds->key, k, DICT_MOVED));
+            if (k != NULL) {
+                // The hash may not have been set yet by the inserter
+                uint64_t hash = ds->hash;
+                if (hash == 0) {
+                    hash = dict->hash == NULL ? dict_hash64(k + 1, k->len, 0) :
+                                                dict_spread(k->hash);
+                }
+                dict_array_put(new, hash, k);
+            }
+        }
+
+        // The thread that migrates the last chunk installs the new array
+        if (atomic_add64(&old->chunks_done, 1) == nchunks) {
+            old->next = dict->retired;
+            dict->retired = old;
+            (void) atomic_cas_ptr((void *volatile *) &dict->array, old, new);
+        }
+    }
+    while (dict->array == old) {
+        thread_yield();
+    }
+}
+
+// Start migrating array a to an array twice the size (unless some other
+// thread already did), and help out.
+static void dict_open_grow(struct dict *dict, struct dict_array *a){
+    mutex_acquire(&dict->grow_lock);
+    if (a->to == NULL && dict->array == a) {
+        struct dict_array *new = dict_array_new(a->size * 2);
+        (void) atomic_cas_ptr((void *volatile *) &a->to, NULL, new);
+    }
+    mutex_release(&dict->grow_lock);
+    dict_help_grow(dict, a);
+}
+
+// Keep track of the number of entries.  To avoid contention, workers only
+// update the shared count every so many inserts.
+static void dict_open_count(struct dict *dict, struct allocator *al, struct dict_array *a){
+    int64_t n;
+    if (al == NULL || dict->counters == NULL) {
+        n = atomic_add64(&dict->nentries, 1);
+    }
+    else {
+        struct dict_counter *dc = &dict->counters[al->worker];
+        if (++dc->n < DICT_COUNT_BATCH) {
+            return;
+        }
+        n = atomic_add64(&dict->nentries, dc->n);
+        dc->n = 0;
+    }
+    if (2 * n > (int64_t) a->size && a->to == NULL) {
+        dict_open_grow(dict, a);
+    }
+}
+
+// Find the key in the open addressing table.  If not there and insert is
+// set, add it.  Returns the keynode or NULL if not found.  khash is the hash
+// kept in the keynode.  If patch is not NULL, it describes the key instead.
+static struct keynode *dict_open_find(struct dict *dict, struct allocator *al,
+                const void *key, unsigned int keyn, uint64_t hash,
+                uint32_t khash, bool insert, const struct dict_patch *patch){
+    struct keynode *k = NULL;       // allocated when first needed
+
+    for (;;) {
+        struct dict_array *a = dict->array;
+        if (a->to != NULL) {
+            dict_help_grow(dict, a);
+            continue;
+        }
+        uint64_t mask = a->size - 1, i = hash & mask;
+        unsigned int nprobes = 0;
+        for (;;) {
+            struct dict_slot *ds = &a->slots[i];
+            struct keynode *x = ds->key;
+            if (x == DICT_MOVED) {
+                break;
+            }
+            if (x == NULL) {
+                if (!insert) {
+                    return NULL;
+                }
+                if (k == NULL) {
+                    k = patch == NULL ?
+                        keynode_new(dict, al, (char *) key, keyn, khash) :
+                        keynode_new_patch(dict, al, patch, keyn, khash);
+                }
+                if (atomic_cas_ptr((void *volatile *) &ds->key, NULL, k)) {
+                    ds->hash = hash;
+                    dict_open_count(dict, al, a);
+                    return k;
+                }
+                continue;       // lost the race, look at the slot again
+            }
+            uint64_t h = ds->hash;
+            if ((h == hash || (h == 0 && x->hash == khash)) &&
+                    keynode_match(x, key, keyn, patch)) {
+                // Somebody else inserted it first.  Memory from a worker
+                // allocator cannot be freed individually.
+                if (k != NULL && al == NULL) {
+                    (*dict->free)(k);
+                }
+                return x;
+            }
+            if (++nprobes == DICT_MAX_PROBES) {
+                dict_open_grow(dict, a);
+                break;
+            }
+            i = (i + 1) & mask;
+        }
+        dict_help_grow(dict, a);
+    }
+}
+
 struct dict *dict_new(unsigned int initial_size, unsigned int nworkers,
                 void *(*m)(size_t size), void (*f)(void *)) {
 	struct dict *dict = new_alloc(struct dict);
@@ -71,7 +305,42 @@ struct dict *dict_new(unsigned int initial_size, unsigned int nworkers,
 	return dict;
 }
 
+// Like dict_new, but the dict is an open addressing table
+struct dict *dict_new_open(unsigned int initial_size, unsigned int nworkers,
+                void *(*m)(size_t size), void (*f)(void *)) {
+    struct dict *dict = dict_new(initial_size, nworkers, m, f);
+    uint64_t size = 1;
+    while (size < dict->length) {
+        size <<= 1;
+    }
+    dict->array = dict_array_new(size);
+    if (nworkers > 0) {
+        dict->counters = calloc(nworkers, sizeof(struct dict_counter));
+    }
+    mutex_init(&dict->grow_lock);
+    return dict;
+}
+
+static void dict_free_retired(struct dict *dict){
+    struct dict_array *a;
+    while ((a = dict->retired) != NULL) {
+        dict->retired = a->next;
+        free(a);
+    }
+}
+
 void dict_delete(struct dict *dict) {
+    if (dict->array != NULL) {
+        for (uint64_t i = 0; i < dict->array->size; i++) {
+            if (dict->array->slots[i].key != NULL) {
+                (*dict->free)(dict->array->slots[i].key);
+            }
+        }
+        dict_free_retired(dict);
+        free(dict->array);
+        free(dict->counters);
+        mutex_destroy(&dict->grow_lock);
+    }
 	for (unsigned int i = 0; i < dict->length; i++) {
 		if (dict->table[i].stable != NULL)
 			keynode_delete(dict, dict->table[i].stable);
@@ -111,10 +380,22 @@ static void dict_resize(struct dict *dict, unsigned int newsize) {
 	free(old);
 }
 
-// Perhaps the most performance critical function in the entire code base
-void *dict_find(struct dict *dict, struct allocator *al,
-                            const void *key, unsigned int keyn){
-    uint32_t hash = hash_func(key, keyn);
+// Open addressing lookup, given the hash of the key
+static inline struct keynode *dict_open_find_hash(struct dict *dict,
+        struct allocator *al, const void *key, unsigned int keyn,
+        uint32_t hash32, bool insert){
+    if (dict->hash != NULL) {
+        return dict_open_find(dict, al, key, keyn, dict_spread(hash32), hash32, insert, NULL);
+    }
+    uint64_t hash = dict_hash64(key, keyn, 0);
+    return dict_open_find(dict, al, key, keyn, hash, (uint32_t) hash, insert, NULL);
+}
+
+// Chained table lookup, given the hash of the key.  If patch is not NULL, it
+// describes the key instead.
+static inline void *dict_find_chained(struct dict *dict, struct allocator *al,
+                    const void *key, unsigned int keyn, uint32_t hash,
+                    const struct dict_patch *patch){
     unsigned int index = hash % dict->length;
     struct dict_bucket *db = &dict->table[index];
 
@@ -122,7 +403,7 @@ void *dict_find(struct dict *dict, struct allocator *al,
     // a lock
 	struct keynode *k = db->stable;
 	while (k != NULL) {
-		if (k->len == keyn && memcmp(k+1, key, keyn) == 0) {
+		if (keynode_match(k, key, keyn, patch)) {
 			return k;
 		}
 		k = k->next;
@@ -134,7 +415,7 @@ void *dict_find(struct dict *dict, struct allocator *al,
         // See if the item is in the unstable list
         k = db->unstable;
         while (k != NULL) {
-            if (k->len == keyn && memcmp(k+1, key, keyn) == 0) {
+            if (keynode_match(k, key, keyn, patch)) {
                 mutex_release(&dict->locks[index % dict->nlocks]);
                 return k;
             }
@@ -147,11 +428,12 @@ void *dict_find(struct dict *dict, struct allocator *al,
 		double f = (double)dict->count / (double)dict->length;
 		if (f > dict->growth_threshold) {
 			dict_resize(dict, dict->length * dict->growth_factor - 1);
-			return dict_find(dict, al, key, keyn);
+			return dict_find_chained(dict, al, key, keyn, hash, patch);
 		}
 	}
 
-    k = keynode_new(dict, al, (char *) key, keyn, hash);
+    k = patch == NULL ? keynode_new(dict, al, (char *) key, keyn, hash) :
+                        keynode_new_patch(dict, al, patch, keyn, hash);
     if (dict->concurrent) {
         k->next = db->unstable;
         db->unstable = k;
@@ -172,10 +454,55 @@ void *dict_find(struct dict *dict, struct allocator *al,
 	return k;
 }
 
+// Perhaps the most performance critical function in the entire code base
+void *dict_find(struct dict *dict, struct allocator *al,
+                            const void *key, unsigned int keyn){
+    if (dict->array != NULL) {
+        return dict_open_find_hash(dict, al, key, keyn,
+            dict->hash == NULL ? 0 : (*dict->hash)(key, keyn), true);
+    }
+    return dict_find_chained(dict, al, key, keyn, dict_hash32(dict, key, keyn), NULL);
+}
+
+// Like dict_find(), but the caller provides the hash of the key, which must
+// be what the hash function of the dict (see dict_set_hash()) would return.
+// This allows hashes to be maintained incrementally.
+void *dict_find_hash(struct dict *dict, struct allocator *al,
+                            const void *key, unsigned int keyn, uint32_t hash){
+    assert(dict->hash != NULL);
+    if (dict->array != NULL) {
+        return dict_open_find_hash(dict, al, key, keyn, hash, true);
+    }
+    return dict_find_chained(dict, al, key, keyn, hash, NULL);
+}
+
+// Like dict_find_hash(), but the key is given as an edit of another key: the
+// patch->len bytes at patch->base, with the patch->del bytes at offset
+// patch->off replaced by the patch->insn bytes at patch->ins.  This saves
+// making a copy of the edited key, and if the key is already there it is
+// not copied at all.
+void *dict_find_patch(struct dict *dict, struct allocator *al,
+                        const struct dict_patch *patch, uint32_t hash){
+    assert(dict->hash != NULL);
+    assert(patch->off + patch->del <= patch->len);
+    unsigned int keyn = patch->len - patch->del + patch->insn;
+    if (dict->array != NULL) {
+        return dict_open_find(dict, al, NULL, keyn, dict_spread(hash), hash, true, patch);
+    }
+    return dict_find_chained(dict, al, NULL, keyn, hash, patch);
+}
+
 // Similar to dict_find(), but gets a lock on the bucket
 struct keynode *dict_find_lock(struct dict *dict, struct allocator *al,
                             const void *key, unsigned int keyn){
-    uint32_t hash = hash_func(key, keyn);
+    if (dict->array != NULL) {
+        struct keynode *k = dict_open_find_hash(dict, al, key, keyn,
+            dict->hash == NULL ? 0 : (*dict->hash)(key, keyn), true);
+        mutex_acquire(&dict->locks[k->hash % dict->nlocks]);
+        return k;
+    }
+
+    uint32_t hash = dict_hash32(dict, key, keyn);
     unsigned int index = hash % dict->length;
     struct dict_bucket *db = &dict->table[index];
 
@@ -221,6 +548,10 @@ struct keynode *dict_find_lock(struct dict *dict, struct allocator *al,
 }
 
 void dict_find_release(struct dict *dict, struct keynode *k){
+    if (dict->array != NULL) {
+        mutex_release(&dict->locks[k->hash % dict->nlocks]);
+        return;
+    }
     unsigned int index = k->hash % dict->length;
     mutex_release(&dict->locks[index % dict->nlocks]);
 }
@@ -239,8 +570,36 @@ void *dict_retrieve(const void *p, unsigned int *psize){
     return (void *) (k+1);
 }
 
+// The hash of a key that was returned by dict_find()
+uint32_t dict_retrieve_hash(const void *p){
+    const struct keynode *k = p;
+    return k->hash;
+}
+
+// #bytes taken by the table itself, not counting the keys (which come from
+// the allocator)
+uint64_t dict_table_size(struct dict *dict){
+    uint64_t n = (uint64_t) dict->length * sizeof(struct dict_bucket);
+    if (dict->array != NULL) {
+        n += sizeof(struct dict_array) + dict->array->size * sizeof(struct dict_slot);
+    }
+    return n;
+}
+
+// Use the given hash function instead of the default one.  Must be done
+// while the dict is still empty.
+void dict_set_hash(struct dict *dict, dict_hash_t hash){
+    dict->hash = hash;
+}
+
 void *dict_lookup(struct dict *dict, const void *key, unsigned int keyn) {
-    uint32_t hash = hash_func(key, keyn);
+    if (dict->array != NULL) {
+        struct keynode *k = dict_open_find_hash(dict, NULL, key, keyn,
+            dict->hash == NULL ? 0 : (*dict->hash)(key, keyn), false);
+        return k == NULL ? NULL : k->value;
+    }
+
+    uint32_t hash = dict_hash32(dict, key, keyn);
     unsigned int index = hash % dict->length;
     struct dict_bucket *db = &dict->table[index];
 	// __builtin_prefetch(db);
@@ -272,6 +631,16 @@ void *dict_lookup(struct dict *dict, const void *key, unsigned int keyn) {
 }
 
 void dict_iter(struct dict *dict, enumFunc f, void *env) {
+    if (dict->array != NULL) {
+        struct dict_array *a = dict->array;
+        for (uint64_t i = 0; i < a->size; i++) {
+            struct keynode *k = a->slots[i].key;
+            if (k != NULL) {
+                (*f)(env, k+1, k->len, k->value);
+            }
+        }
+        return;
+    }
 	for (unsigned int i = 0; i < dict->length; i++) {
         struct dict_bucket *db = &dict->table[i];
         struct keynode *k = db->stable;
@@ -299,9 +668,13 @@ void dict_set_concurrent(struct dict *dict) {
 
 // When going from concurrent to sequential, need to move over
 // the unstable values.
+// Open addressing tables do not need this.
 int dict_make_stable(struct dict *dict, unsigned int worker){
     assert(dict->concurrent);
     int n = 0;
+    if (dict->array != NULL) {
+        return 0;
+    }
 	for (unsigned int i = 0; i < dict->nworkers; i++) {
         struct dict_worker *w = &dict->workers[i];
         struct keynode *k;
@@ -318,6 +691,12 @@ int dict_make_stable(struct dict *dict, unsigned int worker){
 
 void dict_set_sequential(struct dict *dict, int n) {
     assert(dict->concurrent);
+    if (dict->array != NULL) {
+        // No more threads can be looking at the old arrays
+        dict_free_retired(dict);
+        dict->concurrent = 0;
+        return;
+    }
     dict->count += n;
 
 #ifdef notdef
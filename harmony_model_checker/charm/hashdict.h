@@ -5,6 +5,7 @@
 #include <stdlib.h> /* malloc/calloc */
 #include <stdint.h> /* uint32_t */
 #include <string.h> /* memcpy/memcmp */
+#include <stdbool.h>
 
 #include "thread.h"
 
@@ -12,6 +13,16 @@
 
 typedef void (*enumFunc)(void *env, const void *key, unsigned int key_size,
                                 HASHDICT_VALUE_TYPE value);
+typedef uint32_t (*dict_hash_t)(const void *key, unsigned int key_size);
+
+// A key described as an edit of another key (see dict_find_patch())
+struct dict_patch {
+    const void *base;           // the original key
+    unsigned int len;           // its length
+    unsigned int off, del;      // delete del bytes at offset off
+    const void *ins;            // and insert insn bytes from ins there
+    unsigned int insn;
+};
 
 // key directly follows this header
 struct keynode {
@@ -30,6 +41,29 @@ struct dict_bucket {
 struct dict_worker {
     struct keynode **unstable;   // one for each of the workers
 };
+
+// Alternatively, a dict can be an open addressing table (see dict_new_open).
+// Slots are claimed with compare-and-swap, so there is no need for locks or
+// for the stable/unstable split.  When a table fills up, all threads that
+// access it cooperatively migrate the entries to a table twice the size.
+struct dict_slot {
+    volatile uint64_t hash;             // 64-bit fingerprint, 0 if not yet set
+    struct keynode *volatile key;       // NULL if empty
+};
+
+struct dict_array {
+    struct dict_array *next;            // list of retired arrays
+    uint64_t size;                      // #slots, a power of 2
+    struct dict_array *volatile to;     // array being migrated to, if any
+    volatile int64_t next_chunk;        // next chunk of slots to migrate
+    volatile int64_t chunks_done;       // #chunks that have been migrated
+    struct dict_slot slots[0];
+};
+
+struct dict_counter {
+    int64_t n;                          // #inserts not yet added to dict
+    char pad[56];                       // avoid false sharing
+};
 		
 struct dict {
 	struct dict_bucket *table;
@@ -41,11 +75,18 @@ struct dict {
 	double growth_threshold;
 	double growth_factor;
     int concurrent;         // 0 = not concurrent
+    struct dict_array *volatile array;  // open addressing table, or NULL
+    struct dict_array *retired;         // old arrays, freed when sequential
+    struct dict_counter *counters;      // one for each of the workers
+    volatile int64_t nentries;          // approximate #entries in array
+    mutex_t grow_lock;                  // to start migrating the array
+    dict_hash_t hash;                   // hash function, or NULL for default
     void *(*malloc)(size_t size);
     void (*free)(void *);
 };
 
 struct dict *dict_new(unsigned int initial_size, unsigned int nworkers, void *(*malloc)(size_t size), void (*free)(void *));
+struct dict *dict_new_open(unsigned int initial_size, unsigned int nworkers, void *(*malloc)(size_t size), void (*free)(void *));
 void dict_delete(struct dict *dict);
 void *dict_lookup(struct dict *dict, const void *key, unsigned int keylen);
 void **dict_insert(struct dict *dict, struct allocator *al, const void *key, unsigned int keylen);
@@ -53,9 +94,15 @@ struct keynode *dict_find_lock(struct dict *dict, struct allocator *al,
                             const void *key, unsigned int keyn);
 void dict_find_release(struct dict *dict, struct keynode *k);
 void *dict_find(struct dict *dict, struct allocator *al, const void *key, unsigned int keylen);
+void *dict_find_hash(struct dict *dict, struct allocator *al, const void *key, unsigned int keylen, uint32_t hash);
+void *dict_find_patch(struct dict *dict, struct allocator *al, const struct dict_patch *patch, uint32_t hash);
 void *dict_retrieve(const void *p, unsigned int *psize);
+uint32_t dict_retrieve_hash(const void *p);
+void dict_set_hash(struct dict *dict, dict_hash_t hash);
+uint64_t dict_table_size(struct dict *dict);
 void dict_iter(struct dict *dict, enumFunc f, void *user);
 void dict_set_concurrent(struct dict *dict);
 int dict_make_stable(struct dict *dict, unsigned int worker);
 void dict_set_sequential(struct dict *dict, int n);
+uint64_t dict_hash64(const void *key, unsigned int len, uint64_t seed);
 #endif
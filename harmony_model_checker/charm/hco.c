@@ -0,0 +1,58 @@
+#include "head.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+
+#include "global.h"
+#include "hco.h"
+
+#ifdef _WIN32
+#define hco_tell(fp)        _ftelli64(fp)
+#define hco_seek(fp, off)   _fseeki64(fp, off, SEEK_SET)
+#else
+#define hco_tell(fp)        ftello(fp)
+#define hco_seek(fp, off)   fseeko(fp, off, SEEK_SET)
+#endif
+
+static void hco_put64(FILE *out, uint64_t w){
+    hco_put(out, (uint32_t) w);
+    hco_put(out, (uint32_t) (w >> 32));
+}
+
+void hco_put(FILE *out, uint32_t w){
+    unsigned char b[4] = { w, w >> 8, w >> 16, w >> 24 };
+    fwrite(b, 1, sizeof(b), out);
+}
+
+void hco_header(FILE *out){
+    fwrite(HCO_MAGIC, 1, 4, out);
+    hco_put(out, HCO_VERSION);
+}
+
+// Write a section of which the contents are known
+void hco_section(FILE *out, const char *tag, const void *data, uint64_t len){
+    fwrite(tag, 1, 4, out);
+    hco_put64(out, len);
+    fwrite(data, 1, len, out);
+}
+
+// Start a section that is written incrementally.  The length is filled in
+// by hco_end(), which is passed the result.
+int64_t hco_begin(FILE *out, const char *tag){
+    fwrite(tag, 1, 4, out);
+    hco_put64(out, 0);
+    return hco_tell(out);
+}
+
+void hco_end(FILE *out, int64_t start){
+    int64_t end = hco_tell(out);
+    if (start < 0 || end < start || hco_seek(out, start - 8) != 0) {
+        panic("hco_end: can't seek in output file");
+    }
+    hco_put64(out, end - start);
+    if (hco_seek(out, end) != 0) {
+        panic("hco_end: can't seek in output file");
+    }
+}
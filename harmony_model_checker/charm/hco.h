@@ -0,0 +1,37 @@
+#ifndef SRC_HCO_H
+#define SRC_HCO_H
+
+#include <stdio.h>
+#include <stdint.h>
+
+// Binary format of the .hco output file (JSON is written with -Xjson).  The
+// file starts with HCO_MAGIC and a version word, followed by sections that
+// each consist of a 4-character tag, a 64-bit length, and the contents, so
+// a reader can skip the sections it does not need.  The last section is
+// HCO_END.  Integers are little-endian.
+//
+//  ISSU    the issue ("No issues", "Safety violation", ...)
+//  STAT    JSON object with omission_probability or swarm statistics
+//  SYMB    #symbols, then (id, length, JSON value) for each symbol
+//  GRPH    #nodes, then for each node: idx, component, type (HCO_NODE_*),
+//          #transitions, and for each transition the number of symbols and
+//          their ids, then the number of destination nodes and their ids
+//  CEXM    JSON list of the macrosteps of the counterexample
+//  CODE    JSON object with the code, explain, and locations lists
+//
+// All numbers inside SYMB and GRPH are 32-bit words.
+#define HCO_MAGIC       "HCOB"
+#define HCO_VERSION     1
+#define HCO_END         "END "
+
+#define HCO_NODE_NORMAL     0
+#define HCO_NODE_INITIAL    1
+#define HCO_NODE_TERMINAL   2
+
+void hco_header(FILE *out);
+void hco_put(FILE *out, uint32_t w);
+void hco_section(FILE *out, const char *tag, const void *data, uint64_t len);
+int64_t hco_begin(FILE *out, const char *tag);
+void hco_end(FILE *out, int64_t start);
+
+#endif //SRC_HCO_H
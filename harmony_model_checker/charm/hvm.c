@@ -0,0 +1,325 @@
+#include "head.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <assert.h>
+
+#ifndef _WIN32
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
+
+#include "global.h"
+#include "hashdict.h"
+#include "json.h"
+#include "code.h"
+#include "hvm.h"
+
+// Value types in the binary format, in the low 2 bits of a value word
+#define HVM_ATOM    0
+#define HVM_LIST    1
+#define HVM_MAP     2
+
+struct hvm_reader {
+    const char *fname;
+    const unsigned char *base;
+    size_t len, offset;
+    struct json_value **atoms;      // one (shared) atom per constant
+    unsigned int natoms;
+};
+
+static void hvm_corrupt(struct hvm_reader *r){
+    fprintf(stderr, "charm: %s: bad or truncated HVM file\n", r->fname);
+    exit(1);
+}
+
+static uint32_t hvm_word(struct hvm_reader *r){
+    if (r->len - r->offset < 4) {
+        hvm_corrupt(r);
+    }
+    const unsigned char *p = &r->base[r->offset];
+    r->offset += 4;
+    return (uint32_t) p[0] | ((uint32_t) p[1] << 8) |
+            ((uint32_t) p[2] << 16) | ((uint32_t) p[3] << 24);
+}
+
+static struct json_value *hvm_atom(struct hvm_reader *r, uint32_t idx){
+    if (idx >= r->natoms) {
+        hvm_corrupt(r);
+    }
+    return r->atoms[idx];
+}
+
+static struct json_value *hvm_new(int type){
+    struct json_value *jv = new_alloc(struct json_value);
+    jv->type = type;
+    if (type == JV_MAP) {
+        jv->u.map = dict_new(0, 0, NULL, NULL);
+    }
+    return jv;
+}
+
+static struct json_value *hvm_value(struct hvm_reader *r);
+
+// Read n (key, value) pairs into map
+static void hvm_map_entries(struct hvm_reader *r, struct json_value *map, uint32_t n){
+    for (uint32_t i = 0; i < n; i++) {
+        struct json_value *key = hvm_atom(r, hvm_word(r));
+        struct json_value *val = hvm_value(r);
+        json_map_append(map, key->u.atom, val);
+    }
+}
+
+static struct json_value *hvm_value(struct hvm_reader *r){
+    uint32_t w = hvm_word(r);
+    struct json_value *jv;
+    switch (w & 3) {
+    case HVM_ATOM:
+        return hvm_atom(r, w >> 2);
+    case HVM_LIST:
+        // each element takes at least a word
+        if ((w >> 2) > (r->len - r->offset) / 4) {
+            hvm_corrupt(r);
+        }
+        jv = hvm_new(JV_LIST);
+        jv->u.list.nvals = w >> 2;
+        jv->u.list.vals = malloc(jv->u.list.nvals * sizeof(*jv->u.list.vals));
+        for (unsigned int i = 0; i < jv->u.list.nvals; i++) {
+            jv->u.list.vals[i] = hvm_value(r);
+        }
+        return jv;
+    case HVM_MAP:
+        jv = hvm_new(JV_MAP);
+        hvm_map_entries(r, jv, w >> 2);
+        return jv;
+    default:
+        hvm_corrupt(r);
+        return NULL;
+    }
+}
+
+// Free a value read by hvm_value(), except for the atoms, which are shared
+static void hvm_free(struct json_value *jv);
+
+static void hvm_free_entry(void *env, const void *key, unsigned int keylen, void *val){
+    hvm_free(val);
+}
+
+static void hvm_free(struct json_value *jv){
+    switch (jv->type) {
+    case JV_ATOM:
+        return;
+    case JV_MAP:
+        dict_iter(jv->u.map, hvm_free_entry, NULL);
+        dict_delete(jv->u.map);
+        break;
+    case JV_LIST:
+        for (unsigned int i = 0; i < jv->u.list.nvals; i++) {
+            hvm_free(jv->u.list.vals[i]);
+        }
+        free(jv->u.list.vals);
+        break;
+    default:
+        assert(0);
+    }
+    free(jv);
+}
+
+// Decode the binary format.  Each instruction is created as soon as its
+// arguments have been read.  The labels are skipped as charm does not use
+// them.
+static void hvm_decode(struct hvm_reader *r, struct engine *engine, struct hvm *hvm){
+    r->offset = 4;          // skip magic
+    uint32_t version = hvm_word(r);
+    if (version != HVM_VERSION) {
+        fprintf(stderr, "charm: %s: HVM version %u not supported\n", r->fname, version);
+        exit(1);
+    }
+    uint32_t nstrings = hvm_word(r);
+    uint32_t nops = hvm_word(r);
+    uint32_t ncode = hvm_word(r);
+    uint32_t nlabels = hvm_word(r);
+    uint32_t nlocations = hvm_word(r);
+    if (nstrings > (r->len - r->offset) / 4) {
+        hvm_corrupt(r);
+    }
+
+    // The constant pool.  The atoms refer to the mapped file.
+    r->natoms = nstrings;
+    r->atoms = malloc(nstrings * sizeof(*r->atoms));
+    for (uint32_t i = 0; i < nstrings; i++) {
+        uint32_t n = hvm_word(r);
+        if (n > r->len - r->offset) {
+            hvm_corrupt(r);
+        }
+        struct json_value *jv = hvm_new(JV_ATOM);
+        jv->u.atom.base = (char *) &r->base[r->offset];
+        jv->u.atom.len = n;
+        r->atoms[i] = jv;
+        r->offset += (n + 3) & ~(size_t) 3;
+        if (r->offset > r->len) {
+            hvm_corrupt(r);
+        }
+    }
+
+    // The op table
+    if (nops > (r->len - r->offset) / 4) {
+        hvm_corrupt(r);
+    }
+    struct op_info **ops = malloc(nops * sizeof(*ops));
+    for (uint32_t i = 0; i < nops; i++) {
+        struct json_value *name = hvm_atom(r, hvm_word(r));
+        ops[i] = code_op(name->u.atom.base, name->u.atom.len);
+    }
+
+    // Skip the labels
+    if (nlabels > (r->len - r->offset) / 8) {
+        hvm_corrupt(r);
+    }
+    r->offset += (size_t) nlabels * 8;
+
+    // The code.  Each instruction is an op followed by a map of arguments.
+    if (ncode > (r->len - r->offset) / 8) {
+        hvm_corrupt(r);
+    }
+    hvm->code.len = ncode;
+    hvm->code.instrs = malloc(ncode * sizeof(struct instr_t));
+    hvm->code.code_map = dict_new(0, 0, NULL, NULL);
+    for (uint32_t pc = 0; pc < ncode; pc++) {
+        uint32_t op = hvm_word(r);
+        if (op >= nops) {
+            hvm_corrupt(r);
+        }
+        uint32_t w = hvm_word(r);
+        if ((w & 3) != HVM_MAP) {
+            hvm_corrupt(r);
+        }
+        struct json_value *args = hvm_new(JV_MAP);
+        hvm_map_entries(r, args, w >> 2);
+        hvm->code.instrs[pc] = code_instr_init(engine, ops[op], args->u.map);
+        hvm_free(args);
+    }
+    free(ops);
+
+    // Printable form of the code and explanations
+    if (ncode > (r->len - r->offset) / 8) {
+        hvm_corrupt(r);
+    }
+    struct json_value *pretty = hvm_new(JV_LIST);
+    pretty->u.list.nvals = ncode;
+    pretty->u.list.vals = malloc(ncode * sizeof(*pretty->u.list.vals));
+    for (uint32_t pc = 0; pc < ncode; pc++) {
+        struct json_value *pair = hvm_new(JV_LIST);
+        pair->u.list.nvals = 2;
+        pair->u.list.vals = malloc(2 * sizeof(*pair->u.list.vals));
+        pair->u.list.vals[0] = hvm_atom(r, hvm_word(r));
+        pair->u.list.vals[1] = hvm_atom(r, hvm_word(r));
+        pretty->u.list.vals[pc] = pair;
+    }
+    hvm->pretty = pretty;
+
+    // The location table, keyed by pc as in the JSON format
+    if (nlocations > (r->len - r->offset) / 16) {
+        hvm_corrupt(r);
+    }
+    struct json_value *locations = hvm_new(JV_MAP);
+    json_buf_t key;
+    for (uint32_t i = 0; i < nlocations; i++) {
+        char pcbuf[16], linebuf[16];
+        uint32_t pc = hvm_word(r);
+        struct json_value *loc = hvm_new(JV_MAP);
+        key.base = "file"; key.len = 4;
+        json_map_append(loc, key, hvm_atom(r, hvm_word(r)));
+        int n = snprintf(linebuf, sizeof(linebuf), "%u", hvm_word(r));
+        key.base = "line"; key.len = 4;
+        json_map_append(loc, key, json_string(linebuf, n));
+        key.base = "code"; key.len = 4;
+        json_map_append(loc, key, hvm_atom(r, hvm_word(r)));
+        key.base = pcbuf;
+        key.len = snprintf(pcbuf, sizeof(pcbuf), "%u", pc);
+        json_map_append(locations, key, loc);
+    }
+    hvm->locations = locations;
+}
+
+// Read the whole file into memory.  Used where it cannot be mapped.
+static char *hvm_load(const char *fname, size_t *psize){
+    FILE *fp = fopen(fname, "rb");
+    if (fp == NULL) {
+        return NULL;
+    }
+    size_t len = 0, n;
+    char *base = malloc(CHUNKSIZE);
+    while ((n = fread(&base[len], 1, CHUNKSIZE, fp)) > 0) {
+        len += n;
+        base = realloc(base, len + CHUNKSIZE);
+    }
+    fclose(fp);
+    *psize = len;
+    return base;
+}
+
+// Map the file into memory
+static char *hvm_map(const char *fname, size_t *psize){
+#ifndef _WIN32
+    int fd = open(fname, O_RDONLY);
+    if (fd < 0) {
+        return NULL;
+    }
+    struct stat st;
+    if (fstat(fd, &st) == 0 && st.st_size > 0) {
+        void *p = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (p != MAP_FAILED) {
+            close(fd);
+            *psize = st.st_size;
+            return p;
+        }
+    }
+    close(fd);
+#endif
+    return hvm_load(fname, psize);
+}
+
+// Read the given .hvm file, binary or JSON, and create the code.  The
+// contents of the file are kept in hvm->contents and stay in memory.
+void hvm_read(const char *fname, struct engine *engine, struct hvm *hvm){
+    size_t size;
+    char *base = hvm_map(fname, &size);
+    if (base == NULL) {
+        fprintf(stderr, "charm: can't open %s\n", fname);
+        exit(1);
+    }
+    if (size > UINT32_MAX) {
+        fprintf(stderr, "charm: %s: file too large\n", fname);
+        exit(1);
+    }
+    hvm->contents.base = base;
+    hvm->contents.len = size;
+
+    if (size >= 4 && memcmp(base, HVM_MAGIC, 4) == 0) {
+        struct hvm_reader r = {
+            .fname = fname,
+            .base = (const unsigned char *) base,
+            .len = size
+        };
+        hvm_decode(&r, engine, hvm);
+        free(r.atoms);
+        return;
+    }
+
+    json_buf_t buf = hvm->contents;
+    struct json_value *jv = json_parse_value(&buf);
+    if (jv->type != JV_MAP) {
+        fprintf(stderr, "charm: %s: not an HVM file\n", fname);
+        exit(1);
+    }
+    struct json_value *jc = dict_lookup(jv->u.map, "code", 4);
+    assert(jc->type == JV_LIST);
+    hvm->code = code_init_parse(engine, jc);
+    hvm->pretty = dict_lookup(jv->u.map, "pretty", 6);
+    hvm->locations = dict_lookup(jv->u.map, "locations", 9);
+}
@@ -0,0 +1,27 @@
+#ifndef SRC_HVM_H
+#define SRC_HVM_H
+
+#include "json.h"
+#include "code.h"
+
+// Reading .hvm files.  A .hvm file is either JSON or in the binary format
+// written by the compiler (see harmony/bytecode.py), which starts with
+// HVM_MAGIC.  The file is mapped into memory.  The binary format is decoded
+// straight into the code; the JSON format is parsed first.  The printable
+// form of the code and the locations, which are only needed for the output,
+// are JSON structures either way.  For the binary format their atoms point
+// into the mapped file and are shared, so they must not be freed with
+// json_value_free().
+#define HVM_MAGIC       "HVMB"
+#define HVM_VERSION     1
+
+struct hvm {
+    json_buf_t contents;            // the contents of the file
+    struct code_t code;
+    struct json_value *pretty;      // list of (code, explanation) pairs
+    struct json_value *locations;   // map of pc to file, line, and code
+};
+
+void hvm_read(const char *fname, struct engine *engine, struct hvm *hvm);
+
+#endif //SRC_HVM_H
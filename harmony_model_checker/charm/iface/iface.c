@@ -85,7 +85,7 @@ struct node_vec_t *find_one_step_children(struct node *n) {
         if (node != n && (ctx->atomic == 0 || ctx->terminated)) {
             node_vec_push(result, node);
         } else {
-            for (struct edge *edge = node->fwd; edge != NULL; edge = edge->fwdnext) {
+            for (struct edge *edge = node->fwd; edge < &node->fwd[node->nfwd]; edge++) {
                 if (!hashset_contains(visited, &edge->dst, sizeof(struct node *))) {
                     node_vec_push(work, edge->dst);
                 }
@@ -101,7 +101,7 @@ struct node_vec_t *find_one_step_children(struct node *n) {
 
 struct node_vec_t *find_all_children(struct node *n) {
     struct node_vec_t *result = node_vec_init(1);
-    for (struct edge *e = n->fwd; e != NULL; e = e->fwdnext) {
+    for (struct edge *e = n->fwd; e < &n->fwd[n->nfwd]; e++) {
         node_vec_push(result, e->dst);
     }
     return result;
@@ -191,7 +191,7 @@ struct iface_graph_t *iface_evaluate_spec_graph(struct global_t *global, int ifa
         (*iface_node)->initial = true;
         (*iface_node)->terminated = false;
         (*iface_node)->choosing = false;
-        (*iface_node)->state = &initial_node->state;
+        (*iface_node)->state = initial_node->state;
 
         struct node_vec_t *children = find_all_children(initial_node);
         node_vec_append_all(worklist, children);
@@ -224,11 +224,11 @@ struct iface_graph_t *iface_evaluate_spec_graph(struct global_t *global, int ifa
         assert(iface_node != NULL);
 
         iface_step.ctx->pc = iface_pc;
-        iface_node->value = iface_evaluate(global, &node->state, &iface_step);
+        iface_node->value = iface_evaluate(global, node->state, &iface_step);
         iface_node->initial = false;
-        iface_node->terminated = value_ctx_all_eternal(node->state.ctxbag);
-        iface_node->choosing = node->state.choosing != 0;
-        iface_node->state = &node->state;
+        iface_node->terminated = value_ctx_all_eternal(node->state->ctxbag);
+        iface_node->choosing = node->state->choosing != 0;
+        iface_node->state = node->state;
         if (iface_step.ctx->failure != 0) {
             iface_node->value = VALUE_ADDRESS;
 #ifndef NDEBUG
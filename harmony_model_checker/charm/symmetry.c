@@ -0,0 +1,244 @@
+#include "head.h"
+
+#include <stdlib.h>
+#include <stddef.h>
+#include <string.h>
+#include <assert.h>
+
+#include "global.h"
+#include "value.h"
+#include "symmetry.h"
+
+// The fields of a state that are renamed, in the order in which they are
+// compared to pick the representative.
+static const size_t sym_fields[] = {
+    offsetof(struct state, vars),
+    offsetof(struct state, seqs),
+    offsetof(struct state, choosing),
+    offsetof(struct state, ctxbag),
+    offsetof(struct state, stopbag),
+    offsetof(struct state, termbag),
+};
+#define NFIELDS (sizeof(sym_fields) / sizeof(sym_fields[0]))
+
+#define FIELD(s, i)     (* (hvalue_t *) ((char *) (s) + sym_fields[i]))
+
+struct symmetry *symmetry_new(void){
+    struct symmetry *sym = new_alloc(struct symmetry);
+    return sym;
+}
+
+// Add a group of symmetric atoms, given as a comma-separated list of names
+// (with or without the leading '.').  Returns false if the list is bad.
+bool symmetry_add_group(struct symmetry *sym, struct engine *engine, const char *names){
+    unsigned int first = sym->natoms;
+
+    while (*names != '\0') {
+        const char *end = strchr(names, ',');
+        if (end == NULL) {
+            end = names + strlen(names);
+        }
+        const char *p = *names == '.' ? names + 1 : names;
+        if (end == p) {
+            return false;
+        }
+        hvalue_t atom = value_put_atom(engine, p, end - p);
+        for (unsigned int i = 0; i < sym->natoms; i++) {
+            if (sym->atoms[i] == atom) {
+                return false;
+            }
+        }
+        sym->atoms = realloc(sym->atoms, (sym->natoms + 1) * sizeof(hvalue_t));
+        sym->atoms[sym->natoms++] = atom;
+        names = *end == ',' ? end + 1 : end;
+    }
+    if (sym->natoms - first < 2) {
+        return false;
+    }
+    sym->groups = realloc(sym->groups, (sym->ngroups + 1) * sizeof(unsigned int));
+    sym->groups[sym->ngroups++] = first;
+    return true;
+}
+
+// Enumerate the permutations of the atoms within group g, starting at
+// position k, and combine them with those of the following groups.
+static void sym_gen(struct symmetry *sym, unsigned int *cur, unsigned int g, unsigned int k){
+    if (g == sym->ngroups) {
+        memcpy(&sym->perms[sym->nperms++ * sym->natoms], cur, sym->natoms * sizeof(unsigned int));
+        return;
+    }
+    unsigned int end = g + 1 == sym->ngroups ? sym->natoms : sym->groups[g + 1];
+    if (k == end) {
+        sym_gen(sym, cur, g + 1, g + 1 == sym->ngroups ? 0 : sym->groups[g + 1]);
+        return;
+    }
+    for (unsigned int i = k; i < end; i++) {
+        unsigned int t = cur[k]; cur[k] = cur[i]; cur[i] = t;
+        sym_gen(sym, cur, g, k + 1);
+        t = cur[k]; cur[k] = cur[i]; cur[i] = t;
+    }
+}
+
+// Called once all groups have been added
+void symmetry_init(struct symmetry *sym){
+    uint64_t total = 1;
+    for (unsigned int g = 0; g < sym->ngroups; g++) {
+        unsigned int end = g + 1 == sym->ngroups ? sym->natoms : sym->groups[g + 1];
+        for (unsigned int n = 2; n <= end - sym->groups[g]; n++) {
+            total *= n;
+            if (total > SYMMETRY_MAX_PERMS) {
+                panic("symmetry_init: too many permutations (at most 8 symmetric atoms)");
+            }
+        }
+    }
+    sym->perms = malloc(total * sym->natoms * sizeof(unsigned int));
+    unsigned int *cur = malloc(sym->natoms * sizeof(unsigned int));
+    for (unsigned int i = 0; i < sym->natoms; i++) {
+        cur[i] = i;
+    }
+    sym->nperms = 0;
+    sym_gen(sym, cur, 0, 0);
+    assert(sym->nperms == total);
+    free(cur);
+}
+
+static int q_value_cmp(const void *v1, const void *v2){
+    return value_cmp(* (const hvalue_t *) v1, * (const hvalue_t *) v2);
+}
+
+static int q_key_cmp(const void *e1, const void *e2){
+    return value_cmp(* (const hvalue_t *) e1, * (const hvalue_t *) e2);
+}
+
+// Rename the symmetric atoms in the given value.  Values that do not
+// change are not copied.
+hvalue_t symmetry_map(struct symmetry *sym, struct engine *engine, hvalue_t v, const unsigned int *map){
+    unsigned int size, n;
+    hvalue_t *vals, result;
+    bool changed = false;
+
+    switch (VALUE_TYPE(v)) {
+    case VALUE_ATOM:
+        for (unsigned int i = 0; i < sym->natoms; i++) {
+            if (sym->atoms[i] == v) {
+                return sym->atoms[map[i]];
+            }
+        }
+        return v;
+    case VALUE_LIST:
+    case VALUE_ADDRESS:
+    case VALUE_SET:
+    case VALUE_DICT:
+        if ((v & ~VALUE_MASK) == 0) {
+            return v;
+        }
+        vals = value_copy(v, &size);
+        n = size / sizeof(hvalue_t);
+        for (unsigned int i = 0; i < n; i++) {
+            hvalue_t w = symmetry_map(sym, engine, vals[i], map);
+            if (w != vals[i]) {
+                vals[i] = w;
+                changed = true;
+            }
+        }
+        if (!changed) {
+            result = v;
+        }
+        else if (VALUE_TYPE(v) == VALUE_LIST) {
+            result = value_put_list(engine, vals, size);
+        }
+        else if (VALUE_TYPE(v) == VALUE_ADDRESS) {
+            result = value_put_address(engine, vals, size);
+        }
+        else if (VALUE_TYPE(v) == VALUE_SET) {
+            // Renaming is one-to-one, so there are no duplicates
+            qsort(vals, n, sizeof(hvalue_t), q_value_cmp);
+            result = value_put_set(engine, vals, size);
+        }
+        else {
+            qsort(vals, n / 2, 2 * sizeof(hvalue_t), q_key_cmp);
+            result = value_put_dict(engine, vals, size);
+        }
+        free(vals);
+        return result;
+    case VALUE_CONTEXT: {
+        struct context *ctx = value_copy(v, &size);
+        hvalue_t *fields[] = { &ctx->arg, &ctx->this, &ctx->vars, &ctx->trap_arg };
+        for (unsigned int i = 0; i < sizeof(fields) / sizeof(fields[0]); i++) {
+            hvalue_t w = symmetry_map(sym, engine, *fields[i], map);
+            if (w != *fields[i]) {
+                *fields[i] = w;
+                changed = true;
+            }
+        }
+        for (int i = 0; i < ctx->sp; i++) {
+            hvalue_t w = symmetry_map(sym, engine, ctx->stack[i], map);
+            if (w != ctx->stack[i]) {
+                ctx->stack[i] = w;
+                changed = true;
+            }
+        }
+        result = changed ? value_put_context(engine, ctx) : v;
+        free(ctx);
+        return result;
+    }
+    default:
+        return v;
+    }
+}
+
+void symmetry_map_state(struct symmetry *sym, struct engine *engine, struct state *state, const unsigned int *map){
+    for (unsigned int i = 0; i < NFIELDS; i++) {
+        FIELD(state, i) = symmetry_map(sym, engine, FIELD(state, i), map);
+    }
+}
+
+// Replace the state by the representative of its symmetry class, which is
+// the renaming that is smallest when comparing the (interned, and thus
+// unique) values of its fields.  Returns the permutation that was applied.
+unsigned int symmetry_canon(struct symmetry *sym, struct engine *engine, struct state *state){
+    struct state best = *state, cand = *state;
+    unsigned int bestp = 0;
+
+    for (unsigned int p = 1; p < sym->nperms; p++) {
+        const unsigned int *map = &sym->perms[p * sym->natoms];
+        bool smaller = false;
+        unsigned int i;
+        for (i = 0; i < NFIELDS; i++) {
+            hvalue_t w = symmetry_map(sym, engine, FIELD(state, i), map);
+            if (!smaller) {
+                if (w > FIELD(&best, i)) {
+                    break;
+                }
+                smaller = w < FIELD(&best, i);
+            }
+            FIELD(&cand, i) = w;
+        }
+        if (i == NFIELDS && smaller) {
+            best = cand;
+            bestp = p;
+        }
+    }
+    *state = best;
+    return bestp;
+}
+
+// Used to reconstruct the actual states along a path.  If map renames the
+// representative of a state into the actual state, then after this call it
+// renames the representative of the successor into the actual successor,
+// given that the representative was obtained with the given permutation.
+void symmetry_undo(struct symmetry *sym, unsigned int *map, unsigned int perm){
+    const unsigned int *p = &sym->perms[perm * sym->natoms];
+    unsigned int *old = malloc(sym->natoms * sizeof(unsigned int));
+    memcpy(old, map, sym->natoms * sizeof(unsigned int));
+    for (unsigned int i = 0; i < sym->natoms; i++) {
+        map[p[i]] = old[i];
+    }
+    free(old);
+}
+
+void symmetry_invert(struct symmetry *sym, unsigned int *inv, const unsigned int *map){
+    for (unsigned int i = 0; i < sym->natoms; i++) {
+        inv[map[i]] = i;
+    }
+}
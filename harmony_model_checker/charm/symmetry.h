@@ -0,0 +1,39 @@
+#ifndef SRC_SYMMETRY_H
+#define SRC_SYMMETRY_H
+
+#include <stdint.h>
+#include <stdbool.h>
+#include "value.h"
+
+#define SYMMETRY_MAX_PERMS  40320       // 8!, fits in a uint16_t
+
+// Symmetry reduction (-Xsymmetry).  The programmer declares one or more
+// groups of interchangeable atoms, typically the identifiers given to a
+// set of identical threads (as in spawn worker(.w1), spawn worker(.w2),
+// ...).  The model must treat the atoms of a group alike: it may compare
+// them for equality and use them as keys, but not depend on their order.
+// Then renaming the atoms of a group throughout a state yields a state that
+// behaves the same, and only one representative of each such class of
+// states needs to be explored.
+//
+// A permutation is a map from the index of each symmetric atom to the
+// index of the atom that replaces it.  perms[0] is the identity.
+struct symmetry {
+    unsigned int natoms;        // total #symmetric atoms
+    hvalue_t *atoms;            // the atoms, group by group
+    unsigned int ngroups;
+    unsigned int *groups;       // index of first atom of each group
+    unsigned int nperms;        // #permutations
+    unsigned int *perms;        // nperms x natoms
+};
+
+struct symmetry *symmetry_new(void);
+bool symmetry_add_group(struct symmetry *sym, struct engine *engine, const char *names);
+void symmetry_init(struct symmetry *sym);
+hvalue_t symmetry_map(struct symmetry *sym, struct engine *engine, hvalue_t v, const unsigned int *map);
+void symmetry_map_state(struct symmetry *sym, struct engine *engine, struct state *state, const unsigned int *map);
+unsigned int symmetry_canon(struct symmetry *sym, struct engine *engine, struct state *state);
+void symmetry_undo(struct symmetry *sym, unsigned int *map, unsigned int perm);
+void symmetry_invert(struct symmetry *sym, unsigned int *inv, const unsigned int *map);
+
+#endif //SRC_SYMMETRY_H
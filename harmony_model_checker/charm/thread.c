@@ -3,6 +3,10 @@
 #include <assert.h>
 #include "thread.h"
 
+#ifndef CHARM_WINDOWS
+#include <sched.h>
+#endif
+
 #ifdef CHARM_WINDOWS
 
 void thread_create(void (*f)(void *arg), void *arg){
@@ -62,6 +66,40 @@ void barrier_destroy(barrier_t *barrier){
     DeleteCriticalSection(&barrier->mutex);
 }
 
+void thread_yield(){
+    SwitchToThread();
+}
+
+// Add delta to *p and return the new value
+int64_t atomic_add64(volatile int64_t *p, int64_t delta){
+    return InterlockedExchangeAdd64((volatile LONG64 *) p, delta) + delta;
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas_ptr(void *volatile *p, void *old, void *new){
+    return InterlockedCompareExchangePointer(p, new, old) == old;
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas64(volatile uint64_t *p, uint64_t old, uint64_t new){
+    return InterlockedCompareExchange64((volatile LONG64 *) p, new, old) == old;
+}
+
+// Add delta to *p and return the new value
+int32_t atomic_add32(volatile int32_t *p, int32_t delta){
+    return InterlockedExchangeAdd((volatile LONG *) p, delta) + delta;
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas32(volatile uint32_t *p, uint32_t old, uint32_t new){
+    return InterlockedCompareExchange((volatile LONG *) p, new, old) == (LONG) old;
+}
+
+// Or bits into *p and return the old value
+uint64_t atomic_or64(volatile uint64_t *p, uint64_t bits){
+    return InterlockedOr64((volatile LONG64 *) p, bits);
+}
+
 #else // pthreads
 
 void thread_create(void (*f)(void *arg), void *arg){
@@ -113,6 +151,40 @@ void barrier_destroy(barrier_t *barrier){
     pthread_mutex_destroy(&barrier->mutex);
 }
 
+void thread_yield(){
+    sched_yield();
+}
+
+// Add delta to *p and return the new value
+int64_t atomic_add64(volatile int64_t *p, int64_t delta){
+    return __sync_add_and_fetch(p, delta);
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas_ptr(void *volatile *p, void *old, void *new){
+    return __sync_bool_compare_and_swap(p, old, new);
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas64(volatile uint64_t *p, uint64_t old, uint64_t new){
+    return __sync_bool_compare_and_swap(p, old, new);
+}
+
+// Add delta to *p and return the new value
+int32_t atomic_add32(volatile int32_t *p, int32_t delta){
+    return __sync_add_and_fetch(p, delta);
+}
+
+// If *p == old, replace with new.  Returns true if successful
+bool atomic_cas32(volatile uint32_t *p, uint32_t old, uint32_t new){
+    return __sync_bool_compare_and_swap(p, old, new);
+}
+
+// Or bits into *p and return the old value
+uint64_t atomic_or64(volatile uint64_t *p, uint64_t bits){
+    return __sync_fetch_and_or(p, bits);
+}
+
 #endif
 
 int getNumCores(){
@@ -45,6 +45,8 @@ typedef struct {
 #endif
 
 #include <time.h>
+#include <stdint.h>
+#include <stdbool.h>
 
 void thread_create(void (*f)(void *arg), void *arg);
 void mutex_init(mutex_t *mutex);
@@ -55,5 +57,12 @@ void barrier_init(barrier_t *barrier, unsigned int count);
 void barrier_wait(barrier_t *barrier);
 void barrier_destroy(barrier_t *barrier);
 int getNumCores();
+void thread_yield();
+int64_t atomic_add64(volatile int64_t *p, int64_t delta);
+bool atomic_cas_ptr(void *volatile *p, void *old, void *new);
+bool atomic_cas64(volatile uint64_t *p, uint64_t old, uint64_t new);
+uint64_t atomic_or64(volatile uint64_t *p, uint64_t bits);
+int32_t atomic_add32(volatile int32_t *p, int32_t delta);
+bool atomic_cas32(volatile uint32_t *p, uint32_t old, uint32_t new);
 
 #endif // SRC_THREAD_H
@@ -17,23 +17,37 @@
 #include "strbuf.h"
 #include "json.h"
 
+static hvalue_t *value_dict_flatten(void *p, unsigned int *psize);
+
 void *value_get(hvalue_t v, unsigned int *psize){
+    bool dict = VALUE_TYPE(v) == VALUE_DICT;
     v &= ~VALUE_MASK;
     if (v == 0) {
         *psize = 0;
         return NULL;
     }
+    if (dict) {
+        // Large dicts are chunked (see value_put_dict())
+        unsigned int size;
+        hvalue_t *vals = dict_retrieve((void *) v, &size);
+        if (vals[0] == 0) {
+            return value_dict_flatten((void *) v, psize);
+        }
+        if (psize != NULL) {
+            *psize = size;
+        }
+        return vals;
+    }
     return dict_retrieve((void *) v, psize);
 }
 
 void *value_copy(hvalue_t v, unsigned int *psize){
-    v &= ~VALUE_MASK;
-    if (v == 0) {
+    if ((v & ~VALUE_MASK) == 0) {
         *psize = 0;
         return NULL;
     }
     unsigned int size;
-    void *p = dict_retrieve((void *) v, &size);
+    void *p = value_get(v, &size);
     void *r = malloc(size);
     memcpy(r, p, size);
     if (psize != NULL) {
@@ -42,6 +56,392 @@ void *value_copy(hvalue_t v, unsigned int *psize){
     return r;
 }
 
+// The hash of a dict, set, or list is the sum of the hashes of its elements
+// (key/value pairs for dicts, index/value pairs for lists).  Because values
+// are interned, an element is hashed in constant time.  When a single
+// element is added, removed, or replaced, the hash of the new value can be
+// computed from the hash of the old one without looking at the others.
+// Elements are mixed thoroughly, as sums of weak hashes collide a lot.
+static inline uint32_t value_mix(uint64_t x){
+    x ^= x >> 33;
+    x *= 0xff51afd7ed558ccd;
+    x ^= x >> 33;
+    x *= 0xc4ceb9fe1a85ec53;
+    return (uint32_t) (x >> 32);
+}
+
+static inline uint32_t value_hash_pair(hvalue_t k, hvalue_t v){
+    return value_mix((k * 0x9e3779b97f4a7c15) ^ v);
+}
+
+static inline uint32_t value_hash_elt(hvalue_t v){
+    return value_mix(v);
+}
+
+static inline uint32_t value_hash(hvalue_t v);
+
+static uint32_t value_hash_dict(const void *p, unsigned int size){
+    const hvalue_t *vals = p;
+    unsigned int n = size / sizeof(hvalue_t);
+    uint32_t h = 0;
+    if (vals[0] == 0) {         // chunked: sum of the chunks
+        for (unsigned int i = 1; i < n; i++) {
+            h += value_hash(vals[i]);
+        }
+        return h;
+    }
+    for (unsigned int i = 0; i < n; i += 2) {
+        h += value_hash_pair(vals[i], vals[i + 1]);
+    }
+    return h;
+}
+
+static uint32_t value_hash_set(const void *p, unsigned int size){
+    const hvalue_t *vals = p;
+    unsigned int n = size / sizeof(hvalue_t);
+    uint32_t h = 0;
+    for (unsigned int i = 0; i < n; i++) {
+        h += value_hash_elt(vals[i]);
+    }
+    return h;
+}
+
+static uint32_t value_hash_list(const void *p, unsigned int size){
+    const hvalue_t *vals = p;
+    unsigned int n = size / sizeof(hvalue_t);
+    uint32_t h = 0;
+    for (unsigned int i = 0; i < n; i++) {
+        h += value_hash_pair(i, vals[i]);
+    }
+    return h;
+}
+
+// The hash of an interned dict, set, or list (0 if empty)
+static inline uint32_t value_hash(hvalue_t v){
+    v &= ~VALUE_MASK;
+    return v == 0 ? 0 : dict_retrieve_hash((void *) v);
+}
+
+// Large dicts (more than VALUE_DICT_BIG entries) are split into chunks of
+// consecutive entries, each of which is interned as a dict by itself.  The
+// body of a large dict is a 0 (which is not a valid key) followed by its
+// chunks.  Where chunks end depends only on the keys, so equal dicts still
+// have equal bodies.  Storing or removing a key creates new versions of only
+// the chunks involved and of the (short) list of chunks, sharing the other
+// chunks with the old version.  value_get() presents a large dict as a flat
+// array of keys and values, which is made when first asked for and kept.
+#define VALUE_DICT_BIG      64      // larger dicts are chunked
+#define VALUE_CHUNK_AVG     32      // average #entries in a chunk
+#define VALUE_CHUNK_MAX     128     // maximum #entries in a chunk
+
+// Flattened version of a chunked dict, kept in the keynode
+struct value_flat {
+    unsigned int size;
+    hvalue_t vals[0];
+};
+
+// A list of chunks under construction
+struct value_chunks {
+    hvalue_t *vals;             // vals[0] == 0, then the chunks
+    unsigned int n, alloc;
+};
+
+static inline bool value_chunk_end(hvalue_t key, unsigned int n){
+    return n == VALUE_CHUNK_MAX || value_mix(key) % VALUE_CHUNK_AVG == 0;
+}
+
+static hvalue_t value_dict_flat(struct engine *engine, hvalue_t *kv, unsigned int n){
+    if (n == 0) {
+        return VALUE_DICT;
+    }
+    unsigned int size = 2 * n * sizeof(hvalue_t);
+    void *q = dict_find_hash(engine->values->dicts, engine->allocator, kv, size,
+                                value_hash_dict(kv, size));
+    return (hvalue_t) q | VALUE_DICT;
+}
+
+static void value_chunks_add(struct value_chunks *vc, hvalue_t chunk){
+    if (vc->n == vc->alloc) {
+        vc->alloc = vc->alloc == 0 ? 16 : 2 * vc->alloc;
+        vc->vals = realloc(vc->vals, vc->alloc * sizeof(hvalue_t));
+        if (vc->n == 0) {
+            vc->vals[vc->n++] = 0;
+        }
+    }
+    vc->vals[vc->n++] = chunk;
+}
+
+// Cut the n entries in kv into chunks and add them.  Returns the number of
+// entries at the end that do not form a complete chunk (and are not added)
+// unless final is set.
+static unsigned int value_chunkify(struct engine *engine, struct value_chunks *vc,
+                        hvalue_t *kv, unsigned int n, bool final){
+    unsigned int start = 0;
+    for (unsigned int i = 0; i < n; i++) {
+        if (value_chunk_end(kv[2*i], i - start + 1)) {
+            value_chunks_add(vc, value_dict_flat(engine, &kv[2*start], i - start + 1));
+            start = i + 1;
+        }
+    }
+    if (final && start < n) {
+        value_chunks_add(vc, value_dict_flat(engine, &kv[2*start], n - start));
+        start = n;
+    }
+    return n - start;
+}
+
+static hvalue_t value_chunks_put(struct engine *engine, struct value_chunks *vc){
+    uint32_t hash = 0;
+    for (unsigned int i = 1; i < vc->n; i++) {
+        hash += value_hash(vc->vals[i]);
+    }
+    void *q = dict_find_hash(engine->values->dicts, engine->allocator,
+                        vc->vals, vc->n * sizeof(hvalue_t), hash);
+    free(vc->vals);
+    return (hvalue_t) q | VALUE_DICT;
+}
+
+// Returns the chunks of the dict, or NULL if it is not chunked
+static hvalue_t *value_dict_chunks(hvalue_t dict, unsigned int *pn){
+    if ((dict & ~VALUE_MASK) == 0) {
+        return NULL;
+    }
+    unsigned int size;
+    hvalue_t *vals = dict_retrieve((void *) (dict & ~VALUE_MASK), &size);
+    if (vals[0] != 0) {
+        return NULL;
+    }
+    *pn = size / sizeof(hvalue_t) - 1;
+    return &vals[1];
+}
+
+// Index of the chunk that has, or should have, the given key
+static unsigned int value_chunk_find(hvalue_t *chunks, unsigned int n, hvalue_t key){
+    unsigned int lo = 0, hi = n;        // chunk is in [lo, hi)
+    while (hi - lo > 1) {
+        unsigned int mid = (lo + hi) / 2;
+        unsigned int size;
+        hvalue_t *kv = dict_retrieve((void *) (chunks[mid] & ~VALUE_MASK), &size);
+        if (value_cmp(kv[0], key) <= 0) {
+            lo = mid;
+        }
+        else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+
+static hvalue_t *value_dict_flatten(void *p, unsigned int *psize){
+    struct keynode *k = p;
+    struct value_flat *vf = k->value;
+    if (vf == NULL) {
+        unsigned int size, total = 0;
+        hvalue_t *chunks = dict_retrieve(p, &size);
+        unsigned int n = size / sizeof(hvalue_t);
+        for (unsigned int i = 1; i < n; i++) {
+            (void) dict_retrieve((void *) (chunks[i] & ~VALUE_MASK), &size);
+            total += size;
+        }
+        vf = malloc(sizeof(*vf) + total);
+        vf->size = total;
+        char *q = (char *) vf->vals;
+        for (unsigned int i = 1; i < n; i++) {
+            void *kv = dict_retrieve((void *) (chunks[i] & ~VALUE_MASK), &size);
+            memcpy(q, kv, size);
+            q += size;
+        }
+        if (!atomic_cas_ptr((void *volatile *) &k->value, NULL, vf)) {
+            free(vf);
+            vf = k->value;
+        }
+    }
+    if (psize != NULL) {
+        *psize = vf->size;
+    }
+    return vf->vals;
+}
+
+// Replace chunk j of the dict by the given entries, which have the same
+// keys.  The chunk boundaries remain the same.
+static hvalue_t value_chunks_replace(struct engine *engine, hvalue_t *chunks,
+                    unsigned int n, unsigned int j, hvalue_t *kv, unsigned int nkv){
+    struct value_chunks vc = { NULL, 0, 0 };
+    for (unsigned int i = 0; i < n; i++) {
+        value_chunks_add(&vc, i == j ? value_dict_flat(engine, kv, nkv) : chunks[i]);
+    }
+    return value_chunks_put(engine, &vc);
+}
+
+// Replace chunk j of the dict by the given entries, which have different
+// keys.  The chunks are recomputed starting at chunk j until they line up
+// with the old chunks again.  total is the new number of entries.
+static hvalue_t value_chunks_rechunk(struct engine *engine, hvalue_t *chunks,
+                    unsigned int n, unsigned int j, hvalue_t *kv, unsigned int nkv,
+                    unsigned int total){
+    if (total <= VALUE_DICT_BIG) {
+        // Not large anymore
+        hvalue_t *flat = malloc(2 * total * sizeof(hvalue_t)), *q = flat;
+        for (unsigned int i = 0; i < n; i++) {
+            unsigned int size;
+            hvalue_t *ckv;
+            if (i == j) {
+                ckv = kv;
+                size = 2 * nkv * sizeof(hvalue_t);
+            }
+            else {
+                ckv = dict_retrieve((void *) (chunks[i] & ~VALUE_MASK), &size);
+            }
+            memcpy(q, ckv, size);
+            q += size / sizeof(hvalue_t);
+        }
+        hvalue_t result = value_dict_flat(engine, flat, total);
+        free(flat);
+        return result;
+    }
+
+    struct value_chunks vc = { NULL, 0, 0 };
+    for (unsigned int i = 0; i < j; i++) {
+        value_chunks_add(&vc, chunks[i]);
+    }
+    hvalue_t *pending = malloc(2 * nkv * sizeof(hvalue_t));
+    memcpy(pending, kv, 2 * nkv * sizeof(hvalue_t));
+    unsigned int npending = nkv;
+    for (unsigned int i = j + 1;; i++) {
+        unsigned int left = value_chunkify(engine, &vc, pending, npending, i == n);
+        if (i == n) {
+            break;
+        }
+        if (left == 0) {
+            // Lined up again
+            for (; i < n; i++) {
+                value_chunks_add(&vc, chunks[i]);
+            }
+            break;
+        }
+        unsigned int size;
+        hvalue_t *ckv = dict_retrieve((void *) (chunks[i] & ~VALUE_MASK), &size);
+        unsigned int nckv = size / (2 * sizeof(hvalue_t));
+        memmove(pending, &pending[2 * (npending - left)], 2 * left * sizeof(hvalue_t));
+        pending = realloc(pending, 2 * (left + nckv) * sizeof(hvalue_t));
+        memcpy(&pending[2 * left], ckv, size);
+        npending = left + nckv;
+    }
+    free(pending);
+    return value_chunks_put(engine, &vc);
+}
+
+// Number of entries in a chunked dict
+static unsigned int value_chunks_count(hvalue_t *chunks, unsigned int n){
+    unsigned int total = 0;
+    for (unsigned int i = 0; i < n; i++) {
+        unsigned int size;
+        (void) dict_retrieve((void *) (chunks[i] & ~VALUE_MASK), &size);
+        total += size / (2 * sizeof(hvalue_t));
+    }
+    return total;
+}
+
+// Store key:value into a chunked dict.  Returns false if the key is not in
+// the dict and allow_inserts is false.
+static bool value_chunks_store(struct engine *engine, hvalue_t dict, hvalue_t *chunks,
+        unsigned int n, hvalue_t key, hvalue_t value, bool allow_inserts, hvalue_t *result){
+    unsigned int j = value_chunk_find(chunks, n, key);
+    unsigned int size;
+    hvalue_t *ckv = dict_retrieve((void *) (chunks[j] & ~VALUE_MASK), &size);
+    unsigned int nckv = size / (2 * sizeof(hvalue_t));
+    unsigned int i;
+    for (i = 0; i < nckv; i++) {
+        if (ckv[2*i] == key) {
+            if (ckv[2*i + 1] == value) {
+                *result = dict;
+                return true;
+            }
+            hvalue_t *kv = malloc(size);
+            memcpy(kv, ckv, size);
+            kv[2*i + 1] = value;
+            *result = value_chunks_replace(engine, chunks, n, j, kv, nckv);
+            free(kv);
+            return true;
+        }
+        if (value_cmp(ckv[2*i], key) > 0) {
+            break;
+        }
+    }
+    if (!allow_inserts) {
+        return false;
+    }
+    hvalue_t *kv = malloc(size + 2 * sizeof(hvalue_t));
+    memcpy(kv, ckv, 2 * i * sizeof(hvalue_t));
+    kv[2*i] = key;
+    kv[2*i + 1] = value;
+    memcpy(&kv[2*i + 2], &ckv[2*i], 2 * (nckv - i) * sizeof(hvalue_t));
+    *result = value_chunks_rechunk(engine, chunks, n, j, kv, nckv + 1,
+                                value_chunks_count(chunks, n) + 1);
+    free(kv);
+    return true;
+}
+
+static hvalue_t value_chunks_remove(struct engine *engine, hvalue_t dict,
+                    hvalue_t *chunks, unsigned int n, hvalue_t key){
+    unsigned int j = value_chunk_find(chunks, n, key);
+    unsigned int size;
+    hvalue_t *ckv = dict_retrieve((void *) (chunks[j] & ~VALUE_MASK), &size);
+    unsigned int nckv = size / (2 * sizeof(hvalue_t));
+    for (unsigned int i = 0; i < nckv; i++) {
+        if (ckv[2*i] == key) {
+            hvalue_t *kv = malloc(size);
+            memcpy(kv, ckv, 2 * i * sizeof(hvalue_t));
+            memcpy(&kv[2*i], &ckv[2*i + 2], 2 * (nckv - i - 1) * sizeof(hvalue_t));
+            hvalue_t result = value_chunks_rechunk(engine, chunks, n, j, kv, nckv - 1,
+                                value_chunks_count(chunks, n) - 1);
+            free(kv);
+            return result;
+        }
+    }
+    return dict;
+}
+
+static bool value_chunks_load(hvalue_t *chunks, unsigned int n, hvalue_t key, hvalue_t *result){
+    unsigned int j = value_chunk_find(chunks, n, key);
+    unsigned int size;
+    hvalue_t *ckv = dict_retrieve((void *) (chunks[j] & ~VALUE_MASK), &size);
+    size /= sizeof(hvalue_t);
+    for (unsigned int i = 0; i < size; i += 2) {
+        if (ckv[i] == key) {
+            *result = ckv[i + 1];
+            return true;
+        }
+    }
+    return false;
+}
+
+// Like value_put_dict() and value_put_list(), but the body is given as an
+// edit of the body of an existing value (see dict_find_patch()), and its hash
+// is known.  The new body is copied only if it is not there yet.
+static hvalue_t value_put_patch(struct engine *engine, hvalue_t type,
+                    const struct dict_patch *patch, uint32_t hash){
+    unsigned int size = patch->len - patch->del + patch->insn;
+    if (size == 0) {
+        return type;
+    }
+    if (type == VALUE_DICT && size > 2 * VALUE_DICT_BIG * sizeof(hvalue_t)) {
+        // Becomes a large dict, which is chunked
+        char *p = malloc(size);
+        memcpy(p, patch->base, patch->off);
+        memcpy(p + patch->off, patch->ins, patch->insn);
+        memcpy(p + patch->off + patch->insn,
+                    (char *) patch->base + patch->off + patch->del,
+                    patch->len - patch->off - patch->del);
+        hvalue_t v = value_put_dict(engine, p, size);
+        free(p);
+        return v;
+    }
+    struct dict *d = type == VALUE_DICT ? engine->values->dicts : engine->values->lists;
+    void *q = dict_find_patch(d, engine->allocator, patch, hash);
+    return (hvalue_t) q | type;
+}
+
 hvalue_t value_put_atom(struct engine *engine, const void *p, int size){
     if (size == 0) {
         return VALUE_ATOM;
@@ -62,6 +462,12 @@ hvalue_t value_put_dict(struct engine *engine, void *p, int size){
     if (size == 0) {
         return VALUE_DICT;
     }
+    unsigned int n = size / (2 * sizeof(hvalue_t));
+    if (n > VALUE_DICT_BIG) {
+        struct value_chunks vc = { NULL, 0, 0 };
+        (void) value_chunkify(engine, &vc, p, n, true);
+        return value_chunks_put(engine, &vc);
+    }
     void *q = dict_find(engine->values->dicts, engine->allocator, p, size);
     return (hvalue_t) q | VALUE_DICT;
 }
@@ -120,10 +526,9 @@ int value_cmp_dict(hvalue_t v1, hvalue_t v2){
     if (v2 == 0) {
         return 1;
     }
-    void *p1 = (void *) v1, *p2 = (void *) v2;
     unsigned int size1, size2;
-    hvalue_t *vals1 = dict_retrieve(p1, &size1);
-    hvalue_t *vals2 = dict_retrieve(p2, &size2);
+    hvalue_t *vals1 = value_get(v1 | VALUE_DICT, &size1);
+    hvalue_t *vals2 = value_get(v2 | VALUE_DICT, &size2);
     size1 /= sizeof(hvalue_t);
     size2 /= sizeof(hvalue_t);
     unsigned int size = size1 < size2 ? size1 : size2;
@@ -335,9 +740,8 @@ static void value_string_dict(struct strbuf *sb, hvalue_t v) {
         return;
     }
 
-    void *p = (void *) v;
     unsigned int size;
-    hvalue_t *vals = dict_retrieve(p, &size);
+    hvalue_t *vals = value_get(v | VALUE_DICT, &size);
     size /= 2 * sizeof(hvalue_t);
     strbuf_printf(sb, "{ ");
     for (unsigned int i = 0; i < size; i++) {
@@ -357,9 +761,8 @@ static void value_json_dict(struct strbuf *sb, hvalue_t v) {
         return;
     }
 
-    void *p = (void *) v;
     unsigned int size;
-    hvalue_t *vals = dict_retrieve(p, &size);
+    hvalue_t *vals = value_get(v | VALUE_DICT, &size);
     size /= 2 * sizeof(hvalue_t);
 
     strbuf_printf(sb, "{ \"type\": \"dict\", \"value\": [");
@@ -868,24 +1271,29 @@ static bool align_test(){
     return true;
 }
 
-void value_init(struct values_t *values, unsigned int nworkers){
+void value_init(struct values_t *values, unsigned int nworkers, bool open){
+    struct dict *(*dnew)(unsigned int, unsigned int, void *(*)(size_t), void (*)(void *)) =
+                open ? dict_new_open : dict_new;
     if (align_test()) {
         // printf("malloc appears aligned to %d bytes\n", 1 << VALUE_BITS);
-        values->atoms = dict_new(1024*1024, nworkers, NULL, NULL);
-        values->dicts = dict_new(1024*1024, nworkers, NULL, NULL);
-        values->sets = dict_new(1024*1024, nworkers, NULL, NULL);
-        values->lists = dict_new(1024*1024, nworkers, NULL, NULL);
-        values->addresses = dict_new(1024*1024, nworkers, NULL, NULL);
-        values->contexts = dict_new(1024*1024, nworkers, NULL, NULL);
+        values->atoms = (*dnew)(1024*1024, nworkers, NULL, NULL);
+        values->dicts = (*dnew)(1024*1024, nworkers, NULL, NULL);
+        values->sets = (*dnew)(1024*1024, nworkers, NULL, NULL);
+        values->lists = (*dnew)(1024*1024, nworkers, NULL, NULL);
+        values->addresses = (*dnew)(1024*1024, nworkers, NULL, NULL);
+        values->contexts = (*dnew)(1024*1024, nworkers, NULL, NULL);
     }
     else {
-        values->atoms = dict_new(1024*1024, nworkers, align_alloc, align_free);
-        values->dicts = dict_new(1024*1024, nworkers, align_alloc, align_free);
-        values->sets = dict_new(1024*1024, nworkers, align_alloc, align_free);
-        values->lists = dict_new(1024*1024, nworkers, align_alloc, align_free);
-        values->addresses = dict_new(1024*1024, nworkers, align_alloc, align_free);
-        values->contexts = dict_new(1024*1024, nworkers, align_alloc, align_free);
+        values->atoms = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
+        values->dicts = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
+        values->sets = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
+        values->lists = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
+        values->addresses = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
+        values->contexts = (*dnew)(1024*1024, nworkers, align_alloc, align_free);
     }
+    dict_set_hash(values->dicts, value_hash_dict);
+    dict_set_hash(values->sets, value_hash_set);
+    dict_set_hash(values->lists, value_hash_list);
 }
 
 void value_set_concurrent(struct values_t *values){
@@ -925,15 +1333,29 @@ void value_set_sequential(struct values_t *values, struct value_stable *vs){
     dict_set_sequential(values->contexts, vs->context);
 }
 
+// #bytes taken by the hash tables, not counting the values themselves
+uint64_t value_table_size(struct values_t *values){
+    return dict_table_size(values->atoms) + dict_table_size(values->dicts) +
+            dict_table_size(values->sets) + dict_table_size(values->lists) +
+            dict_table_size(values->addresses) + dict_table_size(values->contexts);
+}
+
 // Store key:value in the given dictionary and returns its value code
 // in *result.  May fail if allow_inserts is false and key does not exist
 bool value_dict_trystore(struct engine *engine, hvalue_t dict, hvalue_t key, hvalue_t value, bool allow_inserts, hvalue_t *result){
     assert(VALUE_TYPE(dict) == VALUE_DICT);
 
+    unsigned int nchunks;
+    hvalue_t *chunks = value_dict_chunks(dict, &nchunks);
+    if (chunks != NULL) {
+        return value_chunks_store(engine, dict, chunks, nchunks, key, value, allow_inserts, result);
+    }
+
+    hvalue_t kv[2] = { key, value };
     hvalue_t *vals;
     unsigned int size;
     if (dict == VALUE_DICT) {
-        vals = NULL;
+        vals = kv;          // not used, but must be a valid pointer
         size = 0;
     }
     else {
@@ -949,13 +1371,14 @@ bool value_dict_trystore(struct engine *engine, hvalue_t dict, hvalue_t key, hva
                 *result = dict;
                 return true;
             }
-            int n = size * sizeof(hvalue_t);
-            hvalue_t *copy = malloc(n);
-            memcpy(copy, vals, n);
-            copy[i + 1] = value;
-            hvalue_t v = value_put_dict(engine, copy, n);
-            free(copy);
-            *result = v;
+            struct dict_patch patch = {
+                .base = vals, .len = size * sizeof(hvalue_t),
+                .off = (i + 1) * sizeof(hvalue_t), .del = sizeof(hvalue_t),
+                .ins = &value, .insn = sizeof(hvalue_t)
+            };
+            uint32_t hash = value_hash(dict) - value_hash_pair(key, vals[i + 1])
+                                             + value_hash_pair(key, value);
+            *result = value_put_patch(engine, VALUE_DICT, &patch, hash);
             return true;
         }
         if (value_cmp(vals[i], key) > 0) {
@@ -967,15 +1390,13 @@ bool value_dict_trystore(struct engine *engine, hvalue_t dict, hvalue_t key, hva
         return false;
     }
 
-    int n = (size + 2) * sizeof(hvalue_t);
-    hvalue_t *nvals = malloc(n);
-    memcpy(nvals, vals, i * sizeof(hvalue_t));
-    nvals[i] = key;
-    nvals[i+1] = value;
-    memcpy(&nvals[i+2], &vals[i], (size - i) * sizeof(hvalue_t));
-    hvalue_t v = value_put_dict(engine, nvals, n);
-    free(nvals);
-    *result = v;
+    struct dict_patch patch = {
+        .base = vals, .len = size * sizeof(hvalue_t),
+        .off = i * sizeof(hvalue_t), .del = 0,
+        .ins = kv, .insn = sizeof(kv)
+    };
+    uint32_t hash = value_hash(dict) + value_hash_pair(key, value);
+    *result = value_put_patch(engine, VALUE_DICT, &patch, hash);
     return true;
 }
 
@@ -992,6 +1413,13 @@ hvalue_t value_dict_store(struct engine *engine, hvalue_t dict, hvalue_t key, hv
 bool value_trystore(struct engine *engine, hvalue_t root, hvalue_t key, hvalue_t value, bool allow_inserts, hvalue_t *result){
     assert(VALUE_TYPE(root) == VALUE_DICT || VALUE_TYPE(root) == VALUE_LIST);
 
+    unsigned int nchunks;
+    hvalue_t *chunks;
+    if (VALUE_TYPE(root) == VALUE_DICT &&
+                (chunks = value_dict_chunks(root, &nchunks)) != NULL) {
+        return value_chunks_store(engine, root, chunks, nchunks, key, value, allow_inserts, result);
+    }
+
     unsigned int size;
     hvalue_t *vals = value_get(root, &size);
     unsigned int n = size / sizeof(hvalue_t);
@@ -1005,12 +1433,14 @@ bool value_trystore(struct engine *engine, hvalue_t root, hvalue_t key, hvalue_t
                     *result = root;
                     return true;
                 }
-                hvalue_t *nvals = malloc(size);
-                memcpy(nvals, vals, size);
-                nvals[i + 1] = value;
-                hvalue_t v = value_put_dict(engine, nvals, size);
-                free(nvals);
-                *result = v;
+                struct dict_patch patch = {
+                    .base = vals, .len = size,
+                    .off = (i + 1) * sizeof(hvalue_t), .del = sizeof(hvalue_t),
+                    .ins = &value, .insn = sizeof(hvalue_t)
+                };
+                uint32_t hash = value_hash(root) - value_hash_pair(key, vals[i + 1])
+                                                 + value_hash_pair(key, value);
+                *result = value_put_patch(engine, VALUE_DICT, &patch, hash);
                 return true;
             }
             if (value_cmp(vals[i], key) > 0) {
@@ -1022,15 +1452,14 @@ bool value_trystore(struct engine *engine, hvalue_t root, hvalue_t key, hvalue_t
             return false;
         }
 
-        size += 2 * sizeof(hvalue_t);
-        hvalue_t *nvals = malloc(size);
-        memcpy(nvals, vals, i * sizeof(hvalue_t));
-        nvals[i] = key;
-        nvals[i+1] = value;
-        memcpy(&nvals[i+2], &vals[i], (n - i) * sizeof(hvalue_t));
-        hvalue_t v = value_put_dict(engine, nvals, size);
-        free(nvals);
-        *result = v;
+        hvalue_t kv[2] = { key, value };
+        struct dict_patch patch = {
+            .base = size == 0 ? kv : vals, .len = size,
+            .off = i * sizeof(hvalue_t), .del = 0,
+            .ins = kv, .insn = sizeof(kv)
+        };
+        uint32_t hash = value_hash(root) + value_hash_pair(key, value);
+        *result = value_put_patch(engine, VALUE_DICT, &patch, hash);
         return true;
     }
     else {
@@ -1042,26 +1471,26 @@ bool value_trystore(struct engine *engine, hvalue_t root, hvalue_t key, hvalue_t
         if (index > n) {
             return false;
         }
-        unsigned int nsize;
+        struct dict_patch patch = {
+            .base = size == 0 ? &value : vals, .len = size,
+            .off = index * sizeof(hvalue_t), .del = sizeof(hvalue_t),
+            .ins = &value, .insn = sizeof(hvalue_t)
+        };
+        uint32_t hash = value_hash(root) + value_hash_pair(index, value);
         if (index == n) {
             if (!allow_inserts) {
                 return false;
             }
-            nsize = size + sizeof(hvalue_t);
+            patch.del = 0;
         }
         else {
             if (vals[index] == value) {
                 *result = root;
                 return true;
             }
-            nsize = size;
+            hash -= value_hash_pair(index, vals[index]);
         }
-        hvalue_t *nvals = malloc(nsize);
-        memcpy(nvals, vals, size);
-        nvals[index] = value;
-        hvalue_t v = value_put_list(engine, nvals, nsize);
-        free(nvals);
-        *result = v;
+        *result = value_put_patch(engine, VALUE_LIST, &patch, hash);
         return true;
     }
 }
@@ -1079,6 +1508,13 @@ hvalue_t value_store(struct engine *engine, hvalue_t root, hvalue_t key, hvalue_
 hvalue_t value_dict_load(hvalue_t dict, hvalue_t key){
     assert(VALUE_TYPE(dict) == VALUE_DICT);
 
+    unsigned int nchunks;
+    hvalue_t *chunks = value_dict_chunks(dict, &nchunks);
+    hvalue_t result;
+    if (chunks != NULL && value_chunks_load(chunks, nchunks, key, &result)) {
+        return result;
+    }
+
     hvalue_t *vals;
     unsigned int size;
     if (dict == VALUE_DICT) {
@@ -1111,6 +1547,12 @@ hvalue_t value_dict_load(hvalue_t dict, hvalue_t key){
 hvalue_t value_dict_remove(struct engine *engine, hvalue_t dict, hvalue_t key){
     assert(VALUE_TYPE(dict) == VALUE_DICT);
 
+    unsigned int nchunks;
+    hvalue_t *chunks = value_dict_chunks(dict, &nchunks);
+    if (chunks != NULL) {
+        return value_chunks_remove(engine, dict, chunks, nchunks, key);
+    }
+
     hvalue_t *vals;
     unsigned int size;
     if (dict == VALUE_DICT) {
@@ -1126,14 +1568,13 @@ hvalue_t value_dict_remove(struct engine *engine, hvalue_t dict, hvalue_t key){
 
     for (unsigned int i = 0; i < size; i += 2) {
         if (vals[i] == key) {
-            int n = (size - 2) * sizeof(hvalue_t);
-            hvalue_t *copy = malloc(n);
-            memcpy(copy, vals, i * sizeof(hvalue_t));
-            memcpy(&copy[i], &vals[i+2],
-                   (size - i - 2) * sizeof(hvalue_t));
-            hvalue_t v = value_put_dict(engine, copy, n);
-            free(copy);
-            return v;
+            struct dict_patch patch = {
+                .base = vals, .len = size * sizeof(hvalue_t),
+                .off = i * sizeof(hvalue_t), .del = 2 * sizeof(hvalue_t),
+                .ins = vals, .insn = 0
+            };
+            uint32_t hash = value_hash(dict) - value_hash_pair(key, vals[i + 1]);
+            return value_put_patch(engine, VALUE_DICT, &patch, hash);
         }
         /*
             if (value_cmp(vals[i], key) > 0) {
@@ -1148,6 +1589,13 @@ hvalue_t value_dict_remove(struct engine *engine, hvalue_t dict, hvalue_t key){
 hvalue_t value_remove(struct engine *engine, hvalue_t root, hvalue_t key){
     assert(VALUE_TYPE(root) == VALUE_DICT || VALUE_TYPE(root) == VALUE_LIST);
 
+    unsigned int nchunks;
+    hvalue_t *chunks;
+    if (VALUE_TYPE(root) == VALUE_DICT &&
+                (chunks = value_dict_chunks(root, &nchunks)) != NULL) {
+        return value_chunks_remove(engine, root, chunks, nchunks, key);
+    }
+
     unsigned int size;
     hvalue_t *vals = value_get(root, &size);
     if (size == 0) {
@@ -1164,14 +1612,13 @@ hvalue_t value_remove(struct engine *engine, hvalue_t root, hvalue_t key){
 
         for (unsigned i = 0; i < n; i += 2) {
             if (vals[i] == key) {
-                size -= 2 * sizeof(hvalue_t);
-                hvalue_t *copy = malloc(size);
-                memcpy(copy, vals, i * sizeof(hvalue_t));
-                memcpy(&copy[i], &vals[i+2],
-                       (n - i - 2) * sizeof(hvalue_t));
-                hvalue_t v = value_put_dict(engine, copy, size);
-                free(copy);
-                return v;
+                struct dict_patch patch = {
+                    .base = vals, .len = size,
+                    .off = i * sizeof(hvalue_t), .del = 2 * sizeof(hvalue_t),
+                    .ins = vals, .insn = 0
+                };
+                uint32_t hash = value_hash(root) - value_hash_pair(key, vals[i + 1]);
+                return value_put_patch(engine, VALUE_DICT, &patch, hash);
             }
             /* Not worth it
                 if (value_cmp(vals[i], key) > 0) {
@@ -1240,6 +1687,12 @@ bool value_tryload(
     }
 
     if (VALUE_TYPE(root) == VALUE_DICT) {
+        unsigned int nchunks;
+        hvalue_t *chunks = value_dict_chunks(root, &nchunks);
+        if (chunks != NULL) {
+            return value_chunks_load(chunks, nchunks, key, result);
+        }
+
         hvalue_t *vals;
         unsigned int size;
         vals = value_get(root, &size);
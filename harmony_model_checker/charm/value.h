@@ -69,12 +69,13 @@ struct engine {
     struct values_t *values;
 };
 
-void value_init(struct values_t *values, unsigned int nworkers);
+void value_init(struct values_t *values, unsigned int nworkers, bool open);
 void value_set_concurrent(struct values_t *values);
 void value_stable_add(struct value_stable *vs, struct value_stable *vs2);
 void value_make_stable(struct values_t *values,
             unsigned int worker, struct value_stable *vs);
 void value_set_sequential(struct values_t *values, struct value_stable *vs);
+uint64_t value_table_size(struct values_t *values);
 hvalue_t value_from_json(struct engine *engine, struct dict *map);
 int value_cmp(hvalue_t v1, hvalue_t v2);
 void *value_get(hvalue_t v, unsigned int *size);
@@ -0,0 +1,434 @@
+"""
+    Reusing the code of the top-level statements of a file that did not
+    change since the previous run.
+
+    For each file the cache keeps the code (the Labeled_Ops) that each
+    top-level statement compiled into, together with what compiling it did
+    to the scope.  A statement is found by its fingerprint: a hash of its
+    text, from where it starts up to the next statement, and of everything
+    compiled before the file (the -c and -m options and the files compiled
+    before it).  Where the statement is in the file is not part of it.  The
+    code is reused if, in addition, the names that compiling the statement
+    looked up in the scope have the same values as then.  An edit
+    therefore invalidates the statement it is in and the statements that
+    use what it defines, but not the others, before or after it.
+
+    The code of a statement is saved so that it can be put anywhere: the
+    lines in the file, the pcs in the file, and the names of variables made
+    from a pc are saved relative to where the statement starts, and moved
+    to where it starts now when the code is loaded.  Labels are not stable
+    between runs.  The labels of the file (method names and the like) are
+    saved by their name, labels in code compiled before the file by their
+    pc, and values the statement took from the scope by their name in the
+    scope.  Other labels are private to the code of the statement and are
+    saved with it.
+
+    The cache is in the "code" directory next to the AST cache (see
+    astcache.py) and is turned off in the same way.
+"""
+
+import hashlib
+import io
+import os
+import pickle
+import re
+import tempfile
+
+from harmony_model_checker import astcache
+import harmony_model_checker.harmony.ast as hast
+from harmony_model_checker.harmony.code import Labeled_Op
+from harmony_model_checker.harmony.scope import Scope
+from harmony_model_checker.harmony.value import LabelValue, PcValue
+
+# Code generation depends on these as well as on the parser
+_compiler_sources = [
+    "harmony/code.py",
+    "harmony/ops.py",
+    "harmony/scope.py",
+    "harmony/state.py",
+    "harmony/value.py",
+    "codecache.py",
+]
+
+_salt = None
+_chain = None           # hash of what was compiled so far, None if off
+
+# Names of variables and labels that the compiler makes from a pc
+_pcname = re.compile(r"(\$accu|__cmp__|cmp\$)(\d+)$")
+
+def _get_salt():
+    global _salt
+    if _salt is None:
+        h = hashlib.sha256(astcache._get_salt())
+        install_path = os.path.dirname(os.path.realpath(__file__))
+        for src in _compiler_sources:
+            with open(os.path.join(install_path, src), "rb") as f:
+                h.update(f.read())
+        _salt = h.digest()
+    return _salt
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else \
+                    str(part).encode('utf-8', 'surrogatepass')
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.digest()
+
+def start(constants, modules):
+    """Called before compiling with the -c constants and -m modules."""
+    global _chain
+    if astcache.cache_dir("code") is None:
+        _chain = None
+        return
+    _chain = _hash(_get_salt(),
+        sorted((k, repr(v)) for (k, v) in constants.items()),
+        sorted(modules.items()))
+
+class _Statement:
+    """What compiling a top-level statement did."""
+    def __init__(self):
+        self.ops = []           # the Labeled_Ops appended
+        self.pending = set()    # labels pending before (see Code.nextLabel)
+        self.endlabels = set()  # labels pending after
+        self.location = None    # code.curFile and code.curLine after, as
+                                # a token so that the line is moved
+        self.names = {}         # entries added to or changed in the scope
+        self.used = set()       # -c constants used
+
+class _Place:
+    """Where the code of a statement goes: the file, the pc at which the
+    code of the file starts, and the line and pc of the statement."""
+    def __init__(self, file, start, line, pc):
+        self.file = file
+        self.start = start
+        self.line = line
+        self.pc = pc
+
+# Stands for the _Place in the saved code
+_here = object()
+
+def _token(here, lexeme, file, line, column):
+    return (lexeme, file, here.line + line, column)
+
+def _labeled_op(here, op, file, line, labels):
+    return Labeled_Op(op, file, here.line + line, labels)
+
+def _name(here, prefix, pc):
+    return prefix + str(here.pc + pc)
+
+_set = object()
+
+class _Names(dict):
+    """The names of a scope.  Keeps track of the names that are looked up
+    before they are set, and what they were then."""
+    def __init__(self, names):
+        super().__init__(names)
+        self.read = {}
+
+    def get(self, k, default=None):
+        self.read.setdefault(k, dict.get(self, k))
+        return dict.get(self, k, default)
+
+    def __getitem__(self, k):
+        self.read.setdefault(k, dict.get(self, k))
+        return dict.__getitem__(self, k)
+
+    def __contains__(self, k):
+        self.read.setdefault(k, dict.get(self, k))
+        return dict.__contains__(self, k)
+
+    def __setitem__(self, k, v):
+        self.read.setdefault(k, _set)
+        dict.__setitem__(self, k, v)
+
+class _Pickler(pickle._Pickler):
+    """Saves code so that it can be loaded at another place.  This is the
+    Python implementation of the pickler, as the C one does not allow to
+    save tuples and strings in another way."""
+    def __init__(self, f, place, labels, external, deps):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.place = place
+        self.named = { id(lb): lexeme for (lexeme, lb) in labels.items() }
+        self.external = external
+        self.deps = deps        # id of a value taken from the scope to its name
+
+    def persistent_id(self, obj):
+        if obj is _here:
+            return ("here",)
+        key = self.deps.get(id(obj))
+        if key is not None:
+            return ("dep",) + key
+        if isinstance(obj, LabelValue):
+            lexeme = self.named.get(id(obj))
+            if lexeme is not None:
+                return ("name", lexeme)
+            pc = self.external.get(obj)
+            if pc is not None:
+                return ("label", pc)
+        elif isinstance(obj, PcValue):
+            if isinstance(obj.pc, int) and obj.pc >= self.place.start:
+                return ("pc", obj.pc - self.place.pc)
+        elif isinstance(obj, Scope):
+            for (lexeme, scope) in hast.imported.items():
+                if scope is obj:
+                    return ("module", lexeme)
+            raise pickle.PicklingError("scope of unknown module")
+        return None
+
+    def save(self, obj, save_persistent_id=True):
+        t = type(obj)
+        if save_persistent_id and (t is tuple or t is str or t is Labeled_Op) \
+                and id(obj) not in self.memo and self.persistent_id(obj) is None:
+            place = self.place
+            if t is tuple:
+                if len(obj) == 4 and obj[1] == place.file and type(obj[2]) is int:
+                    (lexeme, file, line, column) = obj
+                    self.save_reduce(_token, (_here, lexeme, file,
+                                    line - place.line, column), obj=obj)
+                    return
+            elif t is str:
+                m = _pcname.match(obj)
+                if m is not None and int(m.group(2)) >= place.start:
+                    self.save_reduce(_name, (_here, m.group(1),
+                                int(m.group(2)) - place.pc), obj=obj)
+                    return
+            elif obj.file == place.file:
+                self.save_reduce(_labeled_op, (_here, obj.op, obj.file,
+                                obj.line - place.line, obj.labels), obj=obj)
+                return
+        super().save(obj, save_persistent_id)
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, place, labels, code, scopes):
+        super().__init__(f)
+        self.place = place
+        self.labels = labels
+        self.code = code
+        self.scopes = scopes
+
+    def persistent_load(self, pid):
+        if pid[0] == "here":
+            return self.place
+        if pid[0] == "dep":
+            (_, depth, name, part) = pid
+            entry = dict.get(self.scopes[depth].names, name)
+            return entry if part == 0 else entry[1]
+        if pid[0] == "name":
+            return self.labels[pid[1]]
+        if pid[0] == "label":
+            # Any of the labels of the op will do: they all become that pc
+            return next(iter(self.code.labeled_ops[pid[1]].labels))
+        if pid[0] == "pc":
+            return PcValue(self.place.pc + pid[1])
+        if pid[0] == "module":
+            return hast.imported[pid[1]]
+        raise pickle.UnpicklingError("bad persistent id")
+
+def _value_key(entry, place, labels, external):
+    """What a name in the scope stands for, as far as the code that uses it
+    is concerned.  Where it is defined does not matter."""
+    if entry is None:
+        return None
+    (t, v) = entry
+    if isinstance(v, tuple) and len(v) == 4:
+        v = v[0]
+    f = io.BytesIO()
+    _Pickler(f, place, labels, external, {}).dump((t, v))
+    return hashlib.sha256(f.getvalue()).digest()
+
+def _fingerprints(filename, contents, ast, scope):
+    """The fingerprints and the lines of the top-level statements of ast,
+    or None if the statements cannot be told apart in the text."""
+    lines = contents.split("\n")
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    bounds = []
+    for s in ast.b:
+        (_, file, line, column) = s.token
+        if file != filename or not (1 <= line <= len(lines)):
+            return None
+        bounds.append(offsets[line - 1] + max(column - 1, 0))
+    bounds.append(len(contents))
+    if any(bounds[i] >= bounds[i + 1] for i in range(len(ast.b))):
+        return None
+
+    # A module is compiled with its name as the prefix of its variables
+    fp = _hash(_chain, os.path.abspath(filename), filename, scope.prefix)
+    return [ (_hash(fp, s.token[3], contents[bounds[i]:bounds[i + 1]]),
+                s.token[2]) for (i, s) in enumerate(ast.b) ]
+
+def _load(path):
+    """Returns the statements saved for the file: a map from a fingerprint
+    to the values that the names it depends on must have, and its code."""
+    try:
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        return saved if isinstance(saved, dict) else {}
+    except Exception:
+        # Missing or corrupt
+        return {}
+
+def _store(path, saved):
+    tmp = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(saved, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp, path)
+        tmp = None
+    except Exception:
+        pass
+    finally:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+def _restore(entry, place, labels, external, scopes, code):
+    """Load saved code if the names it depends on still have the same
+    values, or return None."""
+    (deps, data) = entry
+    try:
+        for ((depth, name), key) in deps:
+            if _value_key(dict.get(scopes[depth].names, name), place,
+                                        labels, external) != key:
+                return None
+        return _Unpickler(io.BytesIO(data), place, labels, code, scopes).load()
+    except Exception:
+        # Refers to something that is not there
+        return None
+
+def _replay(st, ns, code):
+    """Append the code of a saved statement and redo its effects."""
+    if st.ops:
+        first = st.ops[0]
+        labels = (first.labels - st.pending) | code.endlabels
+        code.labeled_ops.append(Labeled_Op(first.op, first.file, first.line, labels))
+        code.labeled_ops.extend(st.ops[1:])
+        code.endlabels = st.endlabels - st.pending
+    else:
+        code.endlabels = (st.endlabels - st.pending) | code.endlabels
+    (_, code.curFile, code.curLine, _) = st.location
+    ns.names.update(st.names)
+    hast.used_constants.update(st.used)
+
+def _compile(s, place, labels, external, scopes, code):
+    """Compile statement s and return what is needed to reuse its code, or
+    None if it cannot be reused."""
+    ns = scopes[0]
+    st = _Statement()
+    st.pending = set(code.endlabels)
+    names = dict(ns.names)
+    used = set(hast.used_constants)
+    for sc in scopes:
+        sc.names.read = {}
+    s.compile(ns, code)
+    st.ops = code.labeled_ops[place.pc:]
+    st.endlabels = set(code.endlabels)
+    st.location = (None, code.curFile, code.curLine, None)
+    st.names = { k: v for (k, v) in ns.names.items()
+                            if k not in names or names[k] is not v }
+    st.used = hast.used_constants - used
+    if names.keys() - ns.names.keys():
+        return None         # removes names: do not save it
+
+    # The names it looked up before setting them, and what they were then
+    deps = []
+    refs = {}
+    try:
+        for (depth, sc) in enumerate(scopes):
+            for (name, entry) in sc.names.read.items():
+                if entry is _set:
+                    continue
+                deps.append(((depth, name),
+                                _value_key(entry, place, labels, external)))
+                if entry is not None:
+                    refs[id(entry)] = (depth, name, 0)
+                    refs.setdefault(id(entry[1]), (depth, name, 1))
+        f = io.BytesIO()
+        _Pickler(f, place, labels, external, refs).dump(st)
+    except Exception:
+        return None         # refers to something that cannot be saved
+    return (deps, f.getvalue())
+
+def compile_file(filename, contents, ast, scope, code):
+    """Compile the top-level block of a file like ast.compile(scope, code),
+    but reuse what can be reused from the previous run."""
+    global _chain
+    if _chain is None:
+        ast.compile(scope, code)
+        return
+    _compile_file(astcache.cache_dir("code"), filename, contents, ast, scope, code)
+
+    # The files compiled later may depend on this one
+    _chain = _hash(_chain, os.path.abspath(filename), contents,
+                                                len(code.labeled_ops))
+
+def _compile_file(d, filename, contents, ast, scope, code):
+    if d is None or not isinstance(ast, hast.BlockAST) or ast.atomically \
+                                                    or not scope.inherit:
+        ast.compile(scope, code)
+        return
+
+    fps = _fingerprints(filename, contents, ast, scope)
+    if fps is None:
+        ast.compile(scope, code)
+        return
+
+    # The labels of the file by name, which is stable between runs (the
+    # names are unique, see _load_file)
+    labels = { lexeme: lb for ((lexeme, file, line, column), lb)
+                                                    in ast.getLabels() }
+
+    # Labels of the code before this file
+    start = len(code.labeled_ops)
+    external = {}
+    for pc in range(start):
+        for lb in code.labeled_ops[pc].labels:
+            external[lb] = pc
+
+    path = d / hashlib.sha256(_hash(_get_salt(), os.path.abspath(filename))).hexdigest()
+    saved = _load(path)
+
+    # Same as BlockAST.compile, but keeps track of the names looked up in
+    # the scope and its ancestors
+    ns = Scope(scope)
+    for ((lexeme, file, line, column), lb) in ast.getLabels():
+        ns.names[lexeme] = ("constant", (lb, file, line, column))
+    scopes = []
+    sc = ns
+    while sc is not None:
+        scopes.append(sc)
+        sc = sc.parent
+    for sc in scopes:
+        sc.names = _Names(sc.names)
+    kept = {}
+    compiled = False
+    try:
+        for (s, (fp, line)) in zip(ast.b, fps):
+            place = _Place(filename, start, line, len(code.labeled_ops))
+            st = None
+            if fp in saved:
+                st = _restore(saved[fp], place, labels, external, scopes, code)
+            if st is not None:
+                _replay(st, ns, code)
+                kept[fp] = saved[fp]
+                continue
+            compiled = True
+            entry = _compile(s, place, labels, external, scopes, code)
+            if entry is not None:
+                kept[fp] = entry
+    finally:
+        for sc in scopes:
+            sc.names = dict(sc.names)
+    for name, x in ns.names.items():
+        scope.names[name] = x
+
+    if compiled or kept.keys() != saved.keys():
+        _store(path, kept)
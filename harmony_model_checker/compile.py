@@ -9,6 +9,7 @@ from harmony_model_checker.parser.HarmonyParser import HarmonyParser
 from harmony_model_checker.parser.HarmonyErrorListener import HarmonyLexerErrorListener, HarmonyParserErrorListener
 from harmony_model_checker.parser.HarmonyLexer import HarmonyLexer
 from harmony_model_checker.harmony.ops import *
+from harmony_model_checker import astcache, codecache
 
 import os
 
@@ -77,9 +78,16 @@ def _load_file(filename: str, scope: Scope, code: Code):
         return
     legacy_harmony.namestack.append(filename)
     with open(filename, "r", encoding='utf-8') as f:
-        legacy_harmony.files[filename] = f.read().split("\n")
+        contents = f.read()
+    legacy_harmony.files[filename] = contents.split("\n")
 
-    ast = _parse(filename)
+    # Use the cached AST if the file has been parsed before
+    key = astcache.cache_key(filename, contents)
+    ast = astcache.load(key)
+    if ast is None:
+        ast = _parse(filename)
+        if ast is not None:
+            astcache.store(key, ast)
     if ast is None:
         raise HarmonyCompilerError(
             message="Unknown error: unable to parse Harmony file",
@@ -103,7 +111,8 @@ def _load_file(filename: str, scope: Scope, code: Code):
             )
         scope.names[lexeme] = ("constant", (lb, file, line, column))
 
-    ast.compile(scope, code)
+    # Reuses the code of the statements that did not change
+    codecache.compile_file(filename, contents, ast, scope, code)
     legacy_harmony.namestack.pop()
 
 
@@ -226,6 +235,7 @@ def do_compile(fname: str, consts: List[str], mods: List[str], interface: List[s
                 message="Usage: -m module=version to specify a module version"
             )
 
+    codecache.start(legacy_harmony.constants, legacy_harmony.modules)
     scope = Scope(None)
     scope.inherit = True
     code = Code()
@@ -1,60 +1,63 @@
 import sys
 import json
-from automata.fa.dfa import DFA
+from harmony_model_checker.harmony.dfa import IntDFA, inclusion_trace
 
-def parse(file):
+def parse(file, symbols):
     with open(file, encoding='utf-8') as f:
         js = json.load(f)
 
-        states = { "__error__": {} }
+        states = {}
+        values = {}
         initial_state = None
         final_states = set()
-        input_symbols = set()
-        transitions = { "__error__": {} }
 
         for s in js["nodes"]:
             idx = str(s["idx"])
             val = str(s["value"])
-            input_symbols.add(val)
-            transitions[idx] = {}
+            if val not in symbols:
+                symbols[val] = len(symbols)
+            states[idx] = len(states)
+            values[idx] = val
             if s["type"] == "initial":
                 assert initial_state == None
                 initial_state = idx;
             elif s["type"] == "terminal":
                 final_states.add(idx)
-            states[idx] = val
-
-        for s in states:
-            for x in input_symbols:
-                transitions[s][x] = "__error__"
+        if "__term__" not in symbols:
+            symbols["__term__"] = len(symbols)
 
+        src = []
+        symbol = []
+        dst = []
         for edge in js['edges']:
-            src = str(edge["src"])
-            dst = str(edge["dst"])
-            assert dst != initial_state
-            assert src not in final_states
-            if src != dst:
-                if dst in final_states:
+            s = str(edge["src"])
+            d = str(edge["dst"])
+            assert d != initial_state
+            assert s not in final_states
+            if s != d:
+                if d in final_states:
                     val = "__term__"
                 else:
-                    val = states[dst]
-                transitions[src][val] = dst
+                    val = values[d]
+                src.append(states[s])
+                symbol.append(symbols[val])
+                dst.append(states[d])
 
-    return DFA(
-        states=set(states.keys()),
-        input_symbols=input_symbols,
-        transitions=transitions,
-        initial_state=initial_state,
-        final_states=final_states
-    )
+    return IntDFA(len(states), states[initial_state],
+                    [ states[s] for s in final_states ], src, symbol, dst)
 
 def main():
+    symbols = {}
     print("DFA1")
-    dfa1 = parse(sys.argv[1])
+    dfa1 = parse(sys.argv[1], symbols)
     print("DFA2")
-    dfa2 = parse(sys.argv[2])
+    dfa2 = parse(sys.argv[2], symbols)
     print("CMP")
-    assert dfa1 <= dfa2
+    trace = inclusion_trace(dfa1, dfa2)
+    if trace is not None:
+        names = { v: k for k, v in symbols.items() }
+        print("not included:", [ names[s] for s in trace ])
+        sys.exit(1)
     print("DONE")
 
 if __name__ == "__main__":
@@ -1,427 +1,229 @@
-import subprocess
-import sys
 import json
+import subprocess
 
+from harmony_model_checker.harmony.dfa import read_hfa, is_equivalent, distinguishing_trace
 from harmony_model_checker.harmony.jsonstring import json_string
 
-try:
-    import pydot
-    got_pydot = True
-except Exception as e:
-    got_pydot = False
-
-try:
-    from automata.fa.nfa import NFA
-    from automata.fa.dfa import DFA
-    got_automata = True
-except Exception as e:
-    got_automata = False
-
-
-# an error state is a non-final state all of whose outgoing transitions
-# point only to itself
-def find_error_states(transitions, final_states):
-    error_states = set()
-    for s, d in transitions.items():
-        if s not in final_states and all(v == s for v in d.values()):
-            error_states.add(s)
-    return error_states
-
-def is_dfa_equivalent(dfa: DFA, hfa: DFA) -> bool:
-    stack = []
-
-    # Create states, where each state is renamed to an index to make each state unique
-    dfa_states = [(k, v) for k, v in enumerate(list(dfa.states))]
-    hfa_states = [(len(dfa_states) + k, v) for k, v in enumerate(list(hfa.states))]
-    states = dfa_states + hfa_states
-    n = len(states)
-
-    # For convenience for mapping between states and indices
-    idx_to_states = {k: v for k, v in states}
-    dfa_state_to_idx = {v: k for k, v in dfa_states}
-    hfa_state_to_idx = {v: k for k, v in hfa_states}
-
-    dfa_final_states = {k: v for k, v in dfa_states if v in dfa.final_states}
-    hfa_final_states = {k: v for k, v in hfa_states if v in hfa.final_states}
-    # Collection of final states, indexed by state idx
-    final_states = {**dfa_final_states, **hfa_final_states}
-
-    # Tree-implementation of sets of states
-    parents = [None] * n
-    rank = [None] * n
-    def make_set(q: int):
-        parents[q] = q
-        rank[q] = 0
-
-    def find_set(x):
-        if x != parents[x]:
-            parents[x] = find_set(parents[x])
-        return parents[x]
-
-    def link(x, y):
-        if rank[x] > rank[y]:
-            parents[y] = x
-        else:
-            parents[x] = y
-            if rank[x] == rank[y]:
-                rank[y] += 1
-
-    def union(p: int, q: int):
-        link(find_set(p), find_set(q))
-
-
-    # Create a set for each state in the 2 DFAs
-    for k, _ in states:
-        make_set(k)
-
-    # Union the two initial states
-    dfa_init_idx = dfa_state_to_idx[dfa.initial_state]
-    hfa_init_idx = hfa_state_to_idx[hfa.initial_state]
-    union(dfa_init_idx, hfa_init_idx)
-    stack.append((dfa_init_idx, hfa_init_idx))
-
-    # Traverse the stack
-    while stack:
-        k1, k2 = stack.pop()
-        q1, q2 = idx_to_states[k1], idx_to_states[k2]
-        dfa_t = dfa.transitions[q1]
-        hfa_t = hfa.transitions[q2]
-
-        # Check each common transitions
-        symbols = set(dfa_t.keys()).intersection(hfa_t.keys())
-        for s in symbols:
-            p1 = dfa_state_to_idx[dfa_t[s]]
-            p2 = hfa_state_to_idx[hfa_t[s]]
-
-            r1 = find_set(p1)
-            r2 = find_set(p2)
-            # If their sets are not equivalent, then combine them
-            if r1 != r2:
-                union(p1, p2)
-                stack.append((p1, p2))
-
-    # Create sets of sets of states
-    sets = dict()
-    for k, p in enumerate(parents):
-        if p in sets:
-            sets[p].add(k)
-        else:
-            sets[p] = {k}
-
-    # Check condition for DFA equivalence
-    return all(
-        all(q in final_states for q in s) or all(q not in final_states for q in s)
-        for s in sets.values()
-    )
-
-
-def read_hfa(file, dfa, nfa):
-    with open(file, encoding='utf-8') as fd:
-        js = json.load(fd)
-        initial = js["initial"]
-        states = { "{}" }
-        final = set()
-        symbols = set()
-        for e in js["edges"]:
-            symbol = json_string(e["symbol"])
-            symbols.add(symbol)
-        transitions = { "{}": { s: "{}" for s in symbols } }
-        for n in js["nodes"]:
-            idx = n["idx"]
-            states.add(idx)
-            if n["type"] == "final":
-                final.add(idx)
-            transitions[idx] = { s: "{}" for s in symbols }
-        for e in js["edges"]:
-            symbol = json_string(e["symbol"])
-            transitions[e["src"]][symbol] = e["dst"]
-
-    hfa = DFA(
-        states=states,
-        input_symbols=symbols,
-        transitions=transitions,
-        initial_state=initial,
-        final_states=final
-    )
-
-    print("Phase 7: comparing behaviors", len(dfa.states), len(hfa.states))
-    if len(dfa.states) == len(hfa.states):      # HACK
-        return                                  # HACK
-    if len(dfa.states) > 100 or len(hfa.states) > 100:
-        print("  warning: this could take a while")
-
-    assert dfa.input_symbols <= hfa.input_symbols
-    if dfa.input_symbols < hfa.input_symbols:
+def compare_behaviors(file, hfa):
+    """Compare the behavior in .hfa file hfa, computed by charm, with the
+    one specified in .hfa file file."""
+    symbols = {}
+    spec = read_hfa(file, symbols)
+    dfa = read_hfa(hfa, symbols)
+    names = { v: k for k, v in symbols.items() }
+
+    print("Phase 7: comparing behaviors", dfa.nstates, spec.nstates)
+    missing = spec.symbols() - dfa.symbols()
+    if missing:
         print("behavior warning: symbols missing from behavior:",
-            hfa.input_symbols - dfa.input_symbols)
-        return
-
-    if not is_dfa_equivalent(dfa, hfa):
-        print("behavior warning: not equivalent to specified behavior")
-        diff = hfa - dfa
-        behavior_show_diagram(diff, "diff.png")
+            { names[s] for s in missing })
 
-# Modified from automata-lib
-def behavior_show_diagram(dfa, path=None):
-    graph = pydot.Dot(graph_type='digraph', rankdir='LR')
-    nodes = {}
-    rename = {}
-    next_idx = 0
-    error_states = find_error_states(dfa.transitions, dfa.final_states)
-    for state in dfa.states:
-        if state in rename:
-            idx = rename[state]
-        else:
-            rename[state] = idx = next_idx
-            next_idx += 1
-        if state in error_states:
-            continue
-        if state == dfa.initial_state:
-            # color start state with green
-            if state in dfa.final_states:
-                initial_state_node = pydot.Node(
-                    str(idx),
-                    style='filled',
-                    peripheries=2,
-                    fillcolor='#66cc33', label="initial")
-            else:
-                initial_state_node = pydot.Node(
-                    str(idx), style='filled', fillcolor='#66cc33', label="initial")
-            nodes[state] = initial_state_node
-            graph.add_node(initial_state_node)
-        else:
-            if state in dfa.final_states:
-                state_node = pydot.Node(str(idx), peripheries=2, label="final")
-            else:
-                state_node = pydot.Node(str(idx), label="")
-            nodes[state] = state_node
-            graph.add_node(state_node)
-    # adding edges
-    for from_state, lookup in dfa.transitions.items():
-        for to_label, to_state in lookup.items():
-            if to_state not in error_states and to_label != "":
-                graph.add_edge(pydot.Edge(
-                    nodes[from_state],
-                    nodes[to_state],
-                    label=to_label
-                ))
-    if path:
-        try:
-            graph.write_png(path)
-        except FileNotFoundError:
-            print("install graphviz (www.graphviz.org) to see output DFAs")
-    return graph
-
-def eps_closure_rec(states, transitions, current, output):
-    if current in output:
-        return
-    output.add(current)
-    t = transitions[current]
-    if '' in t:
-        for s in t['']:
-            eps_closure_rec(states, transitions, s, output)
-
-def eps_closure(states, transitions, current):
-    x = set()
-    eps_closure_rec(states, transitions, current, x)
-    return frozenset(x)
-
-def behavior_parse(js, minify, outputfiles, behavior):
-    if outputfiles["hfa"] == None and outputfiles["png"] == None and outputfiles["gv"] == None and behavior == None:
+    if is_equivalent(dfa, spec):
         return
 
-    states = set()
-    initial_state = None;
-    final_states = set()
-    transitions = {}
-    labels = {}
-
-    for s in js["nodes"]:
-        idx = str(s["idx"])
-        transitions[idx] = {}
-        if s["type"] == "initial":
-            assert initial_state == None
-            initial_state = idx;
-            val = "__init__"
-        elif s["type"] == "terminal":
-            final_states.add(idx)
-        states.add(idx)
-
-    def add_edge(src, val, dst):
-        assert dst != initial_state
-        # assert src not in final_states
-        if val in transitions[src]:
-            transitions[src][val].add(dst)
-        else:
-            transitions[src][val] = {dst}
-
-    intermediate = 0
-    symbols = js['symbols']
-    input_symbols = { json_string(v) for v in symbols.values() }
-    labels = { json_string(v):v for v in symbols.values() }
-    for s in js['nodes']:
-        for [path, dsts] in s["transitions"]:
-            for dest_node in dsts:
-                src = str(s["idx"])
-                dst = str(dest_node)
-                if path == []:
-                    add_edge(src, "", dst)
-                else:
-                    for e in path[:-1]:
-                        symbol = json_string(symbols[str(e)])
-                        inter = "s%d"%intermediate
-                        intermediate += 1
-                        states.add(inter)
-                        transitions[inter] = {}
-                        add_edge(src, symbol, inter)
-                        src = inter
-                    e = path[-1]
-                    symbol = json_string(symbols[str(e)])
-                    add_edge(src, symbol, dst)
-
-    # print("states", states)
-    # print("initial", initial_state)
-    # print("final", final_states)
-    # print("symbols", input_symbols)
-    # print("transitions", transitions)
-
-    print("Phase 6: convert NFA (%d states) to DFA"%len(states))
-
-    if got_automata:
-        nfa = NFA(
-            states=states,
-            input_symbols=input_symbols,
-            transitions=transitions,
-            initial_state=initial_state,
-            final_states=final_states
-        )
-        intermediate = DFA.from_nfa(nfa)  # returns an equivalent DFA
-        if minify and len(final_states) != 0:
-            print("minify #states=%d"%len(intermediate.states))
-            dfa = intermediate.minify(retain_names = True)
-            print("minify done #states=%d"%len(dfa.states))
-        else:
-            dfa = intermediate
-        dfa_states = dfa.states
-        (dfa_transitions,) = dfa.transitions,
-        dfa_initial_state = dfa.initial_state
-        dfa_final_states = dfa.final_states
+    print("behavior warning: not equivalent to specified behavior")
+    trace = distinguishing_trace(dfa, spec)
+    if dfa.accepts(trace):
+        what = "output not in the specified behavior"
     else:
-        # Compute the epsilon closure for each state
-        eps_closures = { s:eps_closure(states, transitions, s) for s in states }
-
-        # Convert the NFA into a DFA
-        dfa_transitions = {}
-        dfa_initial_state = eps_closures[initial_state]
-        q = [dfa_initial_state]       # queue of states to handle
-        while q != []:
-            current = q.pop()
-            if current in dfa_transitions:
+        what = "specified output that is never produced"
+    print("  %s: [%s]"%(what, ", ".join(names[s] for s in trace)))
+
+def nfa_build(results):
+    """Build the NFA of the printed output from the (destuttered) graph in
+    the .hco file, as nfa_build() in charm/behavior.c does.  State 0 is the
+    initial state.  Return the final states, and for each state its empty
+    transitions (a list of states) and other transitions (a list of
+    (symbol, state) pairs)."""
+    nodes = sorted(results.nodes(), key=lambda n: n[2] != "initial")
+    state = { idx: q for q, (idx, _, _, _) in enumerate(nodes) }
+    final = { state[idx] for (idx, _, type, _) in nodes if type == "terminal" }
+    eps = [ [] for _ in nodes ]
+    moves = [ [] for _ in nodes ]
+    for (idx, _, _, transitions) in nodes:
+        src = state[idx]
+
+        # Print histories that have all but their last symbol in common
+        # share intermediate states
+        prefixes = {}
+        for (path, dsts) in transitions:
+            if path == []:
+                eps[src] += [ state[d] for d in dsts ]
                 continue
-            dfa_transitions[current] = {}
-            for symbol in input_symbols:
-                ec = set()
-                for nfa_state in current:
-                    if symbol in transitions[nfa_state]:
-                        for next in transitions[nfa_state][symbol]:
-                            ec |= eps_closures[next]
-                n = dfa_transitions[current][symbol] = frozenset(ec)
-                q.append(n)
-        dfa_states = set(dfa_transitions.keys())
-        dfa_final_states = set()
-        for dfa_state in dfa_states:
-            for nfa_state in dfa_state:
-                if nfa_state in final_states:
-                    dfa_final_states.add(dfa_state)
-        print("conversion done")
-    dfa_error_states = find_error_states(dfa_transitions, dfa_final_states)
-
+            q = src
+            if len(path) > 1:
+                key = tuple(path[:-1])
+                if key not in prefixes:
+                    for symbol in path[:-1]:
+                        eps.append([])
+                        moves.append([])
+                        moves[q].append((symbol, len(moves) - 1))
+                        q = len(moves) - 1
+                    prefixes[key] = q
+                q = prefixes[key]
+            moves[q] += [ (path[-1], state[d]) for d in dsts ]
+    return (final, eps, moves)
+
+def nfa_to_dfa(final, eps, moves):
+    """Subset construction.  Return the number of states, the final states,
+    and the transitions as (src, symbol, dst) triples.  State 0 is the
+    initial state, and missing transitions go to an error state."""
+    def closure(states):
+        result = set(states)
+        todo = list(states)
+        while todo:
+            for q in eps[todo.pop()]:
+                if q not in result:
+                    result.add(q)
+                    todo.append(q)
+        return frozenset(result)
+
+    sets = [ closure([0]) ]
+    index = { sets[0]: 0 }
+    edges = []
+    for (d, cur) in enumerate(sets):       # sets grows along the way
+        targets = {}
+        for q in cur:
+            for (symbol, dst) in moves[q]:
+                targets.setdefault(symbol, set()).add(dst)
+        for (symbol, dsts) in sorted(targets.items()):
+            next = closure(dsts)
+            if next not in index:
+                index[next] = len(sets)
+                sets.append(next)
+            edges.append((d, symbol, index[next]))
+    return (len(sets), { d for (d, cur) in enumerate(sets) if cur & final },
+                                                                    edges)
+
+def minimize(nstates, final, edges):
+    """Minimize a DFA with missing transitions.  The states from which no
+    final state can be reached are left out, as they are equivalent to the
+    error state, and the others are merged by partition refinement.  Return
+    the DFA in the same form."""
+    preds = [ [] for _ in range(nstates) ]
+    for (src, _, dst) in edges:
+        preds[dst].append(src)
+    live = set(final)
+    todo = list(final)
+    while todo:
+        for q in preds[todo.pop()]:
+            if q not in live:
+                live.add(q)
+                todo.append(q)
+    live.add(0)
+    edges = [ e for e in edges if e[0] in live and e[2] in live ]
+    out = { q: [] for q in live }
+    for (src, symbol, dst) in edges:
+        out[src].append((symbol, dst))
+
+    block = { q: int(q in final) for q in live }
+    nblocks = 0
+    while True:
+        signature = { q: (block[q], tuple((s, block[d]) for (s, d) in out[q]))
+                                                                for q in live }
+        names = {}
+        for q in sorted(live):          # so that state 0 stays in block 0
+            names.setdefault(signature[q], len(names))
+        block = { q: names[signature[q]] for q in live }
+        if len(names) == nblocks:
+            break
+        nblocks = len(names)
+    return (nblocks, { block[q] for q in final },
+            sorted({ (block[src], s, block[dst]) for (src, s, dst) in edges }))
+
+def remove_error_states(nstates, final, edges):
+    """Without final states the DFA is not minimized.  Leave out the error
+    states: non-final states all of whose transitions lead to themselves."""
+    nsymbols = len({ s for (_, s, _) in edges })
+    loops = [ 0 ] * nstates
+    for (src, _, dst) in edges:
+        if src == dst:
+            loops[src] += 1
+    keep = [ q for q in range(nstates)
+                    if q == 0 or q in final or loops[q] != nsymbols ]
+    name = { q: i for (i, q) in enumerate(keep) }
+    return (len(keep), { name[q] for q in final },
+            [ (name[src], s, name[dst]) for (src, s, dst) in edges
+                                            if src in name and dst in name ])
+
+def write_hfa(file, nstates, final, edges, symbols):
+    with open(file, "w", encoding='utf-8') as fd:
+        print("{", file=fd)
+        print("  \"initial\": \"0\",", file=fd)
+        print("  \"nodes\": [", file=fd)
+        for q in range(nstates):
+            print("    {", file=fd)
+            print("      \"idx\": \"%d\","%q, file=fd)
+            print("      \"type\": \"%s\""%("final" if q in final else "normal"), file=fd)
+            print("    }" + ("," if q + 1 < nstates else ""), file=fd)
+        print("  ],", file=fd)
+        print("  \"edges\": [", file=fd)
+        for (i, (src, symbol, dst)) in enumerate(edges):
+            print("    {", file=fd)
+            print("      \"src\": \"%d\","%src, file=fd)
+            print("      \"dst\": \"%d\","%dst, file=fd)
+            print("      \"symbol\": %s"%json.dumps(symbols[str(symbol)], ensure_ascii=False), file=fd)
+            print("    }" + ("," if i + 1 < len(edges) else ""), file=fd)
+        print("  ]", file=fd)
+        print("}", file=fd)
+
+def write_gv(file, nstates, final, edges, symbols):
+    with open(file, "w", encoding='utf-8') as fd:
+        print("digraph {", file=fd)
+        print("  rankdir = \"LR\"", file=fd)
+        for q in range(nstates):
+            if q == 0:
+                print("  s0 [label=\"initial\",style=filled,%sfillcolor=\"#66cc33\"]"%("peripheries=2," if q in final else ""), file=fd)
+            elif q in final:
+                print("  s%d [peripheries=2,label=\"final\"]"%q, file=fd)
+            else:
+                print("  s%d [label=\"\"]"%q, file=fd)
+        for (src, symbol, dst) in edges:
+            label = json.dumps(json_string(symbols[str(symbol)]), ensure_ascii=False)
+            print("  s%d -> s%d [label=%s]"%(src, dst, label), file=fd)
+        print("}", file=fd)
+
+def behavior_write(results, outputfiles):
+    """Compute the behavior from the graph in the .hco file and write the
+    .hfa and .gv files, as charm does when it runs (see behavior_write() in
+    charm/behavior.c).  Used when harmony is given a .hco file."""
+    (final, eps, moves) = nfa_build(results)
+    print("Phase 6: convert NFA (%d states) to DFA"%len(moves))
+    (nstates, final, edges) = nfa_to_dfa(final, eps, moves)
+    if final:
+        (nstates, final, edges) = minimize(nstates, final, edges)
+    else:
+        (nstates, final, edges) = remove_error_states(nstates, final, edges)
+    symbols = results.symbols()
     if outputfiles["hfa"] != None:
-        with open(outputfiles["hfa"], "w", encoding='utf-8') as fd:
-            names = {}
-            for (idx, s) in enumerate(dfa_states):
-                names[s] = idx
-            print("{", file=fd)
-            print("  \"initial\": \"%s\","%names[dfa_initial_state], file=fd)
-            print("  \"nodes\": [", file=fd)
-            first = True
-            for s in dfa_states:
-                if s in dfa_error_states:
-                    continue
-                if first:
-                    first = False
-                else:
-                    print(",", file=fd)
-                print("    {", file=fd)
-                print("      \"idx\": \"%s\","%names[s], file=fd)
-                if s in dfa_final_states:
-                    t = "final"
-                else:
-                    t = "normal"
-                print("      \"type\": \"%s\""%t, file=fd)
-                print("    }", end="", file=fd)
-            print(file=fd)
-            print("  ],", file=fd)
-
-            print("  \"edges\": [", file=fd)
-            first = True
-            for (src, edges) in dfa_transitions.items():
-                for (input, dst) in edges.items():
-                    if dst not in dfa_error_states:
-                        if first:
-                            first = False
-                        else:
-                            print(",", file=fd)
-                        print("    {", file=fd)
-                        print("      \"src\": \"%s\","%names[src], file=fd)
-                        print("      \"dst\": \"%s\","%names[dst], file=fd)
-                        print("      \"symbol\": %s"%json.dumps(labels[input], ensure_ascii=False), file=fd)
-                        print("    }", end="", file=fd)
-            print(file=fd)
-            print("  ]", file=fd)
+        write_hfa(outputfiles["hfa"], nstates, final, edges, symbols)
+    if outputfiles["gv"] != None:
+        write_gv(outputfiles["gv"], nstates, final, edges, symbols)
 
-            print("}", file=fd)
+# charm computes the DFA of the printed output and writes the .hfa and .gv
+# files (harmony passes it -Xhfa and -Xgv).  What is left here is making
+# the picture and comparing against a specified behavior, unless harmony
+# was given a .hco file (from_hco), in which case charm did not run.
+def behavior_parse(results, outputfiles, behavior, from_hco=False):
+    if outputfiles["hfa"] == None and outputfiles["png"] == None and outputfiles["gv"] == None and behavior == None:
+        return
 
-    if outputfiles["gv"] != None:
-        with open(outputfiles["gv"], "w", encoding='utf-8') as fd:
-            names = {}
-            for (idx, s) in enumerate(dfa_states):
-                names[s] = idx
-            print("digraph {", file=fd)
-            print("  rankdir = \"LR\"", file=fd)
-            for s in dfa_states:
-                if s in dfa_error_states:
-                    continue
-                if s == dfa_initial_state:
-                    if s in dfa_final_states:
-                        print("  s%s [label=\"initial\",style=filled,peripheries=2,fillcolor=\"#66cc33\"]"%names[s], file=fd)
-                    else:
-                        print("  s%s [label=\"initial\",style=filled,fillcolor=\"#66cc33\"]"%names[s], file=fd)
-                else:
-                    if s in dfa_final_states:
-                        print("  s%s [peripheries=2,label=\"final\"]"%names[s], file=fd)
-                    else:
-                        print("  s%s [label=\"\"]"%names[s], file=fd)
+    # With hash compaction, bitstate, or disk mode (or when a memory budget
+    # ran low) the state graph is not kept
+    if not results.has_graph():
+        print("No behavior: state graph not recorded (-Xhashcompact, -Xbitstate, -Xdisk, or -Xmem)")
+        return
 
-            for (src, edges) in dfa_transitions.items():
-                for (input, dst) in edges.items():
-                    if dst not in dfa_error_states:
-                        print("  s%s -> s%s [label=%s]"%(names[src], names[dst], json.dumps(input, ensure_ascii=False)), file=fd)
-            print("}", file=fd)
+    if from_hco:
+        behavior_write(results, outputfiles)
 
     if outputfiles["png"] != None:
-        if got_pydot and got_automata:
-            behavior_show_diagram(dfa, path=outputfiles["png"])
-        else:
-            assert outputfiles["gv"] != None
-            try:
-                subprocess.run(["dot", "-Tpng", "-o", outputfiles["png"],
-                                outputfiles["gv"] ])
-            except FileNotFoundError:
-                print("install graphviz (www.graphviz.org) to see output DFAs")
+        assert outputfiles["gv"] != None
+        try:
+            subprocess.run(["dot", "-Tpng", "-o", outputfiles["png"],
+                            outputfiles["gv"] ])
+        except FileNotFoundError:
+            print("install graphviz (www.graphviz.org) to see output DFAs")
 
     if behavior != None:
-        if got_automata:
-            read_hfa(behavior, dfa, nfa)
-        else:
-            print("Can't check behavior subset because automata-lib is not available")
+        compare_behaviors(behavior, outputfiles["hfa"])
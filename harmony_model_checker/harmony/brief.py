@@ -129,19 +129,19 @@ class Brief:
                 self.failure = self.lastmis["failure"]
             self.interrupted = "interrupt" in self.lastmis and self.lastmis["interrupt"] == "True"
 
-    def run(self, outputfiles, behavior):
-        with open(outputfiles["hco"], encoding='utf-8') as f:
-            print("Phase 5: loading", outputfiles["hco"])
-            top = json.load(f)
-            assert isinstance(top, dict)
-            if top["issue"] == "No issues":
-                behavior_parse(top, True, outputfiles, behavior)
-                return True
+    def run(self, results, outputfiles, behavior, from_hco=False):
+        print("Phase 5: loading", outputfiles["hco"])
+        # Without a counterexample there is nothing to explain, but the
+        # issue may say that not everything was checked
+        if results.macrosteps() is None:
+            behavior_parse(results, outputfiles, behavior, from_hco)
+            return True
 
-            # print("Issue:", top["issue"])
-            assert isinstance(top["macrosteps"], list)
-            for mes in top["macrosteps"]:
-                self.print_macrostep(mes)
-            self.flush()
-            print(self.failure)
-            return False
+        # print("Issue:", results.issue())
+        macrosteps = results.macrosteps()
+        assert isinstance(macrosteps, list)
+        for mes in macrosteps:
+            self.print_macrostep(mes)
+        self.flush()
+        print(self.failure)
+        return False
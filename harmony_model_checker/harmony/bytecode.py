@@ -0,0 +1,93 @@
+"""
+    Binary format of .hvm files.
+
+    A .hvm file holds the same information as the JSON format (labels, code,
+    pretty, locations), but as a sequence of little-endian 32-bit words so
+    that charm can map it into memory and use it in place.  Every string in
+    the file is stored once, in a constant pool, and referred to by its index.
+
+    header:     "HVMB" version nstrings nops ncode nlabels nlocations
+    strings:    nstrings x (length, bytes padded to a multiple of 4)
+    ops:        nops x string       (the names of the ops used)
+    labels:     nlabels x (string, pc)
+    code:       ncode x (op, value)  (value is the map of the op arguments)
+    pretty:     ncode x (string, string)
+    locations:  nlocations x (pc, file string, line, code string)
+
+    A value is a single word, with the type in the low 2 bits.  For an atom
+    the rest is the string index.  A list of n elements is followed by the n
+    values, and a map of n entries is followed by n (key string, value) pairs.
+"""
+
+import struct
+
+HVM_MAGIC = b"HVMB"
+HVM_VERSION = 1
+
+HVM_ATOM = 0
+HVM_LIST = 1
+HVM_MAP = 2
+
+class BytecodeWriter:
+    def __init__(self):
+        self.strings = {}
+        self.words = []
+
+    def string(self, s):
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        return idx
+
+    def value(self, v):
+        if type(v) is str:
+            self.words.append((self.string(v) << 2) | HVM_ATOM)
+        elif type(v) is dict:
+            self.words.append((len(v) << 2) | HVM_MAP)
+            for k, x in v.items():
+                self.words.append(self.string(k))
+                self.value(x)
+        elif type(v) is list:
+            self.words.append((len(v) << 2) | HVM_LIST)
+            for x in v:
+                self.value(x)
+        else:
+            # charm reads a number as an atom, as it does in the JSON format
+            self.words.append((self.string(str(v)) << 2) | HVM_ATOM)
+
+    def write(self, f, labels, code, pretty, locations):
+        """Write a .hvm file to binary file f.  labels maps label names to
+        pcs, code is a list of op maps (see Op.jmap()), pretty a list
+        of (text, explanation) pairs, and locations a list of
+        (pc, file, line, code) tuples."""
+        ops = {}
+        oplist = []
+        for args in code:
+            name = args["op"]
+            if name not in ops:
+                ops[name] = len(oplist)
+                oplist.append(self.string(name))
+        labelwords = []
+        for k, pc in labels.items():
+            labelwords += [ self.string(k), pc ]
+        for args in code:
+            self.words.append(ops[args["op"]])
+            self.value({ k: v for k, v in args.items() if k != "op" })
+        for (text, explain) in pretty:
+            self.words += [ self.string(text), self.string(explain) ]
+        for (pc, file, line, src) in locations:
+            self.words += [ pc, self.string(file), line, self.string(src) ]
+
+        pool = []
+        for s in self.strings:
+            b = s.encode("utf-8")
+            pool.append(struct.pack("<I", len(b)))
+            pool.append(b + b"\0" * (-len(b) % 4))
+
+        f.write(HVM_MAGIC)
+        f.write(struct.pack("<6I", HVM_VERSION, len(self.strings),
+                len(oplist), len(code), len(labels), len(locations)))
+        f.write(b"".join(pool))
+        f.write(struct.pack("<%dI"%len(oplist), *oplist))
+        f.write(struct.pack("<%dI"%len(labelwords), *labelwords))
+        f.write(struct.pack("<%dI"%len(self.words), *self.words))
@@ -0,0 +1,211 @@
+"""
+    DFAs over integer arrays, for comparing behaviors.
+
+    The states of an IntDFA are numbered 0..n-1 and its symbols are small
+    integers (see read_hfa for how symbols are numbered so that two DFAs
+    can be compared).  The transitions of state q are
+    symbol[first[q]:first[q+1]] and dst[first[q]:first[q+1]], sorted by
+    symbol.  A missing transition goes to an implicit error state, written
+    -1, which is not final and has no transitions.
+
+    is_equivalent() is the algorithm of Hopcroft and Karp: it merges the
+    pairs of states reached by the same input in a union-find structure and
+    takes near-linear time.  distinguishing_trace() and inclusion_trace()
+    search the product of the two DFAs breadth-first, so that they return a
+    shortest trace.
+"""
+
+import json
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from harmony_model_checker.harmony.jsonstring import json_string
+
+try:
+    import numpy
+    got_numpy = True
+except Exception as e:
+    got_numpy = False
+
+class IntDFA:
+    def __init__(self, nstates, initial, final, src, symbol, dst):
+        """final is a collection of final states, and src, symbol, and dst
+        are equally long sequences that describe the transitions.  If there
+        are two transitions for the same state and symbol, the last one
+        counts."""
+        self.nstates = nstates
+        self.initial = initial
+        self.final = bytearray(nstates)
+        for q in final:
+            self.final[q] = 1
+
+        # Order the transitions by state and symbol, keeping the last one
+        # of duplicates
+        n = len(src)
+        if got_numpy and n > 0:
+            src = numpy.asarray(src, dtype=numpy.int64)
+            symbol = numpy.asarray(symbol, dtype=numpy.int64)
+            dst = numpy.asarray(dst, dtype=numpy.int64)
+            order = numpy.lexsort((-numpy.arange(n), symbol, src))
+            src, symbol, dst = src[order], symbol[order], dst[order]
+            keep = numpy.ones(n, dtype=bool)
+            keep[1:] = (src[1:] != src[:-1]) | (symbol[1:] != symbol[:-1])
+            src, symbol, dst = src[keep], symbol[keep], dst[keep]
+            first = numpy.zeros(nstates + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(src, minlength=nstates), out=first[1:])
+            self.first = array("l", first.tolist())
+            self.symbol = array("l", symbol.tolist())
+            self.dst = array("l", dst.tolist())
+        else:
+            order = sorted(range(n), key=lambda t: (src[t], symbol[t], -t))
+            self.first = array("l", [0] * (nstates + 1))
+            self.symbol = array("l")
+            self.dst = array("l")
+            last = None
+            for t in order:
+                if (src[t], symbol[t]) == last:
+                    continue
+                last = (src[t], symbol[t])
+                self.first[src[t] + 1] += 1
+                self.symbol.append(symbol[t])
+                self.dst.append(dst[t])
+            for q in range(nstates):
+                self.first[q + 1] += self.first[q]
+
+    def is_final(self, q):
+        return q >= 0 and self.final[q] != 0
+
+    def step(self, q, symbol):
+        """The state after symbol in state q, or -1."""
+        if q < 0:
+            return -1
+        lo, hi = self.first[q], self.first[q + 1]
+        i = bisect_left(self.symbol, symbol, lo, hi)
+        return self.dst[i] if i < hi and self.symbol[i] == symbol else -1
+
+    def accepts(self, trace):
+        q = self.initial
+        for symbol in trace:
+            q = self.step(q, symbol)
+        return self.is_final(q)
+
+    def symbols(self):
+        """The set of symbols that have transitions."""
+        return set(self.symbol)
+
+def _successors(a, p, b, q):
+    """Iterate over (symbol, p', q') for the symbols of state p of a and
+    state q of b.  One of p' and q' may be the error state (-1)."""
+    i, i_end = (a.first[p], a.first[p + 1]) if p >= 0 else (0, 0)
+    j, j_end = (b.first[q], b.first[q + 1]) if q >= 0 else (0, 0)
+    asym, adst, bsym, bdst = a.symbol, a.dst, b.symbol, b.dst
+    while i < i_end or j < j_end:
+        if j == j_end or (i < i_end and asym[i] < bsym[j]):
+            yield (asym[i], adst[i], -1)
+            i += 1
+        elif i == i_end or bsym[j] < asym[i]:
+            yield (bsym[j], -1, bdst[j])
+            j += 1
+        else:
+            yield (asym[i], adst[i], bdst[j])
+            i += 1
+            j += 1
+
+def is_equivalent(a, b):
+    """Check if a and b accept the same language (Hopcroft-Karp)."""
+    # The error states are a.nstates and b's at the end
+    offset = a.nstates + 1
+    parent = array("l", range(offset + b.nstates + 1))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    todo = deque([ (a.initial, b.initial) ])
+    parent[a.initial] = offset + b.initial
+    while todo:
+        (p, q) = todo.popleft()
+        if a.is_final(p) != b.is_final(q):
+            return False
+        for (_, p2, q2) in _successors(a, p, b, q):
+            x = find(p2 if p2 >= 0 else a.nstates)
+            y = find(offset + (q2 if q2 >= 0 else b.nstates))
+            if x != y:
+                parent[x] = y
+                todo.append((p2, q2))
+    return True
+
+def _product_search(a, b, bad, prune):
+    """Search the product of a and b breadth-first for a pair of states
+    (p, q) for which bad(p, q) holds, not going past pairs for which
+    prune(p, q) holds.  Return the symbols of a shortest path to such a
+    pair, or None."""
+    width = b.nstates + 1
+    start = (a.initial + 1) * width + b.initial + 1
+    parent = { start: None }
+    todo = deque([ (a.initial, b.initial) ])
+    while todo:
+        (p, q) = todo.popleft()
+        if bad(p, q):
+            trace = []
+            k = (p + 1) * width + q + 1
+            while parent[k] is not None:
+                (k, s) = parent[k]
+                trace.append(s)
+            trace.reverse()
+            return trace
+        k = (p + 1) * width + q + 1
+        for (s, p2, q2) in _successors(a, p, b, q):
+            if prune(p2, q2):
+                continue
+            k2 = (p2 + 1) * width + q2 + 1
+            if k2 not in parent:
+                parent[k2] = (k, s)
+                todo.append((p2, q2))
+    return None
+
+def distinguishing_trace(a, b):
+    """Return a shortest trace accepted by one of a and b but not the
+    other, or None if they are equivalent."""
+    return _product_search(a, b,
+        lambda p, q: a.is_final(p) != b.is_final(q),
+        lambda p, q: p < 0 and q < 0)
+
+def inclusion_trace(a, b):
+    """Return a shortest trace accepted by a but not by b, or None if the
+    language of a is included in that of b."""
+    return _product_search(a, b,
+        lambda p, q: a.is_final(p) and not b.is_final(q),
+        lambda p, q: p < 0)
+
+def read_hfa(file, symbols):
+    """Read a .hfa file into an IntDFA.  symbols maps the symbols (in the
+    form of json_string) to their numbers, and is extended with the new
+    ones, so that DFAs read with the same map can be compared."""
+    with open(file, encoding='utf-8') as fd:
+        js = json.load(fd)
+
+    states = {}
+    def state(idx):
+        if idx not in states:
+            states[idx] = len(states)
+        return states[idx]
+
+    initial = state(js["initial"])
+    final = [ state(n["idx"]) for n in js["nodes"] if n["type"] == "final" ]
+    for n in js["nodes"]:
+        state(n["idx"])
+    src = []
+    symbol = []
+    dst = []
+    for e in js["edges"]:
+        s = json_string(e["symbol"])
+        if s not in symbols:
+            symbols[s] = len(symbols)
+        src.append(state(e["src"]))
+        symbol.append(symbols[s])
+        dst.append(state(e["dst"]))
+    return IntDFA(len(states), initial, final, src, symbol, dst)
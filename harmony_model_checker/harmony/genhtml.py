@@ -19,10 +19,6 @@ class GenHTML:
         self.style = (self_dir / "charm.css").read_text()
         self.js = (self_dir / "charm.js").read_text()
 
-    def file_include(self, name, f):
-        with open(name, encoding='utf-8') as g:
-            print(g.read(), file=f)
-
     def html_megastep(self, step, tid, name, nmicrosteps, width, f):
         print("<tr id='mes%d'>"%(step-1), file=f)
         print("  <td align='right'>", file=f)
@@ -278,7 +274,7 @@ class GenHTML:
         print(file=f)
         print("];", file=f)
         print("var state =", file=f)
-        self.file_include(outputfiles["hco"], f)
+        json.dump(self.top, f, ensure_ascii=False)
         print(";", file=f)
         print(self.js, file=f)
         # file_include("charm.js", f)
@@ -339,29 +335,28 @@ class GenHTML:
                 d[k] = val
         self.dict_merge(vardir, d)
 
-    def run(self, outputfiles):
+    def run(self, results, outputfiles):
         # First figure out how many megasteps there are and how many threads
         lasttid = -1
-        with open(outputfiles["hco"], encoding='utf-8') as f:
-            self.top = json.load(f)
-            assert isinstance(self.top, dict)
-            if "macrosteps" in self.top:
-                macrosteps = self.top["macrosteps"]
-                for mas in macrosteps:
-                    tid = int(mas["tid"])
+        # The page does not use the graph
+        self.top = results.page()
+        if "macrosteps" in self.top:
+            macrosteps = self.top["macrosteps"]
+            for mas in macrosteps:
+                tid = int(mas["tid"])
+                if tid >= self.nthreads:
+                    self.nthreads = tid + 1
+                if tid != lasttid:
+                    self.nmegasteps += 1
+                    lasttid = tid
+                self.nmicrosteps += len(mas["microsteps"])
+                for mis in mas["microsteps"]:
+                    if "shared" in mis:
+                        self.vars_add(self.vardir, mis["shared"])
+                for ctx in mas["contexts"]:
+                    tid = int(ctx["tid"])
                     if tid >= self.nthreads:
                         self.nthreads = tid + 1
-                    if tid != lasttid:
-                        self.nmegasteps += 1
-                        lasttid = tid
-                    self.nmicrosteps += len(mas["microsteps"])
-                    for mis in mas["microsteps"]:
-                        if "shared" in mis:
-                            self.vars_add(self.vardir, mis["shared"])
-                    for ctx in mas["contexts"]:
-                        tid = int(ctx["tid"])
-                        if tid >= self.nthreads:
-                            self.nthreads = tid + 1
 
         with open(outputfiles["htm"], "w", encoding='utf-8') as out:
             self.html(out, outputfiles)
@@ -56,6 +56,7 @@ from harmony_model_checker.harmony.scope import *
 from harmony_model_checker.harmony.state import *
 from harmony_model_checker.harmony.ops import *
 from harmony_model_checker.harmony.bag_util import *
+from harmony_model_checker.harmony.bytecode import BytecodeWriter
 from harmony_model_checker.exception import HarmonyCompilerError
 from harmony_model_checker import __version__
 
@@ -1238,6 +1239,21 @@ def dumpCode(printCode, code, scope, f=sys.stdout):
         print("  }", file=f)
         print("}", file=f)
 
+def dumpBinaryCode(code, scope, f):
+    """Write the code to binary file f in the binary .hvm format (see
+    bytecode.py).  dumpCode("json", ...) writes the same in JSON."""
+    labels = dict(scope.labels)
+    labels["__end__"] = len(code.labeled_ops)
+    ops = [ lop.op for lop in code.labeled_ops ]
+    locations = []
+    for pc, lop in enumerate(code.labeled_ops):
+        if lop.file != None:
+            locations.append((pc, lop.file, lop.line, files[lop.file][lop.line-1]))
+    BytecodeWriter().write(f, labels,
+        [ op.jmap() for op in ops ],
+        [ (str(op), op.explain()) for op in ops ],
+        locations)
+
 tladefs = """-------- MODULE Harmony --------
 EXTENDS Integers, FiniteSets, Bags, Sequences, TLC
 
@@ -0,0 +1,255 @@
+"""
+    Reading .hco files.
+
+    charm writes the .hco file either in JSON (charm -Xjson, harmony
+    --hco-json) or in a binary format that consists of sections (see
+    charm/hco.h): the issue, the symbols, the graph, the counterexample,
+    and the code.  HcoReader finds the sections without reading them, so
+    that, for example, the counterexample can be read without loading the
+    graph.
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+
+HCO_MAGIC = b"HCOB"
+HCO_VERSION = 1
+HCO_END = "END "
+
+NODE_TYPES = [ "normal", "initial", "terminal" ]
+
+def is_binary_hco(file):
+    with open(file, "rb") as f:
+        return f.read(4) == HCO_MAGIC
+
+def _words(data):
+    a = array("I")
+    assert a.itemsize == 4
+    a.frombytes(data)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+class HcoReader:
+    def __init__(self, file):
+        self.file = file
+        self.f = open(file, "rb")
+        if self.f.read(4) != HCO_MAGIC:
+            self.f.close()
+            raise ValueError("%s: not a binary .hco file"%file)
+        (version,) = struct.unpack("<I", self.f.read(4))
+        if version != HCO_VERSION:
+            self.f.close()
+            raise ValueError("%s: .hco version %d not supported"%(file, version))
+
+        # Find the sections
+        self.sections = {}
+        while True:
+            hdr = self.f.read(12)
+            if len(hdr) < 12:
+                self.f.close()
+                raise ValueError("%s: truncated .hco file"%file)
+            tag = hdr[:4].decode("ascii")
+            (length,) = struct.unpack_from("<Q", hdr, 4)
+            if tag == HCO_END:
+                break
+            self.sections[tag] = (self.f.tell(), length)
+            self.f.seek(length, os.SEEK_CUR)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def section(self, tag):
+        """Return the contents of the given section, or None if absent."""
+        if tag not in self.sections:
+            return None
+        (offset, length) = self.sections[tag]
+        self.f.seek(offset)
+        data = self.f.read(length)
+        if len(data) != length:
+            raise ValueError("%s: truncated .hco file"%self.file)
+        return data
+
+    def issue(self):
+        return self.section("ISSU").decode("utf-8")
+
+    def stats(self):
+        data = self.section("STAT")
+        return {} if data is None else json.loads(data)
+
+    def has_graph(self):
+        return "GRPH" in self.sections
+
+    def symbols(self):
+        data = self.section("SYMB")
+        if data is None:
+            return None
+        (n,) = struct.unpack_from("<I", data, 0)
+        offset = 4
+        symbols = {}
+        for _ in range(n):
+            (id, length) = struct.unpack_from("<II", data, offset)
+            offset += 8
+            symbols[str(id)] = json.loads(data[offset:offset+length])
+            offset += length
+        return symbols
+
+    def graph(self):
+        """The graph section as an array of words, or None."""
+        data = self.section("GRPH")
+        return None if data is None else _words(data)
+
+    @staticmethod
+    def iter_nodes(w):
+        """Iterate over the nodes in graph w as (idx, component, type,
+        transitions) tuples, where transitions is a list of
+        [symbols, destinations] pairs."""
+        i = 1
+        for _ in range(w[0]):
+            (idx, component, type, ntransitions) = w[i:i+4]
+            i += 4
+            transitions = []
+            for _ in range(ntransitions):
+                n = w[i]
+                path = w[i+1:i+1+n].tolist()
+                i += n + 1
+                n = w[i]
+                transitions.append([ path, w[i+1:i+1+n].tolist() ])
+                i += n + 1
+            yield (idx, component, NODE_TYPES[type], transitions)
+
+    def nodes(self):
+        """The nodes of the graph, in the form of the JSON format."""
+        w = self.graph()
+        if w is None:
+            return None
+        return [ { "idx": idx, "component": component,
+                   "transitions": transitions, "type": type }
+            for (idx, component, type, transitions) in self.iter_nodes(w) ]
+
+    def macrosteps(self):
+        """The counterexample, or None if there is no issue."""
+        data = self.section("CEXM")
+        return None if data is None else json.loads(data)
+
+    def code(self):
+        """A map with the code, explain, and locations entries."""
+        return json.loads(self.section("CODE"))
+
+    def to_json(self, graph=True):
+        """Return the contents in the form of the JSON format.  Leave out
+        the symbols and nodes if graph is False."""
+        top = self.stats()
+        top["issue"] = self.issue()
+        if graph and self.has_graph():
+            top["symbols"] = self.symbols()
+            top["nodes"] = self.nodes()
+        macrosteps = self.macrosteps()
+        if macrosteps is not None:
+            top["macrosteps"] = macrosteps
+        top.update(self.code())
+        return top
+
+def read_hco(file, graph=True):
+    """Read a .hco file in either format and return it in the form of the
+    JSON format (see HcoReader.to_json)."""
+    if is_binary_hco(file):
+        with HcoReader(file) as r:
+            return r.to_json(graph)
+    with open(file, encoding='utf-8') as f:
+        top = json.load(f)
+    if not graph:
+        top.pop("symbols", None)
+        top.pop("nodes", None)
+    return top
+
+class Results:
+    """The results of a model checking run, shared by the consumers of the
+    .hco file (Brief, GenHTML, behavior_parse).  Each part is read from the
+    file when first used, and only once.  For the binary format only the
+    sections that are used are read.  A JSON file is parsed as a whole."""
+
+    def __init__(self, file):
+        self.file = file
+        self.reader = HcoReader(file) if is_binary_hco(file) else None
+        self.top = None         # the contents of a JSON file
+        self.cache = {}
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+
+    def contents(self):
+        if self.top is None:
+            with open(self.file, encoding='utf-8') as f:
+                self.top = json.load(f)
+            assert isinstance(self.top, dict)
+        return self.top
+
+    def get(self, key, read):
+        if key not in self.cache:
+            self.cache[key] = read()
+        return self.cache[key]
+
+    def issue(self):
+        if self.reader is None:
+            return self.contents()["issue"]
+        return self.get("issue", self.reader.issue)
+
+    def macrosteps(self):
+        """The counterexample, or None if there is no issue."""
+        if self.reader is None:
+            return self.contents().get("macrosteps")
+        return self.get("macrosteps", self.reader.macrosteps)
+
+    def code(self):
+        """A map with the code, explain, and locations entries."""
+        if self.reader is None:
+            top = self.contents()
+            return { k: top[k] for k in [ "code", "explain", "locations" ] }
+        return self.get("code", self.reader.code)
+
+    def stats(self):
+        if self.reader is None:
+            top = self.contents()
+            return { k: top[k] for k in [ "omission_probability", "swarm" ]
+                                                                if k in top }
+        return self.get("stats", self.reader.stats)
+
+    def has_graph(self):
+        if self.reader is None:
+            return "nodes" in self.contents()
+        return self.reader.has_graph()
+
+    def symbols(self):
+        if self.reader is None:
+            return self.contents()["symbols"]
+        return self.get("symbols", self.reader.symbols)
+
+    def nodes(self):
+        """Iterate over the nodes of the graph as (idx, component, type,
+        transitions) tuples (see HcoReader.iter_nodes)."""
+        if self.reader is None:
+            for s in self.contents()["nodes"]:
+                yield (s["idx"], s["component"], s["type"], s["transitions"])
+        else:
+            yield from HcoReader.iter_nodes(self.get("graph", self.reader.graph))
+
+    def page(self):
+        """The parts used by the web page: everything but the graph."""
+        top = dict(self.stats())
+        top["issue"] = self.issue()
+        macrosteps = self.macrosteps()
+        if macrosteps is not None:
+            top["macrosteps"] = macrosteps
+        top.update(self.code())
+        return top
@@ -1,3 +1,4 @@
+import json
 import math
 from harmony_model_checker.harmony.value import *
 from harmony_model_checker.harmony.bag_util import *
@@ -15,8 +16,11 @@ class Op:
     def use(self):      # set of local variables used by this op
         return set()
 
+    def jmap(self):     # the op and its arguments, as in the JSON .hvm format
+        return { "op": "XXX %s"%str(self) }
+
     def jdump(self):
-        return '{ "op": "XXX %s" }'%str(self)
+        return json.dumps(self.jmap(), ensure_ascii=False)
 
     def tladump(self):
         return 'Skip(self, "%s")'%self
@@ -92,8 +96,8 @@ class SetIntLevelOp(Op):
     def __repr__(self):
         return "SetIntLevel"
 
-    def jdump(self):
-        return '{ "op": "SetIntLevel" }'
+    def jmap(self):
+        return { "op": "SetIntLevel" }
 
     def tladump(self):
         return 'OpSetIntLevel(self)'
@@ -127,11 +131,11 @@ class CutOp(Op):
         else:
             return self.lvars(self.value) | self.lvars(self.key)
 
-    def jdump(self):
+    def jmap(self):
         if self.key == None:
-            return '{ "op": "Cut", "value": "%s" }'%(self.convert(self.value))
+            return { "op": "Cut", "value": self.convert(self.value) }
         else:
-            return '{ "op": "Cut", "key": "%s", "value": "%s" }'%(self.convert(self.key), self.convert(self.value))
+            return { "op": "Cut", "key": self.convert(self.key), "value": self.convert(self.value) }
 
     def tladump(self):
         if self.key == None:
@@ -181,8 +185,8 @@ class SplitOp(Op):
     def __repr__(self):
         return "Split %d"%self.n
 
-    def jdump(self):
-        return '{ "op": "Split", "count": "%d" }'%self.n
+    def jmap(self):
+        return { "op": "Split", "count": "%d"%self.n }
 
     def tladump(self):
         return 'OpSplit(self, %d)'%self.n
@@ -206,8 +210,8 @@ class MoveOp(Op):
     def __repr__(self):
         return "Move %d"%self.offset
 
-    def jdump(self):
-        return '{ "op": "Move", "offset": "%d" }'%self.offset
+    def jmap(self):
+        return { "op": "Move", "offset": "%d"%self.offset }
 
     def tladump(self):
         return 'OpMove(self, %d)'%self.offset
@@ -224,8 +228,8 @@ class DupOp(Op):
     def __repr__(self):
         return "Dup"
 
-    def jdump(self):
-        return '{ "op": "Dup" }'
+    def jmap(self):
+        return { "op": "Dup" }
 
     def tladump(self):
         return 'OpDup(self)'
@@ -243,8 +247,8 @@ class GoOp(Op):
     def __repr__(self):
         return "Go"
 
-    def jdump(self):
-        return '{ "op": "Go" }'
+    def jmap(self):
+        return { "op": "Go" }
 
     def tladump(self):
         return 'OpGo(self)'
@@ -291,11 +295,11 @@ class LoadVarOp(Op):
             return { self.lvar }
         return self.lvars(self.v)
 
-    def jdump(self):
+    def jmap(self):
         if self.v == None:
-            return '{ "op": "LoadVar" }'
+            return { "op": "LoadVar" }
         else:
-            return '{ "op": "LoadVar", "value": "%s" }'%self.convert(self.v)
+            return { "op": "LoadVar", "value": self.convert(self.v) }
 
     def tladump(self):
         if self.v == None:
@@ -326,9 +330,9 @@ class PushOp(Op):
         (lexeme, file, line, column) = self.constant
         return "Push %s"%strValue(lexeme)
 
-    def jdump(self):
+    def jmap(self):
         (lexeme, file, line, column) = self.constant
-        return '{ "op": "Push", "value": %s }'%jsonValue(lexeme)
+        return { "op": "Push", "value": jsonValue(lexeme) }
 
     def tladump(self):
         (lexeme, file, line, column) = self.constant
@@ -361,12 +365,12 @@ class LoadOp(Op):
             (lexeme, file, line, column) = self.name
             return "Load " + _prefix_name(self.prefix, lexeme)
 
-    def jdump(self):
+    def jmap(self):
         if self.name == None:
-            return '{ "op": "Load" }'
+            return { "op": "Load" }
         else:
             (lexeme, file, line, column) = self.name
-            return '{ "op": "Load", "value": [{ "type": "atom", "value": "%s"}] }'%_prefix_name(self.prefix, lexeme)
+            return { "op": "Load", "value": [ jsonValue(_prefix_name(self.prefix, lexeme)) ] }
 
     def tladump(self):
         if self.name == None:
@@ -412,12 +416,12 @@ class StoreOp(Op):
             (lexeme, file, line, column) = self.name
             return "Store " + _prefix_name(self.prefix, lexeme)
 
-    def jdump(self):
+    def jmap(self):
         if self.name == None:
-            return '{ "op": "Store" }'
+            return { "op": "Store" }
         else:
             (lexeme, file, line, column) = self.name
-            return '{ "op": "Store", "value": [{ "type": "atom", "value": "%s"}] }'%_prefix_name(self.prefix, lexeme)
+            return { "op": "Store", "value": [ jsonValue(_prefix_name(self.prefix, lexeme)) ] }
 
     def tladump(self):
         if self.name == None:
@@ -476,12 +480,12 @@ class DelOp(Op):
         else:
             return "Del"
 
-    def jdump(self):
+    def jmap(self):
         if self.name == None:
-            return '{ "op": "Del" }'
+            return { "op": "Del" }
         else:
             (lexeme, file, line, column) = self.name
-            return '{ "op": "Del", "value": [{ "type": "atom", "value": "%s"}] }'%_prefix_name(self.prefix, lexeme)
+            return { "op": "Del", "value": [ jsonValue(_prefix_name(self.prefix, lexeme)) ] }
 
     def tladump(self):
         if self.name == None:
@@ -521,8 +525,8 @@ class SaveOp(Op):
     def __repr__(self):
         return "Save"
 
-    def jdump(self):
-        return '{ "op": "Save" }'
+    def jmap(self):
+        return { "op": "Save" }
 
     def tladump(self):
         return "OpSave(self)"
@@ -544,12 +548,12 @@ class StopOp(Op):
         else:
             return "Stop"
 
-    def jdump(self):
+    def jmap(self):
         if self.name != None:
             (lexeme, file, line, column) = self.name
-            return '{ "op": "Stop", "value": %s }'%lexeme
+            return { "op": "Stop", "value": lexeme }
         else:
-            return '{ "op": "Stop" }'
+            return { "op": "Stop" }
 
     def tladump(self):
         if self.name == None:
@@ -597,8 +601,8 @@ class SequentialOp(Op):
     def __repr__(self):
         return "Sequential"
 
-    def jdump(self):
-        return '{ "op": "Sequential" }'
+    def jmap(self):
+        return { "op": "Sequential" }
 
     def tladump(self):
         return 'OpSequential(self)'
@@ -617,8 +621,8 @@ class ContinueOp(Op):
     def explain(self):
         return "a no-op, must follow a Stop operation"
 
-    def jdump(self):
-        return '{ "op": "Continue" }'
+    def jmap(self):
+        return { "op": "Continue" }
 
     def tladump(self):
         return 'OpContinue(self)'
@@ -631,8 +635,8 @@ class AddressOp(Op):
     def __repr__(self):
         return "Address"
 
-    def jdump(self):
-        return '{ "op": "Address" }'
+    def jmap(self):
+        return { "op": "Address" }
 
     def tladump(self):
         return "OpBin(self, FunAddress)"
@@ -670,11 +674,11 @@ class StoreVarOp(Op):
             return { self.lvar }
         return set()
 
-    def jdump(self):
+    def jmap(self):
         if self.v == None:
-            return '{ "op": "StoreVar" }'
+            return { "op": "StoreVar" }
         else:
-            return '{ "op": "StoreVar", "value": "%s" }'%self.convert(self.v)
+            return { "op": "StoreVar", "value": self.convert(self.v) }
 
     def tladump(self):
         if self.v == None:
@@ -730,11 +734,11 @@ class DelVarOp(Op):
             return { self.lvar }
         return set()
 
-    def jdump(self):
+    def jmap(self):
         if self.v == None:
-            return '{ "op": "DelVar" }'
+            return { "op": "DelVar" }
         else:
-            return '{ "op": "DelVar", "value": "%s" }'%self.convert(self.v)
+            return { "op": "DelVar", "value": self.convert(self.v) }
 
     def tladump(self):
         if self.v == None:
@@ -762,8 +766,8 @@ class ChooseOp(Op):
     def __repr__(self):
         return "Choose"
 
-    def jdump(self):
-        return '{ "op": "Choose" }'
+    def jmap(self):
+        return { "op": "Choose" }
 
     def tladump(self):
         return 'OpChoose(self)'
@@ -787,11 +791,11 @@ class AssertOp(Op):
     def __repr__(self):
         return "Assert2" if self.exprthere else "Assert"
 
-    def jdump(self):
+    def jmap(self):
         if self.exprthere:
-            return '{ "op": "Assert2" }'
+            return { "op": "Assert2" }
         else:
-            return '{ "op": "Assert" }'
+            return { "op": "Assert" }
 
     def tladump(self):
         (lexeme, file, line, column) = self.token
@@ -830,8 +834,8 @@ class PrintOp(Op):
     def __repr__(self):
         return "Print"
 
-    def jdump(self):
-        return '{ "op": "Print" }'
+    def jmap(self):
+        return { "op": "Print" }
 
     def tladump(self):
         return 'OpPrint(self)'
@@ -852,8 +856,8 @@ class PossiblyOp(Op):
     def __repr__(self):
         return "Possibly %d"%self.index
 
-    def jdump(self):
-        return '{ "op": "Possibly", "index": "%d" }'%self.index
+    def jmap(self):
+        return { "op": "Possibly", "index": "%d"%self.index }
 
     def explain(self):
         return "pop a condition and check"
@@ -865,8 +869,8 @@ class PopOp(Op):
     def __repr__(self):
         return "Pop"
 
-    def jdump(self):
-        return '{ "op": "Pop" }'
+    def jmap(self):
+        return { "op": "Pop" }
 
     def tladump(self):
         return 'OpPop(self)'
@@ -890,9 +894,9 @@ class FrameOp(Op):
     def define(self):
         return self.lvars(self.args) | { "result" }
 
-    def jdump(self):
+    def jmap(self):
         (lexeme, file, line, column) = self.name
-        return '{ "op": "Frame", "name": "%s", "args": "%s" }'%(lexeme, self.convert(self.args))
+        return { "op": "Frame", "name": lexeme, "args": self.convert(self.args) }
 
     def tladump(self):
         (lexeme, file, line, column) = self.name
@@ -915,8 +919,8 @@ class ReturnOp(Op):
     def __repr__(self):
         return "Return"
 
-    def jdump(self):
-        return '{ "op": "Return" }'
+    def jmap(self):
+        return { "op": "Return" }
 
     def tladump(self):
         return 'OpReturn(self)'
@@ -965,8 +969,8 @@ class SpawnOp(Op):
     def __repr__(self):
         return "Spawn"
 
-    def jdump(self):
-        return '{ "op": "Spawn", "eternal": "%s" }'%("True" if self.eternal else "False")
+    def jmap(self):
+        return { "op": "Spawn", "eternal": "True" if self.eternal else "False" }
 
     def tladump(self):
         return 'OpSpawn(self)'
@@ -997,8 +1001,8 @@ class TrapOp(Op):
     def explain(self):
         return "pop a pc and argument and set trap"
 
-    def jdump(self):
-        return '{ "op": "Trap" }'
+    def jmap(self):
+        return { "op": "Trap" }
 
     def tladump(self):
         return 'OpTrap(self)'
@@ -1022,8 +1026,8 @@ class AtomicIncOp(Op):
     def tladump(self):
         return 'OpAtomicInc(self)'
 
-    def jdump(self):
-        return '{ "op": "AtomicInc", "lazy": "%s" }'%str(self.lazy)
+    def jmap(self):
+        return { "op": "AtomicInc", "lazy": str(self.lazy) }
 
     def explain(self):
         return "increment atomic counter of context; thread runs uninterrupted if larger than 0"
@@ -1036,8 +1040,8 @@ class AtomicDecOp(Op):
     def __repr__(self):
         return "AtomicDec"
 
-    def jdump(self):
-        return '{ "op": "AtomicDec" }'
+    def jmap(self):
+        return { "op": "AtomicDec" }
 
     def tladump(self):
         return 'OpAtomicDec(self)'
@@ -1054,8 +1058,8 @@ class ReadonlyIncOp(Op):
     def __repr__(self):
         return "ReadonlyInc"
 
-    def jdump(self):
-        return '{ "op": "ReadonlyInc" }'
+    def jmap(self):
+        return { "op": "ReadonlyInc" }
 
     def explain(self):
         return "increment readonly counter of context; thread cannot mutate shared variables if > 0"
@@ -1071,8 +1075,8 @@ class ReadonlyDecOp(Op):
     def __repr__(self):
         return "ReadonlyDec"
 
-    def jdump(self):
-        return '{ "op": "ReadonlyDec" }'
+    def jmap(self):
+        return { "op": "ReadonlyDec" }
 
     def tladump(self):
         return 'OpReadonlyDec(self)'
@@ -1093,8 +1097,8 @@ class InvariantOp(Op):
     def __repr__(self):
         return "Invariant " + str(self.end)
 
-    def jdump(self):
-        return '{ "op": "Invariant", "end": "%d" }'%self.end
+    def jmap(self):
+        return { "op": "Invariant", "end": "%d"%self.end }
 
     def tladump(self):
         return 'OpInvariant(self, %d)'%self.end
@@ -1119,8 +1123,8 @@ class JumpOp(Op):
     def __repr__(self):
         return "Jump " + str(self.pc)
 
-    def jdump(self):
-        return '{ "op": "Jump", "pc": "%d" }'%self.pc
+    def jmap(self):
+        return { "op": "Jump", "pc": "%d"%self.pc }
 
     def tladump(self):
         return 'OpJump(self, %d)'%self.pc
@@ -1145,8 +1149,8 @@ class JumpCondOp(Op):
     def __repr__(self):
         return "JumpCond " + str(self.cond) + " " + str(self.pc)
 
-    def jdump(self):
-        return '{ "op": "JumpCond", "pc": "%d", "cond": %s }'%(self.pc, jsonValue(self.cond))
+    def jmap(self):
+        return { "op": "JumpCond", "pc": "%d"%self.pc, "cond": jsonValue(self.cond) }
 
     def tladump(self):
         return 'OpJumpCond(self, %d, %s)'%(self.pc, tlaValue(self.cond))
@@ -1177,9 +1181,9 @@ class NaryOp(Op):
         (lexeme, file, line, column) = self.op
         return "%d-ary "%self.n + str(lexeme)
 
-    def jdump(self):
+    def jmap(self):
         (lexeme, file, line, column) = self.op
-        return '{ "op": "Nary", "arity": %d, "value": "%s" }'%(self.n, lexeme)
+        return { "op": "Nary", "arity": self.n, "value": lexeme }
 
     def tladump(self):
         (lexeme, file, line, column) = self.op
@@ -1657,8 +1661,8 @@ class ApplyOp(Op):
     def __repr__(self):
         return "Apply"
 
-    def jdump(self):
-        return '{ "op": "Apply" }'
+    def jmap(self):
+        return { "op": "Apply" }
 
     def tladump(self):
         return 'OpApply(self)'
@@ -1,5 +1,3 @@
-import json
-
 tlavarcnt = 0           # to generate unique TLA+ variables
 
 def tlaValue(lexeme):
@@ -18,15 +16,16 @@ def strValue(v):
         return '"%s"'%v
     assert False, v
 
+# The representation of a value in the JSON .hvm format
 def jsonValue(v):
     if isinstance(v, Value):
-        return v.jdump()
+        return v.jmap()
     if isinstance(v, bool):
-        return '{ "type": "bool", "value": "%s" }'%str(v)
+        return { "type": "bool", "value": str(v) }
     if isinstance(v, int) or isinstance(v, float):
-        return '{ "type": "int", "value": %s }'%str(v)
+        return { "type": "int", "value": v }
     if isinstance(v, str):
-        return '{ "type": "atom", "value": %s }'%json.dumps(v, ensure_ascii=False)
+        return { "type": "atom", "value": v }
     assert False, v
 
 def strVars(v):
@@ -55,7 +54,7 @@ class Value:
     def __str__(self):
         return self.__repr__()
 
-    def jdump(self):
+    def jmap(self):
         assert False
 
     def substitute(self, map):
@@ -80,8 +79,8 @@ class PcValue(Value):
     def key(self):
         return (3, self.pc)
 
-    def jdump(self):
-        return '{ "type": "pc", "value": "%d" }'%self.pc
+    def jmap(self):
+        return { "type": "pc", "value": "%d"%self.pc }
 
 class _LabelIdGenerator:
 
@@ -102,6 +101,12 @@ class LabelValue(Value):
         self.module = module
         self.label = label
 
+    def __setstate__(self, state):
+        # A label loaded from the AST cache gets a new id so that it cannot
+        # clash with the labels created in this run
+        self.__dict__.update(state)
+        self.id = _LabelIdGenerator.new_id()
+
     def __repr__(self):
         if self.module == None:
             return "LABEL(" + str(self.id) + ", " + self.label + ")"
@@ -117,7 +122,7 @@ class LabelValue(Value):
     def key(self):
         return (100, self.id)
 
-    def jdump(self):
+    def jmap(self):
         assert False
 
     def substitute(self, map):
@@ -143,13 +148,8 @@ class ListValue(Value):
         s = "<<" + ",".join(tlaValue(x) for x in self.vals) + ">>"
         return 'HList(%s)'%s
 
-    def jdump(self):
-        result = ""
-        for v in self.vals:
-            if result != "":
-                result += ", "
-            result += jsonValue(v)
-        return '{ "type": "list", "value": [%s] }'%result
+    def jmap(self):
+        return { "type": "list", "value": [ jsonValue(v) for v in self.vals ] }
 
     def __hash__(self):
         hash = 0
@@ -218,14 +218,10 @@ class DictValue(Value):
         s += " [] OTHER -> FALSE ]"
         return 'HDict(%s)'%s
 
-    def jdump(self):
-        result = ""
+    def jmap(self):
         keys = sorted(self.d.keys(), key=keyValue)
-        for k in keys:
-            if result != "":
-                result += ", "
-            result += '{ "key": %s, "value": %s }'%(jsonValue(k), jsonValue(self.d[k]))
-        return '{ "type": "dict", "value": [%s] }'%result
+        return { "type": "dict", "value": [ { "key": jsonValue(k),
+                        "value": jsonValue(self.d[k]) } for k in keys ] }
 
     def __hash__(self):
         hash = 0
@@ -273,14 +269,9 @@ class SetValue(Value):
         s = "{" + ",".join(tlaValue(x) for x in self.s) + "}"
         return 'HSet(%s)'%s
 
-    def jdump(self):
-        result = ""
+    def jmap(self):
         vals = sorted(self.s, key=keyValue)
-        for v in vals:
-            if result != "":
-                result += ", "
-            result += jsonValue(v)
-        return '{ "type": "set", "value": [%s] }'%result
+        return { "type": "set", "value": [ jsonValue(v) for v in vals ] }
 
     def __hash__(self):
         return frozenset(self.s).__hash__()
@@ -315,13 +306,9 @@ class AddressValue(Value):
         s = "<<" + ",".join(tlaValue(x) for x in self.indexes) + ">>"
         return 'HAddress(%s)'%s
 
-    def jdump(self):
-        result = ""
-        for index in self.indexes:
-            if result != "":
-                result += ", "
-            result = result + jsonValue(index)
-        return '{ "type": "address", "value": [%s] }'%result
+    def jmap(self):
+        return { "type": "address",
+                        "value": [ jsonValue(index) for index in self.indexes ] }
 
     def __hash__(self):
         hash = 0
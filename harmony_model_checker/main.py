@@ -1,5 +1,7 @@
 from typing import Dict, List, Optional
 import json
+import os
+import tempfile
 import pathlib
 import webbrowser
 import sys
@@ -15,6 +17,7 @@ from harmony_model_checker.exception import HarmonyCompilerError, HarmonyCompile
 import harmony_model_checker.harmony.harmony as legacy_harmony
 from harmony_model_checker.harmony.genhtml import GenHTML
 from harmony_model_checker.harmony.brief import Brief
+from harmony_model_checker.harmony.hco import Results
 from harmony_model_checker.compile import do_compile
 
 
@@ -43,6 +46,10 @@ args.add_argument("-o", action='append', type=pathlib.Path,
                   help="specify output file (.hvm, .hco, .hfa, .htm. .tla, .png, .gv)")
 args.add_argument("-j", action="store_true",
                   help="list machine code in JSON format")
+args.add_argument("--hvm-json", action="store_true",
+                  help="write the .hvm file in JSON rather than binary format")
+args.add_argument("--hco-json", action="store_true",
+                  help="write the .hco file in JSON rather than binary format")
 args.add_argument("--noweb", action="store_true", default=False,
                   help="do not automatically open web browser")
 args.add_argument("--suppress", action="store_true",
@@ -96,11 +103,21 @@ def handle_hvm(ns, output_files, parse_code_only, code, scope):
     charm_options = ns.cf or []
     if ns.B:
         charm_options.append("-B" + ns.B)
+    if ns.hco_json:
+        charm_options.append("-Xjson")
+    if output_files["hfa"] is not None:
+        charm_options.append("-Xhfa=" + output_files["hfa"])
+    if output_files["gv"] is not None:
+        charm_options.append("-Xgv=" + output_files["gv"])
 
     # see if there is a configuration file
     if code is not None:
-        with open(output_files["hvm"], "w", encoding='utf-8') as fd:
-            legacy_harmony.dumpCode("json", code, scope, f=fd)
+        if ns.hvm_json:
+            with open(output_files["hvm"], "w", encoding='utf-8') as fd:
+                legacy_harmony.dumpCode("json", code, scope, f=fd)
+        else:
+            with open(output_files["hvm"], "wb") as fd:
+                legacy_harmony.dumpBinaryCode(code, scope, fd)
 
     if parse_code_only:
         exit()
@@ -125,7 +142,7 @@ def handle_hvm(ns, output_files, parse_code_only, code, scope):
             print("charm model checker failed")
             exit(r)
 
-def handle_hco(ns, output_files):
+def handle_hco(ns, output_files, from_hco=False):
     suppress_output = ns.suppress
 
     behavior = None
@@ -134,10 +151,13 @@ def handle_hco(ns, output_files):
 
     disable_browser = settings.values.disable_web or ns.noweb
     
+    # The results are read once and shared
+    results = Results(output_files["hco"])
     b = Brief()
-    b.run(output_files, behavior)
+    b.run(results, output_files, behavior, from_hco)
     gh = GenHTML()
-    gh.run(output_files)
+    gh.run(results, output_files)
+    results.close()
     if not suppress_output:
         p = pathlib.Path(output_files["htm"]).resolve()
         url = "file://" + str(p)
@@ -234,6 +254,14 @@ def main():
     if output_files["png"] is not None and output_files["gv"] is None:
         output_files["gv"] = stem + ".gv"
 
+    # The behavior is computed by charm.  To compare it against the one
+    # given with -B it is written to a temporary file if not requested.
+    tmp_hfa = None
+    if ns.B is not None and output_files["hfa"] is None:
+        fd, tmp_hfa = tempfile.mkstemp(suffix=".hfa")
+        os.close(fd)
+        output_files["hfa"] = tmp_hfa
+
     charm_flag = True
     print_code: Optional[str] = None
     if ns.a:
@@ -263,4 +291,7 @@ def main():
         
     if input_file_type == ".hco":
         print("Skipping Phases 1-4...")
-        handle_hco(ns, output_files)
+        handle_hco(ns, output_files, from_hco=True)
+
+    if tmp_hfa is not None and os.path.exists(tmp_hfa):
+        os.remove(tmp_hfa)
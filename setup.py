@@ -122,7 +122,8 @@ def get_c_extension_include_dirs():
 module = Extension(
     f"{PROJECT_DIR_NAME}.charm",
     sources=get_c_extension_src(),
-    include_dirs=get_c_extension_include_dirs()
+    include_dirs=get_c_extension_include_dirs(),
+    libraries=[] if sys.platform == "win32" else ["m"]
 )
 
 setuptools.setup(
@@ -0,0 +1,114 @@
+"""
+    Running the compiler and the model checker from the tests.  The compiler
+    keeps global state and charm exits when it is done, so both run in a
+    separate process.
+"""
+
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from harmony_model_checker.harmony.hco import read_hco
+
+_compile = """
+import sys
+from harmony_model_checker.compile import do_compile
+import harmony_model_checker.harmony.harmony as legacy_harmony
+code, scope = do_compile(sys.argv[1], [], sys.argv[4:], None)
+if sys.argv[3] == "json":
+    with open(sys.argv[2], "w", encoding="utf-8") as f:
+        legacy_harmony.dumpCode("json", code, scope, f=f)
+else:
+    with open(sys.argv[2], "wb") as f:
+        legacy_harmony.dumpBinaryCode(code, scope, f)
+"""
+
+_charm = """
+import sys
+from harmony_model_checker import charm
+sys.exit(charm.run_model_checker(*sys.argv[1:]))
+"""
+
+# The issue if no safety violation is found by a mode that keeps no state
+# graph, and so cannot look for the other kinds of issues
+no_graph = "No safety violations (liveness and data races not checked)"
+
+def strip(x):
+    """Leave out what differs between runs: the hashes, which are addresses,
+    and the node ids, which depend on the order of the search."""
+    if isinstance(x, dict):
+        return { k: strip(v) for (k, v) in x.items()
+                                if not k.endswith("hash") and k != "id" }
+    if isinstance(x, list):
+        return [ strip(v) for v in x ]
+    return x
+
+class CharmTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.dir = pathlib.Path(cls.tmpdir.name)
+        cls.env = dict(os.environ, XDG_CACHE_HOME=str(cls.dir / "cache"))
+        cls.compiled = {}
+        cls.searched = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def compile(self, filename, modules=[], format="binary"):
+        """Compile a Harmony file and return the .hvm file."""
+        key = (filename, tuple(modules), format)
+        if key not in self.compiled:
+            hvm = self.dir / ("%d.hvm" % len(self.compiled))
+            r = subprocess.run([sys.executable, "-c", _compile, filename,
+                        str(hvm), format] + modules, env=self.env,
+                        capture_output=True, text=True)
+            self.assertEqual(r.returncode, 0, r.stderr)
+            self.compiled[key] = hvm
+        return self.compiled[key]
+
+    def run_charm(self, *args):
+        return subprocess.run([sys.executable, "-c", _charm] + list(args),
+                        env=self.env, capture_output=True, text=True)
+
+    def charm(self, hvm, *options, hco=None):
+        """Run charm and return the #states and the issue."""
+        if hco is None:
+            hco = self.dir / "out.hco"
+        if os.path.exists(hco):
+            os.remove(hco)
+        r = self.run_charm(*options, "-o" + str(hco), str(hvm))
+        self.assertEqual(r.returncode, 0, r.stderr)
+        m = re.search(r"#states (\d+)", r.stdout)
+        self.assertIsNotNone(m, r.stdout)
+        return (int(m.group(1)), read_hco(str(hco), graph=False)["issue"])
+
+    def search(self, filename, *options, modules=[]):
+        """Compile a Harmony file, run charm on it, and return the #states
+        and the issue.  The default search is only done once."""
+        hvm = self.compile(filename, modules)
+        if options:
+            return self.charm(hvm, *options)
+        key = (filename, tuple(modules))
+        if key not in self.searched:
+            self.searched[key] = self.charm(hvm)
+        return self.searched[key]
+
+    def assertSameSearch(self, filename, *options, modules=[], issue=None,
+                                                                all=True):
+        """Check that the options find the same issue as the default search,
+        or the given one.  If the search explores all states, which it does
+        not if it stops at a safety violation, the #states must be the same
+        as well."""
+        (states, expected) = self.search(filename, modules=modules)
+        (n, found) = self.search(filename, *options, modules=modules)
+        self.assertEqual(found, expected if issue is None else issue,
+                                                            filename)
+        if all:
+            self.assertEqual(n, states, filename)
@@ -0,0 +1,98 @@
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from harmony_model_checker import astcache
+
+# The compiler keeps global state, so each compilation runs in a separate
+# process.  It writes the code in JSON, and prints the files it parsed.
+_compile = """
+import os
+import sys
+from harmony_model_checker import compile
+import harmony_model_checker.harmony.harmony as legacy_harmony
+parse = compile._parse
+def _parse(filename):
+    print(os.path.basename(filename))
+    return parse(filename)
+compile._parse = _parse
+code, scope = compile.do_compile(sys.argv[1], [], [], None)
+with open(sys.argv[2], "w", encoding="utf-8") as f:
+    legacy_harmony.dumpCode("json", code, scope, f=f)
+"""
+
+program = """from synch import Lock, acquire, release
+
+lk = Lock()
+count = 0
+
+def f(self):
+    acquire(?lk)
+    count += 1
+    release(?lk)
+
+for i in { 1..2 }:
+    spawn f(i)
+"""
+
+# The files that compiling the program parses if nothing is cached
+parsed_all = { "prog.hny", "synch.hny", "list.hny", "bag.hny" }
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmpdir.name)
+        self.cache = self.dir / "cache"
+        self.file = self.dir / "prog.hny"
+        self.file.write_text(program)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def compile(self, cached=True):
+        """Compile the program and return the code and the files parsed."""
+        env = dict(os.environ, XDG_CACHE_HOME=str(self.cache))
+        if not cached:
+            env["HARMONY_DISABLE_CACHE"] = "true"
+        out = self.dir / "prog.json"
+        r = subprocess.run([sys.executable, "-c", _compile, str(self.file),
+                    str(out)], env=env, capture_output=True, text=True)
+        self.assertEqual(r.returncode, 0, r.stderr)
+        return (out.read_text(), set(r.stdout.split()))
+
+
+class TestAstCache(CacheTestCase):
+
+    def test_hit(self):
+        (code, parsed) = self.compile()
+        self.assertEqual(parsed, parsed_all)
+        self.assertEqual(self.compile(), (code, set()))
+        self.assertEqual(self.compile(cached=False)[0], code)
+
+    def test_changed(self):
+        self.compile()
+        self.file.write_text(program.replace("count += 1", "count += 2"))
+        (code, parsed) = self.compile()
+        self.assertEqual(parsed, { "prog.hny" })
+        self.assertEqual(self.compile(cached=False)[0], code)
+
+    def test_disabled(self):
+        self.assertEqual(self.compile(cached=False)[1], parsed_all)
+        self.assertFalse(self.cache.exists())
+
+    def test_corrupt(self):
+        (code, _) = self.compile()
+        for f in (self.cache / "harmony-model-checker" / "ast").iterdir():
+            f.write_bytes(b"not a pickle")
+        self.assertEqual(self.compile(), (code, parsed_all))
+
+    def test_key(self):
+        key = astcache.cache_key("prog.hny", program)
+        self.assertEqual(astcache.cache_key("prog.hny", program), key)
+        self.assertNotEqual(astcache.cache_key("prog.hny", program + "\n"), key)
+        self.assertNotEqual(astcache.cache_key("other.hny", program), key)
@@ -0,0 +1,35 @@
+from harmony_model_checker.harmony.hco import read_hco
+from tests.charmutil import CharmTestCase
+
+# Fully explored, with each kind of issue
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+# Models where the search stops at a safety violation
+violations = [ "code/clock.hny", "code/atm.hny" ]
+
+
+class TestAsync(CharmTestCase):
+
+    def test_async(self):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, "-Xasync", modules=modules)
+        for filename in violations:
+            self.assertSameSearch(filename, "-Xasync", all=False)
+
+    def test_paths(self):
+        # The paths to the issue are shortest paths, as in the default search
+        for (filename, modules) in models[1:]:
+            hvm = self.compile(filename, modules)
+            lengths = []
+            for options in [ [], [ "-Xasync" ] ]:
+                self.charm(hvm, *options)
+                macrosteps = read_hco(str(self.dir / "out.hco"),
+                                            graph=False)["macrosteps"]
+                lengths.append((len(macrosteps), sum(len(m["microsteps"])
+                                                    for m in macrosteps)))
+            self.assertEqual(lengths[0], lengths[1], filename)
@@ -0,0 +1,60 @@
+import json
+
+from harmony_model_checker.harmony.behavior import behavior_parse
+from harmony_model_checker.harmony.dfa import read_hfa, is_equivalent
+from harmony_model_checker.harmony.hco import Results
+from tests.charmutil import CharmTestCase
+
+# Models that print, for comparing the behavior computed from a .hco file
+# with the one charm computes
+printing = [ "code/hello4.hny", "code/hello5.hny", "code/hello6.hny",
+             "code/hello8.hny", "code/hello9.hny", "code/hello1.hny",
+             "code/hello2.hny", "code/hello3.hny", "code/hello7.hny" ]
+
+
+class TestBehavior(CharmTestCase):
+
+    def behavior(self, filename):
+        """Run charm on a model and return the .hfa and .gv files it
+        writes."""
+        hfa = self.dir / "out.hfa"
+        gv = self.dir / "out.gv"
+        self.assertEqual(self.search(filename, "-Xhfa=" + str(hfa),
+                                "-Xgv=" + str(gv))[1], "No issues")
+        with open(hfa, encoding="utf-8") as f:
+            return (json.load(f), gv.read_text())
+
+    def test_hello(self):
+        # hello4 prints "hello world" any number of times
+        (hfa, gv) = self.behavior("code/hello4.hny")
+        self.assertEqual(hfa, {
+            "initial": "0",
+            "nodes": [ { "idx": "0", "type": "final" } ],
+            "edges": [ { "src": "0", "dst": "0",
+                    "symbol": { "type": "atom", "value": "hello world" } } ]
+        })
+        self.assertIn('s0 -> s0 [label="\\"hello world\\""]', gv)
+
+    def test_silent(self):
+        # A model that prints nothing only accepts the empty sequence
+        (hfa, _) = self.behavior("code/Peterson.hny")
+        self.assertEqual(hfa, { "initial": "0",
+                "nodes": [ { "idx": "0", "type": "final" } ], "edges": [] })
+
+    def test_hco(self):
+        # harmony x.hco computes the behavior from the graph in the .hco
+        # file, and must find the same DFA as charm
+        for filename in printing:
+            (hfa, gv) = self.behavior(filename)
+            outputfiles = { "hfa": str(self.dir / "hco.hfa"),
+                            "gv": str(self.dir / "hco.gv"), "png": None }
+            results = Results(str(self.dir / "out.hco"))
+            behavior_parse(results, outputfiles, None, from_hco=True)
+            results.close()
+            symbols = {}
+            a = read_hfa(str(self.dir / "out.hfa"), symbols)
+            b = read_hfa(outputfiles["hfa"], symbols)
+            self.assertEqual(a.nstates, b.nstates, filename)
+            self.assertTrue(is_equivalent(a, b), filename)
+            self.assertEqual(len(gv.splitlines()),
+                len((self.dir / "hco.gv").read_text().splitlines()), filename)
@@ -0,0 +1,26 @@
+import os
+
+from tests.charmutil import CharmTestCase
+
+
+class TestCheckpoint(CharmTestCase):
+
+    def test_resume(self):
+        # A chain of 120004 states, one per epoch, so that the search is not
+        # done after a second
+        hvm = self.compile("tests/resources/charm/chain.hny")
+        checkpoint = str(self.dir / "chain.ck")
+        r = self.run_charm("-t1", "-Xcheckpoint=" + checkpoint,
+                            "-o" + str(self.dir / "out.hco"), str(hvm))
+        if r.returncode == 0:
+            self.skipTest("the search finished before the timeout")
+        self.assertIn("timeout exceeded", r.stderr)
+        self.assertTrue(os.path.exists(checkpoint))
+        self.assertEqual(self.charm(hvm, "-Xresume=" + checkpoint),
+                                                    (120004, "No issues"))
+
+        # With other options the checkpoint is refused
+        r = self.run_charm("-Xresume=" + checkpoint, "-Xsymmetry=x,y",
+                            "-o" + str(self.dir / "out.hco"), str(hvm))
+        self.assertNotEqual(r.returncode, 0)
+        self.assertIn("different options", r.stderr)
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+
+from tests.test_astcache import CacheTestCase, program
+
+# Like the script in test_astcache, but with -c constants, and prints the
+# file of each statement whose code is reused
+_compile = """
+import os
+import sys
+from harmony_model_checker import codecache, compile
+import harmony_model_checker.harmony.harmony as legacy_harmony
+replay = codecache._replay
+def _replay(st, ns, code):
+    replay(st, ns, code)
+    print(os.path.basename(code.curFile))
+codecache._replay = _replay
+code, scope = compile.do_compile(sys.argv[1], sys.argv[3:], [], None)
+with open(sys.argv[2], "w", encoding="utf-8") as f:
+    legacy_harmony.dumpCode("json", code, scope, f=f)
+"""
+
+
+class TestCodeCache(CacheTestCase):
+
+    def run_compile(self, consts, cached=True):
+        env = dict(os.environ, XDG_CACHE_HOME=str(self.cache))
+        if not cached:
+            env["HARMONY_DISABLE_CACHE"] = "true"
+        out = self.dir / "prog.json"
+        r = subprocess.run([sys.executable, "-c", _compile, str(self.file),
+                    str(out)] + consts, env=env, capture_output=True, text=True)
+        self.assertEqual(r.returncode, 0, r.stderr)
+        return (out.read_text(), r.stdout.split().count("prog.hny"))
+
+    def reused(self, contents, *consts):
+        """Compile contents and return the #statements of the program whose
+        code is reused.  The code must be the same as without the cache."""
+        self.file.write_text(contents)
+        (expected, _) = self.run_compile(list(consts), cached=False)
+        (code, n) = self.run_compile(list(consts))
+        self.assertEqual(code, expected)
+        return n
+
+    def test_edits(self):
+        self.assertEqual(self.reused(program), 0)
+        self.assertEqual(self.reused(program), 5)
+
+        # Only the statement with the edit is compiled again, as the others
+        # do not depend on what changed
+        self.assertEqual(self.reused(program + "assert count <= 2\n"), 5)
+        edited = program.replace("count += 1", "count += 2")
+        self.assertEqual(self.reused(edited), 4)
+        edited = edited.replace("count = 0", "count = 1")
+        self.assertEqual(self.reused(edited), 4)
+
+        # Where the statements are does not matter
+        self.assertEqual(self.reused("\n" + edited), 5)
+
+    def test_dependencies(self):
+        contents = """const D = 1
+count = 0
+
+def f():
+    count += 1
+
+def g():
+    count -= D
+
+spawn f()
+spawn g()
+"""
+        self.assertEqual(self.reused(contents), 0)
+
+        # A line added to f moves g, which is reused
+        contents = contents.replace("count += 1", "count += 1\n    count += 1")
+        self.assertEqual(self.reused(contents), 5)
+
+        # g uses D, so it is compiled again
+        self.assertEqual(self.reused(contents.replace("D = 1", "D = 2")), 4)
+
+    def test_constants(self):
+        # Nothing is reused with another value for a -c constant
+        contents = "const N = 1\nx = N\nassert x == N\n"
+        self.assertEqual(self.reused(contents), 0)
+        self.assertEqual(self.reused(contents), 3)
+        self.assertEqual(self.reused(contents, "N=2"), 0)
+        self.assertEqual(self.reused(contents, "N=2"), 3)
+
+        # Only the last run of a file is kept
+        self.assertEqual(self.reused(contents), 0)
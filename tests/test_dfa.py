@@ -0,0 +1,41 @@
+import unittest
+
+from harmony_model_checker.harmony.dfa import IntDFA, distinguishing_trace, \
+                            inclusion_trace, is_equivalent, read_hfa
+
+# Over the symbols 0 and 1: words with an even number of 1s, the same with
+# a state that is split in two, and words without a 1
+even = IntDFA(2, 0, [ 0 ], [ 0, 0, 1, 1 ], [ 0, 1, 0, 1 ], [ 0, 1, 1, 0 ])
+even3 = IntDFA(3, 0, [ 0, 2 ], [ 0, 0, 1, 1, 2, 2 ], [ 0, 1, 0, 1, 0, 1 ],
+                                                    [ 0, 1, 1, 2, 2, 1 ])
+no1 = IntDFA(1, 0, [ 0 ], [ 0 ], [ 0 ], [ 0 ])
+
+
+class TestDfa(unittest.TestCase):
+
+    def test_equivalent(self):
+        self.assertTrue(is_equivalent(even, even3))
+        self.assertTrue(is_equivalent(even3, even))
+        self.assertFalse(is_equivalent(even, no1))
+        self.assertIsNone(distinguishing_trace(even, even3))
+        self.assertEqual(distinguishing_trace(even, no1), [ 1, 1 ])
+
+    def test_inclusion(self):
+        self.assertIsNone(inclusion_trace(no1, even))
+        self.assertEqual(inclusion_trace(even, no1), [ 1, 1 ])
+
+    def test_duplicates(self):
+        # The last of two transitions for the same state and symbol counts
+        a = IntDFA(2, 0, [ 1 ], [ 0, 0 ], [ 0, 0 ], [ 0, 1 ])
+        self.assertTrue(a.accepts([ 0 ]))
+        self.assertFalse(a.accepts([ 0, 0 ]))
+
+    def test_read_hfa(self):
+        symbols = {}
+        a = read_hfa("tests/resources/charm/product.hfa", symbols)
+        self.assertEqual(len(symbols), 3)
+        self.assertEqual(a.nstates, 4)
+        (sa, sb, sc) = sorted(symbols.values())
+        self.assertTrue(a.accepts([ sa, sb ]))
+        self.assertFalse(a.accepts([ sa, sc ]))
+        self.assertFalse(a.accepts([ sa ]))
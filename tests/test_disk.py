@@ -0,0 +1,44 @@
+from tests.charmutil import CharmTestCase, no_graph
+
+# Models without a safety violation.  Only safety violations are checked,
+# and the issue says so.
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+# Models where the search stops at a safety violation
+violations = [ "code/clock.hny", "code/atm.hny" ]
+
+
+class TestDisk(CharmTestCase):
+
+    def check(self, *options):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, *options, modules=modules,
+                                                        issue=no_graph)
+        for filename in violations:
+            self.assertSameSearch(filename, *options, all=False)
+
+    def test_disk(self):
+        self.check("-Xdisk")
+
+    def test_dir(self):
+        self.check("-Xdisk=" + str(self.dir))
+
+    def test_options(self):
+        hvm = self.compile("code/Peterson.hny")
+        for option in [ "-Xasync", "-Xhashcompact", "-Xbitstate" ]:
+            r = self.run_charm("-Xdisk", option,
+                                "-o" + str(self.dir / "out.hco"), str(hvm))
+            self.assertNotEqual(r.returncode, 0, option)
+            self.assertIn("-Xdisk cannot be combined", r.stderr)
+
+    def test_bad_dir(self):
+        hvm = self.compile("code/Peterson.hny")
+        r = self.run_charm("-Xdisk=" + str(self.dir / "none"),
+                            "-o" + str(self.dir / "out.hco"), str(hvm))
+        self.assertNotEqual(r.returncode, 0)
+        self.assertIn("not a writable directory", r.stderr)
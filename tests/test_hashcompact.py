@@ -0,0 +1,38 @@
+from tests.charmutil import CharmTestCase, no_graph
+
+# Models without a safety violation.  Only safety violations are checked,
+# and the issue says so.
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+# Models where the search stops at a safety violation
+violations = [ "code/clock.hny", "code/atm.hny" ]
+
+
+class TestHashCompact(CharmTestCase):
+
+    def check(self, *options):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, *options, modules=modules,
+                                                        issue=no_graph)
+        for filename in violations:
+            self.assertSameSearch(filename, *options, all=False)
+
+    def test_hashcompact(self):
+        self.check("-Xhashcompact")
+        self.check("-Xhashcompact=1M")
+
+    def test_full(self):
+        # The table has room for 115 fingerprints, far fewer than the states
+        (_, issue) = self.search("code/queuedemo.hny", "-Xhashcompact=1k",
+                                                modules=[ "queue=queueMS" ])
+        self.assertEqual(issue, "Incomplete: hash compaction table full"
+                                " (no safety violations found so far)")
+
+    def test_bitstate(self):
+        self.check("-Xbitstate")
+        self.check("-Xbitstate=1M")
@@ -0,0 +1,67 @@
+from harmony_model_checker.harmony.hco import HcoReader, Results, read_hco
+from tests.charmutil import CharmTestCase, strip
+
+# A run with a counterexample, runs with a graph, one of a model that
+# prints, and runs without a graph
+runs = [
+    ("tests/resources/charm/choose.hny", []),
+    ("code/Peterson.hny", []),
+    ("code/hello4.hny", []),
+    ("code/Peterson.hny", [ "-Xhashcompact" ]),
+    ("code/Peterson.hny", [ "-Xswarm=1" ]),
+]
+
+
+class TestHco(CharmTestCase):
+
+    def test_same(self):
+        # The binary .hco file must contain the same results as the JSON one
+        for (filename, options) in runs:
+            hvm = self.compile(filename)
+            self.charm(hvm, "-Xjson", *options, hco=self.dir / "j.hco")
+            self.charm(hvm, *options, hco=self.dir / "b.hco")
+            self.assertEqual(strip(read_hco(str(self.dir / "j.hco"))),
+                            strip(read_hco(str(self.dir / "b.hco"))), filename)
+
+    def test_graph(self):
+        # The graph of hello4, which prints "hello world" any number of times
+        self.charm(self.compile("code/hello4.hny"))
+        with HcoReader(str(self.dir / "out.hco")) as r:
+            self.assertTrue(r.has_graph())
+            self.assertEqual(r.symbols(),
+                        { "1": { "type": "atom", "value": "hello world" } })
+            nodes = r.nodes()
+        self.assertEqual([ n["type"] for n in nodes ].count("initial"), 1)
+        self.assertIn("terminal", [ n["type"] for n in nodes ])
+        idxs = { n["idx"] for n in nodes }
+        paths = []
+        for n in nodes:
+            for (path, dsts) in n["transitions"]:
+                self.assertTrue(set(dsts) <= idxs)
+                paths.append(path)
+        self.assertIn([ 1 ], paths)
+
+        # Without a graph the sections are left out
+        self.charm(self.compile("code/hello4.hny"), "-Xhashcompact")
+        with HcoReader(str(self.dir / "out.hco")) as r:
+            self.assertFalse(r.has_graph())
+            self.assertIsNone(r.symbols())
+            self.assertIsNone(r.nodes())
+
+    def test_results(self):
+        # Results gives the same for both formats as read_hco
+        for (filename, options) in runs:
+            hvm = self.compile(filename)
+            for (hco, flags) in [ ("j.hco", [ "-Xjson" ]), ("b.hco", []) ]:
+                hco = str(self.dir / hco)
+                self.charm(hvm, *flags, *options, hco=hco)
+                top = read_hco(hco)
+                results = Results(hco)
+                self.assertEqual(results.page(), read_hco(hco, graph=False))
+                self.assertEqual(results.has_graph(), "nodes" in top)
+                if "nodes" in top:
+                    self.assertEqual(results.symbols(), top["symbols"])
+                    self.assertEqual(list(results.nodes()),
+                            [ (n["idx"], n["component"], n["type"],
+                                n["transitions"]) for n in top["nodes"] ])
+                results.close()
@@ -0,0 +1,38 @@
+from harmony_model_checker.harmony.hco import read_hco
+from tests.charmutil import CharmTestCase, strip
+
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+
+class TestHvm(CharmTestCase):
+
+    def test_same(self):
+        # The binary .hvm file must give the same results as the JSON one
+        for (filename, modules) in models:
+            self.assertEqual(self.charm(self.compile(filename, modules)),
+                    self.charm(self.compile(filename, modules, "json")),
+                    filename)
+
+    def test_counterexample(self):
+        # A model with only one thread, so that there is only one
+        # counterexample
+        filename = "tests/resources/charm/choose.hny"
+        self.charm(self.compile(filename, [], "json"), hco=self.dir / "j.hco")
+        self.charm(self.compile(filename), hco=self.dir / "b.hco")
+        j = read_hco(str(self.dir / "j.hco"))
+        b = read_hco(str(self.dir / "b.hco"))
+        self.assertEqual(j["issue"], "Safety violation")
+        self.assertEqual(strip(j["macrosteps"]), strip(b["macrosteps"]))
+
+    def test_truncated(self):
+        hvm = self.compile("code/Peterson.hny")
+        bad = self.dir / "bad.hvm"
+        bad.write_bytes(hvm.read_bytes()[:1000])
+        r = self.run_charm("-o" + str(self.dir / "bad.hco"), str(bad))
+        self.assertNotEqual(r.returncode, 0)
+        self.assertIn("bad or truncated HVM file", r.stderr)
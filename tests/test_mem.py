@@ -0,0 +1,24 @@
+from tests.charmutil import CharmTestCase
+
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+
+class TestMem(CharmTestCase):
+
+    def test_large(self):
+        # A budget that is large enough changes nothing
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, "-Xmem=1g", modules=modules)
+        for filename in [ "code/clock.hny", "code/atm.hny" ]:
+            self.assertSameSearch(filename, "-Xmem=1g", all=False)
+
+    def test_small(self):
+        # One that is too small leaves the search incomplete
+        self.assertEqual(self.search("code/Peterson.hny", "-Xmem=64k")[1],
+                "Incomplete: memory budget exceeded "
+                "(no safety violations found so far)")
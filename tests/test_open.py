@@ -0,0 +1,28 @@
+from tests.charmutil import CharmTestCase
+
+# Fully explored, with each kind of issue.  The larger ones make the tables
+# grow a few times.
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+# Models where the search stops at a safety violation
+violations = [ "code/clock.hny", "code/atm.hny" ]
+
+
+class TestOpen(CharmTestCase):
+
+    def test_open(self):
+        for option in [ "-Xopen", "-Xopen=visited", "-Xopen=values" ]:
+            for (filename, modules) in models:
+                self.assertSameSearch(filename, option, modules=modules)
+            for filename in violations:
+                self.assertSameSearch(filename, option, all=False)
+
+    def test_async(self):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, "-Xopen", "-Xasync",
+                                                        modules=modules)
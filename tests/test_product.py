@@ -0,0 +1,25 @@
+from tests.charmutil import CharmTestCase
+
+
+class TestProduct(CharmTestCase):
+
+    def test_own_behavior(self):
+        # The behavior of a model, which charm writes, must be accepted
+        hfa = str(self.dir / "hello4.hfa")
+        self.assertEqual(self.search("code/hello4.hny", "-Xhfa=" + hfa),
+                                                            (3, "No issues"))
+        for options in [ [], [ "-Xproduct" ] ]:
+            self.assertEqual(self.search("code/hello4.hny", "-B" + hfa,
+                                            *options), (3, "No issues"))
+
+    def test_violation(self):
+        # The model prints "a" and then "c".  After "a" the behavior allows
+        # "b", which leads to a final state, and "c", which does not.
+        filename = "tests/resources/charm/product.hny"
+        hfa = "tests/resources/charm/product.hfa"
+        self.assertEqual(self.search(filename, "-B" + hfa)[1],
+                            "Behavior violation: terminal state not final")
+
+        # With -Xproduct printing "c" fails at once
+        self.assertEqual(self.search(filename, "-B" + hfa, "-Xproduct")[1],
+                            "Safety violation")
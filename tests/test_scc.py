@@ -0,0 +1,25 @@
+from tests.charmutil import CharmTestCase
+
+# Models with an issue that is found on the state graph after the search,
+# and a model with one long path through its states
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+    ("tests/resources/charm/chain.hny", []),
+]
+
+
+class TestScc(CharmTestCase):
+
+    def test_scc(self):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, "-Xscc=serial", modules=modules)
+            self.assertSameSearch(filename, "-Xscc=parallel", modules=modules)
+
+    def test_options(self):
+        hvm = self.compile("code/Peterson.hny")
+        r = self.run_charm("-Xscc=other", "-o" + str(self.dir / "out.hco"),
+                                                                    str(hvm))
+        self.assertNotEqual(r.returncode, 0)
@@ -0,0 +1,30 @@
+from tests.charmutil import CharmTestCase
+
+# The #states and the issue that the search finds, one model for each kind
+# of issue
+baseline = [
+    ("code/Peterson.hny", [], 104, "No issues"),
+    ("code/UpEnter.hny", [], 60, "Non-terminating state"),
+    ("code/csonebit.hny", [], 73, "Active busy waiting"),
+    ("code/queuedemo.hny", [ "queue=queueMS" ], 3125,
+                                'Data race (alloc$pool[0]["next"])'),
+]
+
+# The search stops at a safety violation, so the #states depends on the
+# order in which the workers explore the states
+violations = [
+    ("code/clock.hny", "Safety violation"),
+    ("code/atm.hny", "Invariant violation"),
+]
+
+
+class TestSearch(CharmTestCase):
+
+    def test_baseline(self):
+        for (filename, modules, states, issue) in baseline:
+            self.assertEqual(self.search(filename, modules=modules),
+                                                    (states, issue), filename)
+
+    def test_violations(self):
+        for (filename, issue) in violations:
+            self.assertEqual(self.search(filename)[1], issue, filename)
@@ -0,0 +1,24 @@
+from tests.charmutil import CharmTestCase, no_graph
+
+# Models without a safety violation.  A swarm search only checks safety, and
+# the issue says so.
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+
+class TestSwarm(CharmTestCase):
+
+    def check(self, *options):
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, *options, modules=modules,
+                                                        issue=no_graph)
+        # clock has too many states for a swarm search to reach the violation
+        self.assertSameSearch("code/atm.hny", *options, all=False)
+
+    def test_swarm(self):
+        self.check("-Xswarm")
+        self.check("-Xswarm=3")
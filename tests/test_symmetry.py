@@ -0,0 +1,39 @@
+from tests.charmutil import CharmTestCase
+
+# Fully explored, with each kind of issue
+models = [
+    ("code/Peterson.hny", []),
+    ("code/UpEnter.hny", []),
+    ("code/csonebit.hny", []),
+    ("code/queuedemo.hny", [ "queue=queueMS" ]),
+]
+
+
+class TestSymmetry(CharmTestCase):
+
+    def test_unused(self):
+        # Atoms that the model does not use change nothing
+        for (filename, modules) in models:
+            self.assertSameSearch(filename, "-Xsymmetry=x,y",
+                                                        modules=modules)
+
+    def test_workers(self):
+        # Four workers that differ only in their atom, so that each state
+        # has up to 4! = 24 equivalent ones
+        filename = "tests/resources/charm/symlock.hny"
+        self.assertEqual(self.search(filename), (1054, "No issues"))
+        self.assertEqual(self.search(filename, "-Xsymmetry=a,b,c,d"),
+                                                    (106, "No issues"))
+
+        # Without the lock the reduced search still finds the violation
+        filename = "tests/resources/charm/symbad.hny"
+        self.assertEqual(self.search(filename, "-Xsymmetry=a,b,c,d")[1],
+                                                    "Safety violation")
+
+    def test_options(self):
+        hvm = self.compile("code/Peterson.hny")
+        for option in [ "-Xhashcompact", "-Xbitstate", "-Xdisk" ]:
+            r = self.run_charm("-Xsymmetry=a,b", option,
+                                "-o" + str(self.dir / "out.hco"), str(hvm))
+            self.assertNotEqual(r.returncode, 0, option)
+            self.assertIn("-Xsymmetry needs the state graph", r.stderr)